@@ -3,7 +3,7 @@ from django.contrib.auth.hashers import make_password
 from .models import (
     Usuario, Prenda, Transaccion, TipoTransaccion,
     Fundacion, Mensaje, ImpactoAmbiental,
-    Logro, UsuarioLogro, CampanaFundacion
+    Logro, UsuarioLogro, CampanaFundacion, ContadorPlataforma
 )
 
 @admin.register(Usuario)
@@ -107,3 +107,9 @@ class CampanaFundacionAdmin(admin.ModelAdmin):
     search_fields = ('nombre', 'descripcion')
     list_filter = ('activa', 'fundacion', 'fecha_inicio', 'fecha_fin')
     ordering = ('-fecha_inicio',)
+
+@admin.register(ContadorPlataforma)
+class ContadorPlataformaAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'valor', 'fecha_actualizacion')
+    readonly_fields = ('fecha_actualizacion',)
+    ordering = ('nombre',)
@@ -0,0 +1,204 @@
+"""
+Agradecimientos masivos de fundaciones
+Una fundación agradece a todos los donantes de una campaña o de un rango de fechas con
+un solo envío, que se procesa en segundo plano y muestra su avance.
+
+- El envío (EnvioAgradecimiento) se guarda al pedirlo y se procesa fuera de la petición:
+  en un hilo del proceso (AGRADECIMIENTOS_EN_HILO) y/o con `procesar_agradecimientos`.
+- Los donantes se recorren por lotes en orden de id (keyset sobre `ultimo_donante`):
+  cada donante recibe un mensaje, una sola vez, aunque el envío se retome.
+- Cada lote es una transacción: bulk_create de los mensajes, conversaciones e insignias
+  actualizadas por conjunto (conversaciones.registrar_difusion) y avance del envío. Si
+  se interrumpe, no queda a medias y el siguiente reclamo sigue donde quedó.
+- Como el outbox de eventos, un envío se reclama con un UPDATE condicional y el reclamo
+  vence tras PLAZO_RECLAMO: un proceso caído no deja el envío colgado. Si un lote
+  falla, se reintenta con espera; tras MAX_INTENTOS el envío queda FALLIDO.
+"""
+
+import logging
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import panel_negociacion
+from .conversaciones import registrar_difusion
+from .models import EnvioAgradecimiento, Mensaje, Transaccion
+from .tipos_transaccion import DONACION
+
+logger = logging.getLogger(__name__)
+
+TAMANO_LOTE = 1000
+PLAZO_RECLAMO = timedelta(minutes=5)
+MAX_INTENTOS = 5
+ESPERA_REINTENTO = timedelta(minutes=1)
+
+# Donaciones que cuentan para agradecer: las ya recibidas por la fundación
+ESTADOS_AGRADECIBLES = ('COMPLETADA',)
+
+
+class ReclamoVencido(Exception):
+    """Otro proceso reclamó el envío (el reclamo propio venció): se deja de procesar."""
+
+
+# ==============================================================================
+# CREACIÓN
+# ==============================================================================
+
+def donantes(envio, despues_de=None):
+    """Ids distintos de los donantes del envío, en orden (desde `despues_de` exclusive)."""
+    donaciones = Transaccion.objects.filter(
+        fundacion_id=envio.fundacion_id, tipo_codigo=DONACION, estado__in=ESTADOS_AGRADECIBLES,
+    ).exclude(user_origen_id=envio.emisor_id)
+    if envio.campana_id:
+        donaciones = donaciones.filter(campana_id=envio.campana_id)
+    if envio.fecha_desde:
+        donaciones = donaciones.filter(fecha_transaccion__gte=envio.fecha_desde)
+    if envio.fecha_hasta:
+        donaciones = donaciones.filter(fecha_transaccion__lte=envio.fecha_hasta)
+    if despues_de is not None:
+        donaciones = donaciones.filter(user_origen_id__gt=despues_de)
+    return donaciones.order_by('user_origen').values_list('user_origen', flat=True).distinct()
+
+
+def crear_envio(emisor, fundacion, contenido, campana=None, fecha_desde=None, fecha_hasta=None, en_hilo=None):
+    """
+    Registra un agradecimiento masivo y lo deja en cola.
+
+    Args:
+        en_hilo: Procesarlo en un hilo al confirmar (None: según AGRADECIMIENTOS_EN_HILO)
+
+    Returns:
+        EnvioAgradecimiento: con el total de donantes ya calculado
+    """
+    envio = EnvioAgradecimiento(
+        fundacion=fundacion, emisor=emisor, contenido=contenido, campana=campana,
+        fecha_desde=fecha_desde, fecha_hasta=fecha_hasta,
+    )
+    envio.total = donantes(envio).count()
+    with transaction.atomic():
+        envio.save()
+        if en_hilo if en_hilo is not None else getattr(settings, 'AGRADECIMIENTOS_EN_HILO', True):
+            transaction.on_commit(lambda: iniciar_hilo(envio.pk))
+    return envio
+
+
+def iniciar_hilo(id_envio):
+    """Procesa el envío en un hilo del proceso, sin bloquear la petición que lo creó."""
+    def procesar():
+        try:
+            reclamado = reclamar(id_envio)
+            if reclamado:
+                procesar_envio(*reclamado)
+        except Exception as e:
+            # El envío queda en cola: lo retoma `procesar_agradecimientos` al vencer el reclamo
+            logger.error(f"Agradecimiento {id_envio}: el hilo se detuvo: {e}")
+        finally:
+            connection.close()
+
+    threading.Thread(target=procesar, name=f'agradecimiento-{id_envio}', daemon=True).start()
+
+
+# ==============================================================================
+# PROCESAMIENTO
+# ==============================================================================
+
+def reclamar(id_envio=None):
+    """
+    Reclama el envío pendiente más antiguo (o `id_envio`) si ningún otro proceso lo tiene.
+
+    Returns:
+        tuple | None: (EnvioAgradecimiento, marca del reclamo)
+    """
+    ahora = timezone.now()
+    marca = uuid.uuid4().hex
+    disponibles = EnvioAgradecimiento.objects.filter(
+        estado__in=('PENDIENTE', 'EN_PROCESO'), disponible_desde__lte=ahora,
+    )
+    if id_envio is not None:
+        disponibles = disponibles.filter(pk=id_envio)
+    pk = disponibles.order_by('disponible_desde', 'id').values_list('pk', flat=True).first()
+    if pk is None:
+        return None
+    # Solo si sigue disponible: otro proceso pudo reclamarlo entretanto
+    if not disponibles.filter(pk=pk).update(estado='EN_PROCESO', reclamado_por=marca, disponible_desde=ahora + PLAZO_RECLAMO):
+        return None
+    return EnvioAgradecimiento.objects.get(pk=pk), marca
+
+
+def procesar_lote(envio, marca, tamano_lote=TAMANO_LOTE):
+    """
+    Envía el siguiente lote de agradecimientos, en una sola transacción.
+
+    Returns:
+        int: mensajes enviados (el envío queda COMPLETADO si el lote vino incompleto)
+
+    Raises:
+        ReclamoVencido: si el envío ya no está reclamado con `marca` (nada se confirma)
+    """
+    with transaction.atomic():
+        ids = list(donantes(envio, despues_de=envio.ultimo_donante)[:tamano_lote])
+        ahora = timezone.now()
+        if ids:
+            mensajes = Mensaje.objects.bulk_create([
+                Mensaje(emisor_id=envio.emisor_id, receptor_id=id_donante, contenido=envio.contenido, fecha_envio=ahora)
+                for id_donante in ids
+            ], batch_size=1000)
+            registrar_difusion(envio.emisor_id, mensajes)
+            panel_negociacion.invalidar_usuarios([envio.emisor_id, *ids])
+
+        cambios = {'enviados': F('enviados') + len(ids), 'intentos': 0, 'disponible_desde': ahora + PLAZO_RECLAMO}
+        if ids:
+            cambios['ultimo_donante'] = ids[-1]
+        if len(ids) < tamano_lote:
+            cambios.update(estado='COMPLETADO', fecha_fin=ahora, reclamado_por=None, ultimo_error=None)
+        if not EnvioAgradecimiento.objects.filter(pk=envio.pk, reclamado_por=marca).update(**cambios):
+            raise ReclamoVencido(f'El envío {envio.pk} ya no está reclamado por {marca}')
+
+    envio.enviados += len(ids)
+    envio.ultimo_donante = ids[-1] if ids else envio.ultimo_donante
+    if len(ids) < tamano_lote:
+        envio.estado = 'COMPLETADO'
+    return len(ids)
+
+
+def procesar_envio(envio, marca, tamano_lote=TAMANO_LOTE):
+    """
+    Procesa un envío reclamado hasta completarlo (o hasta que un lote falle).
+
+    Returns:
+        int: mensajes enviados en esta pasada
+    """
+    enviados = 0
+    try:
+        while envio.estado != 'COMPLETADO':
+            enviados += procesar_lote(envio, marca, tamano_lote)
+    except ReclamoVencido as e:
+        logger.warning(str(e))
+    except Exception as e:
+        intentos = envio.intentos + 1
+        agotado = intentos >= MAX_INTENTOS
+        logger.error(f"Agradecimiento {envio.pk}: falló un lote (intento {intentos}): {e}")
+        EnvioAgradecimiento.objects.filter(pk=envio.pk, reclamado_por=marca).update(
+            estado='FALLIDO' if agotado else 'EN_PROCESO', intentos=intentos, reclamado_por=None,
+            disponible_desde=timezone.now() + ESPERA_REINTENTO, ultimo_error=str(e),
+        )
+    return enviados
+
+
+def procesar_pendientes(tamano_lote=TAMANO_LOTE):
+    """
+    Procesa los envíos en cola hasta que no quede ninguno disponible.
+
+    Returns:
+        dict: envíos procesados y mensajes enviados
+    """
+    envios = mensajes = 0
+    while (reclamado := reclamar()) is not None:
+        envios += 1
+        mensajes += procesar_envio(*reclamado, tamano_lote=tamano_lote)
+    return {'envios': envios, 'mensajes': mensajes}
@@ -1,21 +1,60 @@
 from rest_framework import viewsets, status, generics
 from rest_framework.decorators import api_view, action
+from rest_framework.exceptions import NotAuthenticated, PermissionDenied, Throttled
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.db.models import Sum, Count, Q
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
 
 from .models import (
     Usuario, Prenda, Transaccion, TipoTransaccion,
-    Fundacion, Mensaje, ImpactoAmbiental, Logro, UsuarioLogro, CampanaFundacion
+    Fundacion, Mensaje, ImpactoAmbiental, Logro, UsuarioLogro, CampanaFundacion, TransaccionHistorica
 )
 from .serializers import (
     UsuarioSerializer, PrendaSerializer, TransaccionSerializer,
     TipoTransaccionSerializer, FundacionSerializer, MensajeSerializer,
     ImpactoAmbientalSerializer, EstadisticasSerializer, ImpactoTotalSerializer,
     LogroSerializer, UsuarioLogroSerializer, CampanaFundacionSerializer,
-    PrendaSimpleSerializer, 
+    PrendaSimpleSerializer, TransaccionLineaTiempoSerializer,
 )
+from . import busqueda_mensajes, contadores
+from .contadores import leer_contadores
+from .conversaciones import MENSAJES_POR_PAGINA, mensajes_hilo
+from .cache_utils import calcular_etag, versiones_tablas
+from .limite_mensajes import MENSAJES_LIMITE, LimiteExcedido, verificar_envio
+from .linea_tiempo import LIMITE_POR_DEFECTO, CursorInvalido, linea_tiempo_usuario
+from .transiciones import ConflictoConcurrencia, TransicionInvalida, accion_hacia, aplicar_transicion
+
+# Listados condicionales (ETag / 304)
+
+class ListaCondicionalMixin:
+    """
+    Agrega ETag al listado y responde 304 si el cliente ya tiene esa versión.
+
+    El ETag sale de los sellos de versión de `tablas_etag` (una sola consulta a
+    los contadores) y de la URL completa con sus filtros, sin serializar nada.
+    Los listados no dependen del usuario, así que pueden guardarlos proxies, salvo
+    los que exponen datos de usuarios (`cache_publica = False`): esos son privados.
+    """
+    tablas_etag = ()
+    cache_publica = True
+
+    def list(self, request, *args, **kwargs):
+        etag = quote_etag(calcular_etag(request.get_full_path(), *versiones_tablas(*self.tablas_etag)))
+        etags_cliente = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in etags_cliente or '*' in etags_cliente:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        if self.cache_publica:
+            patch_cache_control(response, public=True, no_cache=True)
+        else:
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
 
 # Funciones basadas en vistas
 
@@ -140,10 +179,12 @@ class UsuarioDetailAPIView(APIView):
 
 # Vistas basadas en genéricos (generics)
 
-class TransaccionListCreateAPIView(generics.ListCreateAPIView):
+class TransaccionListCreateAPIView(ListaCondicionalMixin, generics.ListCreateAPIView):
     """Lista y crea transacciones."""
     queryset = Transaccion.objects.all()
     serializer_class = TransaccionSerializer
+    tablas_etag = (Transaccion, Prenda, TipoTransaccion, Usuario, Fundacion, CampanaFundacion)
+    cache_publica = False
 
 
 class TransaccionDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
@@ -153,10 +194,11 @@ class TransaccionDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
     lookup_field = 'pk'
 
 
-class FundacionListCreateAPIView(generics.ListCreateAPIView):
+class FundacionListCreateAPIView(ListaCondicionalMixin, generics.ListCreateAPIView):
     """Lista y crea fundaciones."""
     queryset = Fundacion.objects.all()
     serializer_class = FundacionSerializer
+    tablas_etag = (Fundacion,)
 
 
 class FundacionDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
@@ -168,10 +210,11 @@ class FundacionDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
 
 # Conjuntos de vistas (ViewSets)
 
-class PrendaViewSet(viewsets.ModelViewSet):
+class PrendaViewSet(ListaCondicionalMixin, viewsets.ModelViewSet):
     """ViewSet para Prendas - CRUD completo"""
     queryset = Prenda.objects.all()
     serializer_class = PrendaSerializer
+    tablas_etag = (Prenda, Usuario, Fundacion, ImpactoAmbiental)
     
     def get_queryset(self):
         """Permite filtrar prendas por query params"""
@@ -203,10 +246,12 @@ class PrendaViewSet(viewsets.ModelViewSet):
         return Response({'message': 'No hay impacto registrado'}, status=status.HTTP_404_NOT_FOUND)
 
 
-class UsuarioViewSet(viewsets.ModelViewSet):
+class UsuarioViewSet(ListaCondicionalMixin, viewsets.ModelViewSet):
     """ViewSet para Usuarios - CRUD completo"""
     queryset = Usuario.objects.all()
     serializer_class = UsuarioSerializer
+    tablas_etag = (Usuario,)
+    cache_publica = False
     
     @action(detail=True, methods=['get'])
     def prendas(self, request, pk=None):
@@ -218,17 +263,27 @@ class UsuarioViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['get'])
     def transacciones(self, request, pk=None):
-        """Obtiene todas las transacciones de un usuario"""
+        """
+        Línea de tiempo de transacciones del usuario (enviadas y recibidas), paginada por cursor.
+        Parámetros: ?cursor=<siguiente de la página anterior>&limite=<1..100>
+        """
         usuario = self.get_object()
-        transacciones = Transaccion.objects.filter(id_usuario_origen=usuario) | Transaccion.objects.filter(id_usuario_destino=usuario)
-        serializer = TransaccionSerializer(transacciones.distinct(), many=True)
-        return Response(serializer.data)
+        try:
+            limite = int(request.query_params.get('limite', LIMITE_POR_DEFECTO))
+            pagina, siguiente = linea_tiempo_usuario(usuario, cursor=request.query_params.get('cursor'), limite=limite)
+        except (CursorInvalido, ValueError):
+            return Response({'error': 'Parámetros de paginación inválidos'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'resultados': TransaccionLineaTiempoSerializer(pagina, many=True).data,
+            'siguiente': siguiente,
+        })
 
 
-class FundacionViewSet(viewsets.ModelViewSet):
+class FundacionViewSet(ListaCondicionalMixin, viewsets.ModelViewSet):
     """ViewSet para Fundaciones - CRUD completo"""
     queryset = Fundacion.objects.all()
     serializer_class = FundacionSerializer
+    tablas_etag = (Fundacion,)
     
     @action(detail=True, methods=['get'])
     def donaciones(self, request, pk=None):
@@ -239,30 +294,33 @@ class FundacionViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class TipoTransaccionViewSet(viewsets.ModelViewSet):
+class TipoTransaccionViewSet(ListaCondicionalMixin, viewsets.ModelViewSet):
     """ViewSet para Tipos de Transacción - CRUD completo"""
     queryset = TipoTransaccion.objects.all()
     serializer_class = TipoTransaccionSerializer
+    tablas_etag = (TipoTransaccion,)
     
     @action(detail=True, methods=['get'])
     def transacciones(self, request, pk=None):
         """Obtiene todas las transacciones de un tipo específico"""
         tipo = self.get_object()
-        transacciones = Transaccion.objects.filter(id_tipo=tipo)
+        transacciones = Transaccion.objects.filter(tipo=tipo)
         serializer = TransaccionSerializer(transacciones, many=True)
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
     def estadisticas(self, request):
         """Estadísticas por tipo de transacción"""
-        tipos_stats = []
-        for tipo in TipoTransaccion.objects.all():
-            count = Transaccion.objects.filter(id_tipo=tipo).count()
-            tipos_stats.append({
-                'id': tipo.id_tipo,
+        # Una sola consulta agrupada en vez de un count() por tipo (incluye las archivadas)
+        conteo = dict(TransaccionHistorica.objects.order_by().values_list('tipo').annotate(total=Count('pk')))
+        tipos_stats = [
+            {
+                'id': tipo.pk,
                 'nombre': tipo.nombre_tipo,
-                'total_transacciones': count
-            })
+                'total_transacciones': conteo.get(tipo.pk, 0),
+            }
+            for tipo in TipoTransaccion.objects.all()
+        ]
         return Response(tipos_stats)
 
 
@@ -273,20 +331,46 @@ class MensajeViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Permite filtrar mensajes por emisor o receptor"""
-        queryset = Mensaje.objects.all()
+        queryset = Mensaje.objects.select_related('emisor', 'receptor')
         emisor = self.request.query_params.get('emisor', None)
         receptor = self.request.query_params.get('receptor', None)
         
         if emisor:
-            queryset = queryset.filter(id_emisor=emisor)
+            queryset = queryset.filter(emisor=emisor)
         if receptor:
-            queryset = queryset.filter(id_receptor=receptor)
+            queryset = queryset.filter(receptor=receptor)
         
         return queryset.order_by('-fecha_envio')
+
+    def _verificar_limite(self, serializer):
+        """
+        Límite de envío del usuario de la sesión (429 con Retry-After si se excede).
+
+        Las cubetas se llevan por quien tiene la sesión, no por el `emisor` que manda el
+        cliente: sin sesión no se envía y el emisor tiene que ser el usuario de la sesión.
+        Así nadie esquiva su límite cambiando de emisor ni agota el de otro usuario.
+        """
+        id_usuario = self.request.session.get('usuario_id')
+        if not id_usuario:
+            raise NotAuthenticated('Debes iniciar sesión')
+        emisor = serializer.validated_data['emisor']
+        if str(emisor.pk) != str(id_usuario):
+            raise PermissionDenied('Solo puedes enviar mensajes como el usuario de la sesión.')
+        try:
+            verificar_envio(emisor.pk, serializer.validated_data['receptor'].pk)
+        except LimiteExcedido as e:
+            raise Throttled(wait=e.reintentar_en, detail=MENSAJES_LIMITE[e.ambito])
+
+    def perform_create(self, serializer):
+        self._verificar_limite(serializer)
+        serializer.save()
     
     @action(detail=False, methods=['get'])
     def conversacion(self, request):
-        """Obtiene la conversación entre dos usuarios"""
+        """
+        Conversación entre dos usuarios: los mensajes más recientes y, por cursor, los anteriores.
+        Parámetros: ?usuario1=&usuario2=&cursor=<anteriores de la página previa>&limite=<1..100>
+        """
         usuario1_id = request.query_params.get('usuario1', None)
         usuario2_id = request.query_params.get('usuario2', None)
         
@@ -296,28 +380,54 @@ class MensajeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        mensajes = Mensaje.objects.filter(
-            (Q(id_emisor=usuario1_id) & Q(id_receptor=usuario2_id)) |
-            (Q(id_emisor=usuario2_id) & Q(id_receptor=usuario1_id))
-        ).order_by('fecha_envio')
-        
-        serializer = MensajeSerializer(mensajes, many=True)
-        return Response(serializer.data)
+        try:
+            mensajes, anteriores = mensajes_hilo(
+                usuario1_id, usuario2_id, cursor=request.query_params.get('cursor'),
+                limite=int(request.query_params.get('limite', MENSAJES_POR_PAGINA)),
+            )
+        except (CursorInvalido, ValueError):
+            return Response({'error': 'Parámetros inválidos'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'resultados': MensajeSerializer(mensajes, many=True).data,
+            'anteriores': anteriores,
+        })
     
+    @action(detail=False, methods=['get'])
+    def buscar(self, request):
+        """
+        Búsqueda de texto completo en los mensajes del usuario de la sesión.
+        Parámetros: ?q=<texto>&pagina=<n>
+        """
+        id_usuario = request.session.get('usuario_id')
+        if not id_usuario:
+            return Response({'error': 'Debes iniciar sesión'}, status=status.HTTP_401_UNAUTHORIZED)
+        try:
+            pagina = max(1, min(int(request.query_params.get('pagina', 1)), busqueda_mensajes.MAX_PAGINAS))
+        except ValueError:
+            return Response({'error': 'Parámetros inválidos'}, status=status.HTTP_400_BAD_REQUEST)
+        resultados, hay_mas = busqueda_mensajes.buscar(id_usuario, request.query_params.get('q', ''), pagina=pagina)
+        datos = MensajeSerializer(resultados, many=True).data
+        for fila, mensaje in zip(datos, resultados):
+            fila['fragmento'] = mensaje.fragmento
+            fila['rango'] = mensaje.rango
+        return Response({'resultados': datos, 'pagina': pagina, 'hay_mas': hay_mas})
+
     @action(detail=False, methods=['post'])
     def enviar(self, request):
         """Enviar un nuevo mensaje"""
         serializer = MensajeSerializer(data=request.data)
         if serializer.is_valid():
+            self._verificar_limite(serializer)
             serializer.save(fecha_envio=timezone.now())
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ImpactoAmbientalViewSet(viewsets.ModelViewSet):
+class ImpactoAmbientalViewSet(ListaCondicionalMixin, viewsets.ModelViewSet):
     """ViewSet para Impacto Ambiental - CRUD completo"""
     queryset = ImpactoAmbiental.objects.all()
     serializer_class = ImpactoAmbientalSerializer
+    tablas_etag = (ImpactoAmbiental,)
     
     @action(detail=False, methods=['get'])
     def por_prenda(self, request):
@@ -334,10 +444,12 @@ class ImpactoAmbientalViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class TransaccionViewSet(viewsets.ModelViewSet):
+class TransaccionViewSet(ListaCondicionalMixin, viewsets.ModelViewSet):
     """ViewSet para Transacciones - CRUD completo"""
     queryset = Transaccion.objects.all()
     serializer_class = TransaccionSerializer
+    tablas_etag = (Transaccion, Prenda, TipoTransaccion, Usuario, Fundacion, CampanaFundacion)
+    cache_publica = False
     
     def get_queryset(self):
         """Permite filtrar transacciones por query params"""
@@ -367,7 +479,7 @@ class TransaccionViewSet(viewsets.ModelViewSet):
         resultado = []
         
         for tipo in tipos:
-            transacciones = Transaccion.objects.filter(id_tipo=tipo)
+            transacciones = Transaccion.objects.filter(tipo=tipo)
             resultado.append({
                 'tipo': tipo.nombre_tipo,
                 'total': transacciones.count(),
@@ -395,15 +507,19 @@ class TransaccionViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        estados_validos = ['Pendiente', 'Aceptada', 'Rechazada', 'Completada', 'Cancelada']
-        if nuevo_estado not in estados_validos:
-            return Response(
-                {'error': f'Estado inválido. Estados válidos: {estados_validos}'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        transaccion.estado = nuevo_estado
-        transaccion.save()
+        try:
+            accion = accion_hacia(transaccion.estado, nuevo_estado)
+            # Solo se aceptan los campos que alguna transición necesita
+            cambios = {
+                campo: request.data[campo]
+                for campo in ('direccion_entrega', 'razon_disputa')
+                if request.data.get(campo)
+            }
+            aplicar_transicion(transaccion, accion, **cambios)
+        except ConflictoConcurrencia as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        except TransicionInvalida as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         serializer = TransaccionSerializer(transaccion)
         return Response(serializer.data)
@@ -415,23 +531,16 @@ class EstadisticasAPIView(APIView):
     """Estadísticas generales del sistema."""
     
     def get(self, request):
-        total_usuarios = Usuario.objects.count()
-        total_prendas = Prenda.objects.count()
-        total_transacciones = Transaccion.objects.count()
-        total_donaciones = Transaccion.objects.filter(id_tipo__nombre_tipo='Donación').count()
-        
-        impacto = ImpactoAmbiental.objects.aggregate(
-            carbono=Sum('carbono_evitar_kg'),
-            energia=Sum('energia_ahorrada_kwh')
-        )
-        
+        # Contadores desnormalizados (una sola consulta); ver contadores.py
+        totales = leer_contadores()
+
         data = {
-            'total_usuarios': total_usuarios,
-            'total_prendas': total_prendas,
-            'total_transacciones': total_transacciones,
-            'total_donaciones': total_donaciones,
-            'carbono_evitado_total': impacto['carbono'] or 0,
-            'energia_ahorrada_total': impacto['energia'] or 0
+            'total_usuarios': int(totales[contadores.USUARIOS]),
+            'total_prendas': int(totales[contadores.PRENDAS]),
+            'total_transacciones': int(totales[contadores.TRANSACCIONES]),
+            'total_donaciones': int(totales[contadores.DONACIONES]),
+            'carbono_evitado_total': totales[contadores.CARBONO_EVITADO_KG],
+            'energia_ahorrada_total': totales[contadores.ENERGIA_AHORRADA_KWH]
         }
         
         serializer = EstadisticasSerializer(data=data)
@@ -456,10 +565,11 @@ class ImpactoTotalAPIView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 # ---- Logros ----
-class LogroViewSet(viewsets.ModelViewSet):
+class LogroViewSet(ListaCondicionalMixin, viewsets.ModelViewSet):
     """CRUD completo para Logro"""
     queryset = Logro.objects.all()
     serializer_class = LogroSerializer
+    tablas_etag = (Logro,)
 
 # ---- UsuarioLogro ----
 class UsuarioLogroViewSet(viewsets.ModelViewSet):
@@ -478,10 +588,11 @@ class UsuarioLogroViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
     
 # ---- Campañas de Fundación ----
-class CampanaFundacionViewSet(viewsets.ModelViewSet):
+class CampanaFundacionViewSet(ListaCondicionalMixin, viewsets.ModelViewSet):
     """CRUD para campañas solidarias"""
     queryset = CampanaFundacion.objects.all()
     serializer_class = CampanaFundacionSerializer
+    tablas_etag = (CampanaFundacion, Fundacion)
 
     # Custom: campañas activas
     @action(detail=False, methods=['get'])
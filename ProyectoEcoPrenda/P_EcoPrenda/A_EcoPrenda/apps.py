@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class AEcoprendaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'A_EcoPrenda'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .indice_busqueda import busqueda_en_memoria_activa, cargar_snapshot
+
+        if busqueda_en_memoria_activa():
+            cargar_snapshot()
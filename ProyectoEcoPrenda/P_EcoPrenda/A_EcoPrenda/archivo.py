@@ -0,0 +1,149 @@
+"""
+Archivo de transacciones y mensajes antiguos
+Mueve a tablas frías las transacciones terminadas hace tiempo y la conversación entre
+sus partes, para que las tablas calientes y sus índices no crezcan sin límite.
+
+- Candidatas: transacciones COMPLETADA, RECHAZADA o CANCELADA con fecha_transaccion
+  anterior a ARCHIVO_ANTIGUEDAD_DIAS, buscadas por el índice (estado, fecha_transaccion),
+  y sin eventos del outbox por despachar.
+- Mensajes: los anteriores al mismo límite entre las partes de cada transacción archivada,
+  salvo que el par tenga todavía una transacción activa (o una disputa abierta). Como en la
+  retención de mensajes, nunca se archivan los no leídos ni el último mensaje de cada par:
+  el resumen de la conversación (Conversacion: último mensaje y no leídos de cada lado)
+  sigue siendo válido sin tocarlo.
+- Cada lote copia y borra en una sola transacción de base de datos: si se interrumpe,
+  el lote no queda a medias y la siguiente ejecución sigue donde quedó (las filas ya
+  archivadas no están en la tabla caliente).
+- Archivar no es eliminar: los contadores de la plataforma no se descuentan. Los
+  reportes consultan TransaccionHistorica / MensajeHistorico, vistas que unen ambas tablas.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from . import contadores
+from .cache_utils import marcar_version_tabla
+from .models import EventoTransaccion, Mensaje, MensajeArchivado, Transaccion, TransaccionArchivada
+from .transiciones import ESTADOS_ACTIVOS
+
+logger = logging.getLogger(__name__)
+
+ANTIGUEDAD_DIAS = getattr(settings, 'ARCHIVO_ANTIGUEDAD_DIAS', 365)
+
+ESTADOS_TERMINALES = ('COMPLETADA', 'RECHAZADA', 'CANCELADA')
+
+# Nombres de las métricas en ContadorPlataforma
+TRANSACCIONES_ARCHIVADAS = 'transacciones_archivadas'
+MENSAJES_ARCHIVADOS = 'mensajes_archivados'
+
+_COLUMNAS_TRANSACCION = [f.attname for f in Transaccion._meta.concrete_fields]
+_COLUMNAS_MENSAJE = [f.attname for f in Mensaje._meta.concrete_fields]
+
+
+def _par(a, b):
+    return (a, b) if a <= b else (b, a)
+
+
+# ==============================================================================
+# CANDIDATAS
+# ==============================================================================
+
+def buscar_archivables(limite, tamano_lote):
+    """Hasta `tamano_lote` transacciones terminadas antes de `limite` (como dicts de columnas)."""
+    eventos_pendientes = EventoTransaccion.objects.filter(transaccion=OuterRef('pk'), estado='PENDIENTE')
+    filas = []
+    for estado in ESTADOS_TERMINALES:
+        restantes = tamano_lote - len(filas)
+        if restantes <= 0:
+            break
+        filas += list(
+            Transaccion.objects.filter(estado=estado, fecha_transaccion__lt=limite)
+            .exclude(Exists(eventos_pendientes))
+            .order_by('fecha_transaccion')
+            .values(*_COLUMNAS_TRANSACCION)[:restantes]
+        )
+    return filas
+
+
+def _mensajes_archivables(filas, limite):
+    """Mensajes anteriores a `limite` entre las partes de las transacciones del lote."""
+    pares = {_par(f['user_origen_id'], f['user_destino_id']) for f in filas if f['user_destino_id']}
+    if not pares:
+        return []
+    usuarios = {pk for par in pares for pk in par}
+
+    # Un par con una transacción todavía activa conserva su conversación en caliente
+    activos = Transaccion.objects.filter(
+        estado__in=ESTADOS_ACTIVOS, user_origen__in=usuarios, user_destino__in=usuarios,
+    ).values_list('user_origen', 'user_destino')
+    pares -= {_par(a, b) for a, b in activos}
+    if not pares:
+        return []
+
+    mensajes = Mensaje.objects.filter(
+        usuario_menor__in={menor for menor, _ in pares}, usuario_mayor__in={mayor for _, mayor in pares},
+        fecha_envio__lt=limite, leido=True,
+    ).values(*_COLUMNAS_MENSAJE)
+    mensajes = [m for m in mensajes if (m['usuario_menor_id'], m['usuario_mayor_id']) in pares]
+
+    # El más reciente de cada par se queda: si no hay otro posterior, es el último de la conversación
+    ultimos = {}
+    for m in mensajes:
+        clave = (m['usuario_menor_id'], m['usuario_mayor_id'])
+        if clave not in ultimos or (m['fecha_envio'], m['id']) > (ultimos[clave]['fecha_envio'], ultimos[clave]['id']):
+            ultimos[clave] = m
+    conservados = {m['id'] for m in ultimos.values()}
+    return [m for m in mensajes if m['id'] not in conservados]
+
+
+# ==============================================================================
+# LOTE
+# ==============================================================================
+
+def archivar_lote(tamano_lote=500, antiguedad_dias=None, ahora=None):
+    """
+    Archiva un lote de transacciones terminadas y su conversación.
+
+    Args:
+        tamano_lote: Máximo de transacciones por lote
+        antiguedad_dias: Antigüedad mínima (por defecto, ARCHIVO_ANTIGUEDAD_DIAS)
+        ahora: Momento de referencia (por defecto, timezone.now())
+
+    Returns:
+        dict: transacciones y mensajes archivados en el lote
+    """
+    ahora = ahora or timezone.now()
+    limite = ahora - timedelta(days=antiguedad_dias or ANTIGUEDAD_DIAS)
+
+    with transaction.atomic():
+        filas = buscar_archivables(limite, tamano_lote)
+        if not filas:
+            return {'transacciones': 0, 'mensajes': 0}
+        mensajes = _mensajes_archivables(filas, limite)
+        ids = [f['id'] for f in filas]
+
+        # ignore_conflicts: un lote repetido tras un corte no duplica filas en el archivo
+        TransaccionArchivada.objects.bulk_create(
+            [TransaccionArchivada(fecha_archivo=ahora, **f) for f in filas], ignore_conflicts=True,
+        )
+        MensajeArchivado.objects.bulk_create(
+            [MensajeArchivado(fecha_archivo=ahora, **m) for m in mensajes], ignore_conflicts=True,
+        )
+
+        EventoTransaccion.objects.filter(transaccion_id__in=ids).delete()
+        # Borrado directo, sin señales: archivar no debe descontar los contadores de
+        # la plataforma (post_delete de Transaccion) ni cargar cada fila en memoria.
+        Transaccion.objects.filter(pk__in=ids)._raw_delete(Transaccion.objects.db)
+        Mensaje.objects.filter(pk__in=[m['id'] for m in mensajes]).delete()
+
+        marcar_version_tabla(Transaccion)
+        contadores.incrementar(TRANSACCIONES_ARCHIVADAS, len(filas))
+        contadores.incrementar(MENSAJES_ARCHIVADOS, len(mensajes))
+
+    logger.info(f"Archivo: {len(filas)} transacciones y {len(mensajes)} mensajes (anteriores a {limite:%Y-%m-%d})")
+    return {'transacciones': len(filas), 'mensajes': len(mensajes)}
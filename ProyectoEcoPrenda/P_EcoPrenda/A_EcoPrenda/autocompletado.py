@@ -0,0 +1,370 @@
+"""
+Autocompletado del buscador de prendas
+Estructura de prefijos en memoria (lista ordenada + bisect) sobre nombres y categorías normalizados.
+
+- Cada sugerencia pesa según cuántas prendas disponibles la usan (popularidad)
+  y qué tan recientes son (decaimiento exponencial con vida media configurable).
+- Se construye al primer uso y luego se actualiza incrementalmente con señales de Prenda,
+  aplicadas al confirmar la transacción.
+- Como el índice de búsqueda, guarda la versión de cada prenda y el sello version:prenda.
+  Si el sello cambió (escribió otro worker), el siguiente uso aplica solo las prendas
+  modificadas desde la última sincronización cuya versión no coincide. Cada
+  INTERVALO_RECONSTRUCCION segundos se reconstruye entero (quita lo borrado por otros).
+"""
+
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .indice_busqueda import MARGEN_DELTA, plegar_tildes, sello_prendas
+
+
+# ==============================================================================
+# CONFIGURACIÓN
+# ==============================================================================
+
+# Vida media (días) del aporte de una prenda al peso de su sugerencia
+VIDA_MEDIA_DIAS = getattr(settings, 'AUTOCOMPLETADO_VIDA_MEDIA_DIAS', 30)
+
+# Fecha de referencia para los pesos: 2 ** ((fecha - EPOCA) / vida media).
+# Al ser fija, los pesos ya acumulados no tienen que recalcularse con el tiempo.
+EPOCA = 1704067200  # 2024-01-01 UTC
+
+LARGO_MINIMO_PREFIJO = 2
+MAX_SUGERENCIAS = 8
+
+# Cada prefijo consultado guarda sus TOP_K mejores sugerencias y se mantiene con los cambios
+TOP_K = 2 * MAX_SUGERENCIAS
+MAX_PREFIJOS_MEMORIZADOS = 50000
+
+# Prefijos de hasta LARGO_MAXIMO_PRECALCULADO caracteres que abarcan más de
+# UMBRAL_PREFIJO_AMPLIO claves se precalculan al construir (su primer cálculo sería lento)
+UMBRAL_PREFIJO_AMPLIO = 1000
+LARGO_MAXIMO_PRECALCULADO = 6
+
+# Segundos hasta reconstruir el autocompletado desde la base de datos
+INTERVALO_RECONSTRUCCION = 3600
+
+def normalizar(texto):
+    """Minúsculas, sin tildes y con espacios simples."""
+    return ' '.join(plegar_tildes(texto or '').split())
+
+
+def peso_por_fecha(fecha):
+    """Aporte de una prenda publicada en `fecha` (las más recientes pesan más)."""
+    segundos = (fecha or timezone.now()).timestamp() - EPOCA
+    return 2 ** (segundos / (VIDA_MEDIA_DIAS * 86400))
+
+
+# ==============================================================================
+# ESTRUCTURA DE PREFIJOS
+# ==============================================================================
+
+class Autocompletado:
+    """
+    Sugerencias por prefijo.
+
+    `_claves` es una lista ordenada de tuplas (clave normalizada, sugerencia);
+    cada sugerencia se registra con su texto completo y con cada sufijo que
+    empieza en una palabra, para que 'roja' sugiera 'Camiseta roja'.
+
+    Para cada prefijo consultado se guarda `[mejores, cota, amplio]`: las TOP_K
+    sugerencias de mayor peso y una cota tal que ninguna sugerencia fuera de la
+    lista pesa más que ella. Los cambios de peso ajustan esas listas en vez de
+    descartarlas, así que responder casi nunca requiere recorrer las claves.
+    """
+
+    def __init__(self):
+        self._claves = []        # [(clave, (tipo, texto_normalizado))] ordenada
+        self._sugerencias = {}   # (tipo, texto_normalizado) -> [texto a mostrar, peso, cantidad]
+        self._por_prenda = {}    # id de prenda -> [((tipo, texto_normalizado), aporte)]
+        self._prefijos = {}      # prefijo -> [lista de sugerencias, cota, amplio]
+        self._versiones = {}     # id de prenda -> Prenda.version aplicada (falta si no se conoce)
+        self._lock = threading.Lock()
+        self.sello = None        # sello de versión de la tabla prenda al sincronizar
+        self.marca = None        # momento de la última sincronización (compara con Prenda.modificada)
+        self.construido = time.monotonic()
+
+    def __len__(self):
+        return len(self._sugerencias)
+
+    @staticmethod
+    def _claves_de(texto_normalizado):
+        palabras = texto_normalizado.split(' ')
+        return {' '.join(palabras[i:]) for i in range(len(palabras))}
+
+    def _peso(self, sugerencia):
+        datos = self._sugerencias.get(sugerencia)
+        return datos[1] if datos is not None else None
+
+    # --- Mantenimiento de las listas por prefijo ---
+
+    def _ajustar(self, sugerencia):
+        """Reubica una sugerencia (con peso nuevo o eliminada) en las listas de sus prefijos."""
+        if not self._prefijos:
+            return
+        peso = self._peso(sugerencia)
+        prefijos = {
+            clave[:largo]
+            for clave in self._claves_de(sugerencia[1])
+            for largo in range(LARGO_MINIMO_PREFIJO, len(clave) + 1)
+        }
+        for prefijo in prefijos:
+            entrada = self._prefijos.get(prefijo)
+            if entrada is None:
+                continue
+            mejores, cota = entrada[0], entrada[1]
+            if sugerencia in mejores:
+                if peso is None or peso < cota:
+                    mejores.remove(sugerencia)
+                else:
+                    mejores.sort(key=self._peso, reverse=True)
+            elif peso is not None and peso > cota:
+                mejores.append(sugerencia)
+                mejores.sort(key=self._peso, reverse=True)
+                if len(mejores) > TOP_K:
+                    entrada[1] = max(cota, self._peso(mejores.pop()))
+            # Sin suficientes sugerencias confiables: se recalcula en la próxima consulta
+            if len(mejores) < MAX_SUGERENCIAS and entrada[1] != float('-inf'):
+                del self._prefijos[prefijo]
+
+    def _calcular(self, prefijo, inicio=None, fin=None):
+        """Recorre las claves del prefijo y guarda sus TOP_K mejores sugerencias."""
+        if inicio is None:
+            inicio = bisect_left(self._claves, (prefijo,))
+            fin = bisect_left(self._claves, (prefijo + '\uffff',), inicio)
+        candidatas = {sugerencia for _, sugerencia in self._claves[inicio:fin]}
+        mejores = heapq.nlargest(TOP_K + 1, candidatas, key=self._peso)
+        cota = self._peso(mejores.pop()) if len(mejores) > TOP_K else float('-inf')
+
+        if len(self._prefijos) >= MAX_PREFIJOS_MEMORIZADOS:
+            self._prefijos = {p: e for p, e in self._prefijos.items() if e[2]}
+        entrada = [mejores, cota, fin - inicio > UMBRAL_PREFIJO_AMPLIO]
+        self._prefijos[prefijo] = entrada
+        return entrada
+
+    def _precalcular_amplios(self):
+        """Calcula de una pasada los prefijos cortos que abarcan muchas claves."""
+        self._prefijos = {}
+        for largo in range(LARGO_MINIMO_PREFIJO, LARGO_MAXIMO_PRECALCULADO + 1):
+            inicio = 0
+            total = len(self._claves)
+            while inicio < total:
+                prefijo = self._claves[inicio][0][:largo]
+                fin = bisect_left(self._claves, (prefijo + '\uffff',), inicio)
+                if len(prefijo) == largo and fin - inicio > UMBRAL_PREFIJO_AMPLIO:
+                    self._calcular(prefijo, inicio, fin)
+                inicio = fin
+
+    # --- Aportes de las prendas ---
+
+    def _sumar(self, sugerencia, texto, aporte, insertar=True):
+        datos = self._sugerencias.get(sugerencia)
+        if datos is None:
+            self._sugerencias[sugerencia] = [texto, aporte, 1]
+            if insertar:
+                for clave in self._claves_de(sugerencia[1]):
+                    insort(self._claves, (clave, sugerencia))
+        else:
+            datos[0] = texto
+            datos[1] += aporte
+            datos[2] += 1
+        if insertar:
+            self._ajustar(sugerencia)
+
+    def _restar(self, sugerencia, aporte):
+        datos = self._sugerencias.get(sugerencia)
+        if datos is None:
+            return
+        datos[1] -= aporte
+        datos[2] -= 1
+        if datos[2] <= 0:
+            del self._sugerencias[sugerencia]
+            for clave in self._claves_de(sugerencia[1]):
+                pos = bisect_left(self._claves, (clave, sugerencia))
+                if pos < len(self._claves) and self._claves[pos] == (clave, sugerencia):
+                    del self._claves[pos]
+        self._ajustar(sugerencia)
+
+    def _quitar_prenda(self, id_prenda):
+        for sugerencia, aporte in self._por_prenda.pop(id_prenda, ()):
+            self._restar(sugerencia, aporte)
+
+    def _agregar_prenda(self, id_prenda, nombre, categoria, fecha, insertar=True):
+        aporte = peso_por_fecha(fecha)
+        registradas = []
+        for tipo, texto in (('prenda', nombre), ('categoria', categoria)):
+            clave = normalizar(texto)
+            if clave:
+                sugerencia = (tipo, clave)
+                self._sumar(sugerencia, texto.strip(), aporte, insertar)
+                registradas.append((sugerencia, aporte))
+        self._por_prenda[id_prenda] = registradas
+
+    def actualizar_prenda(self, id_prenda, nombre, categoria, fecha, disponible, version=None):
+        """Agrega, reemplaza o quita (si no está disponible) el aporte de una prenda."""
+        with self._lock:
+            self._quitar_prenda(id_prenda)
+            if disponible:
+                self._agregar_prenda(id_prenda, nombre, categoria, fecha)
+            if version is None:
+                self._versiones.pop(id_prenda, None)
+            else:
+                self._versiones[id_prenda] = version
+
+    def eliminar_prenda(self, id_prenda):
+        with self._lock:
+            self._quitar_prenda(id_prenda)
+            self._versiones.pop(id_prenda, None)
+
+    def desactualizadas(self, versiones):
+        """Ids de `versiones` (id de prenda -> Prenda.version) con otra versión que la aplicada."""
+        with self._lock:
+            return [pk for pk, version in versiones.items() if self._versiones.get(pk) != version]
+
+    def vencido(self):
+        return time.monotonic() - self.construido > INTERVALO_RECONSTRUCCION
+
+    def cargar(self, filas):
+        """
+        Carga inicial en bloque: acumula las sugerencias, ordena las claves una
+        sola vez y precalcula los prefijos amplios.
+
+        Args:
+            filas: Iterable de (id, nombre, categoria, fecha_publicacion, version) de prendas disponibles
+        """
+        with self._lock:
+            for id_prenda, nombre, categoria, fecha, version in filas:
+                self._agregar_prenda(id_prenda, nombre, categoria, fecha, insertar=False)
+                self._versiones[id_prenda] = version
+            self._claves = sorted(
+                (clave, sugerencia)
+                for sugerencia in self._sugerencias
+                for clave in self._claves_de(sugerencia[1])
+            )
+            self._precalcular_amplios()
+
+    # --- Consultas ---
+
+    def sugerir(self, prefijo, limite=MAX_SUGERENCIAS):
+        """
+        Sugerencias para un prefijo, ordenadas por peso.
+
+        Args:
+            prefijo: Texto escrito por el usuario (se normaliza)
+            limite: Cantidad máxima de sugerencias
+
+        Returns:
+            list: [{'texto': str, 'tipo': 'prenda'|'categoria'}]
+        """
+        prefijo = normalizar(prefijo)
+        limite = max(1, min(limite, MAX_SUGERENCIAS))
+        if len(prefijo) < LARGO_MINIMO_PREFIJO:
+            return []
+
+        with self._lock:
+            entrada = self._prefijos.get(prefijo) or self._calcular(prefijo)
+            return [
+                {'texto': self._sugerencias[s][0], 'tipo': s[0]}
+                for s in entrada[0][:limite]
+            ]
+
+
+# ==============================================================================
+# INSTANCIA DEL PROCESO
+# ==============================================================================
+
+_autocompletado = None
+_lock_inicializacion = threading.Lock()
+
+
+def construir_desde_db(lote=5000):
+    """Construye el autocompletado con las prendas disponibles (recorrido por lotes)."""
+    from .models import Prenda
+
+    # El sello y la marca se toman antes de recorrer: lo que se confirme durante el recorrido los supera
+    sello, marca = sello_prendas(), timezone.now()
+
+    def filas():
+        ultimo_id = 0
+        while True:
+            bloque = list(
+                Prenda.objects.filter(pk__gt=ultimo_id, estado='DISPONIBLE')
+                .order_by('pk')
+                .values_list('pk', 'nombre', 'categoria', 'fecha_publicacion', 'version')[:lote]
+            )
+            if not bloque:
+                return
+            yield from bloque
+            ultimo_id = bloque[-1][0]
+
+    autocompletado = Autocompletado()
+    autocompletado.cargar(filas())
+    autocompletado.sello, autocompletado.marca = sello, marca
+    return autocompletado
+
+
+def sincronizar(autocompletado, lote=5000):
+    """
+    Aplica las prendas modificadas desde la última sincronización (con el índice de
+    Prenda.modificada) cuya versión no coincide con la aplicada.
+
+    Returns:
+        int: Prendas aplicadas
+    """
+    from .models import Prenda
+
+    sello, marca = sello_prendas(), timezone.now()
+    modificadas = Prenda.objects.filter(modificada__gte=autocompletado.marca - MARGEN_DELTA)
+    cambiadas = autocompletado.desactualizadas(dict(modificadas.values_list('pk', 'version')))
+    for inicio in range(0, len(cambiadas), lote):
+        for pk, nombre, categoria, fecha, estado, version in Prenda.objects.filter(
+            pk__in=cambiadas[inicio:inicio + lote]
+        ).values_list('pk', 'nombre', 'categoria', 'fecha_publicacion', 'estado', 'version'):
+            autocompletado.actualizar_prenda(pk, nombre, categoria, fecha, estado == 'DISPONIBLE', version)
+    autocompletado.sello, autocompletado.marca = sello, marca
+    return len(cambiadas)
+
+
+def obtener_autocompletado():
+    """
+    Devuelve el autocompletado del proceso, al día con la base de datos.
+
+    Lo construye en el primer uso y cada INTERVALO_RECONSTRUCCION segundos; si el sello
+    de la tabla prenda cambió desde la última sincronización, aplica lo modificado.
+    """
+    global _autocompletado
+    sello = sello_prendas()
+    with _lock_inicializacion:
+        if _autocompletado is None or _autocompletado.vencido():
+            _autocompletado = construir_desde_db()
+        elif _autocompletado.sello != sello:
+            sincronizar(_autocompletado)
+        return _autocompletado
+
+
+def registrar_prenda(prenda):
+    """Aplica un guardado de prenda al autocompletado, si ya está construido, al confirmar."""
+    datos = (
+        prenda.pk, prenda.nombre, prenda.categoria,
+        prenda.fecha_publicacion, prenda.estado == 'DISPONIBLE', prenda.version,
+    )
+
+    def aplicar():
+        if _autocompletado is not None:
+            _autocompletado.actualizar_prenda(*datos)
+
+    transaction.on_commit(aplicar)
+
+
+def quitar_prenda(id_prenda):
+    def aplicar():
+        if _autocompletado is not None:
+            _autocompletado.eliminar_prenda(id_prenda)
+
+    transaction.on_commit(aplicar)
@@ -0,0 +1,219 @@
+"""
+Búsqueda de texto completo en los mensajes de un usuario
+Solo busca en las conversaciones en que participa; resultados por relevancia, con el
+fragmento que coincide resaltado y paginados.
+
+- PostgreSQL: columna `busqueda` (tsvector generado desde `contenido`, configuración
+  'spanish') con índice GIN; la consulta usa websearch_to_tsquery, así que acepta
+  "frases", OR y -exclusiones. Relevancia con ts_rank y fragmentos con ts_headline.
+- SQLite (desarrollo): tabla FTS5 `mensaje_fts` de contenido externo, mantenida por
+  triggers; relevancia bm25 y fragmentos con snippet(). Si la tabla se pierde (SQLite
+  reconstruye `mensaje` al alterarla y borra sus triggers), `reconstruir_busqueda_mensajes`
+  la vuelve a crear.
+- Otros motores: icontains, por fecha, con el fragmento recortado en Python.
+- El fragmento se resalta con marcas de control que se cambian por <mark> después de
+  escapar el texto: el contenido de un mensaje nunca se interpreta como HTML.
+- Paginación por número de página (el orden por relevancia no admite cursor), hasta
+  MAX_PAGINAS; se pide una fila de más para saber si hay otra página, sin COUNT.
+"""
+
+import logging
+import re
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .conversaciones import cursor_hasta
+from .indice_busqueda import plegar_tildes
+from .models import Mensaje
+
+logger = logging.getLogger(__name__)
+
+RESULTADOS_POR_PAGINA = 20
+MAX_PAGINAS = 50
+LARGO_MINIMO = 2
+
+INICIO_MARCA = '\x02'
+FIN_MARCA = '\x03'
+
+_RE_TERMINO = re.compile(r'\w+')
+
+
+# ==============================================================================
+# ESQUEMA (ver migración 0016_mensaje_busqueda)
+# ==============================================================================
+
+SQL_POSTGRESQL = [
+    """ALTER TABLE mensaje ADD COLUMN IF NOT EXISTS busqueda tsvector
+        GENERATED ALWAYS AS (to_tsvector('spanish'::regconfig, coalesce(contenido, ''))) STORED""",
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS mensaje_busqueda_idx ON mensaje USING GIN (busqueda)',
+]
+
+SQL_SQLITE = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS mensaje_fts USING fts5(
+        contenido, content='mensaje', content_rowid='id', tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS mensaje_fts_insertar AFTER INSERT ON mensaje BEGIN
+        INSERT INTO mensaje_fts(rowid, contenido) VALUES (new.id, new.contenido);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS mensaje_fts_borrar AFTER DELETE ON mensaje BEGIN
+        INSERT INTO mensaje_fts(mensaje_fts, rowid, contenido) VALUES ('delete', old.id, old.contenido);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS mensaje_fts_editar AFTER UPDATE OF contenido ON mensaje BEGIN
+        INSERT INTO mensaje_fts(mensaje_fts, rowid, contenido) VALUES ('delete', old.id, old.contenido);
+        INSERT INTO mensaje_fts(rowid, contenido) VALUES (new.id, new.contenido);
+    END""",
+]
+
+
+def instalar(reconstruir=False):
+    """
+    Crea (si faltan) la columna e índice o la tabla FTS5 y sus triggers.
+
+    Args:
+        reconstruir: En SQLite, además vuelve a indexar todos los mensajes
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for sql in SQL_POSTGRESQL:
+                cursor.execute(sql)
+        elif connection.vendor == 'sqlite':
+            for sql in SQL_SQLITE:
+                cursor.execute(sql)
+            if reconstruir:
+                cursor.execute("INSERT INTO mensaje_fts(mensaje_fts) VALUES ('rebuild')")
+
+
+def motor():
+    """'postgresql', 'sqlite' (si existe la tabla FTS5) o 'basico'."""
+    if connection.vendor == 'postgresql':
+        return 'postgresql'
+    if connection.vendor == 'sqlite' and 'mensaje_fts' in connection.introspection.table_names():
+        return 'sqlite'
+    return 'basico'
+
+
+# ==============================================================================
+# FRAGMENTOS
+# ==============================================================================
+
+def resaltar(fragmento):
+    """Fragmento con marcas de control -> HTML seguro con <mark>."""
+    html = escape(fragmento).replace(INICIO_MARCA, '<mark>').replace(FIN_MARCA, '</mark>')
+    return mark_safe(html)
+
+
+def _fragmento_basico(contenido, terminos, contexto=60):
+    """Recorte alrededor del primer término (ya plegado) encontrado, con las coincidencias marcadas."""
+    plegado = plegar_tildes(contenido)  # Mismo largo que el original para texto en español
+    posiciones = [plegado.find(t) for t in terminos if t in plegado]
+    inicio = max(0, min(posiciones, default=0) - contexto)
+    fin = min(len(contenido), inicio + 2 * contexto + 40)
+    recorte = contenido[inicio:fin]
+    if terminos and len(plegado) == len(contenido):
+        patron = re.compile('|'.join(re.escape(t) for t in sorted(terminos, key=len, reverse=True)))
+        partes, ultimo = [], 0
+        for coincidencia in patron.finditer(plegado[inicio:fin]):
+            partes += [recorte[ultimo:coincidencia.start()], INICIO_MARCA, recorte[coincidencia.start():coincidencia.end()], FIN_MARCA]
+            ultimo = coincidencia.end()
+        recorte = ''.join(partes) + recorte[ultimo:]
+    return ('…' if inicio else '') + recorte + ('…' if fin < len(contenido) else '')
+
+
+# ==============================================================================
+# BÚSQUEDA
+# ==============================================================================
+
+def _buscar_postgresql(id_usuario, texto, limite, desde):
+    opciones = f'StartSel={INICIO_MARCA}, StopSel={FIN_MARCA}, MaxWords=25, MinWords=8, MaxFragments=2, FragmentDelimiter=" … "'
+    sql = """
+        WITH consulta AS (SELECT websearch_to_tsquery('spanish', %s) AS q),
+        pagina AS (
+            SELECT m.id, m.contenido, m.fecha_envio, ts_rank(m.busqueda, consulta.q) AS rango
+            FROM mensaje m, consulta
+            WHERE m.busqueda @@ consulta.q AND (m.emisor_id = %s OR m.receptor_id = %s)
+            ORDER BY rango DESC, m.fecha_envio DESC NULLS LAST, m.id DESC
+            LIMIT %s OFFSET %s
+        )
+        SELECT pagina.id, pagina.rango, ts_headline('spanish', pagina.contenido, consulta.q, %s)
+        FROM pagina, consulta
+        ORDER BY pagina.rango DESC, pagina.fecha_envio DESC NULLS LAST, pagina.id DESC
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [texto, id_usuario, id_usuario, limite, desde, opciones])
+        return cursor.fetchall()
+
+
+def _consulta_fts5(terminos):
+    """Términos como frases entre comillas (sin operadores del usuario); el último, por prefijo."""
+    frases = ['"' + t.replace('"', '""') + '"' for t in terminos]
+    frases[-1] += '*'
+    return ' '.join(frases)
+
+
+def _buscar_sqlite(id_usuario, terminos, limite, desde):
+    # bm25 es menor cuanto más relevante: se devuelve negado para ordenar como ts_rank
+    sql = """
+        SELECT m.id, -bm25(mensaje_fts) AS rango, snippet(mensaje_fts, 0, %s, %s, '…', 16)
+        FROM mensaje_fts JOIN mensaje m ON m.id = mensaje_fts.rowid
+        WHERE mensaje_fts MATCH %s AND (m.emisor_id = %s OR m.receptor_id = %s)
+        ORDER BY bm25(mensaje_fts), m.fecha_envio DESC, m.id DESC
+        LIMIT %s OFFSET %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [INICIO_MARCA, FIN_MARCA, _consulta_fts5(terminos), id_usuario, id_usuario, limite, desde])
+        return cursor.fetchall()
+
+
+def _buscar_basico(id_usuario, terminos, limite, desde):
+    consulta = Mensaje.objects.participante(id_usuario)
+    for termino in terminos:
+        consulta = consulta.filter(contenido__icontains=termino)
+    filas = consulta.order_by('-fecha_envio', '-id').values_list('id', 'contenido')[desde:desde + limite]
+    plegados = [plegar_tildes(t) for t in terminos]
+    return [(pk, None, _fragmento_basico(contenido, plegados)) for pk, contenido in filas]
+
+
+def buscar(id_usuario, texto, pagina=1, por_pagina=RESULTADOS_POR_PAGINA):
+    """
+    Busca en los mensajes enviados o recibidos por el usuario.
+
+    Args:
+        id_usuario: Usuario que busca (solo ve sus conversaciones)
+        texto: Texto de la búsqueda
+        pagina: Número de página (desde 1, hasta MAX_PAGINAS)
+        por_pagina: Resultados por página
+
+    Returns:
+        tuple: (lista de Mensaje con emisor, receptor, `rango`, `fragmento` (HTML seguro),
+        `otro` (la otra parte) y `cursor` (su página en la conversación), hay otra página)
+    """
+    texto = ' '.join((texto or '').split())
+    terminos = _RE_TERMINO.findall(texto)
+    if len(texto) < LARGO_MINIMO or not terminos:
+        return [], False
+    pagina = max(1, min(int(pagina), MAX_PAGINAS))
+    desde = (pagina - 1) * por_pagina
+
+    motor_actual = motor()
+    if motor_actual == 'postgresql':
+        filas = _buscar_postgresql(id_usuario, texto, por_pagina + 1, desde)
+    elif motor_actual == 'sqlite':
+        filas = _buscar_sqlite(id_usuario, terminos, por_pagina + 1, desde)
+    else:
+        filas = _buscar_basico(id_usuario, terminos, por_pagina + 1, desde)
+
+    hay_mas = len(filas) > por_pagina and pagina < MAX_PAGINAS
+    filas = filas[:por_pagina]
+    mensajes = Mensaje.objects.select_related('emisor', 'receptor').in_bulk([pk for pk, _, _ in filas])
+    resultados = []
+    for pk, rango, fragmento in filas:
+        mensaje = mensajes.get(pk)
+        if mensaje is None:  # Borrado entre las dos consultas
+            continue
+        mensaje.rango = rango
+        mensaje.fragmento = resaltar(fragmento)
+        mensaje.otro = mensaje.receptor if mensaje.emisor_id == id_usuario else mensaje.emisor
+        mensaje.cursor = cursor_hasta(mensaje)
+        resultados.append(mensaje)
+    return resultados, hay_mas
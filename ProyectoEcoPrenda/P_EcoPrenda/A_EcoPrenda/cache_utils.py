@@ -0,0 +1,156 @@
+"""
+Utilidades de caché
+- Tarjetas de prendas usadas en los listados, versionadas por fila
+- Validadores HTTP (ETag) calculados desde sellos de versión, sin renderizar la respuesta
+"""
+
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from . import contadores
+from .conversaciones import clave_no_leidos
+
+
+# ==============================================================================
+# TARJETAS DE PRENDAS
+# ==============================================================================
+
+PLANTILLA_TARJETA_PRENDA = 'tarjeta_prenda.html'
+
+# Tiempo de vida de una tarjeta en caché (segundos). Las versiones nuevas usan otra clave,
+# así que el timeout solo limita cuánto tiempo ocupan memoria las versiones antiguas.
+TIMEOUT_TARJETAS = getattr(settings, 'CACHE_TARJETAS_TIMEOUT', 60 * 60)
+
+
+def clave_tarjeta_prenda(prenda):
+    """
+    Clave de caché de la tarjeta de una prenda.
+
+    La clave incluye la versión de la fila, por lo que cualquier guardado de la
+    prenda (o cambio de nombre de su dueño) apunta automáticamente a una clave nueva.
+    """
+    return f"tarjeta_prenda:{prenda.pk}:v{prenda.version}"
+
+
+def renderizar_tarjetas_prendas(prendas):
+    """
+    Devuelve el HTML de las tarjetas de una página de prendas.
+
+    Busca todas las tarjetas con una sola llamada `get_many`, renderiza solo las
+    que faltan y las guarda con una sola llamada `set_many`.
+
+    Args:
+        prendas: Iterable de Prenda (idealmente con select_related('user'))
+
+    Returns:
+        tuple: (lista de HTML en el mismo orden, cantidad de aciertos en caché)
+    """
+    prendas = list(prendas)
+    claves = [clave_tarjeta_prenda(prenda) for prenda in prendas]
+    en_cache = cache.get_many(claves)
+
+    tarjetas = []
+    nuevas = {}
+    for prenda, clave in zip(prendas, claves):
+        html = en_cache.get(clave)
+        if html is None:
+            html = render_to_string(PLANTILLA_TARJETA_PRENDA, {'prenda': prenda})
+            nuevas[clave] = html
+        tarjetas.append(html)
+
+    if nuevas:
+        cache.set_many(nuevas, TIMEOUT_TARJETAS)
+
+    return tarjetas, len(en_cache)
+
+
+# ==============================================================================
+# VALIDADORES HTTP (ETag / 304)
+# ==============================================================================
+
+def nombre_version_tabla(modelo):
+    """Nombre del contador que actúa como sello de versión de la tabla de un modelo."""
+    return f"version:{modelo._meta.db_table}"
+
+
+def marcar_version_tabla(modelo):
+    """
+    Cambia el sello de versión de la tabla del modelo al confirmar la transacción en curso.
+
+    Como todo contador (ver contadores.incrementar), el UPDATE de la fila del sello queda
+    fuera de la transacción que escribe: la fila no se bloquea mientras dura la escritura,
+    así que dos escrituras concurrentes sobre la misma tabla no se esperan entre sí. Si la
+    transacción se revierte, el sello no cambia.
+    """
+    contadores.incrementar(nombre_version_tabla(modelo), 1)
+
+
+def versiones_tablas(*modelos):
+    """
+    Sellos de versión de varias tablas con una sola consulta.
+
+    Los incrementa signals.py (con marcar_version_tabla) tras cada guardado o borrado
+    confirmado de esos modelos.
+
+    Returns:
+        list: versión de cada modelo, en el mismo orden (0 si aún no cambió)
+    """
+    from .models import ContadorPlataforma
+
+    nombres = [nombre_version_tabla(modelo) for modelo in modelos]
+    valores = dict(ContadorPlataforma.objects.filter(nombre__in=nombres).values_list('nombre', 'valor'))
+    return [int(valores.get(nombre, 0)) for nombre in nombres]
+
+
+def calcular_etag(*partes):
+    return hashlib.sha1(':'.join(str(parte) for parte in partes).encode()).hexdigest()
+
+
+def etag_pagina(request, *partes):
+    """
+    ETag de una página HTML.
+
+    Además de los sellos de versión incluye al usuario de la sesión (la barra de
+    navegación cambia según quién la ve), su insignia de mensajes sin leer y la
+    cookie de mensajes pendientes, para no responder 304 cuando hay un mensaje
+    flash que mostrar.
+
+    La insignia se lee tal cual de la caché, sin ir a la base de datos: si falta,
+    la parte vale None y la página se renderiza (y la vuelve a cargar).
+    """
+    usuario_id = request.session.get('usuario_id', '')
+    return calcular_etag(
+        request.session.get('id_usuario', ''),
+        usuario_id,
+        cache.get(clave_no_leidos(usuario_id)) if usuario_id else '',
+        request.COOKIES.get('messages', ''),
+        *partes,
+    )
+
+
+def pagina_condicional(etag_func):
+    """
+    Decorador para vistas HTML: responde 304 si el ETag coincide, sin ejecutar la vista.
+
+    `etag_func(request, *args, **kwargs)` debe ser barata (idealmente una consulta)
+    y devolver None cuando no se puede calcular (p. ej. la prenda no existe).
+    La respuesta es privada y se revalida siempre (depende de la sesión).
+    """
+    def decorador(vista):
+        vista_condicional = condition(etag_func=etag_func)(vista)
+
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            response = vista_condicional(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD') and response.has_header('ETag'):
+                patch_cache_control(response, private=True, no_cache=True)
+                patch_vary_headers(response, ('Cookie',))
+            return response
+        return envoltura
+    return decorador
@@ -381,23 +381,24 @@ def generar_informe_impacto(usuario=None, fundacion=None):
         dict con informe completo
     """
     from .models import Transaccion, ImpactoAmbiental
+    from .tipos_transaccion import DONACION, nombre_tipo
     
     if usuario:
         # Informe de usuario
         transacciones = Transaccion.objects.filter(
-            id_usuario_origen=usuario,
+            user_origen=usuario,
             estado='COMPLETADA'
-        ).select_related('id_prenda', 'id_tipo')
+        ).select_related('prenda')
         
         titulo = f"Impacto de {usuario.nombre}"
     
     elif fundacion:
         # Informe de fundación
         transacciones = Transaccion.objects.filter(
-            id_fundacion=fundacion,
+            fundacion=fundacion,
             estado='COMPLETADA',
-            id_tipo__nombre_tipo='Donación'
-        ).select_related('id_prenda', 'id_usuario_origen')
+            tipo_codigo=DONACION
+        ).select_related('prenda', 'user_origen')
         
         titulo = f"Impacto de {fundacion.nombre}"
     
@@ -405,14 +406,14 @@ def generar_informe_impacto(usuario=None, fundacion=None):
         # Informe global
         transacciones = Transaccion.objects.filter(
             estado='COMPLETADA'
-        ).select_related('id_prenda', 'id_tipo')
+        ).select_related('prenda')
         
         titulo = "Impacto Global de EcoPrenda"
     
     # Desglose por tipo de transacción
     desglose = {}
     for trans in transacciones:
-        tipo = trans.id_tipo.nombre_tipo
+        tipo = nombre_tipo(trans.tipo_id)  # Registro en memoria: sin join con tipo_transaccion
         if tipo not in desglose:
             desglose[tipo] = {
                 'cantidad': 0,
@@ -422,11 +423,11 @@ def generar_informe_impacto(usuario=None, fundacion=None):
             }
         
         try:
-            impacto = ImpactoAmbiental.objects.get(id_prenda=trans.id_prenda)
+            impacto = ImpactoAmbiental.objects.get(prenda=trans.prenda)
             carbono = float(impacto.carbono_evitar_kg or 0)
             energia = float(impacto.energia_ahorrada_kwh or 0)
         except ImpactoAmbiental.DoesNotExist:
-            impacto_calc = calcular_impacto_prenda(trans.id_prenda.categoria)
+            impacto_calc = calcular_impacto_prenda(trans.prenda.categoria)
             carbono = impacto_calc['carbono_evitado_kg']
             energia = impacto_calc['energia_ahorrada_kwh']
         
@@ -0,0 +1,163 @@
+"""
+Contadores desnormalizados de la plataforma
+Evitan los count(*) y Sum sobre tablas completas en la portada y en las estadísticas de la API.
+
+- Las señales (signals.py) aplican incrementos atómicos con F() cuando se confirma la
+  transacción que los origina, no dentro de ella: cada fila de contador es compartida por
+  toda la plataforma y bloquearla hasta el final de cada escritura las serializaría todas.
+  Si el proceso cae entre la confirmación y el incremento, `reconciliar_contadores` corrige.
+- Las vistas leen todos los contadores con una sola consulta (`leer_contadores`).
+- `reconciliar_contadores` recalcula los valores reales y corrige cualquier desvío
+  (por ejemplo, tras un `QuerySet.update()` o un borrado masivo fuera del ORM).
+"""
+
+import logging
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+
+from .tipos_transaccion import DONACION
+
+logger = logging.getLogger(__name__)
+
+
+# ==============================================================================
+# NOMBRES DE LOS CONTADORES
+# ==============================================================================
+
+USUARIOS = 'usuarios'
+PRENDAS = 'prendas'
+PRENDAS_DISPONIBLES = 'prendas_disponibles'
+TRANSACCIONES = 'transacciones'
+DONACIONES = 'donaciones'
+CARBONO_EVITADO_KG = 'carbono_evitado_kg'
+ENERGIA_AHORRADA_KWH = 'energia_ahorrada_kwh'
+
+CONTADORES = [
+    USUARIOS, PRENDAS, PRENDAS_DISPONIBLES, TRANSACCIONES,
+    DONACIONES, CARBONO_EVITADO_KG, ENERGIA_AHORRADA_KWH,
+]
+
+
+# ==============================================================================
+# ESCRITURA Y LECTURA
+# ==============================================================================
+
+def incrementar(nombre, delta=1):
+    """
+    Suma `delta` a un contador con una UPDATE atómica (valor = valor + delta).
+
+    Dentro de una transacción se aplica al confirmarla (si se revierte, no se aplica):
+    la fila del contador solo queda bloqueada lo que dura su propia UPDATE.
+    """
+    if not delta:
+        return
+    transaction.on_commit(lambda: _sumar(nombre, delta), robust=True)
+
+
+def _sumar(nombre, delta):
+    from .models import ContadorPlataforma
+
+    actualizados = ContadorPlataforma.objects.filter(nombre=nombre).update(valor=F('valor') + delta)
+    if actualizados:
+        return
+    # La fila aún no existe (base sin sembrar): se crea y se vuelve a intentar.
+    try:
+        with transaction.atomic():
+            ContadorPlataforma.objects.create(nombre=nombre, valor=delta)
+    except IntegrityError:
+        ContadorPlataforma.objects.filter(nombre=nombre).update(valor=F('valor') + delta)
+
+
+def fijar(nombre, valor):
+    """Guarda un valor absoluto (métricas tipo indicador, p. ej. el retraso del último lote)."""
+    from .models import ContadorPlataforma
+
+    ContadorPlataforma.objects.update_or_create(nombre=nombre, defaults={'valor': valor})
+
+
+def leer_contadores():
+    """
+    Todos los contadores con una sola consulta.
+
+    Returns:
+        dict: nombre -> Decimal (0 para los contadores que aún no existen)
+    """
+    from .models import ContadorPlataforma
+
+    valores = dict.fromkeys(CONTADORES, Decimal('0'))
+    valores.update(ContadorPlataforma.objects.values_list('nombre', 'valor'))
+    return valores
+
+
+def es_tipo_donacion(tipo_id):
+    from .tipos_transaccion import codigo_tipo
+
+    return codigo_tipo(tipo_id) == DONACION
+
+
+# ==============================================================================
+# RECONCILIACIÓN
+# ==============================================================================
+
+def calcular_valores_reales():
+    """Recalcula cada contador desde las tablas (consultas completas, solo para reconciliar)."""
+    from .models import ImpactoAmbiental, Prenda, TransaccionHistorica, Usuario
+
+    prendas = Prenda.objects.aggregate(
+        total=Count('pk'),
+        disponibles=Count('pk', filter=Q(estado='DISPONIBLE')),
+    )
+    # Incluye las archivadas: archivar no descuenta (ver archivo.py)
+    transacciones = TransaccionHistorica.objects.aggregate(
+        total=Count('pk'),
+        donaciones=Count('pk', filter=Q(tipo_codigo=DONACION)),
+    )
+    impacto = ImpactoAmbiental.objects.aggregate(
+        carbono=Sum('carbono_evitar_kg'),
+        energia=Sum('energia_ahorrada_kwh'),
+    )
+    return {
+        USUARIOS: Decimal(Usuario.objects.count()),
+        PRENDAS: Decimal(prendas['total']),
+        PRENDAS_DISPONIBLES: Decimal(prendas['disponibles']),
+        TRANSACCIONES: Decimal(transacciones['total']),
+        DONACIONES: Decimal(transacciones['donaciones']),
+        CARBONO_EVITADO_KG: impacto['carbono'] or Decimal('0'),
+        ENERGIA_AHORRADA_KWH: impacto['energia'] or Decimal('0'),
+    }
+
+
+def reconciliar(aplicar=True):
+    """
+    Compara los contadores con los valores reales y corrige las diferencias.
+
+    Args:
+        aplicar: Si es False solo informa, sin escribir
+
+    Returns:
+        dict: nombre -> (valor guardado, valor real) de los contadores desviados
+    """
+    from .models import ContadorPlataforma
+
+    with transaction.atomic():
+        # Bloquea las filas para que no se pierdan incrementos concurrentes al sobrescribir.
+        guardados = {
+            c.nombre: c for c in ContadorPlataforma.objects.select_for_update().filter(nombre__in=CONTADORES)
+        }
+        reales = calcular_valores_reales()
+
+        desvios = {}
+        for nombre, real in reales.items():
+            contador = guardados.get(nombre)
+            guardado = contador.valor if contador else None
+            if guardado == real:
+                continue
+            desvios[nombre] = (guardado, real)
+            if aplicar:
+                ContadorPlataforma.objects.update_or_create(nombre=nombre, defaults={'valor': real})
+
+    if desvios:
+        logger.warning(f"Contadores desviados{' (corregidos)' if aplicar else ''}: {desvios}")
+    return desvios
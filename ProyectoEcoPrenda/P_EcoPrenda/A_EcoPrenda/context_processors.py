@@ -0,0 +1,18 @@
+"""
+Context processors de A_EcoPrenda
+"""
+
+from . import conversaciones
+
+
+def mensajes_no_leidos(request):
+    """
+    Insignia de mensajes sin leer del usuario de la sesión.
+
+    Se entrega como callable: la plantilla lo evalúa solo si lo muestra, y el valor
+    sale de la caché (ver conversaciones.contar_no_leidos).
+    """
+    usuario = getattr(request, 'usuario_actual', None)
+    if usuario is None:
+        return {'mensajes_no_leidos': 0}
+    return {'mensajes_no_leidos': lambda: conversaciones.contar_no_leidos(usuario.pk)}
@@ -0,0 +1,409 @@
+"""
+Resumen de conversaciones (bandeja de entrada)
+Una fila de Conversacion por par de usuarios con el último mensaje y los no leídos de cada lado.
+
+- Cada mensaje nuevo actualiza su fila con una sola UPDATE: suma uno al contador del
+  receptor y reemplaza el último mensaje solo si el nuevo es más reciente (un mensaje
+  que llega tarde no pisa al último). Si la fila no existe se crea.
+- `enviar` crea el mensaje y actualiza el resumen en la misma transacción (el resumen
+  lo escribe el receptor post_save de Mensaje; los bulk_create llaman a `registrar_mensajes`).
+- `marcar_leidos` marca los mensajes con una sola UPDATE (por la clave del hilo) y
+  descuenta exactamente los marcados: un mensaje que llega entretanto sigue sin leer.
+- La insignia de no leídos de cada usuario vive en la caché (`contar_no_leidos`): los
+  mensajes nuevos y las lecturas la ajustan con incr/decr al confirmar la transacción;
+  si falta, se recalcula sumando los contadores de sus conversaciones (no un COUNT de
+  Mensaje). `reconciliar_no_leidos` corrige los contadores desde Mensaje.leido.
+- `registrar_difusion` (un mismo mensaje a muchos receptores, como los agradecimientos
+  masivos) actualiza las conversaciones por conjunto, no una UPDATE por par.
+- La bandeja se pagina por cursor sobre (fecha_ultimo_mensaje, id), un índice por lado
+  del par, combinados como en la línea de tiempo de transacciones.
+- Los mensajes de una conversación se leen por la clave del hilo (usuario_menor,
+  usuario_mayor) y su índice (hilo, fecha_envio, id): la página más reciente primero y,
+  con el cursor, las anteriores. Abrir un hilo largo cuesta lo mismo que uno corto.
+"""
+
+import logging
+from collections import defaultdict
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .linea_tiempo import LIMITE_MAXIMO, codificar_cursor, decodificar_cursor, ids_pagina
+from .models import Conversacion, Mensaje
+
+logger = logging.getLogger(__name__)
+
+
+CONVERSACIONES_POR_PAGINA = 20
+MENSAJES_POR_PAGINA = 30
+
+# Vida de la insignia en caché (segundos): acota cuánto dura un desvío entre reconciliaciones
+TIMEOUT_NO_LEIDOS = getattr(settings, 'CACHE_NO_LEIDOS_TIMEOUT', 15 * 60)
+LARGO_VISTA_PREVIA = 100
+
+
+def par(id_a, id_b):
+    """(menor, mayor) de dos ids de usuario."""
+    return (id_a, id_b) if id_a <= id_b else (id_b, id_a)
+
+
+def campo_no_leidos(id_usuario, menor):
+    """Contador de no leídos del lado de `id_usuario` en el par que empieza por `menor`."""
+    return 'no_leidos_menor' if id_usuario == menor else 'no_leidos_mayor'
+
+
+def _vista_previa(contenido):
+    contenido = ' '.join((contenido or '').split())
+    if len(contenido) <= LARGO_VISTA_PREVIA:
+        return contenido
+    return contenido[:LARGO_VISTA_PREVIA - 1] + '…'
+
+
+# ==============================================================================
+# ESCRITURA
+# ==============================================================================
+
+def _actualizar_par(menor, mayor, ultimo, no_leidos):
+    """
+    Una UPDATE sobre la fila del par.
+
+    Args:
+        ultimo: Mensaje más reciente del grupo
+        no_leidos: dict campo de no leídos -> cantidad a sumar
+
+    Returns:
+        int: filas actualizadas (0 si la conversación aún no existe)
+    """
+    fecha = ultimo.fecha_envio or timezone.now()
+    return Conversacion.objects.filter(usuario_menor_id=menor, usuario_mayor_id=mayor).update(
+        **_ultimo_mensaje(fecha, Value(ultimo.pk), ultimo.contenido),
+        **{campo: F(campo) + cantidad for campo, cantidad in no_leidos.items()},
+    )
+
+
+def _ultimo_mensaje(fecha, id_mensaje, contenido):
+    """Campos del último mensaje para una UPDATE: solo cambian si el mensaje no es más antiguo."""
+    mas_reciente = Q(fecha_ultimo_mensaje__lte=fecha)
+
+    def si_mas_reciente(valor, campo):
+        return Case(
+            When(mas_reciente, then=valor), default=F(campo),
+            output_field=Conversacion._meta.get_field(campo),
+        )
+
+    return {
+        'ultimo_mensaje': si_mas_reciente(id_mensaje, 'ultimo_mensaje'),
+        'vista_previa': si_mas_reciente(Value(_vista_previa(contenido)), 'vista_previa'),
+        'fecha_ultimo_mensaje': si_mas_reciente(Value(fecha), 'fecha_ultimo_mensaje'),
+    }
+
+
+def registrar_mensaje(mensaje):
+    """Refleja un mensaje recién creado en el resumen de su conversación."""
+    menor, mayor = par(mensaje.emisor_id, mensaje.receptor_id)
+    no_leidos = {campo_no_leidos(mensaje.receptor_id, menor): int(not mensaje.leido)}
+    if not mensaje.leido:
+        _ajustar_insignias({mensaje.receptor_id: 1})
+    if _actualizar_par(menor, mayor, mensaje, no_leidos):
+        return
+    try:
+        with transaction.atomic():
+            Conversacion.objects.create(
+                usuario_menor_id=menor, usuario_mayor_id=mayor, ultimo_mensaje=mensaje,
+                vista_previa=_vista_previa(mensaje.contenido),
+                fecha_ultimo_mensaje=mensaje.fecha_envio or timezone.now(), **no_leidos,
+            )
+    except IntegrityError:
+        # Otro mensaje del mismo par creó la fila entretanto
+        _actualizar_par(menor, mayor, mensaje, no_leidos)
+
+
+def registrar_mensajes(mensajes):
+    """Como registrar_mensaje para mensajes creados con bulk_create (una UPDATE por par)."""
+    grupos = defaultdict(list)
+    for mensaje in mensajes:
+        grupos[par(mensaje.emisor_id, mensaje.receptor_id)].append(mensaje)
+    if not grupos:
+        return
+
+    # Filas faltantes, con la fecha más antigua del grupo para que la UPDATE las complete
+    Conversacion.objects.bulk_create([
+        Conversacion(
+            usuario_menor_id=menor, usuario_mayor_id=mayor,
+            fecha_ultimo_mensaje=min(m.fecha_envio or timezone.now() for m in grupo),
+        )
+        for (menor, mayor), grupo in grupos.items()
+    ], ignore_conflicts=True)
+
+    for (menor, mayor), grupo in grupos.items():
+        ultimo = max(grupo, key=lambda m: (m.fecha_envio or timezone.now(), m.pk or 0))
+        no_leidos = defaultdict(int)
+        for mensaje in grupo:
+            no_leidos[campo_no_leidos(mensaje.receptor_id, menor)] += int(not mensaje.leido)
+        _actualizar_par(menor, mayor, ultimo, no_leidos)
+
+    por_receptor = defaultdict(int)
+    for mensaje in mensajes:
+        por_receptor[mensaje.receptor_id] += int(not mensaje.leido)
+    _ajustar_insignias(por_receptor)
+
+
+def registrar_difusion(id_emisor, mensajes):
+    """
+    Como registrar_mensajes para un mismo mensaje de `id_emisor` a muchos receptores
+    (mismo contenido y fecha, un receptor por mensaje, creados con bulk_create).
+
+    Las conversaciones se actualizan por conjunto: un INSERT de las filas faltantes y
+    una UPDATE por lado del par, sin importar cuántos receptores haya. Cada fila toma su
+    mensaje con una subconsulta sobre el índice del hilo.
+    """
+    if not mensajes:
+        return
+    fecha, contenido = mensajes[0].fecha_envio, mensajes[0].contenido
+    receptores = [m.receptor_id for m in mensajes]
+    Conversacion.objects.bulk_create([
+        Conversacion(
+            usuario_menor_id=min(id_emisor, receptor), usuario_mayor_id=max(id_emisor, receptor),
+            fecha_ultimo_mensaje=fecha,
+        )
+        for receptor in receptores
+    ], ignore_conflicts=True, batch_size=1000)
+
+    mensaje_del_par = Subquery(
+        Mensaje.objects.filter(
+            usuario_menor=OuterRef('usuario_menor'), usuario_mayor=OuterRef('usuario_mayor'),
+            fecha_envio=fecha, emisor_id=id_emisor,
+        ).order_by('-id').values('id')[:1]
+    )
+    campos = _ultimo_mensaje(fecha, mensaje_del_par, contenido)
+    # El emisor es el menor del par (el receptor lee del lado mayor) o al revés
+    Conversacion.objects.filter(usuario_menor_id=id_emisor, usuario_mayor_id__in=receptores).update(
+        no_leidos_mayor=F('no_leidos_mayor') + 1, **campos,
+    )
+    Conversacion.objects.filter(usuario_mayor_id=id_emisor, usuario_menor_id__in=receptores).update(
+        no_leidos_menor=F('no_leidos_menor') + 1, **campos,
+    )
+    # Una insignia por receptor: se descartan todas juntas y se recalculan al leerlas
+    transaction.on_commit(lambda: cache.delete_many([clave_no_leidos(receptor) for receptor in receptores]))
+
+
+def enviar(emisor, receptor, contenido):
+    """Crea un mensaje y actualiza su conversación de forma atómica."""
+    with transaction.atomic():
+        return Mensaje.objects.create(
+            emisor=emisor, receptor=receptor, contenido=contenido, fecha_envio=timezone.now(),
+        )
+
+
+def marcar_leidos(usuario, id_otro):
+    """
+    Marca como leídos los mensajes que `id_otro` envió a `usuario`.
+
+    Returns:
+        int: mensajes marcados
+    """
+    menor, mayor = par(usuario.pk, int(id_otro))
+    campo = campo_no_leidos(usuario.pk, menor)
+    with transaction.atomic():
+        marcados = Mensaje.objects.hilo(menor, mayor).filter(receptor=usuario, leido=False).update(leido=True)
+        if marcados:
+            Conversacion.objects.filter(usuario_menor_id=menor, usuario_mayor_id=mayor).update(
+                **{campo: Greatest(F(campo) - marcados, 0)}
+            )
+            _ajustar_insignias({usuario.pk: -marcados})
+    return marcados
+
+
+def marcar_todos_leidos(usuario):
+    """
+    Marca como leídos todos los mensajes recibidos por el usuario (una UPDATE de
+    Mensaje y una por lado de sus conversaciones).
+
+    Returns:
+        int: mensajes marcados
+    """
+    with transaction.atomic():
+        marcados = Mensaje.objects.filter(receptor=usuario, leido=False).update(leido=True)
+        Conversacion.objects.filter(usuario_menor=usuario, no_leidos_menor__gt=0).update(no_leidos_menor=0)
+        Conversacion.objects.filter(usuario_mayor=usuario, no_leidos_mayor__gt=0).exclude(
+            usuario_menor=usuario
+        ).update(no_leidos_mayor=0)
+        transaction.on_commit(lambda: cache.set(clave_no_leidos(usuario.pk), 0, TIMEOUT_NO_LEIDOS))
+    return marcados
+
+
+# ==============================================================================
+# INSIGNIA DE NO LEÍDOS
+# ==============================================================================
+
+def clave_no_leidos(id_usuario):
+    return f'no_leidos:{id_usuario}'
+
+
+def no_leidos_en_db(id_usuario):
+    """Mensajes sin leer del usuario, sumando los contadores de sus conversaciones."""
+    menor = Conversacion.objects.filter(usuario_menor_id=id_usuario).aggregate(n=Sum('no_leidos_menor'))['n']
+    mayor = Conversacion.objects.filter(usuario_mayor_id=id_usuario).exclude(
+        usuario_menor_id=id_usuario
+    ).aggregate(n=Sum('no_leidos_mayor'))['n']
+    return (menor or 0) + (mayor or 0)
+
+
+def contar_no_leidos(id_usuario):
+    """Insignia de no leídos del usuario: de la caché, o de la base de datos si falta."""
+    clave = clave_no_leidos(id_usuario)
+    valor = cache.get(clave)
+    if valor is None:
+        valor = no_leidos_en_db(id_usuario)
+        # add: no pisa el valor que otra petición ya cargó (y quizá ajustó)
+        cache.add(clave, valor, TIMEOUT_NO_LEIDOS)
+    return max(0, valor)
+
+
+def _ajustar_insignias(cambios):
+    """Suma `cambios` (id de usuario -> delta) a las insignias en caché al confirmar."""
+    cambios = {id_usuario: delta for id_usuario, delta in cambios.items() if delta}
+    if not cambios:
+        return
+
+    def ajustar():
+        for id_usuario, delta in cambios.items():
+            try:
+                cache.incr(clave_no_leidos(id_usuario), delta)
+            except ValueError:
+                # Sin valor en caché: la próxima lectura lo calcula desde la base de datos
+                pass
+
+    transaction.on_commit(ajustar)
+
+
+def reconciliar_no_leidos(aplicar=True):
+    """
+    Recalcula los no leídos de cada conversación desde Mensaje.leido y corrige los desvíos.
+
+    Las insignias en caché de los usuarios afectados se descartan (se recalculan al leerlas).
+
+    Args:
+        aplicar: Si es False solo informa, sin escribir
+
+    Returns:
+        dict: (menor, mayor) -> ((no_leidos_menor, no_leidos_mayor) guardados, reales)
+    """
+    reales = defaultdict(int)
+    pendientes = Mensaje.objects.filter(leido=False).order_by().values(
+        'usuario_menor', 'usuario_mayor', 'receptor'
+    ).annotate(n=Count('id'))
+    for fila in pendientes:
+        reales[(fila['usuario_menor'], fila['usuario_mayor'], fila['receptor'])] = fila['n']
+
+    desvios, corregidas = {}, []
+    filas = Conversacion.objects.only('usuario_menor', 'usuario_mayor', 'no_leidos_menor', 'no_leidos_mayor')
+    for conversacion in filas.iterator(chunk_size=2000):
+        menor, mayor = conversacion.usuario_menor_id, conversacion.usuario_mayor_id
+        real = (reales[(menor, mayor, menor)], reales[(menor, mayor, mayor)] if menor != mayor else 0)
+        guardado = (conversacion.no_leidos_menor, conversacion.no_leidos_mayor)
+        if guardado == real:
+            continue
+        desvios[(menor, mayor)] = (guardado, real)
+        conversacion.no_leidos_menor, conversacion.no_leidos_mayor = real
+        corregidas.append(conversacion)
+
+    if aplicar and corregidas:
+        with transaction.atomic():
+            Conversacion.objects.bulk_update(corregidas, ['no_leidos_menor', 'no_leidos_mayor'], batch_size=1000)
+        cache.delete_many([clave_no_leidos(pk) for par_usuarios in desvios for pk in par_usuarios])
+    if desvios:
+        logger.warning(f"Conversaciones con no leídos desviados{' (corregidas)' if aplicar else ''}: {len(desvios)}")
+    return desvios
+
+
+# ==============================================================================
+# BANDEJA
+# ==============================================================================
+
+def bandeja(usuario, cursor=None, limite=CONVERSACIONES_POR_PAGINA):
+    """
+    Una página de las conversaciones del usuario, la de actividad más reciente primero.
+
+    Cada Conversacion lleva `otro` (el otro usuario) y `no_leidos` (los del usuario).
+
+    Returns:
+        tuple: (lista de Conversacion, cursor de la página siguiente o None)
+
+    Raises:
+        CursorInvalido: Si el cursor está mal formado
+    """
+    limite = max(1, min(int(limite), LIMITE_MAXIMO))
+    lados = [
+        Conversacion.objects.filter(usuario_menor=usuario),
+        Conversacion.objects.filter(usuario_mayor=usuario).exclude(usuario_menor=usuario),
+    ]
+    if cursor:
+        fecha, pk = decodificar_cursor(cursor)
+        antes = Q(fecha_ultimo_mensaje__lt=fecha) | Q(fecha_ultimo_mensaje=fecha, id__lt=pk)
+        lados = [lado.filter(antes, fecha_ultimo_mensaje__lte=fecha) for lado in lados]
+
+    ids = ids_pagina(lados, limite, 'fecha_ultimo_mensaje')
+    hay_mas = len(ids) > limite
+    ids = ids[:limite]
+
+    por_id = Conversacion.objects.select_related('usuario_menor', 'usuario_mayor').in_bulk(ids)
+    conversaciones = [por_id[pk] for pk in ids if pk in por_id]
+    for conversacion in conversaciones:
+        es_menor = conversacion.usuario_menor_id == usuario.pk
+        conversacion.otro = conversacion.usuario_mayor if es_menor else conversacion.usuario_menor
+        conversacion.no_leidos = conversacion.no_leidos_menor if es_menor else conversacion.no_leidos_mayor
+
+    siguiente = None
+    if hay_mas and conversaciones:
+        siguiente = codificar_cursor(conversaciones[-1], 'fecha_ultimo_mensaje')
+    return conversaciones, siguiente
+
+
+# ==============================================================================
+# HILO
+# ==============================================================================
+
+def mensajes_hilo(id_a, id_b, cursor=None, limite=MENSAJES_POR_PAGINA):
+    """
+    Una página de los mensajes entre dos usuarios, en orden cronológico.
+
+    La primera página trae los más recientes; el cursor devuelto pide los anteriores.
+    Los mensajes sin fecha no tienen posición en el orden y no se listan.
+
+    Args:
+        id_a, id_b: Ids de los dos usuarios (en cualquier orden)
+        cursor: Cursor devuelto por la página anterior (None para la más reciente)
+        limite: Mensajes por página (se acota a LIMITE_MAXIMO)
+
+    Returns:
+        tuple: (lista de Mensaje con su emisor, cursor de los mensajes anteriores o None)
+
+    Raises:
+        CursorInvalido: Si el cursor está mal formado
+    """
+    limite = max(1, min(int(limite), LIMITE_MAXIMO))
+    consulta = Mensaje.objects.hilo(id_a, id_b).filter(fecha_envio__isnull=False)
+    if cursor:
+        fecha, pk = decodificar_cursor(cursor)
+        antes = Q(fecha_envio__lt=fecha) | Q(fecha_envio=fecha, id__lt=pk)
+        consulta = consulta.filter(antes, fecha_envio__lte=fecha)
+
+    mensajes = list(consulta.select_related('emisor').order_by('-fecha_envio', '-id')[:limite + 1])
+    anteriores = codificar_cursor(mensajes[limite - 1], 'fecha_envio') if len(mensajes) > limite else None
+    mensajes = mensajes[:limite]
+    mensajes.reverse()
+    return mensajes, anteriores
+
+
+def cursor_hasta(mensaje):
+    """Cursor de la página de su conversación que termina en `mensaje` (para mostrarlo en contexto)."""
+    if mensaje.fecha_envio is None:
+        return None
+    # mensajes_hilo devuelve los anteriores al cursor: uno "justo después" incluye al mensaje
+    return codificar_cursor(SimpleNamespace(fecha_envio=mensaje.fecha_envio, pk=mensaje.pk + 1), 'fecha_envio')
@@ -0,0 +1,130 @@
+"""
+Adaptadores de couriers para el seguimiento de envíos
+Interfaz común para consultar el estado de un código de seguimiento en cada courier.
+
+- Cada courier se implementa como subclase de AdaptadorCourier con `consultar` asíncrono
+  y se registra con @registrar_courier; se busca por el nombre guardado en
+  Transaccion.courier (sin distinguir mayúsculas).
+- Cada adaptador declara sus límites: consultas por segundo y consultas simultáneas.
+  El poller (seguimiento.py) los respeta con un LimitadorTasa y un semáforo por courier.
+- CourierFalso responde desde memoria con una latencia configurable; sirve para
+  probar el poller sin salir a la red. No queda registrado: quien lo usa lo registra
+  (y lo quita al terminar), para que el poller nunca complete o cancele transacciones
+  reales que digan courier 'falso'.
+"""
+
+import asyncio
+from collections import namedtuple
+
+
+# Estados normalizados que devuelve un adaptador
+EN_TRANSITO = 'EN_TRANSITO'
+ENTREGADO = 'ENTREGADO'
+DEVUELTO = 'DEVUELTO'
+DESCONOCIDO = 'DESCONOCIDO'
+
+EstadoEnvio = namedtuple('EstadoEnvio', ['codigo', 'estado', 'detalle'], defaults=[''])
+
+
+class ErrorCourier(Exception):
+    """El courier no pudo responder (caído, límite excedido, respuesta inválida)."""
+
+
+# ==============================================================================
+# INTERFAZ
+# ==============================================================================
+
+class AdaptadorCourier:
+    """Base de los adaptadores: el poller crea una instancia por courier y por lote."""
+
+    nombre = None
+    max_por_segundo = 10
+    max_concurrentes = 5
+    timeout_segundos = 10
+
+    async def consultar(self, codigo):
+        """
+        Estado actual de un envío.
+
+        Returns:
+            EstadoEnvio
+
+        Raises:
+            ErrorCourier: Si el courier no pudo responder
+        """
+        raise NotImplementedError
+
+    async def cerrar(self):
+        """Libera conexiones abiertas al terminar la pasada."""
+
+
+ADAPTADORES = {}
+
+
+def registrar_courier(clase):
+    ADAPTADORES[clase.nombre.lower()] = clase
+    return clase
+
+
+def quitar_courier(clase):
+    ADAPTADORES.pop(clase.nombre.lower(), None)
+
+
+def obtener_adaptador(nombre_courier):
+    """Clase del adaptador para el nombre guardado en la transacción (None si no hay)."""
+    return ADAPTADORES.get((nombre_courier or '').strip().lower())
+
+
+# ==============================================================================
+# LÍMITE DE TASA
+# ==============================================================================
+
+class LimitadorTasa:
+    """
+    Espacia uniformemente las consultas a un courier (`por_segundo`).
+
+    No guarda objetos de asyncio, así que sirve entre varias pasadas del event loop;
+    el tope de consultas simultáneas lo aplica el poller con un semáforo por lote.
+    """
+
+    def __init__(self, por_segundo):
+        self.intervalo = 1 / por_segundo
+        self.proximo = 0.0
+
+    async def esperar_turno(self):
+        # Se reserva el siguiente hueco libre antes de dormir: las demás consultas siguen en fila
+        ahora = asyncio.get_running_loop().time()
+        turno = max(ahora, self.proximo)
+        self.proximo = turno + self.intervalo
+        if turno > ahora:
+            await asyncio.sleep(turno - ahora)
+
+
+# ==============================================================================
+# COURIER FALSO
+# ==============================================================================
+
+class CourierFalso(AdaptadorCourier):
+    """
+    Courier en memoria para pruebas (registrarlo con registrar_courier antes de usarlo).
+
+    Los estados se fijan en `CourierFalso.estados` (código -> estado); sin entrada, un
+    código que empieza con 'ENT' se da por entregado, 'DEV' por devuelto, 'ERR' falla y
+    el resto sigue en tránsito.
+    """
+
+    nombre = 'falso'
+    max_por_segundo = 2000
+    max_concurrentes = 200
+    latencia_segundos = 0.05
+    estados = {}
+
+    async def consultar(self, codigo):
+        await asyncio.sleep(self.latencia_segundos)
+        estado = self.estados.get(codigo)
+        if estado is None:
+            if codigo.startswith('ERR'):
+                raise ErrorCourier(f'Courier falso: error simulado para {codigo}')
+            prefijos = {'ENT': ENTREGADO, 'DEV': DEVUELTO}
+            estado = prefijos.get(codigo[:3], EN_TRANSITO)
+        return EstadoEnvio(codigo, estado)
@@ -0,0 +1,110 @@
+"""
+Cola de disputas para moderadores
+Disputas abiertas de la más antigua a la más reciente, y la evidencia (mensajes entre
+las partes) cargada por páginas.
+
+- La cola lee el índice parcial (fecha_disputa, id) WHERE en_disputa: solo contiene las
+  disputas abiertas, así que recorrerlo no depende del tamaño de la tabla de transacciones.
+- Ambas listas se paginan por cursor (keyset) con el mismo formato opaco que la línea de
+  tiempo; las partes de cada disputa llegan en la misma consulta (select_related).
+- La evidencia se limita a la ventana de la transacción: desde su creación hasta la
+  entrega (o hasta ahora si sigue abierta), leída por la clave del hilo del par.
+"""
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .linea_tiempo import codificar_cursor, decodificar_cursor
+from .models import Mensaje, Transaccion
+
+
+DISPUTAS_POR_PAGINA = 20
+MENSAJES_POR_PAGINA = 30
+LIMITE_MAXIMO = 100
+
+_PARTES = ('prenda', 'user_origen', 'user_destino', 'reportado_por', 'fundacion')
+
+
+def _acotar(limite, por_defecto):
+    try:
+        return max(1, min(int(limite), LIMITE_MAXIMO))
+    except (TypeError, ValueError):
+        return por_defecto
+
+
+def _despues_de(cursor, campo):
+    """Filtro de las filas posteriores al cursor en orden ascendente (campo, id)."""
+    fecha, pk = decodificar_cursor(cursor)
+    return Q(**{f'{campo}__gt': fecha}) | Q(**{campo: fecha, 'id__gt': pk})
+
+
+# ==============================================================================
+# COLA
+# ==============================================================================
+
+def disputas_abiertas():
+    return Transaccion.objects.filter(en_disputa=True)
+
+
+def cola_disputas(cursor=None, limite=DISPUTAS_POR_PAGINA):
+    """
+    Una página de la cola de disputas abiertas, las más antiguas primero.
+
+    Args:
+        cursor: Cursor devuelto por la página anterior (None para la primera)
+        limite: Disputas por página (se acota a LIMITE_MAXIMO)
+
+    Returns:
+        tuple: (lista de Transaccion con sus partes cargadas, cursor siguiente o None)
+
+    Raises:
+        CursorInvalido: Si el cursor está mal formado
+    """
+    limite = _acotar(limite, DISPUTAS_POR_PAGINA)
+    consulta = disputas_abiertas().select_related(*_PARTES).order_by('fecha_disputa', 'id')
+    if cursor:
+        consulta = consulta.filter(_despues_de(cursor, 'fecha_disputa'))
+
+    disputas = list(consulta[:limite + 1])
+    siguiente = codificar_cursor(disputas[limite - 1], 'fecha_disputa') if len(disputas) > limite else None
+    return disputas[:limite], siguiente
+
+
+# ==============================================================================
+# EVIDENCIA
+# ==============================================================================
+
+def ventana_evidencia(transaccion):
+    """(desde, hasta) de los mensajes que sirven como evidencia de la transacción."""
+    return transaccion.fecha_transaccion, transaccion.fecha_entrega or timezone.now()
+
+
+def evidencia_disputa(transaccion, cursor=None, limite=MENSAJES_POR_PAGINA):
+    """
+    Una página de los mensajes entre las partes dentro de la ventana de la transacción.
+
+    Returns:
+        tuple: (lista de Mensaje en orden cronológico, cursor siguiente o None)
+
+    Raises:
+        CursorInvalido: Si el cursor está mal formado
+    """
+    limite = _acotar(limite, MENSAJES_POR_PAGINA)
+    origen, destino = transaccion.user_origen_id, transaccion.user_destino_id
+    if not origen or not destino:
+        return [], None
+
+    desde, hasta = ventana_evidencia(transaccion)
+    filtros = Q(fecha_envio__lte=hasta)
+    if desde:
+        filtros &= Q(fecha_envio__gte=desde)
+    if cursor:
+        filtros &= _despues_de(cursor, 'fecha_envio')
+
+    mensajes = list(
+        Mensaje.objects.hilo(origen, destino).filter(filtros)
+        .select_related('emisor').order_by('fecha_envio', 'id')[:limite + 1]
+    )
+
+    siguiente = codificar_cursor(mensajes[limite - 1], 'fecha_envio') if len(mensajes) > limite else None
+    return mensajes[:limite], siguiente
@@ -0,0 +1,227 @@
+"""
+Outbox de eventos de transacciones
+Los efectos secundarios de un cambio de estado se despachan fuera de la petición.
+
+- Cada cambio de estado (transiciones.py y la creación de la transacción) inserta un
+  EventoTransaccion en la misma transacción de base de datos: si el cambio se revierte,
+  el evento también, y si se confirma, el evento queda garantizado.
+- `procesar_lote` reclama eventos con un UPDATE condicional (sin SELECT ... FOR UPDATE): varios
+  trabajadores pueden drenar la tabla a la vez sin despachar dos veces el mismo evento.
+  Un reclamo vence tras PLAZO_RECLAMO, así que un trabajador caído no deja eventos colgados.
+- Los consumidores reciben todos los eventos del lote que les interesan. Su trabajo y la
+  marca de "completado" se confirman juntos, así que un reintento no repite lo ya hecho.
+- Antes de consumir se renueva el reclamo con un UPDATE condicional en la misma transacción:
+  si venció y otro trabajador tomó los eventos, no se hace nada; si sigue vigente, las filas
+  quedan bloqueadas hasta confirmar y nadie puede reclamarlas a mitad del consumo.
+- Si un consumidor falla, el evento se reintenta con espera exponencial; tras
+  MAX_INTENTOS queda FALLIDO para revisarlo a mano.
+"""
+
+import logging
+import uuid
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import panel_negociacion
+from .conversaciones import registrar_mensajes
+from .models import EventoTransaccion, Mensaje, Transaccion
+from .tipos_transaccion import DONACION
+
+logger = logging.getLogger(__name__)
+
+PLAZO_RECLAMO = timedelta(minutes=5)
+MAX_INTENTOS = 8
+ESPERA_BASE_SEGUNDOS = 30
+ESPERA_MAXIMA_SEGUNDOS = 3600
+
+
+class ReclamoVencido(Exception):
+    """Otro trabajador reclamó los eventos (el reclamo propio venció): se dejan sin consumir."""
+
+
+# ==============================================================================
+# PUBLICACIÓN
+# ==============================================================================
+
+def publicar(transaccion, estado_anterior, estado_nuevo):
+    """Inserta el evento de un cambio de estado (llamar dentro de la transacción del cambio)."""
+    return EventoTransaccion.objects.create(
+        transaccion_id=transaccion.pk, estado_anterior=estado_anterior, estado_nuevo=estado_nuevo,
+    )
+
+
+def publicar_lote(transacciones, estado_nuevo):
+    """Un solo INSERT para un lote; `transacciones` aún tienen su estado anterior."""
+    EventoTransaccion.objects.bulk_create([
+        EventoTransaccion(transaccion_id=t.pk, estado_anterior=t.estado, estado_nuevo=estado_nuevo)
+        for t in transacciones
+    ])
+
+
+# ==============================================================================
+# CONSUMIDORES
+# ==============================================================================
+
+# funcion(eventos): procesa una lista de EventoTransaccion (con su transacción cargada)
+Consumidor = namedtuple('Consumidor', ['funcion', 'estados'])
+
+CONSUMIDORES = {}
+
+
+def consumidor(nombre, estados=None):
+    """
+    Registra un consumidor de eventos.
+
+    Args:
+        nombre: Identificador estable (se guarda en consumidores_completados)
+        estados: Estados nuevos que le interesan (None para todos)
+    """
+    def registrar(funcion):
+        CONSUMIDORES[nombre] = Consumidor(funcion, tuple(estados) if estados else None)
+        return funcion
+    return registrar
+
+
+def _le_interesa(nombre, consumidor_, evento):
+    if nombre in evento.consumidores_completados:
+        return False
+    return consumidor_.estados is None or evento.estado_nuevo in consumidor_.estados
+
+
+def _consumir(nombre, funcion, eventos, marca):
+    """
+    Ejecuta el consumidor y marca los eventos como completados para él, todo junto.
+
+    Raises:
+        ReclamoVencido: si alguno de los eventos ya no está reclamado con `marca` (nada se confirma)
+    """
+    with transaction.atomic():
+        vigentes = EventoTransaccion.objects.filter(
+            pk__in=[e.pk for e in eventos], reclamado_por=marca
+        ).update(disponible_desde=timezone.now() + PLAZO_RECLAMO)
+        if vigentes != len(eventos):
+            raise ReclamoVencido(f'Eventos de {nombre} ya no reclamados por {marca}')
+        funcion(eventos)
+        for evento in eventos:
+            evento.consumidores_completados = [*evento.consumidores_completados, nombre]
+        EventoTransaccion.objects.bulk_update(eventos, ['consumidores_completados'])
+
+
+# ==============================================================================
+# DESPACHO
+# ==============================================================================
+
+def reclamar(tamano_lote):
+    """
+    Reclama hasta `tamano_lote` eventos disponibles para este trabajador.
+
+    Returns:
+        tuple: (marca del reclamo, lista de EventoTransaccion reclamados)
+    """
+    ahora = timezone.now()
+    marca = uuid.uuid4().hex
+    disponibles = EventoTransaccion.objects.filter(estado='PENDIENTE', disponible_desde__lte=ahora)
+    ids = list(disponibles.order_by('disponible_desde', 'id').values_list('pk', flat=True)[:tamano_lote])
+    if not ids:
+        return marca, []
+    # Solo se toman los que siguen disponibles: otro trabajador pudo reclamarlos entretanto
+    disponibles.filter(pk__in=ids).update(reclamado_por=marca, disponible_desde=ahora + PLAZO_RECLAMO)
+    eventos = EventoTransaccion.objects.filter(reclamado_por=marca).select_related('transaccion').order_by('id')
+    return marca, list(eventos)
+
+
+def _espera(intentos):
+    return timedelta(seconds=min(ESPERA_BASE_SEGUNDOS * 2 ** (intentos - 1), ESPERA_MAXIMA_SEGUNDOS))
+
+
+def procesar_lote(tamano_lote=100):
+    """
+    Reclama un lote de eventos y lo despacha a los consumidores registrados.
+
+    Returns:
+        dict: reclamados, procesados, reintentos y fallidos (los que otro trabajador reclamó
+        entretanto no cuentan como procesados)
+    """
+    marca, eventos = reclamar(tamano_lote)
+    errores, perdidos = {}, set()
+    for nombre, consumidor_ in CONSUMIDORES.items():
+        pendientes = [
+            e for e in eventos
+            if e.pk not in errores and e.pk not in perdidos and _le_interesa(nombre, consumidor_, e)
+        ]
+        if not pendientes:
+            continue
+        try:
+            _consumir(nombre, consumidor_.funcion, pendientes, marca)
+        except Exception:
+            # Se aísla el evento que falla (o cuyo reclamo venció): los demás siguen adelante
+            for evento in pendientes:
+                try:
+                    _consumir(nombre, consumidor_.funcion, [evento], marca)
+                except ReclamoVencido:
+                    # Ahora es de otro trabajador, que lo consumirá
+                    perdidos.add(evento.pk)
+                except Exception as e:
+                    logger.error(f"Consumidor {nombre} falló con el evento {evento.pk}: {e}")
+                    errores[evento.pk] = f'{nombre}: {e}'
+    if perdidos:
+        logger.warning(f"Eventos reclamados por otro trabajador antes de consumirlos: {len(perdidos)}")
+
+    ahora = timezone.now()
+    terminados = [e.pk for e in eventos if e.pk not in errores and e.pk not in perdidos]
+    procesados = EventoTransaccion.objects.filter(pk__in=terminados, reclamado_por=marca).update(
+        estado='PROCESADO', fecha_procesado=ahora, reclamado_por=None, ultimo_error=None,
+    )
+    reintentos = fallidos = 0
+    for evento in eventos:
+        if evento.pk not in errores:
+            continue
+        intentos = evento.intentos + 1
+        agotado = intentos >= MAX_INTENTOS
+        reintentos += not agotado
+        fallidos += agotado
+        EventoTransaccion.objects.filter(pk=evento.pk, reclamado_por=marca).update(
+            estado='FALLIDO' if agotado else 'PENDIENTE', intentos=intentos, reclamado_por=None,
+            disponible_desde=ahora + _espera(intentos), ultimo_error=errores[evento.pk],
+        )
+
+    return {'reclamados': len(eventos), 'procesados': procesados, 'reintentos': reintentos, 'fallidos': fallidos}
+
+
+# ==============================================================================
+# CONSUMIDORES DE LA APLICACIÓN
+# ==============================================================================
+
+@consumidor('logros', estados=['COMPLETADA'])
+def otorgar_logros_completadas(eventos):
+    """Evalúa los logros de ambas partes de las transacciones completadas (una pasada por lote)."""
+    from .logros import otorgar_logros
+
+    ids_usuario = set()
+    for evento in eventos:
+        ids_usuario.update(filter(None, (evento.transaccion.user_origen_id, evento.transaccion.user_destino_id)))
+    otorgar_logros(ids_usuario)
+
+
+@consumidor('agradecimiento_donacion', estados=['COMPLETADA'])
+def agradecer_donaciones(eventos):
+    """Mensaje del representante de la fundación a cada donante cuya donación se recibió."""
+    ids = [e.transaccion_id for e in eventos if e.transaccion.tipo_codigo == DONACION and e.transaccion.fundacion_id]
+    donaciones = Transaccion.objects.filter(
+        pk__in=ids, fundacion__representante__isnull=False
+    ).select_related('prenda', 'fundacion')
+    ahora = timezone.now()
+    mensajes = Mensaje.objects.bulk_create([
+        Mensaje(
+            emisor_id=d.fundacion.representante_id,
+            receptor_id=d.user_origen_id,
+            contenido=f"Gracias por tu donación de {d.prenda.nombre}! Tu prenda ha sido recibida y será destinada a {d.fundacion.nombre}.",
+            fecha_envio=ahora,
+        )
+        for d in donaciones
+    ])
+    registrar_mensajes(mensajes)
+    panel_negociacion.invalidar_usuarios(pk for m in mensajes for pk in (m.emisor_id, m.receptor_id))
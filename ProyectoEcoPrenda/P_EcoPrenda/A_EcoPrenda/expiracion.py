@@ -0,0 +1,99 @@
+"""
+Expiración de transacciones sin avance
+Cancela las transacciones que llevan demasiado tiempo sin entregarse y libera sus prendas.
+
+- El plazo de cada estado se configura en TRANSACCIONES_EXPIRACION_HORAS.
+- Los candidatos se buscan por el índice (estado, fecha_transaccion), los más antiguos
+  primero y en lotes acotados.
+- Cada lote se cancela con aplicar_transicion_lote: UPDATE condicionado a la versión
+  leída, así que una transacción aceptada o enviada entretanto no se toca.
+- Métricas (tabla de contadores): total expiradas, tamaño del último lote y retraso,
+  en segundos, de la transacción vencida más antigua que sigue pendiente.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Min
+from django.utils import timezone
+
+from . import contadores
+from .models import Transaccion
+from .transiciones import aplicar_transicion_lote
+
+logger = logging.getLogger(__name__)
+
+# Plazos por defecto (horas desde fecha_transaccion)
+PLAZOS_HORAS = getattr(settings, 'TRANSACCIONES_EXPIRACION_HORAS', {
+    'PENDIENTE': 72,
+    'ACEPTADA': 168,
+    'RESERVADA': 168,
+})
+
+# Nombres de las métricas en ContadorPlataforma
+EXPIRADAS = 'transacciones_expiradas'
+ULTIMO_LOTE = 'expiracion_ultimo_lote'
+RETRASO_SEGUNDOS = 'expiracion_retraso_segundos'
+
+
+def _limites(ahora):
+    """estado -> fecha_transaccion a partir de la cual aún no vence."""
+    return {estado: ahora - timedelta(hours=horas) for estado, horas in PLAZOS_HORAS.items()}
+
+
+def buscar_vencidas(ahora, tamano_lote):
+    """Hasta `tamano_lote` transacciones vencidas, las más antiguas de cada estado primero."""
+    vencidas = []
+    for estado, limite in _limites(ahora).items():
+        restantes = tamano_lote - len(vencidas)
+        if restantes <= 0:
+            break
+        vencidas += list(
+            Transaccion.objects.filter(estado=estado, fecha_transaccion__lt=limite)
+            .order_by('fecha_transaccion')
+            .only('estado', 'version', 'prenda', 'fecha_transaccion')[:restantes]
+        )
+    return vencidas
+
+
+def retraso_segundos(ahora):
+    """Cuánto hace que venció la transacción vencida más antigua aún sin expirar (0 si no hay)."""
+    retraso = 0
+    for estado, limite in _limites(ahora).items():
+        mas_antigua = Transaccion.objects.filter(
+            estado=estado, fecha_transaccion__lt=limite
+        ).aggregate(fecha=Min('fecha_transaccion'))['fecha']
+        if mas_antigua is not None:
+            retraso = max(retraso, (limite - mas_antigua).total_seconds())
+    return int(retraso)
+
+
+def expirar_lote(tamano_lote=500, ahora=None):
+    """
+    Cancela un lote de transacciones vencidas y registra las métricas.
+
+    Args:
+        tamano_lote: Máximo de transacciones a cancelar
+        ahora: Momento de referencia (por defecto, timezone.now())
+
+    Returns:
+        dict: encontradas, expiradas, fallidas (cambiaron entretanto) y retraso_segundos
+    """
+    ahora = ahora or timezone.now()
+    vencidas = buscar_vencidas(ahora, tamano_lote)
+    expiradas, fallidas = aplicar_transicion_lote(vencidas, 'cancelar') if vencidas else ([], {})
+
+    retraso = retraso_segundos(ahora)
+    contadores.incrementar(EXPIRADAS, len(expiradas))
+    contadores.fijar(ULTIMO_LOTE, len(expiradas))
+    contadores.fijar(RETRASO_SEGUNDOS, retraso)
+    if expiradas or fallidas:
+        logger.info(f"Expiración: {len(expiradas)} canceladas, {len(fallidas)} cambiaron entretanto, retraso {retraso}s")
+
+    return {
+        'encontradas': len(vencidas),
+        'expiradas': len(expiradas),
+        'fallidas': len(fallidas),
+        'retraso_segundos': retraso,
+    }
@@ -0,0 +1,509 @@
+"""
+Índice invertido en memoria para la búsqueda de prendas
+Backend opcional (puro Python) para despliegues sin búsqueda de texto completo en la base de datos.
+
+- Indexa `nombre`, `descripcion` y `categoria` con plegado de tildes y stemming liviano en español.
+- Cada término apunta a un arreglo ordenado de ids de prenda (array('I'), 4 bytes por id).
+- La disponibilidad se guarda en un bitset (1 bit por id de prenda).
+- Se construye al iniciar desde un snapshot en disco y se mantiene al día con señales de Prenda,
+  aplicadas al confirmar la transacción (un cambio revertido nunca llega al índice).
+- Guarda la versión de cada prenda y el sello de versión de la tabla (version:prenda) con que
+  se sincronizó. Un cambio local aplicado al confirmar adelanta el sello si nadie más escribió.
+  Si el sello cambió (p. ej. escribió otro proceso), el siguiente uso lee solo las prendas
+  modificadas desde la última sincronización (Prenda.modificada, indexada) y reindexa las
+  que tienen otra versión. Cada INTERVALO_COMPLETA segundos, y al cargar un snapshot, la
+  sincronización recorre la tabla entera para quitar también las prendas borradas por otros
+  procesos (mientras tanto, buscar_ids las descarta al filtrar en la base de datos).
+"""
+
+import logging
+import os
+import pickle
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Las prendas se releen desde `marca - MARGEN_DELTA`: cubre las escrituras que se confirman
+# después de sincronizar con una marca anterior (transacciones largas, relojes de otro servidor)
+MARGEN_DELTA = timedelta(minutes=5)
+INTERVALO_COMPLETA = 3600  # Segundos entre recorridos completos de la tabla
+
+
+# ==============================================================================
+# NORMALIZACIÓN DE TEXTO
+# ==============================================================================
+
+PALABRAS_VACIAS = {
+    'de', 'del', 'la', 'las', 'el', 'los', 'un', 'una', 'unos', 'unas',
+    'y', 'e', 'o', 'u', 'en', 'con', 'sin', 'para', 'por', 'al', 'a', 'que',
+}
+
+_RE_TOKEN = re.compile(r'[a-z0-9]+')
+
+
+def plegar_tildes(texto):
+    """Convierte a minúsculas y elimina tildes/diacríticos ('Pantalón' -> 'pantalon')."""
+    descompuesto = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def raiz(token):
+    """
+    Stemming liviano para español: quita plurales y la vocal final de género.
+
+    'camisetas' -> 'camiset', 'pantalones' -> 'pantalon', 'luces' -> 'luz'
+    """
+    if len(token) <= 3:
+        return token
+    if token.endswith('ces') and len(token) > 4:
+        token = token[:-3] + 'z'
+    elif token.endswith('es') and len(token) > 4 and token[-3] not in 'aeiou':
+        token = token[:-2]
+    elif token.endswith('s') and token[-2] in 'aeiou':
+        token = token[:-1]
+    if len(token) > 4 and token[-1] in 'aeo':
+        token = token[:-1]
+    return token
+
+
+def tokenizar(texto):
+    """Lista de raíces de un texto, sin palabras vacías."""
+    if not texto:
+        return []
+    return [raiz(t) for t in _RE_TOKEN.findall(plegar_tildes(texto)) if t not in PALABRAS_VACIAS]
+
+
+def texto_prenda(prenda):
+    """Texto indexable de una prenda."""
+    return ' '.join(filter(None, [prenda.nombre, prenda.descripcion, prenda.categoria]))
+
+
+# ==============================================================================
+# ÍNDICE INVERTIDO
+# ==============================================================================
+
+class IndiceInvertido:
+    """
+    Índice invertido compacto: término -> array('I') ordenado de ids de prenda.
+
+    Además guarda, por documento, los ids de sus términos (para poder quitarlo o
+    reindexarlo sin volver a leer el texto antiguo), su versión de fila y un bitset
+    de disponibilidad.
+    """
+
+    def __init__(self):
+        self._terminos = {}      # término -> id de término
+        self._postings = []      # id de término -> array('I') de ids de prenda (ordenado)
+        self._documentos = {}    # id de prenda -> array('I') de ids de término
+        self._versiones = {}     # id de prenda -> Prenda.version indexada (falta si no se conoce)
+        self._disponibles = bytearray()
+        self._lock = threading.Lock()
+        self.sello = None        # sello de versión de la tabla al sincronizar (ver sello_prendas)
+        self.marca = None        # momento de la última sincronización (compara con Prenda.modificada)
+        self.completa = None     # time.monotonic() del último recorrido completo en este proceso
+
+    def __len__(self):
+        return len(self._documentos)
+
+    @property
+    def max_id(self):
+        return max(self._documentos) if self._documentos else 0
+
+    # --- Bitset de disponibilidad ---
+
+    def _marcar_disponible(self, id_prenda, disponible):
+        byte, bit = divmod(id_prenda, 8)
+        if byte >= len(self._disponibles):
+            if not disponible:
+                return
+            self._disponibles.extend(bytes(byte - len(self._disponibles) + 1))
+        if disponible:
+            self._disponibles[byte] |= (1 << bit)
+        else:
+            self._disponibles[byte] &= ~(1 << bit) & 0xFF
+
+    def esta_disponible(self, id_prenda):
+        byte, bit = divmod(id_prenda, 8)
+        return byte < len(self._disponibles) and bool(self._disponibles[byte] & (1 << bit))
+
+    # --- Mantenimiento ---
+
+    def _id_termino(self, termino):
+        id_termino = self._terminos.get(termino)
+        if id_termino is None:
+            id_termino = len(self._postings)
+            self._terminos[termino] = id_termino
+            self._postings.append(array('I'))
+        return id_termino
+
+    def _quitar(self, id_prenda):
+        self._versiones.pop(id_prenda, None)
+        terminos = self._documentos.pop(id_prenda, None)
+        if terminos is None:
+            return
+        for id_termino in terminos:
+            ids = self._postings[id_termino]
+            pos = bisect_left(ids, id_prenda)
+            if pos < len(ids) and ids[pos] == id_prenda:
+                del ids[pos]
+        self._marcar_disponible(id_prenda, False)
+
+    def _agregar(self, id_prenda, texto, disponible, version):
+        ids_terminos = sorted({self._id_termino(t) for t in tokenizar(texto)})
+        for id_termino in ids_terminos:
+            ids = self._postings[id_termino]
+            # Caso habitual: prendas nuevas con id mayor que todos los existentes
+            if not ids or ids[-1] < id_prenda:
+                ids.append(id_prenda)
+            else:
+                ids.insert(bisect_left(ids, id_prenda), id_prenda)
+        self._documentos[id_prenda] = array('I', ids_terminos)
+        if version is not None:
+            self._versiones[id_prenda] = version
+        self._marcar_disponible(id_prenda, disponible)
+
+    def indexar(self, id_prenda, texto, disponible=True, version=None):
+        """Agrega o reemplaza el documento de una prenda."""
+        with self._lock:
+            self._quitar(id_prenda)
+            self._agregar(id_prenda, texto, disponible, version)
+
+    def eliminar(self, id_prenda):
+        """Quita una prenda del índice."""
+        with self._lock:
+            self._quitar(id_prenda)
+
+    def actualizar_disponibilidad(self, id_prenda, disponible):
+        with self._lock:
+            self._marcar_disponible(id_prenda, disponible)
+            # El cambio de estado también cambió la versión de la fila, que aquí no se conoce
+            self._versiones.pop(id_prenda, None)
+
+    def desactualizadas(self, versiones, parcial=False):
+        """
+        Compara el índice con las versiones de la base de datos.
+
+        Args:
+            versiones: dict id de prenda -> Prenda.version
+            parcial: `versiones` trae solo algunas prendas (no se buscan borradas)
+
+        Returns:
+            tuple: (ids a reindexar, ids indexados que ya no existen)
+        """
+        with self._lock:
+            cambiadas = [pk for pk, version in versiones.items() if self._versiones.get(pk) != version]
+            borradas = [] if parcial else [pk for pk in self._documentos if pk not in versiones]
+        return cambiadas, borradas
+
+    def requiere_completa(self):
+        """True si toca recorrer la tabla entera (nunca en este proceso o hace INTERVALO_COMPLETA)."""
+        return self.marca is None or self.completa is None or time.monotonic() - self.completa > INTERVALO_COMPLETA
+
+    # --- Consultas ---
+
+    def _ids_termino(self, termino):
+        id_termino = self._terminos.get(termino)
+        return self._postings[id_termino] if id_termino is not None else array('I')
+
+    @staticmethod
+    def _contiene(ids, id_prenda):
+        pos = bisect_left(ids, id_prenda)
+        return pos < len(ids) and ids[pos] == id_prenda
+
+    @classmethod
+    def _interseccion(cls, listas):
+        """
+        Intersección de arrays ordenados, partiendo del más corto.
+
+        Si el candidato es mucho más pequeño que la otra lista se buscan sus ids
+        con bisect; si no, se reduce con set.intersection_update (en C).
+        """
+        listas = sorted(listas, key=len)
+        resultado = set(listas[0])
+        for otra in listas[1:]:
+            if not resultado:
+                break
+            if len(resultado) * 16 < len(otra):
+                resultado = {i for i in resultado if cls._contiene(otra, i)}
+            else:
+                resultado.intersection_update(otra)
+        return resultado
+
+    def buscar(self, consulta, solo_disponibles=True, limite=None):
+        """
+        Busca prendas por texto.
+
+        Los términos de un grupo se combinan con AND; los grupos separados por
+        'OR' se combinan con OR. Ej: 'chaqueta negra OR abrigo'.
+
+        Args:
+            consulta: Texto de búsqueda
+            solo_disponibles: Filtrar por el bitset de disponibilidad
+            limite: Máximo de ids a devolver (los más recientes primero)
+
+        Returns:
+            list: ids de prenda en orden descendente
+        """
+        grupos = [tokenizar(g) for g in re.split(r'\s+OR\s+', consulta or '')]
+        grupos = [g for g in grupos if g]
+        if not grupos:
+            return []
+
+        with self._lock:
+            encontrados = set()
+            for terminos in grupos:
+                listas = [self._ids_termino(t) for t in set(terminos)]
+                if any(len(lista) == 0 for lista in listas):
+                    continue
+                encontrados |= self._interseccion(listas)
+
+            ordenados = sorted(encontrados, reverse=True)
+            if not solo_disponibles:
+                return ordenados[:limite] if limite else ordenados
+
+            # El bitset se consulta solo hasta completar el límite
+            resultado = []
+            for id_prenda in ordenados:
+                if self.esta_disponible(id_prenda):
+                    resultado.append(id_prenda)
+                    if limite and len(resultado) >= limite:
+                        break
+            return resultado
+
+    # --- Snapshot ---
+
+    def guardar(self, ruta):
+        """Escribe el índice a disco (escritura atómica)."""
+        with self._lock:
+            datos = {
+                'terminos': self._terminos,
+                'postings': self._postings,
+                'documentos': self._documentos,
+                'versiones': self._versiones,
+                'disponibles': bytes(self._disponibles),
+                'sello': self.sello,
+                'marca': self.marca,
+            }
+            temporal = f"{ruta}.tmp"
+            with open(temporal, 'wb') as archivo:
+                pickle.dump(datos, archivo, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, ruta)
+
+    @classmethod
+    def cargar(cls, ruta):
+        with open(ruta, 'rb') as archivo:
+            datos = pickle.load(archivo)
+        indice = cls()
+        indice._terminos = datos['terminos']
+        indice._postings = datos['postings']
+        indice._documentos = datos['documentos']
+        # Snapshots anteriores sin versiones: la primera sincronización reindexa todo
+        indice._versiones = datos.get('versiones', {})
+        indice._disponibles = bytearray(datos['disponibles'])
+        indice.sello = datos.get('sello')
+        indice.marca = datos.get('marca')
+        return indice
+
+
+# ==============================================================================
+# ÍNDICE DEL PROCESO
+# ==============================================================================
+
+_indice = None
+_lock_inicializacion = threading.Lock()
+
+
+def busqueda_en_memoria_activa():
+    """True si el backend de búsqueda configurado es el índice en memoria."""
+    return getattr(settings, 'BUSQUEDA_BACKEND', 'db') == 'memoria'
+
+
+def sello_prendas():
+    """Sello de versión de la tabla prenda (una consulta); cambia tras cada escritura confirmada."""
+    from .cache_utils import versiones_tablas
+    from .models import Prenda
+
+    return versiones_tablas(Prenda)[0]
+
+
+def _indexar_filas(indice, prendas):
+    """Indexa las prendas del QuerySet; devuelve el id de la última fila indexada (None si no hubo)."""
+    pk = None
+    for pk, nombre, descripcion, categoria, estado, version in prendas.values_list(
+        'pk', 'nombre', 'descripcion', 'categoria', 'estado', 'version'
+    ):
+        texto = ' '.join(filter(None, [nombre, descripcion, categoria]))
+        indice.indexar(pk, texto, estado == 'DISPONIBLE', version)
+    return pk
+
+
+def construir_desde_db(indice=None, lote=5000):
+    """Indexa todas las prendas recorriendo la tabla por lotes (keyset)."""
+    from .models import Prenda
+
+    indice = indice or IndiceInvertido()
+    # El sello y la marca se toman antes de recorrer: lo que se confirme durante el recorrido los supera
+    sello, marca = sello_prendas(), timezone.now()
+    ultimo_id = 0
+    while ultimo_id is not None:
+        ultimo_id = _indexar_filas(indice, Prenda.objects.filter(pk__gt=ultimo_id).order_by('pk')[:lote])
+    indice.sello, indice.marca, indice.completa = sello, marca, time.monotonic()
+    return indice
+
+
+def sincronizar(indice, lote=5000, completa=False):
+    """
+    Pone el índice al día con la base de datos sin reconstruirlo.
+
+    Lee (id, versión) de las prendas modificadas desde la última sincronización (con el
+    índice de Prenda.modificada) y reindexa las que cambiaron o son nuevas. El recorrido
+    completo lee todas las prendas y además quita las que ya no existen.
+
+    Args:
+        indice: IndiceInvertido a sincronizar
+        lote: Prendas reindexadas por consulta
+        completa: Recorrer la tabla entera (por defecto, según indice.requiere_completa())
+
+    Returns:
+        int: Prendas reindexadas o quitadas
+    """
+    from .models import Prenda
+
+    completa = completa or indice.requiere_completa()
+    sello, marca = sello_prendas(), timezone.now()
+    prendas = Prenda.objects.all() if completa else Prenda.objects.filter(modificada__gte=indice.marca - MARGEN_DELTA)
+    cambiadas, borradas = indice.desactualizadas(dict(prendas.values_list('pk', 'version')), parcial=not completa)
+    for pk in borradas:
+        indice.eliminar(pk)
+    for inicio in range(0, len(cambiadas), lote):
+        _indexar_filas(indice, Prenda.objects.filter(pk__in=cambiadas[inicio:inicio + lote]))
+    indice.sello, indice.marca = sello, marca
+    if completa:
+        indice.completa = time.monotonic()
+    return len(cambiadas) + len(borradas)
+
+
+def cargar_snapshot():
+    """Carga el snapshot configurado al iniciar el proceso (sin consultar la base de datos)."""
+    global _indice
+    ruta = getattr(settings, 'BUSQUEDA_INDICE_SNAPSHOT', None)
+    if not ruta or not os.path.exists(ruta):
+        return
+    try:
+        with _lock_inicializacion:
+            _indice = IndiceInvertido.cargar(ruta)
+        logger.info(f"Índice de búsqueda cargado desde {ruta} ({len(_indice)} prendas)")
+    except Exception as e:
+        logger.error(f"No se pudo cargar el índice de búsqueda desde {ruta}: {e}")
+
+
+def obtener_indice():
+    """
+    Devuelve el índice del proceso, al día con la base de datos.
+
+    Sin índice (no había snapshot) lo construye completo. Si el sello de la tabla
+    prenda cambió desde la última sincronización (un snapshot viejo, otro proceso que
+    escribió, un cambio que no pasó por las señales), reindexa las prendas modificadas
+    desde entonces cuya versión no coincide (ver sincronizar).
+    """
+    global _indice
+    sello = sello_prendas()
+    with _lock_inicializacion:
+        if _indice is None:
+            _indice = construir_desde_db()
+        elif _indice.sello != sello:
+            sincronizar(_indice)
+        return _indice
+
+
+def buscar_ids(prendas, consulta, limite):
+    """
+    Ids de las prendas de `prendas` que coinciden con la consulta, las más recientes primero.
+
+    El índice entrega los candidatos disponibles ordenados y la base de datos aplica
+    los filtros del QuerySet por tramos de `limite` ids hasta juntar `limite`
+    resultados: un filtro (categoría, talla...) no deja fuera prendas que están más
+    allá de los primeros candidatos, y lo que el índice aún no sabe se descarta.
+
+    Args:
+        prendas: QuerySet de Prenda con los demás filtros de la búsqueda
+        consulta: Texto de búsqueda (ver IndiceInvertido.buscar)
+        limite: Máximo de ids a devolver
+    """
+    candidatos = obtener_indice().buscar(consulta, solo_disponibles=True)
+    encontrados = []
+    for inicio in range(0, len(candidatos), limite):
+        tramo = prendas.filter(pk__in=candidatos[inicio:inicio + limite]).values_list('pk', flat=True)
+        encontrados.extend(sorted(tramo, reverse=True))
+        if len(encontrados) >= limite:
+            break
+    return encontrados[:limite]
+
+
+# ==============================================================================
+# CAMBIOS DESDE LAS SEÑALES
+# ==============================================================================
+
+def _al_confirmar(aplicar):
+    """Aplica `aplicar(indice)` al índice del proceso cuando se confirma la transacción en curso."""
+    if not busqueda_en_memoria_activa():
+        return
+
+    def aplicar_si_hay_indice():
+        # Sin índice no hay nada que actualizar: se construirá desde la base de datos
+        if _indice is not None:
+            aplicar(_indice)
+            _avanzar_sello(_indice)
+
+    transaction.on_commit(aplicar_si_hay_indice)
+
+
+def _avanzar_sello(indice):
+    """
+    Adopta el sello actual tras aplicar un cambio local, si ese cambio es lo único nuevo.
+
+    Cada cambio local se aplica justo después del incremento del sello que lo acompaña
+    (signals.py conecta los sellos antes que el índice). Si el sello avanzó exactamente
+    uno desde la última sincronización no hay escrituras ajenas que leer y la próxima
+    búsqueda no sincroniza; si avanzó más, se deja para sincronizar().
+    """
+    if indice.sello is None:
+        return
+    try:
+        sello = sello_prendas()
+    except Exception as e:
+        logger.warning(f"Índice de búsqueda: no se pudo leer el sello ({e})")
+        return
+    with _lock_inicializacion:
+        if sello == indice.sello + 1:
+            indice.sello = sello
+
+
+def indexar_al_confirmar(prenda):
+    """Reindexa la prenda (texto, disponibilidad y versión, tal como se guardaron) al confirmar."""
+    texto, disponible, version = texto_prenda(prenda), prenda.estado == 'DISPONIBLE', prenda.version
+    _al_confirmar(lambda indice: indice.indexar(prenda.pk, texto, disponible, version))
+
+
+def eliminar_al_confirmar(id_prenda):
+    _al_confirmar(lambda indice: indice.eliminar(id_prenda))
+
+
+def disponibilidad_al_confirmar(ids_prenda, disponible):
+    ids_prenda = list(ids_prenda)
+
+    def aplicar(indice):
+        for id_prenda in ids_prenda:
+            indice.actualizar_disponibilidad(id_prenda, disponible)
+
+    _al_confirmar(aplicar)
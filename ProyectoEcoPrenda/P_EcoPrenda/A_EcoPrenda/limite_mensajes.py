@@ -0,0 +1,154 @@
+"""
+Límite de envío de mensajes
+Frena a quien envía mensajes más rápido de lo que una persona escribe, antes de que
+llenen Mensaje y hagan más lentas todas las conversaciones.
+
+- Tres cubetas: por emisor, por par (emisor, receptor) y global. Cada una admite una
+  ráfaga de `capacidad` mensajes y se recarga a `capacidad / periodo` por segundo.
+- El emisor es siempre el usuario de la sesión, nunca un dato del cliente: quien llama
+  ya verificó que tiene sesión y que envía como sí mismo.
+- Viven en la caché compartida (Redis en producción, memoria local en desarrollo y
+  pruebas), así que valen para todos los workers. La API de caché solo ofrece add/incr
+  atómicos (sin compare-and-set), por eso cada cubeta se lleva como dos contadores por
+  ventana de `periodo` segundos: lo consumido es el de la ventana actual más la parte
+  del anterior que aún no se recarga (ventana deslizante ponderada).
+- Un envío permitido cuesta una lectura (get_many de las seis claves) y un incr por
+  cubeta; uno rechazado, solo la lectura: un script que insiste no escribe en la caché.
+  Si dos envíos compiten por la última ficha, el incr decide y el que sobra se devuelve.
+- `LimiteExcedido` lleva los segundos hasta la próxima ficha, para Retry-After.
+- Si la caché no responde, el envío se permite: el límite protege la base de datos, no
+  debe impedir escribir mensajes.
+"""
+
+import logging
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Ámbito -> (capacidad, periodo en segundos)
+LIMITES_POR_DEFECTO = {
+    'usuario': (30, 60),
+    'par': (10, 60),
+    'global': (3000, 60),
+}
+LIMITES = {**LIMITES_POR_DEFECTO, **getattr(settings, 'LIMITES_MENSAJES', {})}
+
+MENSAJES_LIMITE = {
+    'usuario': 'Estás enviando mensajes demasiado rápido.',
+    'par': 'Estás enviando demasiados mensajes a este usuario.',
+    'global': 'El servicio de mensajes está recibiendo demasiados envíos.',
+}
+
+
+class LimiteExcedido(Exception):
+    """El envío superó una cubeta; `reintentar_en` son los segundos hasta la próxima ficha."""
+
+    def __init__(self, ambito, reintentar_en):
+        self.ambito = ambito
+        self.reintentar_en = reintentar_en
+        super().__init__(f'{MENSAJES_LIMITE[ambito]} Intenta de nuevo en {reintentar_en} s.')
+
+
+# ==============================================================================
+# CUBETAS
+# ==============================================================================
+
+def _cubetas(id_emisor, id_receptor):
+    """(ámbito, clave base) de las cubetas que consume un envío."""
+    return [
+        ('usuario', f'limite_mensajes:usuario:{id_emisor}'),
+        ('par', f'limite_mensajes:par:{id_emisor}:{id_receptor}'),
+        ('global', 'limite_mensajes:global'),
+    ]
+
+
+def _consumido(anterior, actual, transcurrido, periodo):
+    """Fichas en uso: las de la ventana actual y lo que falta recargar de la anterior."""
+    return anterior * (1 - transcurrido / periodo) + actual
+
+
+def _espera(anterior, actual, transcurrido, capacidad, periodo):
+    """Segundos hasta que quede una ficha libre (con `actual` ya sin la del envío rechazado)."""
+    if actual + 1 > capacidad:
+        # Hay que esperar a la ventana siguiente, donde `actual` pasa a ser la anterior
+        restante = periodo - transcurrido
+        return restante + periodo * max(0.0, 1 - (capacidad - 1) / actual)
+    if not anterior:
+        return 0.0
+    return max(0.0, periodo * (1 - (capacidad - 1 - actual) / anterior) - transcurrido)
+
+
+def verificar_envio(id_emisor, id_receptor, ahora=None):
+    """
+    Consume una ficha de cada cubeta del envío o no consume ninguna.
+
+    Args:
+        id_emisor: Usuario de la sesión que envía
+        id_receptor: Usuario que recibe
+        ahora: Marca de tiempo (segundos); por defecto, la actual
+
+    Raises:
+        LimiteExcedido: si alguna cubeta está vacía (ámbito y segundos de espera)
+    """
+    ahora = time.time() if ahora is None else ahora
+    cubetas = []
+    for ambito, base in _cubetas(id_emisor, id_receptor):
+        capacidad, periodo = LIMITES[ambito]
+        ventana = int(ahora // periodo)
+        cubetas.append((ambito, capacidad, periodo, ahora - ventana * periodo,
+                        f'{base}:{ventana - 1}', f'{base}:{ventana}'))
+
+    try:
+        valores = cache.get_many([clave for *_, anterior, actual in cubetas for clave in (anterior, actual)])
+    except Exception as e:
+        logger.warning(f"Límite de mensajes: caché no disponible ({e}); se permite el envío")
+        return
+
+    # Rechazo sin escribir: basta con la lectura
+    for ambito, capacidad, periodo, transcurrido, clave_anterior, clave_actual in cubetas:
+        anterior, actual = valores.get(clave_anterior, 0), valores.get(clave_actual, 0)
+        if _consumido(anterior, actual, transcurrido, periodo) + 1 > capacidad:
+            raise LimiteExcedido(ambito, _segundos(_espera(anterior, actual, transcurrido, capacidad, periodo)))
+
+    # Consumo: el incr es atómico, así que decide entre envíos concurrentes
+    consumidas = []
+    try:
+        for ambito, capacidad, periodo, transcurrido, clave_anterior, clave_actual in cubetas:
+            actual = _incrementar(clave_actual, 2 * periodo)
+            consumidas.append(clave_actual)
+            anterior = valores.get(clave_anterior, 0)
+            if _consumido(anterior, actual, transcurrido, periodo) > capacidad:
+                raise LimiteExcedido(ambito, _segundos(_espera(anterior, actual - 1, transcurrido, capacidad, periodo)))
+    except LimiteExcedido:
+        _devolver(consumidas)
+        raise
+    except Exception as e:
+        logger.warning(f"Límite de mensajes: caché no disponible ({e}); se permite el envío")
+
+
+def _incrementar(clave, timeout):
+    """incr atómico; crea el contador si no existe (o si venció entre la lectura y el incr)."""
+    try:
+        return cache.incr(clave)
+    except ValueError:
+        if cache.add(clave, 1, timeout):
+            return 1
+        return cache.incr(clave)
+
+
+def _devolver(claves):
+    """Devuelve las fichas tomadas por un envío que al final se rechazó."""
+    for clave in claves:
+        try:
+            cache.decr(clave)
+        except ValueError:
+            pass
+
+
+def _segundos(espera):
+    """Segundos enteros para Retry-After (al menos uno)."""
+    return max(1, math.ceil(espera))
@@ -0,0 +1,141 @@
+"""
+Línea de tiempo de transacciones por usuario
+Transacciones enviadas y recibidas en un solo listado, paginado por cursor (keyset).
+
+- Cada lado (user_origen / user_destino) se consulta por separado para que use su índice
+  compuesto (usuario, fecha_transaccion, id); un OR entre ambos lados obliga a recorrer la tabla.
+- Los lados se combinan con UNION cuando la base de datos admite ORDER BY/LIMIT dentro
+  de la consulta compuesta (PostgreSQL); si no, se mezclan en Python. Cada lado aporta
+  como mucho `limite + 1` ids, así que el costo de una página no depende del historial.
+- La página se lee después por id con prenda, tipo y partes ya cargadas.
+- El cursor es opaco: "fecha|id" de la última fila de la página, en base64.
+"""
+
+import base64
+import binascii
+from datetime import datetime
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Transaccion, TransaccionHistorica
+from .tipos_transaccion import TIPOS_BASE, contar_por_tipo
+
+
+LIMITE_POR_DEFECTO = 20
+LIMITE_MAXIMO = 100
+
+_RELACIONADOS = ('prenda', 'tipo', 'user_origen', 'user_destino', 'fundacion')
+
+
+class CursorInvalido(ValueError):
+    """El cursor recibido no tiene el formato esperado."""
+
+
+# ==============================================================================
+# CURSOR
+# ==============================================================================
+
+def codificar_cursor(objeto, campo='fecha_transaccion'):
+    valor = f'{getattr(objeto, campo).isoformat()}|{objeto.pk}'
+    return base64.urlsafe_b64encode(valor.encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    """
+    (fecha, id) de un cursor generado por codificar_cursor.
+
+    Raises:
+        CursorInvalido: Si el cursor está mal formado
+    """
+    try:
+        fecha, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(fecha), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise CursorInvalido('Cursor de paginación inválido.') from e
+
+
+# ==============================================================================
+# CONSULTAS
+# ==============================================================================
+
+def transacciones_por_lado(usuario, modelo=Transaccion, **filtros):
+    """
+    Querysets (enviadas, recibidas) del usuario, sin repetir transacciones consigo mismo.
+
+    Cada uno filtra por una sola columna de usuario y puede usar su índice.
+    `modelo` puede ser TransaccionHistorica para incluir las archivadas.
+    """
+    enviadas = modelo.objects.filter(user_origen=usuario, **filtros)
+    recibidas = modelo.objects.filter(user_destino=usuario, **filtros).exclude(user_origen=usuario)
+    return enviadas, recibidas
+
+
+def contar_por_tipo_usuario(usuario, **filtros):
+    """
+    Cantidad de transacciones del usuario por código de tipo (dos consultas agrupadas),
+    archivadas incluidas.
+
+    Returns:
+        dict: código -> cantidad, más la clave 'total'
+    """
+    conteo = dict.fromkeys(TIPOS_BASE, 0)
+    for lado in transacciones_por_lado(usuario, modelo=TransaccionHistorica, **filtros):
+        for codigo, cantidad in contar_por_tipo(lado).items():
+            conteo[codigo] = conteo.get(codigo, 0) + cantidad
+    conteo['total'] = sum(conteo.values())
+    return conteo
+
+
+def ids_pagina(lados, limite, campo='fecha_transaccion'):
+    """Ids de las `limite + 1` filas más recientes (por `campo`, id) entre ambos lados."""
+    orden = (f'-{campo}', '-id')
+    lados = [lado.order_by(*orden).values_list(campo, 'id')[:limite + 1] for lado in lados]
+
+    if connection.features.supports_slicing_ordering_in_compound:
+        filas = lados[0].union(lados[1]).order_by(*orden)[:limite + 1]
+    else:
+        filas = sorted(set(lados[0]) | set(lados[1]), reverse=True)[:limite + 1]
+    return [pk for _, pk in filas]
+
+
+def linea_tiempo_usuario(usuario, cursor=None, limite=LIMITE_POR_DEFECTO, **filtros):
+    """
+    Una página de la línea de tiempo del usuario, de la más reciente a la más antigua.
+
+    Cada transacción lleva `es_enviada` y `contraparte` (el otro usuario, o None si
+    es una donación a fundación).
+
+    Args:
+        usuario: Usuario dueño de la línea de tiempo
+        cursor: Cursor devuelto por la página anterior (None para la primera)
+        limite: Transacciones por página (se acota a LIMITE_MAXIMO)
+        **filtros: Filtros adicionales para ambos lados (p. ej. estado='COMPLETADA')
+
+    Returns:
+        tuple: (lista de Transaccion, cursor de la página siguiente o None)
+
+    Raises:
+        CursorInvalido: Si el cursor está mal formado
+    """
+    limite = max(1, min(int(limite), LIMITE_MAXIMO))
+    # Las filas sin fecha no tienen posición en el orden; se excluyen del listado.
+    lados = transacciones_por_lado(usuario, fecha_transaccion__isnull=False, **filtros)
+    if cursor:
+        fecha, pk = decodificar_cursor(cursor)
+        # La cota fecha <= cursor (redundante) deja al planificador usar el índice como rango.
+        despues = Q(fecha_transaccion__lt=fecha) | Q(fecha_transaccion=fecha, id__lt=pk)
+        lados = [lado.filter(despues, fecha_transaccion__lte=fecha) for lado in lados]
+
+    ids = ids_pagina(lados, limite)
+    hay_mas = len(ids) > limite
+    ids = ids[:limite]
+
+    por_id = Transaccion.objects.select_related(*_RELACIONADOS).in_bulk(ids)
+    transacciones = [por_id[pk] for pk in ids if pk in por_id]
+    for transaccion in transacciones:
+        transaccion.es_enviada = transaccion.user_origen_id == usuario.pk
+        transaccion.contraparte = transaccion.user_destino if transaccion.es_enviada else transaccion.user_origen
+
+    siguiente = codificar_cursor(transacciones[-1]) if hay_mas and transacciones else None
+    return transacciones, siguiente
@@ -0,0 +1,106 @@
+"""
+Asignación automática de logros
+Cada regla calcula, con una consulta agrupada, qué usuarios de un conjunto cumplen su condición.
+
+- `otorgar_logros` evalúa todas las reglas para muchos usuarios a la vez (p. ej. los donantes
+  de un lote de donaciones confirmadas): el número de consultas no depende de cuántos sean.
+- Los logros ya obtenidos se leen de una vez y los nuevos se crean con un solo bulk_create.
+- Las transacciones se cuentan en TransaccionHistorica: archivar no quita logros.
+"""
+
+from collections import defaultdict
+
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import ImpactoAmbiental, Logro, Prenda, TransaccionHistorica, UsuarioLogro
+from .tipos_transaccion import DONACION, INTERCAMBIO
+
+
+# ==============================================================================
+# REGLAS
+# ==============================================================================
+
+def _con_minimo(filas, minimo):
+    """Ids de usuario de (id, valor) cuyo valor alcanza el mínimo."""
+    return {pk for pk, valor in filas if (valor or 0) >= minimo}
+
+
+def _donador(ids_usuario):
+    completadas = TransaccionHistorica.objects.filter(
+        user_origen__in=ids_usuario, tipo_codigo=DONACION, estado='COMPLETADA'
+    ).order_by().values_list('user_origen').annotate(total=Count('pk'))
+    return _con_minimo(completadas, 1)
+
+
+def _superuser(ids_usuario):
+    publicadas = Prenda.objects.filter(user__in=ids_usuario).order_by().values_list('user').annotate(total=Count('pk'))
+    return _con_minimo(publicadas, 10)
+
+
+def _intercambiador(ids_usuario):
+    # Un conteo agrupado por cada lado (sin OR entre user_origen y user_destino)
+    totales = defaultdict(int)
+    completados = TransaccionHistorica.objects.filter(tipo_codigo=INTERCAMBIO, estado='COMPLETADA').order_by()
+    for campo in ('user_origen', 'user_destino'):
+        lado = completados.filter(**{f'{campo}__in': ids_usuario}).values_list(campo).annotate(total=Count('pk'))
+        for pk, total in lado:
+            totales[pk] += total
+    return _con_minimo(totales.items(), 5)
+
+
+def _eco_guerrero(ids_usuario):
+    carbono = ImpactoAmbiental.objects.filter(
+        prenda__user__in=ids_usuario
+    ).order_by().values_list('prenda__user').annotate(total=Sum('carbono_evitar_kg'))
+    return _con_minimo(carbono, 1000)
+
+
+# código de Logro -> función(ids_usuario) que devuelve los ids que lo cumplen
+REGLAS = {
+    'DONADOR': _donador,
+    'SUPERUSER': _superuser,
+    'INTERCAMBIADOR': _intercambiador,
+    'ECO_GUERRERO': _eco_guerrero,
+}
+
+
+# ==============================================================================
+# ASIGNACIÓN
+# ==============================================================================
+
+def otorgar_logros(ids_usuario):
+    """
+    Asigna los logros que cada usuario cumple y aún no tiene.
+
+    Args:
+        ids_usuario: Ids de los usuarios a evaluar
+
+    Returns:
+        dict: id de usuario -> lista de Logro nuevos (solo usuarios con alguno)
+    """
+    ids_usuario = set(ids_usuario)
+    if not ids_usuario:
+        return {}
+    logros = [logro for logro in Logro.objects.filter(codigo__in=REGLAS)]
+    if not logros:
+        return {}
+    obtenidos = set(UsuarioLogro.objects.filter(user__in=ids_usuario).values_list('user', 'logro'))
+
+    nuevos = defaultdict(list)
+    ahora = timezone.now()
+    for logro in logros:
+        pendientes = {pk for pk in ids_usuario if (pk, logro.pk) not in obtenidos}
+        if not pendientes:
+            continue
+        for pk in REGLAS[logro.codigo](pendientes):
+            nuevos[pk].append(logro)
+
+    UsuarioLogro.objects.bulk_create(
+        [
+            UsuarioLogro(user_id=pk, logro=logro, fecha_desbloqueo=ahora)
+            for pk, logros_usuario in nuevos.items() for logro in logros_usuario
+        ],
+        ignore_conflicts=True,  # Otra petición pudo asignarlo entre la lectura y la escritura
+    )
+    return dict(nuevos)
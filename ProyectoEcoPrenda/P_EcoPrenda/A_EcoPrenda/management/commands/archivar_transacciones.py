@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from A_EcoPrenda.archivo import ANTIGUEDAD_DIAS, archivar_lote
+
+
+class Command(BaseCommand):
+    help = 'Mueve a las tablas de archivo las transacciones terminadas antiguas y la conversación entre sus partes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Transacciones por lote')
+        parser.add_argument('--dias', type=int, default=ANTIGUEDAD_DIAS, help='Antigüedad mínima en días')
+        parser.add_argument('--max-lotes', type=int, default=0, help='Lotes a procesar (0 = hasta vaciar); se puede retomar después')
+        parser.add_argument('--pausa', type=float, default=0.0, help='Segundos de espera entre lotes (para no cargar la base)')
+
+    def handle(self, *args, **kwargs):
+        tamano_lote = kwargs['lote']
+        if tamano_lote < 1 or kwargs['dias'] < 1:
+            raise CommandError('El lote y la antigüedad deben ser al menos 1.')
+        self.stdout.write(f"Archivando transacciones terminadas hace más de {kwargs['dias']} días")
+
+        lotes = transacciones = mensajes = 0
+        try:
+            while True:
+                resultado = archivar_lote(tamano_lote, antiguedad_dias=kwargs['dias'])
+                if not resultado['transacciones']:
+                    break
+                lotes += 1
+                transacciones += resultado['transacciones']
+                mensajes += resultado['mensajes']
+                self.stdout.write(f"Lote {lotes}: {resultado['transacciones']} transacciones, {resultado['mensajes']} mensajes")
+                if resultado['transacciones'] < tamano_lote or (kwargs['max_lotes'] and lotes >= kwargs['max_lotes']):
+                    break
+                time.sleep(kwargs['pausa'])
+        except KeyboardInterrupt:
+            # Cada lote es atómico: lo ya archivado queda archivado y se retoma en la próxima ejecución
+            self.stdout.write(self.style.WARNING('Detenido.'))
+
+        self.stdout.write(self.style.SUCCESS(f'{transacciones} transacciones y {mensajes} mensajes archivados en {lotes} lotes.'))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from A_EcoPrenda.retencion_mensajes import (
+    FILAS_POR_BORRADO, HILOS_POR_LOTE, RETENCION_DIAS, RETENCION_POR_HILO, depurar_lote,
+)
+
+
+class Command(BaseCommand):
+    help = 'Borra los mensajes que exceden la política de retención (antigüedad y cuota por conversación)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=RETENCION_DIAS, help='Antigüedad mínima en días (0 = solo la cuota)')
+        parser.add_argument('--por-hilo', type=int, default=RETENCION_POR_HILO, help='Mensajes más recientes que conserva cada conversación')
+        parser.add_argument('--lote', type=int, default=HILOS_POR_LOTE, help='Conversaciones por lote')
+        parser.add_argument('--filas', type=int, default=FILAS_POR_BORRADO, help='Filas por DELETE (una transacción cada una)')
+        parser.add_argument('--pausa', type=float, default=0.0, help='Segundos de espera entre borrados (para no cargar la base)')
+        parser.add_argument('--desde', type=int, default=0, help='Conversacion.id desde el que seguir (el último informado)')
+        parser.add_argument('--max-lotes', type=int, default=0, help='Lotes a procesar (0 = todos); se puede retomar con --desde')
+        parser.add_argument('--simular', action='store_true', help='No borra: estima cuántos mensajes y bytes se liberarían')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['por_hilo'] < 1 or kwargs['lote'] < 1 or kwargs['filas'] < 1:
+            raise CommandError('La cuota por conversación, el lote y las filas deben ser al menos 1.')
+        simular = kwargs['simular']
+        politica = f"{kwargs['por_hilo']} mensajes por conversación"
+        if kwargs['dias']:
+            politica += f" o {kwargs['dias']} días"
+        self.stdout.write(f"{'Simulando' if simular else 'Aplicando'} la retención: se conservan {politica}")
+
+        lotes = hilos = protegidos = mensajes = liberados = 0
+        ultimo = kwargs['desde']
+        try:
+            while ultimo is not None:
+                resultado = depurar_lote(
+                    ultimo, dias=kwargs['dias'] or None, por_hilo=kwargs['por_hilo'], simular=simular,
+                    hilos_por_lote=kwargs['lote'], filas_por_borrado=kwargs['filas'], pausa=kwargs['pausa'],
+                )
+                lotes += 1
+                hilos += resultado['hilos']
+                protegidos += resultado['protegidos']
+                mensajes += resultado['mensajes']
+                liberados += resultado['bytes']
+                if resultado['mensajes']:
+                    self.stdout.write(f"Lote {lotes} (hasta la conversación {resultado['ultimo'] or 'final'}): {resultado['mensajes']} mensajes")
+                ultimo = resultado['ultimo']
+                if kwargs['max_lotes'] and lotes >= kwargs['max_lotes']:
+                    break
+        except KeyboardInterrupt:
+            # Cada tramo es atómico: lo ya borrado queda borrado
+            self.stdout.write(self.style.WARNING('Detenido.'))
+
+        verbo = 'se borrarían' if simular else 'borrados'
+        self.stdout.write(self.style.SUCCESS(
+            f'{hilos} conversaciones revisadas ({protegidos} protegidas por transacciones activas o disputas): '
+            f'{mensajes} mensajes {verbo}, {liberados / 1024:.1f} KB de contenido.'
+        ))
+        if ultimo is not None:
+            self.stdout.write(f'Para continuar: --desde {ultimo}')
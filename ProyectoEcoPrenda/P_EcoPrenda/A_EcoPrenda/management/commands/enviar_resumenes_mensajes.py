@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from A_EcoPrenda.resumen_mensajes import USUARIOS_POR_LOTE, EjecucionEnCurso, enviar_resumenes
+
+
+class Command(BaseCommand):
+    help = 'Envía por correo el resumen de mensajes sin leer a cada usuario que tenga mensajes por avisar'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=USUARIOS_POR_LOTE, help='Usuarios por lote')
+        parser.add_argument('--simular', action='store_true', help='Arma los correos sin enviarlos ni guardar el avance')
+        parser.add_argument('--continuo', action='store_true', help='Repite el ciclo cada --intervalo minutos (para correr como servicio)')
+        parser.add_argument('--intervalo', type=float, default=15.0, help='Minutos entre ciclos con --continuo')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['lote'] < 1:
+            raise CommandError('El lote debe ser al menos 1.')
+
+        def informar(resultado):
+            if resultado['usuarios']:
+                self.stdout.write(f"Lote: {resultado['usuarios']} usuarios, {resultado['enviados']} enviados, {resultado['fallidos']} fallidos")
+
+        try:
+            while True:
+                inicio = time.perf_counter()
+                try:
+                    totales = enviar_resumenes(simular=kwargs['simular'], limite=kwargs['lote'], al_terminar_lote=informar)
+                except EjecucionEnCurso as e:
+                    self.stdout.write(self.style.WARNING(str(e)))
+                else:
+                    verbo = 'se enviarían' if kwargs['simular'] else 'enviados'
+                    self.stdout.write(self.style.SUCCESS(
+                        f"{totales['enviados']} resúmenes {verbo}, {totales['fallidos']} fallidos "
+                        f"({totales['usuarios']} usuarios) en {time.perf_counter() - inicio:.1f} s"
+                    ))
+                if not kwargs['continuo']:
+                    break
+                time.sleep(kwargs['intervalo'] * 60)
+        except KeyboardInterrupt:
+            # El avance se guarda por lote: lo enviado no se repite en la próxima ejecución
+            self.stdout.write(self.style.WARNING('Detenido.'))
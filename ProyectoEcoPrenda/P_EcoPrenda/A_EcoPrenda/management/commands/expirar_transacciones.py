@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from A_EcoPrenda.expiracion import PLAZOS_HORAS, expirar_lote
+
+
+class Command(BaseCommand):
+    help = 'Cancela las transacciones sin avance (PENDIENTE, ACEPTADA, RESERVADA) vencidas y libera sus prendas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Transacciones por lote')
+        parser.add_argument('--max-lotes', type=int, default=0, help='Lotes por pasada (0 = hasta vaciar)')
+        parser.add_argument('--continuo', action='store_true', help='Repite cada --intervalo segundos (para correr como servicio)')
+        parser.add_argument('--intervalo', type=int, default=300, help='Segundos entre pasadas en modo continuo')
+
+    def _pasada(self, tamano_lote, max_lotes):
+        lotes = expiradas = 0
+        while True:
+            resultado = expirar_lote(tamano_lote)
+            lotes += 1
+            expiradas += resultado['expiradas']
+            self.stdout.write(
+                f"Lote {lotes}: {resultado['expiradas']} expiradas, {resultado['fallidas']} cambiaron entretanto, "
+                f"retraso {resultado['retraso_segundos']}s"
+            )
+            # Un lote incompleto significa que ya no quedan vencidas
+            if resultado['encontradas'] < tamano_lote or (max_lotes and lotes >= max_lotes):
+                return expiradas
+
+    def handle(self, *args, **kwargs):
+        tamano_lote = kwargs['lote']
+        if tamano_lote < 1:
+            raise CommandError('El lote debe tener al menos una transacción.')
+        plazos = ', '.join(f'{estado} {horas} h' for estado, horas in PLAZOS_HORAS.items())
+        self.stdout.write(f'Plazos: {plazos}')
+
+        if not kwargs['continuo']:
+            expiradas = self._pasada(tamano_lote, kwargs['max_lotes'])
+            self.stdout.write(self.style.SUCCESS(f'{expiradas} transacciones expiradas.'))
+            return
+
+        try:
+            while True:
+                close_old_connections()
+                self._pasada(tamano_lote, kwargs['max_lotes'])
+                time.sleep(kwargs['intervalo'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Detenido.'))
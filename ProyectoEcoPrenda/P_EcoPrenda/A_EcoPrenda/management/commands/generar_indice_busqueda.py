@@ -0,0 +1,25 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from A_EcoPrenda.indice_busqueda import construir_desde_db
+
+
+class Command(BaseCommand):
+    help = 'Construye el índice de búsqueda en memoria desde la base de datos y lo guarda como snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ruta', default=None, help='Archivo destino (por defecto BUSQUEDA_INDICE_SNAPSHOT)')
+
+    def handle(self, *args, **kwargs):
+        ruta = kwargs['ruta'] or settings.BUSQUEDA_INDICE_SNAPSHOT
+
+        inicio = time.perf_counter()
+        indice = construir_desde_db()
+        indice.guardar(ruta)
+        segundos = time.perf_counter() - inicio
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Índice con {len(indice)} prendas guardado en {ruta} ({segundos:.1f} s)'
+        ))
@@ -0,0 +1,125 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from A_EcoPrenda.eventos import procesar_lote
+from A_EcoPrenda.logros import otorgar_logros
+from A_EcoPrenda.models import EventoTransaccion, Fundacion, Logro, Mensaje, Prenda, Transaccion, Usuario
+from A_EcoPrenda.tipos_transaccion import DONACION, obtener_tipo
+from A_EcoPrenda.transiciones import aplicar_transicion, aplicar_transicion_lote
+
+
+class Command(BaseCommand):
+    help = 'Compara confirmar donaciones en lote (y luego drenar el outbox) contra confirmarlas una a una'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--donaciones', type=int, default=1000, help='Donaciones por modo')
+        parser.add_argument('--donantes', type=int, default=100, help='Donantes distintos')
+        parser.add_argument('--conservar', action='store_true', help='No borra los datos de prueba al terminar')
+
+    def _crear_donaciones(self, cantidad, donantes, fundacion, tipo, sufijo):
+        prendas = Prenda.objects.bulk_create(
+            Prenda(user=donantes[i % len(donantes)], nombre=f'Prenda lote {sufijo}-{i}', estado='EN_PROCESO_ENTREGA')
+            for i in range(cantidad)
+        )
+        Transaccion.objects.bulk_create(
+            Transaccion(
+                prenda=prenda, tipo=tipo, tipo_codigo=DONACION, estado='EN_PROCESO', version=1,
+                user_origen=prenda.user, fundacion=fundacion, direccion_entrega='Calle 123',
+            )
+            for prenda in prendas
+        )
+        return list(
+            Transaccion.objects.filter(prenda__in=prendas).select_related('prenda')
+        )
+
+    def _medir(self, funcion):
+        # Se cuentan con execute_wrapper: el registro de connection.queries guarda como mucho 9000
+        consultas = 0
+
+        def contar(execute, sql, params, many, context):
+            nonlocal consultas
+            consultas += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(contar):
+            inicio = time.perf_counter()
+            funcion()
+            segundos = time.perf_counter() - inicio
+        return segundos, consultas
+
+    def handle(self, *args, **kwargs):
+        cantidad = kwargs['donaciones']
+        if cantidad < 1 or kwargs['donantes'] < 1:
+            raise CommandError('Se necesita al menos una donación y un donante.')
+
+        sufijo = uuid.uuid4().hex[:8]
+        representante = Usuario.objects.create(nombre='Representante lote', correo=f'lote-{sufijo}-r@ecoprenda.test', contrasena='-')
+        donantes = [
+            Usuario.objects.create(nombre=f'Donante {i}', correo=f'lote-{sufijo}-{i}@ecoprenda.test', contrasena='-')
+            for i in range(kwargs['donantes'])
+        ]
+        fundacion = Fundacion.objects.create(nombre=f'Fundación lote {sufijo}', representante=representante, activa=False)
+        tipo = obtener_tipo(DONACION)
+        logro, logro_creado = Logro.objects.get_or_create(
+            codigo='DONADOR',
+            defaults={'nombre': 'Donador', 'descripcion': 'Primera donación completada', 'tipo': 'DONACION',
+                      'icono': 'bi-gift', 'requisito_valor': 1},
+        )
+
+        def agradecimiento(donacion):
+            return Mensaje(emisor=representante, receptor_id=donacion.user_origen_id,
+                           contenido=f'Gracias por tu donación de {donacion.prenda.nombre}!', fecha_envio=timezone.now())
+
+        try:
+            en_lote = self._crear_donaciones(cantidad, donantes, fundacion, tipo, f'{sufijo}-a')
+            una_a_una = self._crear_donaciones(cantidad, donantes, fundacion, tipo, f'{sufijo}-b')
+
+            # Referencia: lo que hacía confirmar_recepcion_donacion por cada donación
+            def confirmar_una_a_una():
+                for donacion in una_a_una:
+                    aplicar_transicion(donacion, 'completar')
+                    agradecimiento(donacion).save()
+                    otorgar_logros([donacion.user_origen_id])
+
+            # Petición en lote: los agradecimientos y logros quedan en el outbox
+            def confirmar_en_lote():
+                aplicadas, fallidas = aplicar_transicion_lote(en_lote, 'completar')
+                if fallidas:
+                    raise CommandError(f'{len(fallidas)} donaciones fallaron en el lote.')
+
+            def drenar_outbox():
+                while procesar_lote(500)['reclamados']:
+                    pass
+
+            def informar(nombre, funcion):
+                segundos, consultas = self._medir(funcion)
+                self.stdout.write(f'{nombre:<10} {cantidad} donaciones: {segundos * 1000:9.1f} ms  {consultas} consultas')
+
+            # Mismo punto de partida para ambos modos: ningún donante tiene aún el logro
+            logro.usuariologro_set.all().delete()
+            informar('Una a una', confirmar_una_a_una)
+            # Ese modo ya hizo el trabajo en la petición: sus eventos no se despachan
+            EventoTransaccion.objects.filter(transaccion__in=una_a_una).delete()
+            logro.usuariologro_set.all().delete()
+            informar('En lote', confirmar_en_lote)
+            informar('Outbox', drenar_outbox)
+
+            agradecimientos = Mensaje.objects.filter(emisor=representante).count()
+            if agradecimientos != 2 * cantidad:
+                raise CommandError(f'Se esperaban {2 * cantidad} agradecimientos y hay {agradecimientos}.')
+            prendas = Prenda.objects.filter(transaccion__in=[d.pk for d in en_lote])
+            donadas = prendas.filter(estado='DONADA').count()
+            if donadas != cantidad:
+                raise CommandError(f'Solo {donadas} de {cantidad} prendas del lote quedaron DONADA.')
+        finally:
+            if not kwargs['conservar']:
+                Usuario.objects.filter(pk__in=[representante.pk, *(d.pk for d in donantes)]).delete()
+                fundacion.delete()
+                if logro_creado:
+                    logro.delete()
+
+        self.stdout.write(self.style.SUCCESS('Todas las prendas del lote quedaron DONADA.'))
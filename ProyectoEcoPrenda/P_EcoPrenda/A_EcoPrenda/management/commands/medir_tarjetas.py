@@ -0,0 +1,48 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from A_EcoPrenda.cache_utils import clave_tarjeta_prenda, renderizar_tarjetas_prendas
+from A_EcoPrenda.models import Prenda
+
+
+class Command(BaseCommand):
+    help = 'Mide el tiempo de renderizado de una página de tarjetas de prendas con caché fría y caliente'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamano', type=int, default=24, help='Prendas por página (por defecto 24)')
+        parser.add_argument('--repeticiones', type=int, default=20, help='Repeticiones por medición')
+
+    def handle(self, *args, **kwargs):
+        tamano = kwargs['tamano']
+        repeticiones = kwargs['repeticiones']
+
+        prendas = list(Prenda.objects.select_related('user').order_by('-fecha_publicacion')[:tamano])
+        if not prendas:
+            self.stdout.write(self.style.WARNING('No hay prendas para medir.'))
+            return
+        claves = [clave_tarjeta_prenda(prenda) for prenda in prendas]
+
+        # Caché fría: se eliminan las tarjetas antes de cada repetición
+        fria = 0.0
+        for _ in range(repeticiones):
+            cache.delete_many(claves)
+            inicio = time.perf_counter()
+            renderizar_tarjetas_prendas(prendas)
+            fria += time.perf_counter() - inicio
+
+        # Caché caliente: todas las tarjetas se obtienen con un solo get_many
+        caliente = 0.0
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            _, aciertos = renderizar_tarjetas_prendas(prendas)
+            caliente += time.perf_counter() - inicio
+
+        fria_ms = fria / repeticiones * 1000
+        caliente_ms = caliente / repeticiones * 1000
+        self.stdout.write(f'Tarjetas por página: {len(prendas)}')
+        self.stdout.write(f'Sin caché:  {fria_ms:.2f} ms por página')
+        self.stdout.write(f'Con caché:  {caliente_ms:.2f} ms por página ({aciertos}/{len(prendas)} aciertos)')
+        if caliente_ms:
+            self.stdout.write(self.style.SUCCESS(f'Mejora: {fria_ms / caliente_ms:.1f}x'))
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import random
+import time
+import tracemalloc
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from A_EcoPrenda import tiempo_real
+from A_EcoPrenda.models import Usuario
+
+
+class ClienteSSE:
+    """Una conexión SSE simulada contra la aplicación ASGI, sin red de por medio."""
+
+    def __init__(self, cookie, lento=False):
+        self.cookie = cookie
+        self.lento = lento
+        self.estado = None
+        self.latencias = []
+        self.reconectar = False
+        self.listo = asyncio.Event()
+        self.desconectar = asyncio.Event()
+        self.destrabar = asyncio.Event()
+        self._cuerpo_leido = False
+
+    async def recibir(self):
+        if not self._cuerpo_leido:
+            self._cuerpo_leido = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.desconectar.wait()
+        return {'type': 'http.disconnect'}
+
+    async def enviar(self, mensaje):
+        if mensaje['type'] == 'http.response.start':
+            self.estado = mensaje['status']
+            return
+        cuerpo = mensaje.get('body', b'').decode()
+        if cuerpo.startswith('retry:'):
+            self.listo.set()
+        if 'event: mensaje' in cuerpo:
+            if self.lento:
+                # Cliente que no lee: el servidor queda bloqueado en el envío y su cola se llena
+                await self.destrabar.wait()
+            for linea in cuerpo.splitlines():
+                if linea.startswith('data: '):
+                    self.latencias.append(time.perf_counter() - json.loads(linea[6:])['enviado'])
+        if 'event: reconectar' in cuerpo:
+            self.reconectar = True
+
+    def scope(self, ruta):
+        return {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': ruta, 'raw_path': ruta.encode(), 'query_string': b'', 'root_path': '',
+            'headers': [(b'host', b'localhost'), (b'cookie', self.cookie.encode()), (b'user-agent', b'medir-tiempo-real')],
+            'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+        }
+
+
+class Command(BaseCommand):
+    help = 'Mide el flujo SSE de mensajes en un worker: conexiones inactivas, reparto y clientes lentos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conexiones', type=int, default=2000, help='Conexiones SSE abiertas a la vez')
+        parser.add_argument('--mensajes', type=int, default=2000, help='Mensajes publicados a conexiones al azar')
+        parser.add_argument('--lentos', type=int, default=20, help='Conexiones que dejan de leer (contrapresión)')
+        parser.add_argument('--tanda', type=int, default=200, help='Conexiones que se abren a la vez')
+        parser.add_argument('--conservar', action='store_true', help='No borra los datos de prueba al terminar')
+
+    def handle(self, *args, **kwargs):
+        cantidad, lentos = kwargs['conexiones'], kwargs['lentos']
+        if cantidad < 1 or not 0 <= lentos < cantidad:
+            raise CommandError('Se necesita al menos una conexión y menos lentas que conexiones.')
+
+        sufijo = uuid.uuid4().hex[:8]
+        # bulk_create: sin hashear contraseñas (no se usan para iniciar sesión)
+        usuarios = Usuario.objects.bulk_create(
+            Usuario(nombre=f'Oyente {i}', correo=f'sse-{sufijo}-{i}@ecoprenda.test', contrasena='-')
+            for i in range(cantidad)
+        )
+        sesiones = Session.objects.bulk_create(
+            Session(
+                session_key=f'sse{sufijo}{i:08d}',
+                session_data=SessionStore().encode({'usuario_id': usuario.pk, 'user_agent': 'medir-tiempo-real'}),
+                expire_date=timezone.now() + timedelta(hours=1),
+            )
+            for i, usuario in enumerate(usuarios)
+        )
+        try:
+            # Se sirve con la aplicación ASGI, así que se mide aunque el despliegue no lo active
+            with override_settings(TIEMPO_REAL_HABILITADO=True):
+                asyncio.run(self._medir(usuarios, sesiones, lentos, kwargs['mensajes'], kwargs['tanda']))
+        finally:
+            if not kwargs['conservar']:
+                Session.objects.filter(pk__in=[s.pk for s in sesiones]).delete()
+                Usuario.objects.filter(pk__in=[u.pk for u in usuarios]).delete()
+
+    async def _medir(self, usuarios, sesiones, lentos, cantidad_mensajes, tanda):
+        aplicacion = get_asgi_application()
+        capa = tiempo_real.obtener_capa()
+        ruta = reverse('eventos_mensajes')
+        cookie = settings.SESSION_COOKIE_NAME + '={}; cookie_consent={{"esenciales":true}}'
+        clientes = [ClienteSSE(cookie.format(s.session_key), lento=i < lentos) for i, s in enumerate(sesiones)]
+
+        # Conexiones: la petición pasa por todo el middleware; después queda inactiva.
+        # La primera calienta la aplicación (URLs, middleware) fuera de la medición de memoria.
+        def conectar(cliente):
+            return asyncio.create_task(aplicacion(cliente.scope(ruta), cliente.recibir, cliente.enviar))
+
+        tareas = [conectar(clientes[0])]
+        await asyncio.wait_for(clientes[0].listo.wait(), timeout=30)
+        # Memoria de Python retenida por las conexiones (el RSS incluye el pico y la fragmentación)
+        tracemalloc.start()
+        memoria_inicial = tracemalloc.get_traced_memory()[0]
+        inicio = time.perf_counter()
+        # Por tandas, como llegan los navegadores: el middleware síncrono atiende de a una petición
+        for desde in range(1, len(clientes), tanda):
+            nuevos = clientes[desde:desde + tanda]
+            tareas += [conectar(cliente) for cliente in nuevos]
+            await asyncio.wait_for(asyncio.gather(*(c.listo.wait() for c in nuevos)), timeout=300)
+        segundos = time.perf_counter() - inicio
+        memoria = (tracemalloc.get_traced_memory()[0] - memoria_inicial) / 1024 / 1024
+        tracemalloc.stop()
+        abiertas = capa.conexiones()
+        if abiertas != len(clientes) or any(c.estado != 200 for c in clientes):
+            raise CommandError(f'Se esperaban {len(clientes)} conexiones abiertas y hay {abiertas}.')
+        self.stdout.write(
+            f'{abiertas} conexiones abiertas en {segundos:.2f} s; '
+            f'memoria +{memoria:.1f} MB (~{memoria * 1024 / max(abiertas - 1, 1):.1f} KB por conexión)'
+        )
+
+        # Reparto: publicaciones desde otro hilo, como las de on_commit en una vista síncrona
+        rapidos = [(u, c) for u, c in zip(usuarios, clientes) if not c.lento]
+
+        def publicar():
+            for i in range(cantidad_mensajes):
+                usuario, _ = random.choice(rapidos)
+                capa.publicar(tiempo_real.canal_usuario(usuario.pk), {'tipo': 'mensaje', 'id': i, 'enviado': time.perf_counter()})
+            # Más avisos de los que caben en la cola de cada cliente lento
+            for usuario, cliente in zip(usuarios, clientes):
+                if cliente.lento:
+                    for i in range(capa.tamano_cola + 10):
+                        capa.publicar(tiempo_real.canal_usuario(usuario.pk), {'tipo': 'mensaje', 'id': i, 'enviado': time.perf_counter()})
+
+        inicio = time.perf_counter()
+        await asyncio.to_thread(publicar)
+        while sum(len(c.latencias) for _, c in rapidos) < cantidad_mensajes and time.perf_counter() - inicio < 60:
+            await asyncio.sleep(0.01)
+        segundos = time.perf_counter() - inicio
+        latencias = sorted(l for _, c in rapidos for l in c.latencias)
+        if len(latencias) != cantidad_mensajes:
+            raise CommandError(f'Se publicaron {cantidad_mensajes} mensajes y llegaron {len(latencias)}.')
+        if latencias:
+            self.stdout.write(
+                f'{len(latencias)} mensajes entregados en {segundos:.2f} s; latencia p50 '
+                f'{latencias[len(latencias) // 2] * 1000:.1f} ms, p99 {latencias[int(len(latencias) * 0.99)] * 1000:.1f} ms'
+            )
+
+        # Contrapresión: los lentos se desbordaron; al destrabarlos reciben `reconectar` y se cierran
+        for cliente in clientes:
+            cliente.destrabar.set()
+        await asyncio.wait_for(asyncio.gather(*tareas[:lentos]), timeout=30)
+        if not all(c.reconectar for c in clientes[:lentos]) or capa.desbordadas < lentos:
+            raise CommandError('Los clientes lentos no recibieron la orden de reconectar.')
+        self.stdout.write(f'{lentos} clientes lentos desbordados y desconectados; quedan {capa.conexiones()} conexiones')
+
+        # Desconexión de los demás: las suscripciones se liberan
+        for cliente in clientes:
+            cliente.desconectar.set()
+        await asyncio.wait_for(asyncio.gather(*tareas, return_exceptions=True), timeout=60)
+        if capa.conexiones():
+            raise CommandError(f'Quedaron {capa.conexiones()} suscripciones tras desconectar a todos.')
+        self.stdout.write(self.style.SUCCESS('Todas las suscripciones se liberaron al desconectar.'))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from A_EcoPrenda.agradecimientos import TAMANO_LOTE, procesar_pendientes
+
+
+class Command(BaseCommand):
+    help = 'Procesa los agradecimientos masivos en cola (y retoma los que quedaron interrumpidos)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='Mensajes por lote')
+        parser.add_argument('--continuo', action='store_true', help='Sigue esperando envíos nuevos (para correr como servicio)')
+        parser.add_argument('--intervalo', type=float, default=5.0, help='Segundos de espera cuando no hay envíos')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['lote'] < 1:
+            raise CommandError('El lote debe ser al menos 1.')
+
+        inicio = time.perf_counter()
+        envios = mensajes = 0
+        try:
+            while True:
+                resultado = procesar_pendientes(kwargs['lote'])
+                envios += resultado['envios']
+                mensajes += resultado['mensajes']
+                if not kwargs['continuo']:
+                    break
+                time.sleep(kwargs['intervalo'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Detenido.'))
+
+        segundos = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(f'{envios} envíos procesados, {mensajes} mensajes enviados en {segundos:.2f} s'))
@@ -0,0 +1,60 @@
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from A_EcoPrenda.eventos import CONSUMIDORES, procesar_lote
+
+
+class Command(BaseCommand):
+    help = 'Despacha los eventos de transacciones del outbox a sus consumidores (logros, agradecimientos, ...)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=100, help='Eventos por lote')
+        parser.add_argument('--trabajadores', type=int, default=1, help='Hilos que drenan el outbox en paralelo')
+        parser.add_argument('--continuo', action='store_true', help='Sigue esperando eventos nuevos (para correr como servicio)')
+        parser.add_argument('--intervalo', type=float, default=2.0, help='Segundos de espera cuando el outbox está vacío')
+
+    def _trabajador(self, tamano_lote, continuo, intervalo, totales, lock):
+        try:
+            while True:
+                resultado = procesar_lote(tamano_lote)
+                with lock:
+                    totales.update(resultado)
+                if resultado['reclamados'] < tamano_lote:
+                    if not continuo:
+                        return
+                    time.sleep(intervalo)
+        finally:
+            connection.close()
+
+    def handle(self, *args, **kwargs):
+        if kwargs['lote'] < 1 or kwargs['trabajadores'] < 1:
+            raise CommandError('El lote y los trabajadores deben ser al menos 1.')
+        self.stdout.write(f"Consumidores: {', '.join(CONSUMIDORES)}")
+
+        totales = Counter()
+        lock = threading.Lock()
+        argumentos = (kwargs['lote'], kwargs['continuo'], kwargs['intervalo'], totales, lock)
+        hilos = [
+            threading.Thread(target=self._trabajador, args=argumentos, daemon=True)
+            for _ in range(kwargs['trabajadores'])
+        ]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        try:
+            for hilo in hilos:
+                while hilo.is_alive():
+                    hilo.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Detenido.'))
+
+        segundos = time.perf_counter() - inicio
+        estilo = self.style.WARNING if totales['fallidos'] else self.style.SUCCESS
+        self.stdout.write(estilo(
+            f"{totales['procesados']} eventos procesados, {totales['reintentos']} para reintentar, "
+            f"{totales['fallidos']} fallidos en {segundos:.2f} s"
+        ))
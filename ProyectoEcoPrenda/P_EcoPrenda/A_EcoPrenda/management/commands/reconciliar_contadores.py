@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from A_EcoPrenda.contadores import reconciliar
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los contadores de la plataforma desde las tablas y corrige los desvíos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--solo-revisar', action='store_true', help='Informa los desvíos sin corregirlos')
+
+    def handle(self, *args, **kwargs):
+        aplicar = not kwargs['solo_revisar']
+        desvios = reconciliar(aplicar=aplicar)
+
+        if not desvios:
+            self.stdout.write(self.style.SUCCESS('Los contadores están al día.'))
+            return
+        for nombre, (guardado, real) in desvios.items():
+            self.stdout.write(f'{nombre}: guardado={guardado} real={real}')
+        accion = 'corregidos' if aplicar else 'con desvío (sin corregir)'
+        self.stdout.write(self.style.WARNING(f'{len(desvios)} contadores {accion}.'))
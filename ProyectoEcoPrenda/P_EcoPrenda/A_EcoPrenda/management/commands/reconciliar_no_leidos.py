@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from A_EcoPrenda.conversaciones import reconciliar_no_leidos
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los mensajes no leídos de cada conversación desde los mensajes y corrige los desvíos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--solo-revisar', action='store_true', help='Informa los desvíos sin corregirlos')
+
+    def handle(self, *args, **kwargs):
+        aplicar = not kwargs['solo_revisar']
+        desvios = reconciliar_no_leidos(aplicar=aplicar)
+
+        if not desvios:
+            self.stdout.write(self.style.SUCCESS('Los no leídos de las conversaciones están al día.'))
+            return
+        for (menor, mayor), (guardado, real) in desvios.items():
+            self.stdout.write(f'{menor}-{mayor}: guardado={guardado} real={real}')
+        accion = 'corregidas' if aplicar else 'con desvío (sin corregir)'
+        self.stdout.write(self.style.WARNING(f'{len(desvios)} conversaciones {accion}.'))
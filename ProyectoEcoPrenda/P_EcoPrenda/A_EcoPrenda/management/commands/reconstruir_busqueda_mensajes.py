@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from A_EcoPrenda import busqueda_mensajes
+
+
+class Command(BaseCommand):
+    help = 'Crea lo que falte de la búsqueda de mensajes (columna/índice o tabla FTS5 y triggers) y reindexa en SQLite'
+
+    def handle(self, *args, **kwargs):
+        busqueda_mensajes.instalar(reconstruir=True)
+        motor = busqueda_mensajes.motor()
+        if motor == 'basico':
+            self.stdout.write(self.style.WARNING(
+                f'El motor {connection.vendor} no tiene búsqueda de texto completo: se usa icontains.'
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(f'Búsqueda de mensajes lista ({motor}).'))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from A_EcoPrenda.couriers import ADAPTADORES
+from A_EcoPrenda.seguimiento import seguir_envios
+
+
+class Command(BaseCommand):
+    help = 'Consulta a los couriers el estado de los envíos en proceso y completa o cancela las transacciones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Envíos consultados concurrentemente por lote')
+        parser.add_argument('--max-lotes', type=int, default=0, help='Lotes por pasada (0 = todos)')
+        parser.add_argument('--continuo', action='store_true', help='Repite cada --intervalo segundos (para correr como servicio)')
+        parser.add_argument('--intervalo', type=int, default=300, help='Segundos entre pasadas en modo continuo')
+
+    def _pasada(self, tamano_lote, max_lotes):
+        inicio = time.perf_counter()
+        resumen = seguir_envios(tamano_lote, max_lotes)
+        self.stdout.write(
+            f"{resumen['consultados']} envíos consultados en {time.perf_counter() - inicio:.2f} s: "
+            f"{resumen['completar']} entregados, {resumen['cancelar']} devueltos, "
+            f"{resumen['errores']} errores, {resumen['cambiaron_entretanto']} cambiaron entretanto"
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs['lote'] < 1:
+            raise CommandError('El lote debe tener al menos un envío.')
+        if not ADAPTADORES:
+            self.stdout.write(self.style.WARNING('No hay couriers registrados (ver A_EcoPrenda/couriers.py): nada que consultar.'))
+            return
+        self.stdout.write(f"Couriers: {', '.join(ADAPTADORES)}")
+
+        if not kwargs['continuo']:
+            self._pasada(kwargs['lote'], kwargs['max_lotes'])
+            return
+
+        try:
+            while True:
+                close_old_connections()
+                self._pasada(kwargs['lote'], kwargs['max_lotes'])
+                time.sleep(kwargs['intervalo'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Detenido.'))
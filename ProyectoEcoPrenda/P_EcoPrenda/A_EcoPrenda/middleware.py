@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from django.utils import timezone
 from django.shortcuts import redirect
 from django.urls import reverse
@@ -6,6 +8,17 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Cada cuántos segundos se vuelve a anotar la última actividad en la sesión: anotarla en
+# cada petición reescribiría la sesión siempre (también en los 304)
+INTERVALO_ACTIVIDAD = 60
+
+
+def es_revalidacion(request):
+    """GET/HEAD condicional: el navegador solo pregunta si su copia sigue vigente."""
+    return request.method in ('GET', 'HEAD') and (
+        'HTTP_IF_NONE_MATCH' in request.META or 'HTTP_IF_MODIFIED_SINCE' in request.META
+    )
+
 
 class SessionManagementMiddleware:
     """
@@ -18,10 +31,16 @@ class SessionManagementMiddleware:
     def __call__(self, request):
         # Código que se ejecuta antes de la vista
         
-        # Actualizar última actividad del usuario
+        # Actualizar última actividad del usuario (a lo más cada INTERVALO_ACTIVIDAD segundos)
         if request.session.get('usuario_id'):
-            request.session['ultima_actividad'] = timezone.now().isoformat()
-            request.session.modified = True
+            ahora = timezone.now()
+            anotada = request.session.get('ultima_actividad')
+            try:
+                vigente = anotada and (ahora - datetime.fromisoformat(anotada)).total_seconds() < INTERVALO_ACTIVIDAD
+            except (TypeError, ValueError):
+                vigente = False
+            if not vigente:
+                request.session['ultima_actividad'] = ahora.isoformat()
         
         # Obtener usuario de la sesión y agregarlo al request
         request.usuario_actual = None
@@ -94,19 +113,22 @@ class SessionSecurityMiddleware:
         self.get_response = get_response
     
     def __call__(self, request):
-        # Verificar si es la primera vez que se crea la sesión
-        if not request.session.session_key:
-            request.session.create()
-        
-        # Rotar la clave de sesión periódicamente (cada 100 requests)
-        contador = request.session.get('request_counter', 0)
-        contador += 1
-        request.session['request_counter'] = contador
+        # Sin usuario en la sesión no hay nada que proteger: no se crea ni se escribe
+        # la sesión, así un visitante anónimo recibe un 304 sin tocar django_session
+        if not request.session.get('usuario_id'):
+            return self.get_response(request)
         
-        if contador >= 100:
-            request.session.cycle_key()
-            request.session['request_counter'] = 0
-            logger.info("Clave de sesión rotada por seguridad")
+        # Rotar la clave de sesión periódicamente (cada 100 requests). Las revalidaciones
+        # no cuentan, para que un 304 no reescriba la sesión
+        if not es_revalidacion(request):
+            contador = request.session.get('request_counter', 0)
+            contador += 1
+            request.session['request_counter'] = contador
+            
+            if contador >= 100:
+                request.session.cycle_key()
+                request.session['request_counter'] = 0
+                logger.info("Clave de sesión rotada por seguridad")
         
         # Guardar información del navegador para detección de cambios
         user_agent = request.META.get('HTTP_USER_AGENT', '')
@@ -118,7 +140,8 @@ class SessionSecurityMiddleware:
             logger.warning("Sesión cerrada: cambio de user agent detectado")
             return redirect('login')
         
-        request.session['user_agent'] = user_agent
+        if sesion_user_agent != user_agent:
+            request.session['user_agent'] = user_agent
         
         response = self.get_response(request)
         return response
\ No newline at end of file
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('A_EcoPrenda', '0002_remove_fundacion_id_fundacion_id_fundacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prenda',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Versión de la fila para invalidar cachés'),
+        ),
+    ]
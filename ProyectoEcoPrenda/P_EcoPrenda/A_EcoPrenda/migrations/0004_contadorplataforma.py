@@ -0,0 +1,60 @@
+# Generated by Django 5.2.5 on 2026-10-19 11:40
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def sembrar_contadores(apps, schema_editor):
+    """Crea los contadores con los valores actuales de las tablas."""
+    ContadorPlataforma = apps.get_model('A_EcoPrenda', 'ContadorPlataforma')
+    Usuario = apps.get_model('A_EcoPrenda', 'Usuario')
+    Prenda = apps.get_model('A_EcoPrenda', 'Prenda')
+    Transaccion = apps.get_model('A_EcoPrenda', 'Transaccion')
+    ImpactoAmbiental = apps.get_model('A_EcoPrenda', 'ImpactoAmbiental')
+
+    prendas = Prenda.objects.aggregate(
+        total=Count('pk'), disponibles=Count('pk', filter=Q(estado='DISPONIBLE'))
+    )
+    transacciones = Transaccion.objects.aggregate(
+        total=Count('pk'), donaciones=Count('pk', filter=Q(tipo__nombre_tipo='Donación'))
+    )
+    impacto = ImpactoAmbiental.objects.aggregate(
+        carbono=Sum('carbono_evitar_kg'), energia=Sum('energia_ahorrada_kwh')
+    )
+    valores = {
+        'usuarios': Usuario.objects.count(),
+        'prendas': prendas['total'],
+        'prendas_disponibles': prendas['disponibles'],
+        'transacciones': transacciones['total'],
+        'donaciones': transacciones['donaciones'],
+        'carbono_evitado_kg': impacto['carbono'] or Decimal('0'),
+        'energia_ahorrada_kwh': impacto['energia'] or Decimal('0'),
+    }
+    ContadorPlataforma.objects.bulk_create(
+        [ContadorPlataforma(nombre=nombre, valor=valor) for nombre, valor in valores.items()]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('A_EcoPrenda', '0003_prenda_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorPlataforma',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50, unique=True)),
+                ('valor', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'contador_plataforma',
+            },
+        ),
+        migrations.RunPython(sembrar_contadores, migrations.RunPython.noop),
+    ]
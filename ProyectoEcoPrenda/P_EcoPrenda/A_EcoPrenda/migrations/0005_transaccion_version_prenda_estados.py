@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 12:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('A_EcoPrenda', '0004_contadorplataforma'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaccion',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Versión de la fila para la concurrencia optimista'),
+        ),
+        migrations.AlterField(
+            model_name='prenda',
+            name='estado',
+            field=models.CharField(choices=[('DISPONIBLE', 'Disponible'), ('RESERVADA', 'Reservada'), ('EN_PROCESO_ENTREGA', 'En Proceso de Entrega'), ('COMPLETADA', 'Completada'), ('CANCELADA', 'Cancelada'), ('AGOTADA', 'Agotada'), ('DONADA', 'Donada'), ('VENDIDA', 'Vendida'), ('INTERCAMBIADA', 'Intercambiada')], default='DISPONIBLE', max_length=50),
+        ),
+    ]
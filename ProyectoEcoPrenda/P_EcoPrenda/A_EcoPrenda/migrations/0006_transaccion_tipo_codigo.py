@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-19 13:40
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def codigo_de_nombre(nombre_tipo):
+    # Copia de tipos_transaccion.codigo_de_nombre (las migraciones no importan código de la app)
+    descompuesto = unicodedata.normalize('NFKD', nombre_tipo or '')
+    sin_tildes = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return '_'.join(sin_tildes.upper().split())
+
+
+def completar_tipo_codigo(apps, schema_editor):
+    """Una UPDATE por tipo (la tabla de tipos tiene pocas filas)."""
+    TipoTransaccion = apps.get_model('A_EcoPrenda', 'TipoTransaccion')
+    Transaccion = apps.get_model('A_EcoPrenda', 'Transaccion')
+    for pk, nombre in TipoTransaccion.objects.values_list('pk', 'nombre_tipo'):
+        Transaccion.objects.filter(tipo_id=pk).update(tipo_codigo=codigo_de_nombre(nombre))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('A_EcoPrenda', '0005_transaccion_version_prenda_estados'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaccion',
+            name='tipo_codigo',
+            field=models.CharField(blank=True, editable=False, help_text='Código del tipo de transacción (DONACION, VENTA, ...)', max_length=30, null=True),
+        ),
+        migrations.RunPython(completar_tipo_codigo, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='transaccion',
+            index=models.Index(fields=['tipo_codigo', 'estado'], name='transaccion_tipo_co_7bc16a_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-19 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('A_EcoPrenda', '0006_transaccion_tipo_codigo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaccion',
+            index=models.Index(fields=['user_origen', 'fecha_transaccion', 'id'], name='transaccion_user_or_7e10e6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaccion',
+            index=models.Index(fields=['user_destino', 'fecha_transaccion', 'id'], name='transaccion_user_de_e2b1f2_idx'),
+        ),
+    ]
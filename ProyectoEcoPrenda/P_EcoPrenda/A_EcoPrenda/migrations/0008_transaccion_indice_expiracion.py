@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-19 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('A_EcoPrenda', '0007_transaccion_indices_linea_tiempo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaccion',
+            index=models.Index(fields=['estado', 'fecha_transaccion'], name='transaccion_estado_25f277_idx'),
+        ),
+    ]
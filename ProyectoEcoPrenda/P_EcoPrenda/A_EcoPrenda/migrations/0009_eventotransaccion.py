@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-19 16:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('A_EcoPrenda', '0008_transaccion_indice_expiracion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoTransaccion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado_anterior', models.CharField(blank=True, max_length=20, null=True)),
+                ('estado_nuevo', models.CharField(max_length=20)),
+                ('fecha_creacion', models.DateTimeField(default=django.utils.timezone.now)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('PROCESADO', 'Procesado'), ('FALLIDO', 'Fallido')], default='PENDIENTE', max_length=20)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('disponible_desde', models.DateTimeField(default=django.utils.timezone.now, help_text='No se despacha antes (reintentos y reclamos en curso)')),
+                ('reclamado_por', models.CharField(blank=True, db_index=True, max_length=32, null=True)),
+                ('consumidores_completados', models.JSONField(blank=True, default=list)),
+                ('ultimo_error', models.TextField(blank=True, null=True)),
+                ('fecha_procesado', models.DateTimeField(blank=True, null=True)),
+                ('transaccion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eventos', to='A_EcoPrenda.transaccion')),
+            ],
+            options={
+                'db_table': 'evento_transaccion',
+                'indexes': [models.Index(fields=['estado', 'disponible_desde'], name='evento_tran_estado_09392f_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:20
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def sincronizar_en_disputa(apps, schema_editor):
+    """en_disputa pasa a marcar solo las disputas abiertas (antes no se limpiaba al resolver)."""
+    Transaccion = apps.get_model('A_EcoPrenda', 'Transaccion')
+    Transaccion.objects.filter(en_disputa=True).exclude(estado='EN_DISPUTA').update(en_disputa=False)
+    Transaccion.objects.filter(estado='EN_DISPUTA').update(
+        en_disputa=True, fecha_disputa=Coalesce('fecha_disputa', 'fecha_transaccion'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('A_EcoPrenda', '0009_eventotransaccion'),
+    ]
+
+    operations = [
+        migrations.RunPython(sincronizar_en_disputa, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='transaccion',
+            index=models.Index(condition=models.Q(('en_disputa', True)), fields=['fecha_disputa', 'id'], name='transaccion_disputas_idx'),
+        ),
+    ]
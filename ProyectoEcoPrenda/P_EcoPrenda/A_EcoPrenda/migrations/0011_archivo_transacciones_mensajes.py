@@ -0,0 +1,132 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+# Vistas de solo lectura sobre tablas calientes y archivo (modelos TransaccionHistorica y
+# MensajeHistorico). Si se agrega una columna a Transaccion o Mensaje, hay que agregarla
+# también a su archivo y volver a crear la vista.
+COLUMNAS_TRANSACCION = (
+    'id, prenda_id, tipo_id, tipo_codigo, user_origen_id, user_destino_id, fundacion_id, campana_id, fecha_transaccion, estado, destino_final, fecha_entrega, en_disputa, razon_disputa, reportado_por_id, fecha_disputa, '
+    'direccion_retiro, direccion_entrega, peso_kg, dimensiones, codigo_seguimiento_envio, costo_envio, courier, version'
+)
+COLUMNAS_MENSAJE = 'id, emisor_id, receptor_id, contenido, fecha_envio, leido'
+
+CREAR_VISTAS = [
+    f"""CREATE VIEW transaccion_historica AS
+        SELECT {COLUMNAS_TRANSACCION}, FALSE AS en_archivo FROM transaccion
+        UNION ALL
+        SELECT {COLUMNAS_TRANSACCION}, TRUE AS en_archivo FROM transaccion_archivada""",
+    f"""CREATE VIEW mensaje_historico AS
+        SELECT {COLUMNAS_MENSAJE}, FALSE AS en_archivo FROM mensaje
+        UNION ALL
+        SELECT {COLUMNAS_MENSAJE}, TRUE AS en_archivo FROM mensaje_archivado""",
+]
+BORRAR_VISTAS = [
+    'DROP VIEW IF EXISTS transaccion_historica',
+    'DROP VIEW IF EXISTS mensaje_historico',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('A_EcoPrenda', '0010_transaccion_cola_disputas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MensajeHistorico',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('contenido', models.CharField(max_length=500)),
+                ('fecha_envio', models.DateTimeField(blank=True, null=True)),
+                ('leido', models.BooleanField(default=False)),
+                ('en_archivo', models.BooleanField()),
+            ],
+            options={
+                'db_table': 'mensaje_historico',
+                'ordering': ['fecha_envio'],
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TransaccionHistorica',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('tipo_codigo', models.CharField(blank=True, max_length=30, null=True)),
+                ('fecha_transaccion', models.DateTimeField(blank=True, null=True)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('ACEPTADA', 'Aceptada'), ('RESERVADA', 'Reservada'), ('EN_PROCESO', 'En Proceso de Entrega'), ('COMPLETADA', 'Completada'), ('RECHAZADA', 'Rechazada'), ('EN_DISPUTA', 'En Disputa'), ('CANCELADA', 'Cancelada')], max_length=20)),
+                ('destino_final', models.CharField(blank=True, max_length=300, null=True)),
+                ('fecha_entrega', models.DateTimeField(blank=True, null=True)),
+                ('en_disputa', models.BooleanField(default=False)),
+                ('razon_disputa', models.TextField(blank=True, null=True)),
+                ('fecha_disputa', models.DateTimeField(blank=True, null=True)),
+                ('direccion_retiro', models.CharField(blank=True, max_length=300, null=True)),
+                ('direccion_entrega', models.CharField(blank=True, max_length=300, null=True)),
+                ('peso_kg', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('dimensiones', models.CharField(blank=True, max_length=100, null=True)),
+                ('codigo_seguimiento_envio', models.CharField(blank=True, max_length=100, null=True)),
+                ('costo_envio', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('courier', models.CharField(blank=True, max_length=50, null=True)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('en_archivo', models.BooleanField()),
+            ],
+            options={
+                'db_table': 'transaccion_historica',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='MensajeArchivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('contenido', models.CharField(max_length=500)),
+                ('fecha_envio', models.DateTimeField(blank=True, null=True)),
+                ('leido', models.BooleanField(default=False)),
+                ('fecha_archivo', models.DateTimeField(default=django.utils.timezone.now)),
+                ('emisor', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='A_EcoPrenda.usuario')),
+                ('receptor', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='A_EcoPrenda.usuario')),
+            ],
+            options={
+                'db_table': 'mensaje_archivado',
+                'indexes': [models.Index(fields=['emisor', 'receptor', 'fecha_envio'], name='mensaje_arc_emisor__8dfc93_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TransaccionArchivada',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('tipo_codigo', models.CharField(blank=True, max_length=30, null=True)),
+                ('fecha_transaccion', models.DateTimeField(blank=True, null=True)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('ACEPTADA', 'Aceptada'), ('RESERVADA', 'Reservada'), ('EN_PROCESO', 'En Proceso de Entrega'), ('COMPLETADA', 'Completada'), ('RECHAZADA', 'Rechazada'), ('EN_DISPUTA', 'En Disputa'), ('CANCELADA', 'Cancelada')], max_length=20)),
+                ('destino_final', models.CharField(blank=True, max_length=300, null=True)),
+                ('fecha_entrega', models.DateTimeField(blank=True, null=True)),
+                ('en_disputa', models.BooleanField(default=False)),
+                ('razon_disputa', models.TextField(blank=True, null=True)),
+                ('fecha_disputa', models.DateTimeField(blank=True, null=True)),
+                ('direccion_retiro', models.CharField(blank=True, max_length=300, null=True)),
+                ('direccion_entrega', models.CharField(blank=True, max_length=300, null=True)),
+                ('peso_kg', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('dimensiones', models.CharField(blank=True, max_length=100, null=True)),
+                ('codigo_seguimiento_envio', models.CharField(blank=True, max_length=100, null=True)),
+                ('costo_envio', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('courier', models.CharField(blank=True, max_length=50, null=True)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('fecha_archivo', models.DateTimeField(default=django.utils.timezone.now)),
+                ('campana', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='A_EcoPrenda.campanafundacion')),
+                ('fundacion', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='A_EcoPrenda.fundacion')),
+                ('prenda', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='A_EcoPrenda.prenda')),
+                ('reportado_por', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='A_EcoPrenda.usuario')),
+                ('tipo', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='A_EcoPrenda.tipotransaccion')),
+                ('user_destino', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='A_EcoPrenda.usuario')),
+                ('user_origen', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='A_EcoPrenda.usuario')),
+            ],
+            options={
+                'db_table': 'transaccion_archivada',
+                'indexes': [models.Index(fields=['user_origen', 'fecha_transaccion'], name='transaccion_user_or_acadd8_idx'), models.Index(fields=['user_destino', 'fecha_transaccion'], name='transaccion_user_de_4ba30f_idx'), models.Index(fields=['tipo_codigo', 'estado'], name='transaccion_tipo_co_7f69e7_idx')],
+            },
+        ),
+        migrations.RunSQL(CREAR_VISTAS, BORRAR_VISTAS),
+    ]
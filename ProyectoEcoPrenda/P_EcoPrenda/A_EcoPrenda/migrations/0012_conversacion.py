@@ -0,0 +1,72 @@
+# Generated by Django 5.2.5 on 2026-10-19 21:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Q, Subquery
+
+
+def poblar_conversaciones(apps, schema_editor):
+    """Un resumen por par a partir de los mensajes existentes (una consulta agrupada por sentido)."""
+    Conversacion = apps.get_model('A_EcoPrenda', 'Conversacion')
+    Mensaje = apps.get_model('A_EcoPrenda', 'Mensaje')
+
+    ultimo_del_sentido = Mensaje.objects.filter(
+        emisor=OuterRef('emisor'), receptor=OuterRef('receptor'),
+    ).order_by(F('fecha_envio').desc(nulls_last=True), '-id').values('id')[:1]
+    por_sentido = list(Mensaje.objects.order_by().values('emisor', 'receptor').annotate(
+        ultimo=Subquery(ultimo_del_sentido), no_leidos=Count('id', filter=Q(leido=False)),
+    ))
+    ultimos = Mensaje.objects.in_bulk([fila['ultimo'] for fila in por_sentido])
+
+    def orden(mensaje):
+        return (mensaje.fecha_envio is not None, mensaje.fecha_envio or 0, mensaje.pk)
+
+    pares = {}
+    for fila in por_sentido:
+        menor, mayor = sorted((fila['emisor'], fila['receptor']))
+        resumen = pares.setdefault((menor, mayor), {'ultimo': None, 'no_leidos_menor': 0, 'no_leidos_mayor': 0})
+        candidato = ultimos[fila['ultimo']]
+        if resumen['ultimo'] is None or orden(candidato) > orden(resumen['ultimo']):
+            resumen['ultimo'] = candidato
+        lado = 'no_leidos_menor' if fila['receptor'] == menor else 'no_leidos_mayor'
+        resumen[lado] += fila['no_leidos']
+
+    Conversacion.objects.bulk_create([
+        Conversacion(
+            usuario_menor_id=menor, usuario_mayor_id=mayor, ultimo_mensaje=resumen['ultimo'],
+            vista_previa=' '.join(resumen['ultimo'].contenido.split())[:100],
+            fecha_ultimo_mensaje=resumen['ultimo'].fecha_envio or django.utils.timezone.now(),
+            no_leidos_menor=resumen['no_leidos_menor'], no_leidos_mayor=resumen['no_leidos_mayor'],
+        )
+        for (menor, mayor), resumen in pares.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('A_EcoPrenda', '0011_archivo_transacciones_mensajes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vista_previa', models.CharField(blank=True, default='', max_length=100)),
+                ('fecha_ultimo_mensaje', models.DateTimeField(default=django.utils.timezone.now)),
+                ('no_leidos_menor', models.PositiveIntegerField(default=0, help_text='Mensajes que usuario_menor aún no leyó')),
+                ('no_leidos_mayor', models.PositiveIntegerField(default=0, help_text='Mensajes que usuario_mayor aún no leyó')),
+                ('ultimo_mensaje', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='A_EcoPrenda.mensaje')),
+                ('usuario_mayor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversaciones_mayor', to='A_EcoPrenda.usuario')),
+                ('usuario_menor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversaciones_menor', to='A_EcoPrenda.usuario')),
+            ],
+            options={
+                'db_table': 'conversacion',
+                'indexes': [models.Index(fields=['usuario_menor', 'fecha_ultimo_mensaje', 'id'], name='conversacio_usuario_210c75_idx'), models.Index(fields=['usuario_mayor', 'fecha_ultimo_mensaje', 'id'], name='conversacio_usuario_d145df_idx')],
+                'constraints': [models.UniqueConstraint(fields=('usuario_menor', 'usuario_mayor'), name='conversacion_par_unico')],
+            },
+        ),
+        migrations.RunPython(poblar_conversaciones, migrations.RunPython.noop),
+    ]
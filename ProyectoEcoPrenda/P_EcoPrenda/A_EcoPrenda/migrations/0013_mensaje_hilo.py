@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+
+# La vista mensaje_historico lista sus columnas: se borra antes de agregar las de la clave
+# del hilo y 0014 la vuelve a crear con ellas.
+COLUMNAS_MENSAJE_ANTERIORES = 'id, emisor_id, receptor_id, contenido, fecha_envio, leido'
+CREAR_VISTA_ANTERIOR = f"""CREATE VIEW mensaje_historico AS
+    SELECT {COLUMNAS_MENSAJE_ANTERIORES}, FALSE AS en_archivo FROM mensaje
+    UNION ALL
+    SELECT {COLUMNAS_MENSAJE_ANTERIORES}, TRUE AS en_archivo FROM mensaje_archivado"""
+
+
+def poblar_hilos(apps, schema_editor):
+    """Clave del hilo en ambas tablas: dos UPDATE por tabla, una por sentido del par."""
+    for nombre in ('Mensaje', 'MensajeArchivado'):
+        modelo = apps.get_model('A_EcoPrenda', nombre)
+        modelo.objects.filter(emisor__lte=F('receptor')).update(
+            usuario_menor=F('emisor'), usuario_mayor=F('receptor'),
+        )
+        modelo.objects.filter(emisor__gt=F('receptor')).update(
+            usuario_menor=F('receptor'), usuario_mayor=F('emisor'),
+        )
+
+
+def _clave(**kwargs):
+    return models.ForeignKey(
+        null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+',
+        to='A_EcoPrenda.usuario', db_index=False, **kwargs,
+    )
+
+
+class Migration(migrations.Migration):
+    # Las columnas se llenan en esta migración y pasan a NOT NULL en la siguiente: en
+    # PostgreSQL no se puede alterar una tabla con FK diferidas pendientes en la misma transacción.
+
+    dependencies = [
+        ('A_EcoPrenda', '0012_conversacion'),
+    ]
+
+    operations = [
+        migrations.RunSQL('DROP VIEW IF EXISTS mensaje_historico', CREAR_VISTA_ANTERIOR),
+        migrations.AddField(model_name='mensaje', name='usuario_menor', field=_clave(editable=False)),
+        migrations.AddField(model_name='mensaje', name='usuario_mayor', field=_clave(editable=False)),
+        migrations.AddField(model_name='mensajearchivado', name='usuario_menor', field=_clave(db_constraint=False)),
+        migrations.AddField(model_name='mensajearchivado', name='usuario_mayor', field=_clave(db_constraint=False)),
+        migrations.RunPython(poblar_hilos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Vista mensaje_historico con la clave del hilo. Si se agrega una columna a Mensaje, hay
+# que agregarla también a MensajeArchivado y volver a crear la vista.
+COLUMNAS_MENSAJE = 'id, emisor_id, receptor_id, contenido, fecha_envio, leido, usuario_menor_id, usuario_mayor_id'
+CREAR_VISTA = f"""CREATE VIEW mensaje_historico AS
+    SELECT {COLUMNAS_MENSAJE}, FALSE AS en_archivo FROM mensaje
+    UNION ALL
+    SELECT {COLUMNAS_MENSAJE}, TRUE AS en_archivo FROM mensaje_archivado"""
+
+
+def _clave(**kwargs):
+    return models.ForeignKey(
+        on_delete=django.db.models.deletion.DO_NOTHING, related_name='+',
+        to='A_EcoPrenda.usuario', db_index=False, **kwargs,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('A_EcoPrenda', '0013_mensaje_hilo'),
+    ]
+
+    operations = [
+        migrations.AlterField(model_name='mensaje', name='usuario_menor', field=_clave(editable=False)),
+        migrations.AlterField(model_name='mensaje', name='usuario_mayor', field=_clave(editable=False)),
+        migrations.AlterField(model_name='mensajearchivado', name='usuario_menor', field=_clave(db_constraint=False)),
+        migrations.AlterField(model_name='mensajearchivado', name='usuario_mayor', field=_clave(db_constraint=False)),
+        migrations.AddIndex(
+            model_name='mensaje',
+            index=models.Index(fields=['usuario_menor', 'usuario_mayor', 'fecha_envio', 'id'], name='mensaje_usuario_260031_idx'),
+        ),
+        migrations.RunSQL(CREAR_VISTA, 'DROP VIEW IF EXISTS mensaje_historico'),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:25
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('A_EcoPrenda', '0014_mensaje_hilo_indice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnvioAgradecimiento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('contenido', models.CharField(max_length=500)),
+                ('fecha_desde', models.DateTimeField(blank=True, null=True)),
+                ('fecha_hasta', models.DateTimeField(blank=True, null=True)),
+                ('fecha_creacion', models.DateTimeField(default=django.utils.timezone.now)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_PROCESO', 'En Proceso'), ('COMPLETADO', 'Completado'), ('FALLIDO', 'Fallido')], default='PENDIENTE', max_length=20)),
+                ('total', models.PositiveIntegerField(default=0, help_text='Donantes a agradecer (calculado al crear el envío)')),
+                ('enviados', models.PositiveIntegerField(default=0)),
+                ('ultimo_donante', models.IntegerField(blank=True, help_text='Último donante enviado: el siguiente lote sigue desde aquí', null=True)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('disponible_desde', models.DateTimeField(default=django.utils.timezone.now, help_text='No se procesa antes (reclamo en curso)')),
+                ('reclamado_por', models.CharField(blank=True, max_length=32, null=True)),
+                ('ultimo_error', models.TextField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('campana', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='A_EcoPrenda.campanafundacion')),
+                ('emisor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='A_EcoPrenda.usuario')),
+                ('fundacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='envios_agradecimiento', to='A_EcoPrenda.fundacion')),
+            ],
+            options={
+                'db_table': 'envio_agradecimiento',
+                'indexes': [models.Index(fields=['estado', 'disponible_desde'], name='envio_agrad_estado_eed567_idx')],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='transaccion',
+            index=models.Index(fields=['fundacion', 'tipo_codigo', 'user_origen'], name='transaccion_fundaci_109a7e_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.5 on 2026-10-19 07:10
+
+from django.db import migrations
+
+# Búsqueda de texto completo en los mensajes (ver busqueda_mensajes.py). Depende del motor,
+# así que no es un campo del modelo: PostgreSQL lleva una columna tsvector generada con su
+# índice GIN; SQLite, una tabla FTS5 mantenida por triggers. Otros motores no llevan nada
+# (la búsqueda usa icontains).
+#
+# En PostgreSQL, agregar la columna generada reescribe la tabla mensaje (bloqueo mientras
+# dura); el índice se crea CONCURRENTLY, por eso la migración no es atómica.
+
+POSTGRESQL = [
+    """ALTER TABLE mensaje ADD COLUMN IF NOT EXISTS busqueda tsvector
+        GENERATED ALWAYS AS (to_tsvector('spanish'::regconfig, coalesce(contenido, ''))) STORED""",
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS mensaje_busqueda_idx ON mensaje USING GIN (busqueda)',
+]
+POSTGRESQL_REVERTIR = [
+    'DROP INDEX CONCURRENTLY IF EXISTS mensaje_busqueda_idx',
+    'ALTER TABLE mensaje DROP COLUMN IF EXISTS busqueda',
+]
+
+SQLITE = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS mensaje_fts USING fts5(
+        contenido, content='mensaje', content_rowid='id', tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS mensaje_fts_insertar AFTER INSERT ON mensaje BEGIN
+        INSERT INTO mensaje_fts(rowid, contenido) VALUES (new.id, new.contenido);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS mensaje_fts_borrar AFTER DELETE ON mensaje BEGIN
+        INSERT INTO mensaje_fts(mensaje_fts, rowid, contenido) VALUES ('delete', old.id, old.contenido);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS mensaje_fts_editar AFTER UPDATE OF contenido ON mensaje BEGIN
+        INSERT INTO mensaje_fts(mensaje_fts, rowid, contenido) VALUES ('delete', old.id, old.contenido);
+        INSERT INTO mensaje_fts(rowid, contenido) VALUES (new.id, new.contenido);
+    END""",
+    "INSERT INTO mensaje_fts(mensaje_fts) VALUES ('rebuild')",
+]
+SQLITE_REVERTIR = [
+    'DROP TRIGGER IF EXISTS mensaje_fts_insertar',
+    'DROP TRIGGER IF EXISTS mensaje_fts_borrar',
+    'DROP TRIGGER IF EXISTS mensaje_fts_editar',
+    'DROP TABLE IF EXISTS mensaje_fts',
+]
+
+
+def _ejecutar(schema_editor, por_motor):
+    for sql in por_motor.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def crear_busqueda(apps, schema_editor):
+    _ejecutar(schema_editor, {'postgresql': POSTGRESQL, 'sqlite': SQLITE})
+
+
+def quitar_busqueda(apps, schema_editor):
+    _ejecutar(schema_editor, {'postgresql': POSTGRESQL_REVERTIR, 'sqlite': SQLITE_REVERTIR})
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('A_EcoPrenda', '0015_envio_agradecimiento'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_busqueda, quitar_busqueda),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('A_EcoPrenda', '0016_mensaje_busqueda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenMensajes',
+            fields=[
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumen_mensajes', serialize=False, to='A_EcoPrenda.usuario')),
+                ('activo', models.BooleanField(default=True, help_text='El usuario recibe el resumen (se da de baja desde el correo)')),
+                ('ultimo_mensaje', models.BigIntegerField(default=0, help_text='Último mensaje avisado: el próximo resumen solo incluye los posteriores')),
+                ('fecha_ultimo_envio', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'resumen_mensajes',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='mensaje',
+            index=models.Index(condition=models.Q(('leido', False)), fields=['receptor', 'id'], name='mensaje_no_leidos_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('A_EcoPrenda', '0017_resumen_mensajes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prenda',
+            name='modificada',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
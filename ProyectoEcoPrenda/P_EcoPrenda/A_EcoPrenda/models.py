@@ -1,8 +1,11 @@
 from django.db import models
+from django.db.models import F, Q
 from django.utils import timezone
 from django.contrib.auth.hashers import make_password, check_password
 import hashlib
 
+from .tipos_transaccion import DONACION, INTERCAMBIO, VENTA, codigo_tipo
+
 # ------------------- Usuario ----------------------
 
 class Usuario(models.Model):
@@ -91,6 +94,13 @@ class Usuario(models.Model):
         """Hashea y asigna la contraseña de forma segura."""
         self.contrasena = make_password(raw_password)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Se recuerda el nombre cargado para detectar cambios que afectan a las tarjetas de sus prendas.
+        instancia._nombre_original = instancia.__dict__.get('nombre')
+        return instancia
+
     def check_password(self, raw_password):
         """Verifica la contraseña contra el hash almacenado.
         Soporta hashes Django (con $) y legacy SHA256 hex.
@@ -109,6 +119,11 @@ class Usuario(models.Model):
         if self.contrasena and '$' not in self.contrasena:
             self.contrasena = make_password(self.contrasena)
         super().save(*args, **kwargs)
+        # Si cambió el nombre, invalida las tarjetas cacheadas de sus prendas (una sola UPDATE).
+        nombre_original = getattr(self, '_nombre_original', None)
+        if nombre_original is not None and nombre_original != self.nombre:
+            Prenda.objects.filter(user=self).update(**Prenda.nueva_version())
+        self._nombre_original = self.nombre
 
 # ------------------- Fundacion ----------------------
 
@@ -146,7 +161,7 @@ class Fundacion(models.Model):
 
     def obtener_representantes(self): return self.representantes.all()
     def total_donaciones_recibidas(self):
-        return Transaccion.objects.filter(id_fundacion=self, id_tipo__nombre_tipo='Donación').count()
+        return Transaccion.objects.filter(fundacion=self, tipo_codigo=DONACION).count()
     
     def save(self, *args, **kwargs):
         # Validación: Si activa=True, lat y lng son obligatorios.
@@ -183,6 +198,9 @@ class Prenda(models.Model):
         ('COMPLETADA', 'Completada'),
         ('CANCELADA', 'Cancelada'),
         ('AGOTADA', 'Agotada'),
+        ('DONADA', 'Donada'),
+        ('VENDIDA', 'Vendida'),
+        ('INTERCAMBIADA', 'Intercambiada'),
     ]
     estado = models.CharField(max_length=50, choices=ESTADO_CHOICES, default='DISPONIBLE')
     
@@ -190,6 +208,12 @@ class Prenda(models.Model):
     
     imagen_prenda = models.ImageField(upload_to='prendas/', blank=True, null=True, max_length=200)
 
+    # Versión de fila: se incrementa en cada guardado y cuando cambia el dueño; forma parte de la clave de caché de la tarjeta.
+    version = models.PositiveIntegerField(default=0, editable=False, help_text='Versión de la fila para invalidar cachés')
+    # Momento de la última versión: con su índice, los procesos que mantienen copias en memoria
+    # (índice de búsqueda, autocompletado) leen solo lo que cambió desde su última sincronización.
+    modificada = models.DateTimeField(auto_now=True, db_index=True)
+
     class Meta:
         db_table = 'prenda'
         indexes = [
@@ -213,11 +237,33 @@ class Prenda(models.Model):
     def __str__(self): return self.nombre
     def esta_disponible(self): return self.estado == 'DISPONIBLE'  # Simplificado.
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Se recuerda el estado cargado para que los contadores detecten cambios de disponibilidad.
+        instancia._estado_original = instancia.__dict__.get('estado')
+        return instancia
+
+    @staticmethod
+    def nueva_version(**cambios):
+        """Valores de un QuerySet.update() de prendas: los cambios más una nueva versión y su marca."""
+        return {**cambios, 'version': F('version') + 1, 'modificada': timezone.now()}
+
+    def save(self, *args, **kwargs):
+        # Cada guardado genera una nueva versión, lo que invalida la tarjeta cacheada.
+        self.version = (self.version or 0) + 1
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = list({*update_fields, 'version', 'modificada'})
+        super().save(*args, **kwargs)
+
 # ------------------- Transaccion ----------------------
 
 class Transaccion(models.Model):
     prenda = models.ForeignKey(Prenda, on_delete=models.CASCADE)  # Cambié a CASCADE y renombré.
     tipo = models.ForeignKey(TipoTransaccion, on_delete=models.CASCADE)  # Cambié a CASCADE y renombré.
+    # Código del tipo (ver tipos_transaccion.py), desnormalizado para filtrar sin join con tipo_transaccion.
+    tipo_codigo = models.CharField(max_length=30, blank=True, null=True, editable=False, help_text='Código del tipo de transacción (DONACION, VENTA, ...)')
     user_origen = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='transacciones_origen')  # Cambié a CASCADE y renombré.
     user_destino = models.ForeignKey(Usuario, on_delete=models.CASCADE, blank=True, null=True, related_name='transacciones_destino')  # Cambié a CASCADE.
     fundacion = models.ForeignKey(Fundacion, on_delete=models.SET_NULL, blank=True, null=True)  # Cambié a SET_NULL.
@@ -290,38 +336,102 @@ class Transaccion(models.Model):
         help_text='Nombre del courier (ej: Chilexpress, Correos, etc.)'
     )
 
+    # Versión de fila: los cambios de estado (transiciones.py) solo se aplican si no cambió desde que se leyó.
+    version = models.PositiveIntegerField(default=0, editable=False, help_text='Versión de la fila para la concurrencia optimista')
+
+    # Estado que toma la prenda según el estado de su transacción.
+    ESTADO_PRENDA_POR_ESTADO = {
+        'PENDIENTE': 'RESERVADA',
+        'ACEPTADA': 'RESERVADA',
+        'RESERVADA': 'RESERVADA',
+        'EN_PROCESO': 'EN_PROCESO_ENTREGA',
+        'EN_DISPUTA': 'EN_PROCESO_ENTREGA',
+        'RECHAZADA': 'DISPONIBLE',
+        'CANCELADA': 'DISPONIBLE',
+    }
+    ESTADO_PRENDA_COMPLETADA = {
+        DONACION: 'DONADA',
+        VENTA: 'VENDIDA',
+        INTERCAMBIO: 'INTERCAMBIADA',
+    }
+
     class Meta:
         db_table = 'transaccion'
         indexes = [
             models.Index(fields=['estado']),  # Para consultas por estado.
             models.Index(fields=['fecha_transaccion']),  # Para ordenar por fecha.
+            models.Index(fields=['tipo_codigo', 'estado']),  # Para filtros por tipo (sin join).
+            models.Index(fields=['user_origen', 'fecha_transaccion', 'id']),  # Línea de tiempo (enviadas).
+            models.Index(fields=['user_destino', 'fecha_transaccion', 'id']),  # Línea de tiempo (recibidas).
+            models.Index(fields=['estado', 'fecha_transaccion']),  # Expiración de transacciones sin avance.
+            models.Index(fields=['fundacion', 'tipo_codigo', 'user_origen']),  # Donantes de una fundación (agradecimientos).
+            # Cola de disputas abiertas: índice parcial, solo contiene las filas en disputa.
+            models.Index(fields=['fecha_disputa', 'id'], condition=Q(en_disputa=True), name='transaccion_disputas_idx'),
         ]
 
     def __str__(self):
         return f"{self.tipo.nombre_tipo} - {self.prenda.nombre}"
-    def es_donacion(self): return self.tipo.nombre_tipo == 'Donación'
+    def es_donacion(self): return codigo_tipo(self.tipo_id) == DONACION
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Se recuerda el tipo cargado para que los contadores detecten cambios de tipo.
+        instancia._tipo_id_original = instancia.__dict__.get('tipo_id')
+        # Y el estado, para tocar la prenda solo cuando cambia.
+        instancia._estado_original = instancia.__dict__.get('estado')
+        return instancia
     
+    def estado_prenda_derivado(self, estado=None):
+        """Estado de la prenda para `estado` (por defecto, el actual) de la transacción."""
+        estado = estado or self.estado
+        if estado == 'COMPLETADA':
+            return self.ESTADO_PRENDA_COMPLETADA.get(codigo_tipo(self.tipo_id), 'COMPLETADA')
+        return self.ESTADO_PRENDA_POR_ESTADO.get(estado)
+
     def actualizar_disponibilidad_prenda(self):
-        if self.estado == 'COMPLETADA':
-            if self.tipo.nombre_tipo == 'Donación':
-                self.prenda.estado = 'DONADA'  # Asumiendo que agregas 'DONADA' a choices si no está.
-            elif self.tipo.nombre_tipo == 'Venta':
-                self.prenda.estado = 'VENDIDA'
-            elif self.tipo.nombre_tipo == 'Intercambio':
-                self.prenda.estado = 'INTERCAMBIADA'
-        elif self.estado in ['PENDIENTE', 'EN_PROCESO']:
-            self.prenda.estado = 'EN_PROCESO'
-        elif self.estado in ['RECHAZADA', 'CANCELADA']:
-            self.prenda.estado = 'DISPONIBLE'
-        self.prenda.save()
+        """Lleva la prenda al estado derivado con un UPDATE de `estado` (solo si cambia). True si cambió."""
+        from .transiciones import sincronizar_prenda
+        return sincronizar_prenda(self, self.estado)
 
     def save(self, *args, **kwargs):
         # Validación: Si estado == 'EN_PROCESO', direccion_entrega es obligatoria.
         if self.estado == 'EN_PROCESO' and not self.direccion_entrega:
             raise ValueError("Dirección de entrega es obligatoria en estado 'EN_PROCESO'.")
+        # Un guardado completo también cambia la versión: invalida los cambios de estado leídos antes.
+        self.version = (self.version or 0) + 1
+        campos_extra = ['version']
+        if self._state.adding or not self.tipo_codigo or self.tipo_id != getattr(self, '_tipo_id_original', None):
+            self.tipo_codigo = codigo_tipo(self.tipo_id)
+            campos_extra.append('tipo_codigo')
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = list({*update_fields, *campos_extra})
+        # Solo un cambio de estado o de tipo puede cambiar el estado de la prenda
+        # (editar, por ejemplo, el código de seguimiento no la toca).
+        afecta_prenda = (
+            self._state.adding
+            or self.estado != getattr(self, '_estado_original', None)
+            or self.tipo_id != getattr(self, '_tipo_id_original', None)
+        )
+        # crear_transaccion reserva la prenda (estado y versión) justo antes de insertar
+        reservada, self._prenda_reservada = getattr(self, '_prenda_reservada', False), False
         super().save(*args, **kwargs)
-        # Actualiza automáticamente la prenda.
-        self.actualizar_disponibilidad_prenda()
+        if not (reservada or (afecta_prenda and self.actualizar_disponibilidad_prenda())):
+            # El detalle de la prenda muestra su transacción actual: su versión cambia igual
+            Prenda.objects.filter(pk=self.prenda_id).update(**Prenda.nueva_version())
+        self._estado_original = self.estado
+
+    # Cambios de estado: delegan en la máquina de estados (transiciones.py).
+    def marcar_en_proceso(self, **cambios):
+        from .transiciones import aplicar_transicion
+        return aplicar_transicion(self, 'enviar', **cambios)
+    def marcar_como_completada(self):
+        from .transiciones import aplicar_transicion
+        return aplicar_transicion(self, 'completar')
+    def cancelar(self):
+        from .transiciones import aplicar_transicion
+        return aplicar_transicion(self, 'cancelar')
 
     # Métodos de permisos (sin cambios mayores, pero ajustados a nuevos nombres de campos).
     def puede_aceptar(self, usuario):
@@ -394,19 +504,92 @@ class Transaccion(models.Model):
 
 # ------------------- Mensaje ----------------------
 
+class MensajeQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create no pasa por save(): la clave del hilo se completa aquí.
+        objs = list(objs)
+        for mensaje in objs:
+            mensaje.asignar_hilo()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def hilo(self, id_a, id_b):
+        """Mensajes entre dos usuarios (en ambos sentidos), por la clave del hilo."""
+        menor, mayor = sorted((int(id_a), int(id_b)))
+        return self.filter(usuario_menor_id=menor, usuario_mayor_id=mayor)
+
+    def participante(self, id_usuario):
+        """Mensajes enviados o recibidos por el usuario."""
+        return self.filter(Q(emisor_id=id_usuario) | Q(receptor_id=id_usuario))
+
+
+def _clave_hilo(usuario):
+    # Los mensajes se borran en cascada por emisor/receptor; la clave del hilo no
+    # agrega otra búsqueda al borrar un usuario ni un índice propio por columna.
+    return models.ForeignKey(
+        usuario, on_delete=models.DO_NOTHING, related_name='+', db_index=False, editable=False,
+    )
+
+
 class Mensaje(models.Model):
     emisor = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='mensajes_enviados')  # Cambié a CASCADE y renombré.
     receptor = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='mensajes_recibidos')  # Cambié a CASCADE.
     contenido = models.CharField(max_length=500)
     fecha_envio = models.DateTimeField(default=timezone.now, blank=True, null=True)
     leido = models.BooleanField(default=False)  # Agregado para marcar mensajes leídos.
+    # Clave del hilo: el par ordenado (menor, mayor), igual en ambos sentidos de la conversación.
+    usuario_menor = _clave_hilo(Usuario)
+    usuario_mayor = _clave_hilo(Usuario)
+
+    objects = MensajeQuerySet.as_manager()
 
     class Meta:
         db_table = 'mensaje'
         ordering = ['fecha_envio']  # Ordena por fecha por defecto.
+        indexes = [
+            # Conversación paginada por cursor: un solo rango del índice para ambos sentidos.
+            models.Index(fields=['usuario_menor', 'usuario_mayor', 'fecha_envio', 'id']),
+            # Resúmenes por correo: índice parcial, solo contiene los mensajes sin leer.
+            models.Index(fields=['receptor', 'id'], condition=Q(leido=False), name='mensaje_no_leidos_idx'),
+        ]
 
     def __str__(self): return f"Mensaje de {self.emisor.nombre} a {self.receptor.nombre}"
 
+    def asignar_hilo(self):
+        self.usuario_menor_id, self.usuario_mayor_id = sorted((self.emisor_id, self.receptor_id))
+
+    def save(self, *args, **kwargs):
+        self.asignar_hilo()
+        super().save(*args, **kwargs)
+
+
+class Conversacion(models.Model):
+    """
+    Resumen de la conversación entre dos usuarios (una fila por par, ver conversaciones.py).
+
+    El par se guarda ordenado (usuario_menor.pk < usuario_mayor.pk); cada lado tiene su
+    contador de mensajes sin leer.
+    """
+    usuario_menor = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='conversaciones_menor')
+    usuario_mayor = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='conversaciones_mayor')
+    ultimo_mensaje = models.ForeignKey(Mensaje, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    vista_previa = models.CharField(max_length=100, blank=True, default='')
+    fecha_ultimo_mensaje = models.DateTimeField(default=timezone.now)
+    no_leidos_menor = models.PositiveIntegerField(default=0, help_text='Mensajes que usuario_menor aún no leyó')
+    no_leidos_mayor = models.PositiveIntegerField(default=0, help_text='Mensajes que usuario_mayor aún no leyó')
+
+    class Meta:
+        db_table = 'conversacion'
+        constraints = [
+            models.UniqueConstraint(fields=['usuario_menor', 'usuario_mayor'], name='conversacion_par_unico'),
+        ]
+        indexes = [
+            # Bandeja de entrada: un índice por lado, como la línea de tiempo de transacciones.
+            models.Index(fields=['usuario_menor', 'fecha_ultimo_mensaje', 'id']),
+            models.Index(fields=['usuario_mayor', 'fecha_ultimo_mensaje', 'id']),
+        ]
+
+    def __str__(self): return f"Conversación {self.usuario_menor_id} - {self.usuario_mayor_id}"
+
 # ------------------- Impacto Ambiental ----------------------
 
 class ImpactoAmbiental(models.Model):
@@ -420,6 +603,14 @@ class ImpactoAmbiental(models.Model):
 
     def __str__(self): return f"Impacto de {self.prenda.nombre}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Valores cargados, para sumar solo la diferencia a los contadores al actualizar.
+        instancia._carbono_original = instancia.__dict__.get('carbono_evitar_kg')
+        instancia._energia_original = instancia.__dict__.get('energia_ahorrada_kwh')
+        return instancia
+
 # ------------------- Logros ----------------------
 
 class Logro(models.Model):
@@ -486,7 +677,7 @@ class CampanaFundacion(models.Model):
         return Transaccion.objects.filter(
             campana=self,  # Ajusté nombre de campo.
             estado='COMPLETADA',
-            tipo__nombre_tipo='Donación'  # Ajusté nombre de campo.
+            tipo_codigo=DONACION
         ).count()
     
     def porcentaje_completado(self):
@@ -500,4 +691,213 @@ class CampanaFundacion(models.Model):
         if self.fecha_fin and self.fecha_inicio >= self.fecha_fin:
             raise ValueError("La fecha de fin debe ser posterior a la fecha de inicio.")
         super().save(*args, **kwargs)
- 
\ No newline at end of file
+ 
+
+# ------------------- Contadores ----------------------
+
+class ContadorPlataforma(models.Model):
+    """Totales de la plataforma desnormalizados (se mantienen con señales, ver contadores.py)."""
+    nombre = models.CharField(max_length=50, unique=True)
+    valor = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'contador_plataforma'
+
+    def __str__(self): return f"{self.nombre}: {self.valor}"
+
+# ------------------- Eventos de transacciones (outbox) ----------------------
+
+class EventoTransaccion(models.Model):
+    """Cambio de estado de una transacción pendiente de despachar a los consumidores (ver eventos.py)."""
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('PROCESADO', 'Procesado'),
+        ('FALLIDO', 'Fallido'),
+    ]
+    transaccion = models.ForeignKey(Transaccion, on_delete=models.CASCADE, related_name='eventos')
+    estado_anterior = models.CharField(max_length=20, blank=True, null=True)
+    estado_nuevo = models.CharField(max_length=20)
+    fecha_creacion = models.DateTimeField(default=timezone.now)
+
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='PENDIENTE')
+    intentos = models.PositiveSmallIntegerField(default=0)
+    disponible_desde = models.DateTimeField(default=timezone.now, help_text='No se despacha antes (reintentos y reclamos en curso)')
+    reclamado_por = models.CharField(max_length=32, blank=True, null=True, db_index=True)
+    consumidores_completados = models.JSONField(default=list, blank=True)
+    ultimo_error = models.TextField(blank=True, null=True)
+    fecha_procesado = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'evento_transaccion'
+        indexes = [
+            models.Index(fields=['estado', 'disponible_desde']),  # Para reclamar los pendientes.
+        ]
+
+    def __str__(self): return f"Transacción {self.transaccion_id}: {self.estado_anterior} -> {self.estado_nuevo}"
+
+# ------------------- Agradecimientos masivos (ver agradecimientos.py) ----------------------
+
+class EnvioAgradecimiento(models.Model):
+    """Agradecimiento de una fundación a todos sus donantes, enviado en segundo plano por lotes."""
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('EN_PROCESO', 'En Proceso'),
+        ('COMPLETADO', 'Completado'),
+        ('FALLIDO', 'Fallido'),
+    ]
+    fundacion = models.ForeignKey(Fundacion, on_delete=models.CASCADE, related_name='envios_agradecimiento')
+    emisor = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='+')
+    contenido = models.CharField(max_length=500)
+    # Filtros de los donantes: campaña y/o rango de fechas de la donación
+    campana = models.ForeignKey(CampanaFundacion, on_delete=models.SET_NULL, null=True, blank=True)
+    fecha_desde = models.DateTimeField(blank=True, null=True)
+    fecha_hasta = models.DateTimeField(blank=True, null=True)
+    fecha_creacion = models.DateTimeField(default=timezone.now)
+
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='PENDIENTE')
+    total = models.PositiveIntegerField(default=0, help_text='Donantes a agradecer (calculado al crear el envío)')
+    enviados = models.PositiveIntegerField(default=0)
+    ultimo_donante = models.IntegerField(blank=True, null=True, help_text='Último donante enviado: el siguiente lote sigue desde aquí')
+    intentos = models.PositiveSmallIntegerField(default=0)
+    disponible_desde = models.DateTimeField(default=timezone.now, help_text='No se procesa antes (reclamo en curso)')
+    reclamado_por = models.CharField(max_length=32, blank=True, null=True)
+    ultimo_error = models.TextField(blank=True, null=True)
+    fecha_fin = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'envio_agradecimiento'
+        indexes = [
+            models.Index(fields=['estado', 'disponible_desde']),  # Para reclamar los pendientes.
+        ]
+
+    def __str__(self): return f"Agradecimiento {self.pk} de {self.fundacion_id}: {self.enviados}/{self.total}"
+
+    @property
+    def porcentaje(self):
+        if self.estado == 'COMPLETADO' or not self.total:
+            return 100 if self.estado == 'COMPLETADO' else 0
+        return min(100, self.enviados * 100 // self.total)
+
+# ------------------- Resumen de mensajes por correo (ver resumen_mensajes.py) ----------------------
+
+class ResumenMensajes(models.Model):
+    """Resumen por correo de los mensajes sin leer de un usuario: hasta dónde se avisó y cuándo."""
+    usuario = models.OneToOneField(Usuario, on_delete=models.CASCADE, primary_key=True, related_name='resumen_mensajes')
+    activo = models.BooleanField(default=True, help_text='El usuario recibe el resumen (se da de baja desde el correo)')
+    ultimo_mensaje = models.BigIntegerField(default=0, help_text='Último mensaje avisado: el próximo resumen solo incluye los posteriores')
+    fecha_ultimo_envio = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'resumen_mensajes'
+
+    def __str__(self): return f"Resumen de mensajes de {self.usuario_id}"
+
+# ------------------- Archivo (tablas frías, ver archivo.py) ----------------------
+
+def _referencia_archivo(modelo, **kwargs):
+    """FK sin restricción ni relación inversa: el archivo no bloquea ni sigue a las tablas calientes."""
+    return models.ForeignKey(modelo, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+', **kwargs)
+
+
+class HistoricoQuerySet(models.QuerySet):
+    """Consultas sobre una vista histórica (tabla caliente + archivo)."""
+    def calientes(self): return self.filter(en_archivo=False)
+    def archivadas(self): return self.filter(en_archivo=True)
+
+
+class TransaccionArchivoBase(models.Model):
+    """Columnas de Transaccion (mismos nombres) para su archivo y la vista histórica."""
+    id = models.BigIntegerField(primary_key=True)
+    prenda = _referencia_archivo(Prenda)
+    tipo = _referencia_archivo(TipoTransaccion)
+    tipo_codigo = models.CharField(max_length=30, blank=True, null=True)
+    user_origen = _referencia_archivo(Usuario)
+    user_destino = _referencia_archivo(Usuario, blank=True, null=True)
+    fundacion = _referencia_archivo(Fundacion, blank=True, null=True)
+    campana = _referencia_archivo('CampanaFundacion', blank=True, null=True)
+    fecha_transaccion = models.DateTimeField(blank=True, null=True)
+    estado = models.CharField(max_length=20, choices=Transaccion.ESTADO_CHOICES)
+    destino_final = models.CharField(max_length=300, blank=True, null=True)
+    fecha_entrega = models.DateTimeField(blank=True, null=True)
+    en_disputa = models.BooleanField(default=False)
+    razon_disputa = models.TextField(null=True, blank=True)
+    reportado_por = _referencia_archivo(Usuario, null=True, blank=True)
+    fecha_disputa = models.DateTimeField(null=True, blank=True)
+    direccion_retiro = models.CharField(max_length=300, blank=True, null=True)
+    direccion_entrega = models.CharField(max_length=300, blank=True, null=True)
+    peso_kg = models.DecimalField(max_digits=5, decimal_places=2, blank=True, null=True)
+    dimensiones = models.CharField(max_length=100, blank=True, null=True)
+    codigo_seguimiento_envio = models.CharField(max_length=100, blank=True, null=True)
+    costo_envio = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    courier = models.CharField(max_length=50, blank=True, null=True)
+    version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self): return f"Transacción {self.id} ({self.estado})"
+
+
+class TransaccionArchivada(TransaccionArchivoBase):
+    """Transacción terminada y antigua movida fuera de la tabla caliente (conserva su id)."""
+    fecha_archivo = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'transaccion_archivada'
+        indexes = [
+            models.Index(fields=['user_origen', 'fecha_transaccion']),  # Historial por usuario.
+            models.Index(fields=['user_destino', 'fecha_transaccion']),
+            models.Index(fields=['tipo_codigo', 'estado']),  # Reportes por tipo.
+        ]
+
+
+class TransaccionHistorica(TransaccionArchivoBase):
+    """Vista de solo lectura: transacciones calientes y archivadas juntas (para reportes)."""
+    en_archivo = models.BooleanField()
+
+    objects = HistoricoQuerySet.as_manager()
+
+    class Meta:
+        managed = False
+        db_table = 'transaccion_historica'
+
+
+class MensajeArchivoBase(models.Model):
+    """Columnas de Mensaje (mismos nombres) para su archivo y la vista histórica."""
+    id = models.BigIntegerField(primary_key=True)
+    emisor = _referencia_archivo(Usuario)
+    receptor = _referencia_archivo(Usuario)
+    contenido = models.CharField(max_length=500)
+    fecha_envio = models.DateTimeField(blank=True, null=True)
+    leido = models.BooleanField(default=False)
+    usuario_menor = _referencia_archivo(Usuario, db_index=False)
+    usuario_mayor = _referencia_archivo(Usuario, db_index=False)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self): return f"Mensaje {self.id}"
+
+
+class MensajeArchivado(MensajeArchivoBase):
+    """Mensaje de una conversación archivada junto con sus transacciones."""
+    fecha_archivo = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'mensaje_archivado'
+        indexes = [
+            models.Index(fields=['emisor', 'receptor', 'fecha_envio']),  # Conversación por par.
+        ]
+
+
+class MensajeHistorico(MensajeArchivoBase):
+    """Vista de solo lectura: mensajes calientes y archivados juntos (para reportes)."""
+    en_archivo = models.BooleanField()
+
+    objects = HistoricoQuerySet.as_manager()
+
+    class Meta:
+        managed = False
+        db_table = 'mensaje_historico'
+        ordering = ['fecha_envio']
@@ -0,0 +1,218 @@
+"""
+Panel de negociación de una prenda
+Todo lo que se necesita para negociar una prenda en una sola respuesta: la prenda y su
+dueño, la transacción activa del usuario sobre ella y los últimos mensajes con la otra
+parte. Evita pasar de la prenda a la conversación (y volver) leyendo cada vez lo mismo.
+
+- Cuesta a lo más tres consultas, sin importar el largo del hilo: la prenda con su dueño,
+  la transacción activa con sus partes y la última página del hilo (por su índice).
+- Se guarda poco tiempo en la caché por (usuario, prenda). La entrada lleva las
+  generaciones del usuario y de la prenda con las que se armó; una lectura (get_many de
+  la entrada y las dos generaciones) basta para saber si sigue válida.
+- Invalidar es borrar generaciones, una sola operación de caché para cualquier número
+  de usuarios o prendas: un mensaje nuevo borra la de sus dos partes y un cambio de la
+  prenda o de una transacción sobre ella, la de la prenda. Una generación que falta se
+  vuelve a crear con un valor nuevo, así que ninguna entrada anterior vuelve a valer.
+- Las generaciones se leen antes de consultar la base de datos: si un cambio se confirma
+  mientras se arma el panel, la entrada queda guardada con una generación ya vieja.
+"""
+
+import logging
+import secrets
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from .conversaciones import MENSAJES_POR_PAGINA, mensajes_hilo
+from .models import Prenda, Transaccion
+from .transiciones import ESTADOS_ACTIVOS
+
+logger = logging.getLogger(__name__)
+
+# Vida del panel en caché (segundos): solo acota lo que no se invalida (p. ej. un cambio de nombre)
+TIMEOUT_PANEL = getattr(settings, 'CACHE_PANEL_NEGOCIACION_TIMEOUT', 30)
+# Las generaciones deben durar más que los paneles que validan
+TIMEOUT_GENERACION = 24 * 60 * 60
+
+MENSAJES_PANEL = 10
+
+
+# ==============================================================================
+# GENERACIONES E INVALIDACIÓN
+# ==============================================================================
+
+def clave_panel(id_usuario, id_prenda, limite):
+    return f'panel_negociacion:{id_usuario}:{id_prenda}:{limite}'
+
+
+def clave_generacion_usuario(id_usuario):
+    return f'panel_negociacion:usuario:{id_usuario}'
+
+
+def clave_generacion_prenda(id_prenda):
+    return f'panel_negociacion:prenda:{id_prenda}'
+
+
+def _generaciones(claves, valores):
+    """Generación vigente de cada clave (crea las que faltan en `valores`)."""
+    generaciones = {}
+    for clave in claves:
+        if clave not in valores:
+            nueva = secrets.token_hex(8)
+            # add: si otra petición la creó entretanto, vale la suya
+            if not cache.add(clave, nueva, TIMEOUT_GENERACION):
+                nueva = cache.get(clave, nueva)
+            valores[clave] = nueva
+        generaciones[clave] = valores[clave]
+    return generaciones
+
+
+def _borrar_generaciones(claves):
+    claves = list(claves)
+    if not claves:
+        return
+
+    def borrar():
+        try:
+            cache.delete_many(claves)
+        except Exception as e:
+            # Sin caché tampoco hay paneles guardados; los que queden vencen en TIMEOUT_PANEL
+            logger.warning(f"Panel de negociación: no se pudo invalidar ({e})")
+
+    transaction.on_commit(borrar)
+
+
+def invalidar_usuarios(ids_usuario):
+    """Descarta los paneles de estos usuarios (mensajes nuevos) al confirmar la transacción."""
+    _borrar_generaciones(clave_generacion_usuario(pk) for pk in set(ids_usuario) if pk)
+
+
+def invalidar_prendas(ids_prenda):
+    """Descarta los paneles de estas prendas, para todos los usuarios, al confirmar la transacción."""
+    _borrar_generaciones(clave_generacion_prenda(pk) for pk in set(ids_prenda) if pk)
+
+
+# ==============================================================================
+# PANEL
+# ==============================================================================
+
+def _usuario(usuario):
+    if usuario is None:
+        return None
+    return {'id': usuario.pk, 'nombre': usuario.nombre}
+
+
+def _transaccion_activa(id_usuario, prenda):
+    """La transacción activa más reciente del usuario sobre la prenda, con sus partes."""
+    return (
+        Transaccion.objects.filter(
+            Q(user_origen_id=id_usuario) | Q(user_destino_id=id_usuario),
+            prenda_id=prenda.pk, estado__in=ESTADOS_ACTIVOS,
+        )
+        .select_related('user_origen', 'user_destino')
+        .order_by('-fecha_transaccion', '-id')
+        .first()
+    )
+
+
+def _contraparte(id_usuario, prenda, transaccion):
+    """Con quién negocia el usuario: el dueño o, si el usuario es el dueño, la otra parte."""
+    if prenda.user_id != id_usuario:
+        return prenda.user
+    if transaccion is None:
+        return None
+    for parte in (transaccion.user_origen, transaccion.user_destino):
+        if parte is not None and parte.pk != id_usuario:
+            return parte
+    return None
+
+
+def construir_panel(id_usuario, id_prenda, limite=MENSAJES_PANEL):
+    """
+    Arma el panel desde la base de datos (a lo más tres consultas).
+
+    Returns:
+        dict serializable en JSON, o None si la prenda no existe
+    """
+    prenda = Prenda.objects.select_related('user').filter(pk=id_prenda).first()
+    if prenda is None:
+        return None
+    transaccion = _transaccion_activa(id_usuario, prenda)
+    contraparte = _contraparte(id_usuario, prenda, transaccion)
+
+    mensajes, anteriores = [], None
+    if contraparte is not None:
+        mensajes, anteriores = mensajes_hilo(id_usuario, contraparte.pk, limite=limite)
+
+    return {
+        'prenda': {
+            'id': prenda.pk,
+            'nombre': prenda.nombre,
+            'descripcion': prenda.descripcion,
+            'categoria': prenda.categoria,
+            'talla': prenda.talla,
+            'estado': prenda.estado,
+            'estado_display': prenda.get_estado_display(),
+            'imagen': prenda.imagen_prenda.url if prenda.imagen_prenda else None,
+            'dueno': _usuario(prenda.user),
+        },
+        'es_dueno': prenda.user_id == id_usuario,
+        'transaccion': None if transaccion is None else {
+            'id': transaccion.pk,
+            'tipo': transaccion.tipo_codigo,
+            'estado': transaccion.estado,
+            'estado_display': transaccion.get_estado_display(),
+            'version': transaccion.version,
+            'fecha_transaccion': transaccion.fecha_transaccion.isoformat() if transaccion.fecha_transaccion else None,
+            'user_origen': transaccion.user_origen_id,
+            'user_destino': transaccion.user_destino_id,
+        },
+        'contraparte': _usuario(contraparte),
+        'mensajes': [
+            {
+                'id': mensaje.pk,
+                'emisor': mensaje.emisor_id,
+                'receptor': mensaje.receptor_id,
+                'contenido': mensaje.contenido,
+                'fecha_envio': mensaje.fecha_envio.isoformat(),
+            }
+            for mensaje in mensajes
+        ],
+        'anteriores': anteriores,
+    }
+
+
+def panel(id_usuario, id_prenda, limite=MENSAJES_PANEL):
+    """
+    Panel de negociación del usuario para la prenda, desde la caché si sigue vigente.
+
+    Args:
+        id_usuario: Usuario que negocia
+        id_prenda: Prenda negociada
+        limite: Mensajes del hilo que se incluyen (los más recientes)
+
+    Returns:
+        dict con la prenda, la transacción activa, la contraparte y los últimos mensajes
+        (y el cursor de los anteriores para conversaciones.mensajes_hilo), o None si la
+        prenda no existe
+    """
+    limite = max(1, min(int(limite), MENSAJES_POR_PAGINA))
+    clave = clave_panel(id_usuario, id_prenda, limite)
+    claves_generacion = [clave_generacion_usuario(id_usuario), clave_generacion_prenda(id_prenda)]
+    try:
+        valores = cache.get_many([clave, *claves_generacion])
+        generaciones = _generaciones(claves_generacion, valores)
+    except Exception as e:
+        logger.warning(f"Panel de negociación: caché no disponible ({e})")
+        return construir_panel(id_usuario, id_prenda, limite)
+
+    guardado = valores.get(clave)
+    if guardado is not None and guardado['generaciones'] == generaciones:
+        return guardado['panel']
+
+    datos = construir_panel(id_usuario, id_prenda, limite)
+    if datos is not None:
+        cache.set(clave, {'generaciones': generaciones, 'panel': datos}, TIMEOUT_PANEL)
+    return datos
@@ -0,0 +1,297 @@
+"""
+Resumen por correo de los mensajes sin leer
+En vez de un correo por mensaje (o de que cada usuario recargue el sitio para ver si le
+escribieron), un proceso periódico envía a cada usuario un solo correo con lo que tiene
+sin leer, agrupado por remitente.
+
+- Los pendientes salen de una consulta agrupada por receptor sobre el índice parcial de
+  mensajes sin leer, por lotes de usuarios en orden de id (keyset). Los remitentes y
+  las vistas previas de todo el lote, de dos consultas más.
+- Solo cuentan los mensajes con más de RESUMEN_MENSAJES_ESPERA_MINUTOS (quien está en
+  línea los lee antes) y posteriores al último resumen: un mensaje se avisa una sola vez.
+- Como mucho un resumen cada RESUMEN_MENSAJES_INTERVALO_HORAS por usuario; quien se dio
+  de baja (enlace firmado en cada correo) no recibe más.
+- El avance (ResumenMensajes) se guarda antes de enviar el lote: si el proceso cae a
+  mitad, un resumen puede perderse pero nunca llega dos veces. Si un envío falla, el
+  avance de ese usuario se restaura y el próximo ciclo lo reintenta.
+- Los correos salen por una sola conexión SMTP abierta (renovada cada
+  CORREOS_POR_CONEXION envíos), a lo más RESUMEN_CORREOS_POR_SEGUNDO por segundo.
+- Una ejecución a la vez: un candado en la caché evita que dos procesos avisen lo mismo.
+"""
+
+import logging
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Count, Exists, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Mensaje, ResumenMensajes, Usuario
+
+logger = logging.getLogger(__name__)
+
+INTERVALO = timedelta(hours=getattr(settings, 'RESUMEN_MENSAJES_INTERVALO_HORAS', 24))
+ESPERA = timedelta(minutes=getattr(settings, 'RESUMEN_MENSAJES_ESPERA_MINUTOS', 30))
+CORREOS_POR_SEGUNDO = getattr(settings, 'RESUMEN_CORREOS_POR_SEGUNDO', 20)
+SITIO_URL = getattr(settings, 'SITIO_URL', 'http://localhost:8000').rstrip('/')
+
+USUARIOS_POR_LOTE = 500
+CORREOS_POR_CONEXION = 100
+REMITENTES_POR_RESUMEN = 5
+
+CANDADO = 'resumen_mensajes:ejecucion'
+PLAZO_CANDADO = 10 * 60  # Se renueva en cada lote
+SAL_BAJA = 'resumen_mensajes.baja'
+
+PLANTILLA_TEXTO = 'resumen_mensajes_correo.txt'
+PLANTILLA_HTML = 'resumen_mensajes_correo.html'
+
+
+class EjecucionEnCurso(Exception):
+    """Otro proceso está enviando resúmenes."""
+
+
+# ==============================================================================
+# PENDIENTES
+# ==============================================================================
+
+def _sin_avisar(ahora):
+    """Mensajes sin leer, con la espera cumplida, posteriores al último resumen de su receptor."""
+    estado = ResumenMensajes.objects.filter(usuario=OuterRef('receptor'))
+    return Mensaje.objects.filter(
+        leido=False,
+        fecha_envio__lte=ahora - ESPERA,
+        id__gt=Coalesce(Subquery(estado.values('ultimo_mensaje')[:1]), 0),
+    ).exclude(
+        Exists(estado.filter(Q(activo=False) | Q(fecha_ultimo_envio__gt=ahora - INTERVALO)))
+    )
+
+
+def pendientes(ahora, despues_de=0, limite=USUARIOS_POR_LOTE):
+    """
+    Usuarios con mensajes por avisar, en orden de id.
+
+    Returns:
+        dict: {id del receptor: (mensajes por avisar, id del último)} de hasta `limite` usuarios
+    """
+    filas = (
+        _sin_avisar(ahora).filter(receptor_id__gt=despues_de)
+        .order_by('receptor').values('receptor')
+        .annotate(total=Count('id'), ultimo=Max('id'))[:limite]
+    )
+    return {fila['receptor']: (fila['total'], fila['ultimo']) for fila in filas}
+
+
+def _remitentes(ids_receptores, ahora):
+    """{receptor: [{'emisor', 'total', 'mensaje'}]} con el último mensaje de cada remitente, del más reciente al más antiguo."""
+    grupos = list(
+        _sin_avisar(ahora).filter(receptor_id__in=ids_receptores)
+        .order_by().values('receptor', 'emisor')
+        .annotate(total=Count('id'), ultimo=Max('id'))
+    )
+    ultimos = Mensaje.objects.select_related('emisor').only(
+        'contenido', 'fecha_envio', 'emisor__id_usuario', 'emisor__nombre', 'emisor__apellido',
+    ).in_bulk([grupo['ultimo'] for grupo in grupos])
+
+    por_receptor = defaultdict(list)
+    for grupo in sorted(grupos, key=lambda g: g['ultimo'], reverse=True):
+        mensaje = ultimos.get(grupo['ultimo'])
+        if mensaje is not None:
+            por_receptor[grupo['receptor']].append({'emisor': mensaje.emisor, 'total': grupo['total'], 'mensaje': mensaje})
+    return por_receptor
+
+
+# ==============================================================================
+# CORREO
+# ==============================================================================
+
+def enlace_baja(id_usuario):
+    """URL absoluta (firmada, sin iniciar sesión) para dejar de recibir el resumen."""
+    return SITIO_URL + reverse('baja_resumen_mensajes', args=[signing.dumps(id_usuario, salt=SAL_BAJA)])
+
+
+def leer_enlace_baja(token):
+    """Id del usuario de un enlace de baja; None si la firma no es válida."""
+    try:
+        return signing.loads(token, salt=SAL_BAJA)
+    except signing.BadSignature:
+        return None
+
+
+def construir_correo(usuario, total, remitentes):
+    """Correo del resumen (texto y HTML) para un usuario."""
+    url_baja = enlace_baja(usuario.pk)
+    contexto = {
+        'usuario': usuario,
+        'total': total,
+        'remitentes': remitentes[:REMITENTES_POR_RESUMEN],
+        'otros_remitentes': max(0, len(remitentes) - REMITENTES_POR_RESUMEN),
+        'sitio_url': SITIO_URL,
+        'url_mensajes': SITIO_URL + reverse('lista_mensajes'),
+        'url_baja': url_baja,
+    }
+    asunto = f"Tienes {total} mensaje{'s' if total != 1 else ''} sin leer en EcoPrenda"
+    correo = EmailMultiAlternatives(
+        asunto, render_to_string(PLANTILLA_TEXTO, contexto), to=[usuario.correo],
+        headers={'List-Unsubscribe': f'<{url_baja}>'},
+    )
+    correo.attach_alternative(render_to_string(PLANTILLA_HTML, contexto), 'text/html')
+    return correo
+
+
+class ConexionCorreo:
+    """
+    Una conexión de correo para muchos envíos, a ritmo limitado.
+
+    La conexión SMTP se abre una vez y se renueva cada `por_conexion` correos (los
+    servidores cortan las sesiones largas) o tras un error.
+    """
+
+    def __init__(self, conexion=None, por_segundo=CORREOS_POR_SEGUNDO, por_conexion=CORREOS_POR_CONEXION):
+        self.conexion = conexion or get_connection()
+        self.intervalo = 1 / por_segundo if por_segundo else 0
+        self.por_conexion = por_conexion
+        self.en_conexion = 0
+        self.siguiente = time.monotonic()
+
+    def enviar(self, correo):
+        """Envía un correo; False si falló (el error queda en el log)."""
+        if self.intervalo:
+            espera = self.siguiente - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            self.siguiente = max(self.siguiente, time.monotonic()) + self.intervalo
+        if self.en_conexion >= self.por_conexion:
+            self.cerrar()
+        try:
+            self.conexion.open()  # No hace nada si ya está abierta
+            enviados = self.conexion.send_messages([correo])
+        except Exception as e:
+            logger.warning(f"Resumen de mensajes: no se pudo enviar a {correo.to[0]}: {e}")
+            self.cerrar()
+            return False
+        self.en_conexion += 1
+        return bool(enviados)
+
+    def cerrar(self):
+        try:
+            self.conexion.close()
+        except Exception:
+            pass
+        self.en_conexion = 0
+
+
+# ==============================================================================
+# LOTES
+# ==============================================================================
+
+def procesar_lote(ahora, conexion, despues_de=0, simular=False, limite=USUARIOS_POR_LOTE):
+    """
+    Envía los resúmenes de los siguientes `limite` usuarios con mensajes por avisar.
+
+    Args:
+        ahora: Momento de referencia de la ejecución
+        conexion: ConexionCorreo compartida por los lotes
+        despues_de: Id de usuario desde el que seguir (exclusive)
+        simular: Arma los correos pero no los envía ni guarda el avance
+
+    Returns:
+        dict: usuarios del lote, enviados, fallidos y `ultimo` (None si no quedan)
+    """
+    lote = pendientes(ahora, despues_de, limite)
+    resultado = {'usuarios': len(lote), 'enviados': 0, 'fallidos': 0,
+                 'ultimo': max(lote) if len(lote) == limite else None}
+    if not lote:
+        return resultado
+
+    remitentes = _remitentes(list(lote), ahora)
+    usuarios = Usuario.objects.only('nombre', 'correo').in_bulk(list(lote))
+    correos = {
+        pk: construir_correo(usuarios[pk], total, remitentes[pk])
+        for pk, (total, _) in lote.items() if pk in usuarios and remitentes[pk]
+    }
+    if simular:
+        resultado['enviados'] = len(correos)
+        return resultado
+
+    # Avance antes de enviar: un corte a mitad del lote no repite correos
+    anteriores = ResumenMensajes.objects.in_bulk(list(correos))
+    with transaction.atomic():
+        _guardar_avance([
+            ResumenMensajes(usuario_id=pk, ultimo_mensaje=lote[pk][1], fecha_ultimo_envio=ahora) for pk in correos
+        ])
+
+    fallidos = [pk for pk, correo in correos.items() if not conexion.enviar(correo)]
+    if fallidos:
+        _guardar_avance([
+            ResumenMensajes(
+                usuario_id=pk,
+                ultimo_mensaje=anteriores[pk].ultimo_mensaje if pk in anteriores else 0,
+                fecha_ultimo_envio=anteriores[pk].fecha_ultimo_envio if pk in anteriores else None,
+            )
+            for pk in fallidos
+        ])
+    resultado['enviados'] = len(correos) - len(fallidos)
+    resultado['fallidos'] = len(fallidos)
+    return resultado
+
+
+def _guardar_avance(estados):
+    ResumenMensajes.objects.bulk_create(
+        estados, update_conflicts=True, unique_fields=['usuario'],
+        update_fields=['ultimo_mensaje', 'fecha_ultimo_envio'],
+    )
+
+
+def enviar_resumenes(simular=False, ahora=None, conexion=None, limite=USUARIOS_POR_LOTE, desde=0, al_terminar_lote=None):
+    """
+    Envía todos los resúmenes pendientes (un ciclo completo).
+
+    Args:
+        simular: Arma los correos sin enviarlos ni guardar el avance
+        conexion: Conexión de correo (por defecto, EMAIL_BACKEND)
+        desde: Id de usuario desde el que empezar (exclusive)
+        al_terminar_lote: Función llamada con el resultado de cada lote
+
+    Returns:
+        dict: usuarios revisados, correos enviados y fallidos
+
+    Raises:
+        EjecucionEnCurso: si otro proceso tiene el candado
+    """
+    ahora = ahora or timezone.now()
+    marca = uuid.uuid4().hex
+    if not simular and not cache.add(CANDADO, marca, PLAZO_CANDADO):
+        raise EjecucionEnCurso('Otro proceso está enviando los resúmenes de mensajes.')
+
+    totales = {'usuarios': 0, 'enviados': 0, 'fallidos': 0}
+    conexion = conexion if isinstance(conexion, ConexionCorreo) else ConexionCorreo(conexion)
+    ultimo = desde
+    try:
+        while ultimo is not None:
+            resultado = procesar_lote(ahora, conexion, despues_de=ultimo, simular=simular, limite=limite)
+            for clave in totales:
+                totales[clave] += resultado[clave]
+            ultimo = resultado['ultimo']
+            if al_terminar_lote:
+                al_terminar_lote(resultado)
+            if not simular:
+                cache.touch(CANDADO, PLAZO_CANDADO)
+    finally:
+        conexion.cerrar()
+        if not simular and cache.get(CANDADO) == marca:
+            cache.delete(CANDADO)
+
+    if totales['enviados'] or totales['fallidos']:
+        logger.info(f"Resumen de mensajes: {totales['enviados']} enviados, {totales['fallidos']} fallidos")
+    return totales
@@ -0,0 +1,148 @@
+"""
+Retención de mensajes
+Borra los mensajes viejos de las conversaciones que ya no los necesitan, para que la
+tabla `mensaje` (y cada consulta de conversación) no crezca sin límite.
+
+- Política: un mensaje se conserva si tiene menos de RETENCION_MENSAJES_DIAS días o si
+  está entre los RETENCION_MENSAJES_POR_HILO más recientes de su conversación. El más
+  reciente siempre queda, así que el resumen de la bandeja (Conversacion) sigue válido.
+- Nunca se borran: los mensajes sin leer (los contadores de no leídos no cambian), las
+  conversaciones de un par con una transacción activa y las de un par que tuvo alguna
+  disputa (abierta o resuelta, también entre las transacciones archivadas).
+- Las conversaciones se recorren por lotes en orden de Conversacion.id (keyset): cada
+  lote lee, con una sola consulta y una función de ventana sobre el índice del hilo,
+  los mensajes que exceden la cuota de cada conversación.
+- Se borra en tramos de `filas_por_borrado` filas, cada uno en su propia transacción:
+  los bloqueos duran lo que un tramo y, si se interrumpe, lo borrado queda borrado y
+  la siguiente ejecución sigue desde el último lote informado.
+- En simulación se recorre igual pero sin borrar: informa cuántos mensajes y cuántos
+  bytes de contenido se liberarían.
+"""
+
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import Length, RowNumber
+from django.utils import timezone
+
+from . import contadores
+from .models import Conversacion, Mensaje, TransaccionHistorica
+from .transiciones import ESTADOS_ACTIVOS
+
+logger = logging.getLogger(__name__)
+
+RETENCION_DIAS = getattr(settings, 'RETENCION_MENSAJES_DIAS', 730)
+RETENCION_POR_HILO = getattr(settings, 'RETENCION_MENSAJES_POR_HILO', 500)
+
+HILOS_POR_LOTE = 200
+FILAS_POR_BORRADO = 1000
+
+# Nombre de la métrica en ContadorPlataforma
+MENSAJES_DEPURADOS = 'mensajes_depurados'
+
+
+# ==============================================================================
+# CANDIDATOS
+# ==============================================================================
+
+def pares_protegidos(pares):
+    """Pares (menor, mayor) con una transacción activa o con alguna disputa."""
+    usuarios = {pk for par in pares for pk in par}
+    if not usuarios:
+        return set()
+    filas = TransaccionHistorica.objects.filter(
+        Q(estado__in=ESTADOS_ACTIVOS) | Q(en_disputa=True) | Q(fecha_disputa__isnull=False),
+        user_origen__in=usuarios, user_destino__in=usuarios,
+    ).values_list('user_origen', 'user_destino')
+    return {tuple(sorted(fila)) for fila in filas} & set(pares)
+
+
+def _excedentes(pares, por_hilo):
+    """(id, fecha_envio, leido, largo) de los mensajes fuera de los `por_hilo` más recientes de cada par."""
+    posicion = Window(
+        RowNumber(),
+        partition_by=[F('usuario_menor'), F('usuario_mayor')],
+        order_by=[F('fecha_envio').desc(nulls_last=True), F('id').desc()],
+    )
+    filas = (
+        Mensaje.objects.filter(
+            usuario_menor__in={menor for menor, _ in pares}, usuario_mayor__in={mayor for _, mayor in pares},
+        )
+        .annotate(posicion=posicion, largo=Length('contenido'))
+        # Solo la condición sobre la ventana: cualquier otro filtro cambiaría la numeración
+        .filter(posicion__gt=por_hilo)
+        .order_by()
+        .values_list('usuario_menor', 'usuario_mayor', 'id', 'fecha_envio', 'leido', 'largo')
+    )
+    return [fila[2:] for fila in filas if fila[:2] in pares]
+
+
+# ==============================================================================
+# LOTE
+# ==============================================================================
+
+def depurar_lote(despues_de=0, dias=RETENCION_DIAS, por_hilo=RETENCION_POR_HILO, simular=False,
+                 hilos_por_lote=HILOS_POR_LOTE, filas_por_borrado=FILAS_POR_BORRADO, pausa=0.0, ahora=None):
+    """
+    Aplica la política de retención a un lote de conversaciones.
+
+    Args:
+        despues_de: Conversacion.id desde el que seguir (exclusive)
+        dias: Antigüedad mínima para borrar (None: solo cuenta la cuota por conversación)
+        por_hilo: Mensajes más recientes que se conservan en cada conversación (al menos 1)
+        simular: No borra; solo cuenta lo que se borraría
+        filas_por_borrado: Filas por DELETE (una transacción cada una)
+        pausa: Segundos de espera entre tramos de borrado
+        ahora: Momento de referencia (por defecto, timezone.now())
+
+    Returns:
+        dict: conversaciones revisadas y protegidas, mensajes y bytes liberados,
+        y `ultimo` (el id desde el que sigue el próximo lote; None si no quedan)
+    """
+    if por_hilo < 1:
+        raise ValueError('Cada conversación conserva al menos su último mensaje.')
+    hilos = list(
+        Conversacion.objects.filter(id__gt=despues_de).order_by('id')
+        .values_list('id', 'usuario_menor_id', 'usuario_mayor_id')[:hilos_por_lote]
+    )
+    resultado = {'hilos': len(hilos), 'protegidos': 0, 'mensajes': 0, 'bytes': 0,
+                 'ultimo': hilos[-1][0] if len(hilos) == hilos_por_lote else None}
+    if not hilos:
+        return resultado
+
+    pares = {(menor, mayor) for _, menor, mayor in hilos}
+    protegidos = pares_protegidos(pares)
+    resultado['protegidos'] = len(protegidos)
+    pares -= protegidos
+    if not pares:
+        return resultado
+
+    limite = (ahora or timezone.now()) - timedelta(days=dias) if dias else None
+    borrables = [
+        (pk, largo or 0) for pk, fecha, leido, largo in _excedentes(pares, por_hilo)
+        if leido and (limite is None or (fecha is not None and fecha < limite))
+    ]
+    if simular:
+        resultado['mensajes'] = len(borrables)
+        resultado['bytes'] = sum(largo for _, largo in borrables)
+        return resultado
+
+    largos = dict(borrables)
+    ids = sorted(largos)
+    for inicio in range(0, len(ids), filas_por_borrado):
+        tramo = ids[inicio:inicio + filas_por_borrado]
+        with transaction.atomic():
+            borrados = Mensaje.objects.filter(pk__in=tramo, leido=True).delete()[1].get(Mensaje._meta.label, 0)
+            contadores.incrementar(MENSAJES_DEPURADOS, borrados)
+        resultado['mensajes'] += borrados
+        resultado['bytes'] += sum(largos[pk] for pk in tramo)
+        if pausa and inicio + filas_por_borrado < len(ids):
+            time.sleep(pausa)
+
+    if resultado['mensajes']:
+        logger.info(f"Retención: {resultado['mensajes']} mensajes borrados en {len(pares)} conversaciones")
+    return resultado
@@ -0,0 +1,155 @@
+"""
+Seguimiento automático de envíos
+Consulta a los couriers el estado de las transacciones EN_PROCESO con código de
+seguimiento y las avanza con la máquina de estados.
+
+- Las transacciones se recorren por id (keyset) en lotes; la base de datos se usa solo
+  fuera del event loop, antes y después de consultar el lote.
+- Las consultas de un lote corren concurrentemente con asyncio. Cada courier tiene su
+  LimitadorTasa (consultas por segundo) y un semáforo (consultas simultáneas), así que
+  un courier lento no frena a los demás ni recibe más tráfico del que admite.
+- ENTREGADO completa la transacción y DEVUELTO la cancela (libera la prenda), ambos con
+  aplicar_transicion_lote: una transacción que cambió entretanto no se toca.
+- Un error o timeout de un envío solo afecta a ese envío; se vuelve a consultar en la
+  siguiente pasada.
+"""
+
+import asyncio
+import logging
+from collections import Counter
+
+from django.db.models import Q
+
+from . import contadores
+from .couriers import ADAPTADORES, DEVUELTO, ENTREGADO, ErrorCourier, LimitadorTasa, obtener_adaptador
+from .models import Transaccion
+from .transiciones import aplicar_transicion_lote
+
+logger = logging.getLogger(__name__)
+
+# Nombres de las métricas en ContadorPlataforma
+ENVIOS_CONSULTADOS = 'envios_consultados'
+ENVIOS_ENTREGADOS = 'envios_entregados'
+ENVIOS_DEVUELTOS = 'envios_devueltos'
+ENVIOS_ERRORES = 'envios_errores_consulta'
+
+# Estado del courier -> acción de la máquina de estados
+ACCIONES_POR_ESTADO = {
+    ENTREGADO: 'completar',
+    DEVUELTO: 'cancelar',
+}
+
+
+def envios_activos():
+    """Transacciones en camino con courier soportado y código de seguimiento."""
+    if not ADAPTADORES:
+        return Transaccion.objects.none()
+    couriers = Q()
+    for nombre in ADAPTADORES:
+        couriers |= Q(courier__iexact=nombre)
+    return Transaccion.objects.filter(
+        couriers, estado='EN_PROCESO', codigo_seguimiento_envio__isnull=False,
+    ).exclude(codigo_seguimiento_envio='')
+
+
+# ==============================================================================
+# CONSULTA CONCURRENTE
+# ==============================================================================
+
+async def _consultar_uno(adaptador, semaforo, limitador, codigo):
+    async with semaforo:
+        await limitador.esperar_turno()
+        return await asyncio.wait_for(adaptador.consultar(codigo), adaptador.timeout_segundos)
+
+
+async def consultar_envios(transacciones, limitadores):
+    """
+    Consulta el estado de todas las transacciones del lote.
+
+    Args:
+        transacciones: Transacciones con courier y código de seguimiento
+        limitadores: dict courier -> LimitadorTasa (se conserva entre lotes)
+
+    Returns:
+        dict: id de transacción -> EstadoEnvio, o la excepción si la consulta falló
+    """
+    adaptadores, semaforos, tareas = {}, {}, {}
+    for transaccion in transacciones:
+        clase = obtener_adaptador(transaccion.courier)
+        if clase is None:
+            continue
+        if clase.nombre not in adaptadores:
+            adaptadores[clase.nombre] = clase()
+            semaforos[clase.nombre] = asyncio.Semaphore(clase.max_concurrentes)
+            limitadores.setdefault(clase.nombre, LimitadorTasa(clase.max_por_segundo))
+        tareas[transaccion.pk] = _consultar_uno(
+            adaptadores[clase.nombre], semaforos[clase.nombre], limitadores[clase.nombre],
+            transaccion.codigo_seguimiento_envio,
+        )
+
+    try:
+        resultados = await asyncio.gather(*tareas.values(), return_exceptions=True)
+    finally:
+        for adaptador in adaptadores.values():
+            await adaptador.cerrar()
+    return dict(zip(tareas, resultados))
+
+
+# ==============================================================================
+# PASADA
+# ==============================================================================
+
+def _aplicar_resultados(transacciones, resultados):
+    """Avanza las transacciones según lo que informó su courier."""
+    resumen = Counter(consultados=len(resultados))
+    por_accion = {accion: [] for accion in ACCIONES_POR_ESTADO.values()}
+    for transaccion in transacciones:
+        resultado = resultados.get(transaccion.pk)
+        if isinstance(resultado, BaseException):
+            resumen['errores'] += 1
+            if not isinstance(resultado, (ErrorCourier, asyncio.TimeoutError)):
+                logger.error(f"Error consultando el envío {transaccion.codigo_seguimiento_envio} ({transaccion.courier}): {resultado!r}")
+            continue
+        accion = ACCIONES_POR_ESTADO.get(getattr(resultado, 'estado', None))
+        if accion:
+            por_accion[accion].append(transaccion)
+
+    for accion, lote in por_accion.items():
+        if lote:
+            aplicadas, fallidas = aplicar_transicion_lote(lote, accion)
+            resumen[accion] += len(aplicadas)
+            resumen['cambiaron_entretanto'] += len(fallidas)
+    return resumen
+
+
+def seguir_envios(tamano_lote=1000, max_lotes=0):
+    """
+    Una pasada completa sobre los envíos activos.
+
+    Args:
+        tamano_lote: Transacciones consultadas concurrentemente por lote
+        max_lotes: Tope de lotes por pasada (0 = todos)
+
+    Returns:
+        Counter: consultados, completar, cancelar, errores y cambiaron_entretanto
+    """
+    resumen = Counter()
+    limitadores = {}
+    ultimo_id = 0
+    lotes = 0
+    while True:
+        transacciones = list(envios_activos().filter(id__gt=ultimo_id).order_by('id')[:tamano_lote])
+        if not transacciones:
+            break
+        resultados = asyncio.run(consultar_envios(transacciones, limitadores))
+        resumen.update(_aplicar_resultados(transacciones, resultados))
+        ultimo_id = transacciones[-1].pk
+        lotes += 1
+        if len(transacciones) < tamano_lote or (max_lotes and lotes >= max_lotes):
+            break
+
+    contadores.incrementar(ENVIOS_CONSULTADOS, resumen['consultados'])
+    contadores.incrementar(ENVIOS_ENTREGADOS, resumen['completar'])
+    contadores.incrementar(ENVIOS_DEVUELTOS, resumen['cancelar'])
+    contadores.incrementar(ENVIOS_ERRORES, resumen['errores'])
+    return resumen
@@ -68,7 +68,7 @@ class PrendaSerializer(serializers.ModelSerializer):
 class PrendaSimpleSerializer(serializers.ModelSerializer):
     class Meta:
         model = Prenda
-        fields = ['id_prenda', 'nombre', 'categoria', 'talla', 'estado']
+        fields = ['id', 'nombre', 'categoria', 'talla', 'estado']
 
 class TransaccionSerializer(serializers.ModelSerializer):
     prenda = PrendaSimpleSerializer(source='id_prenda', read_only=True)
@@ -87,16 +87,32 @@ class TransaccionSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id_transaccion', 'fecha_transaccion']
 
+class TransaccionLineaTiempoSerializer(serializers.ModelSerializer):
+    """Transacción vista desde un usuario (ver linea_tiempo.linea_tiempo_usuario)."""
+    prenda = PrendaSimpleSerializer(read_only=True)
+    tipo_nombre = serializers.CharField(source='tipo.nombre_tipo', read_only=True)
+    es_enviada = serializers.BooleanField(read_only=True)
+    contraparte_id = serializers.IntegerField(source='contraparte.id_usuario', read_only=True, default=None)
+    contraparte_nombre = serializers.CharField(source='contraparte.nombre', read_only=True, default=None)
+    fundacion_nombre = serializers.CharField(source='fundacion.nombre', read_only=True, default=None)
+    class Meta:
+        model = Transaccion
+        fields = [
+            'id', 'prenda', 'tipo_codigo', 'tipo_nombre', 'es_enviada',
+            'contraparte_id', 'contraparte_nombre', 'fundacion_nombre',
+            'fecha_transaccion', 'estado'
+        ]
+
 class MensajeSerializer(serializers.ModelSerializer):
-    emisor_nombre = serializers.CharField(source='id_emisor.nombre', read_only=True)
-    receptor_nombre = serializers.CharField(source='id_receptor.nombre', read_only=True)
+    emisor_nombre = serializers.CharField(source='emisor.nombre', read_only=True)
+    receptor_nombre = serializers.CharField(source='receptor.nombre', read_only=True)
     class Meta:
         model = Mensaje
         fields = [
-            'id_mensaje', 'id_emisor', 'emisor_nombre', 'id_receptor', 'receptor_nombre',
-            'contenido', 'fecha_envio'
+            'id', 'emisor', 'emisor_nombre', 'receptor', 'receptor_nombre',
+            'contenido', 'fecha_envio', 'leido'
         ]
-        read_only_fields = ['id_mensaje', 'fecha_envio']
+        read_only_fields = ['id', 'fecha_envio', 'leido']
 
 # --- Serializers para reportes y dashboard ---
 
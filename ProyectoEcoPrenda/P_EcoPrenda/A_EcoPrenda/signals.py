@@ -0,0 +1,313 @@
+"""
+Señales del modelo
+Mantienen al día las estructuras derivadas (índice de búsqueda, autocompletado, contadores, sellos de versión,
+paneles de negociación)
+y avisan en vivo de los mensajes nuevos
+"""
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import (
+    autocompletado, contadores, conversaciones, eventos, indice_busqueda, panel_negociacion,
+    tiempo_real, tipos_transaccion,
+)
+from .cache_utils import marcar_version_tabla
+from .models import (
+    CampanaFundacion, Fundacion, ImpactoAmbiental, Logro, Mensaje, Prenda,
+    TipoTransaccion, Transaccion, Usuario,
+)
+from .transiciones import (
+    prenda_cambio_estado, prendas_cambio_estado_lote,
+    transaccion_cambio_estado, transacciones_cambio_estado_lote,
+)
+
+
+# ==============================================================================
+# AUTOCOMPLETADO
+# ==============================================================================
+
+@receiver(post_save, sender=Prenda)
+def actualizar_autocompletado(sender, instance, **kwargs):
+    autocompletado.registrar_prenda(instance)
+
+
+@receiver(post_delete, sender=Prenda)
+def quitar_de_autocompletado(sender, instance, **kwargs):
+    autocompletado.quitar_prenda(instance.pk)
+
+
+# ==============================================================================
+# TIPOS DE TRANSACCIÓN EN MEMORIA
+# ==============================================================================
+
+@receiver(post_save, sender=TipoTransaccion)
+@receiver(post_delete, sender=TipoTransaccion)
+def invalidar_tipos_transaccion(sender, **kwargs):
+    tipos_transaccion.invalidar()
+
+
+@receiver(post_save, sender=TipoTransaccion)
+def propagar_codigo_tipo(sender, instance, created, **kwargs):
+    """Si se renombra un tipo, sus transacciones pasan al código nuevo."""
+    if created:
+        return
+    codigo = tipos_transaccion.codigo_de_nombre(instance.nombre_tipo)
+    Transaccion.objects.filter(tipo=instance).exclude(tipo_codigo=codigo).update(tipo_codigo=codigo)
+
+
+# ==============================================================================
+# CONTADORES DE LA PLATAFORMA
+# ==============================================================================
+
+def _decimal(valor):
+    """Las vistas pueden asignar floats a campos Decimal antes de guardar."""
+    return Decimal(str(valor)) if valor is not None else Decimal('0')
+
+
+@receiver(post_save, sender=Usuario)
+def contar_usuario_creado(sender, instance, created, **kwargs):
+    if created:
+        contadores.incrementar(contadores.USUARIOS, 1)
+
+
+@receiver(post_delete, sender=Usuario)
+def descontar_usuario_eliminado(sender, instance, **kwargs):
+    contadores.incrementar(contadores.USUARIOS, -1)
+
+
+@receiver(post_save, sender=Prenda)
+def contar_prenda(sender, instance, created, **kwargs):
+    """Total de prendas al crear; prendas disponibles al crear o al cambiar de estado."""
+    disponible = instance.estado == 'DISPONIBLE'
+    if created:
+        contadores.incrementar(contadores.PRENDAS, 1)
+        contadores.incrementar(contadores.PRENDAS_DISPONIBLES, int(disponible))
+    elif hasattr(instance, '_estado_original'):
+        estaba_disponible = instance._estado_original == 'DISPONIBLE'
+        contadores.incrementar(contadores.PRENDAS_DISPONIBLES, int(disponible) - int(estaba_disponible))
+    instance._estado_original = instance.estado
+
+
+@receiver(post_delete, sender=Prenda)
+def descontar_prenda_eliminada(sender, instance, **kwargs):
+    contadores.incrementar(contadores.PRENDAS, -1)
+    if getattr(instance, '_estado_original', instance.estado) == 'DISPONIBLE':
+        contadores.incrementar(contadores.PRENDAS_DISPONIBLES, -1)
+
+
+@receiver(post_save, sender=Transaccion)
+def contar_transaccion(sender, instance, created, **kwargs):
+    """Total de transacciones al crear; donaciones al crear o al cambiar de tipo."""
+    if created:
+        contadores.incrementar(contadores.TRANSACCIONES, 1)
+        if contadores.es_tipo_donacion(instance.tipo_id):
+            contadores.incrementar(contadores.DONACIONES, 1)
+    else:
+        tipo_original = getattr(instance, '_tipo_id_original', instance.tipo_id)
+        if tipo_original != instance.tipo_id:
+            delta = int(contadores.es_tipo_donacion(instance.tipo_id)) - int(contadores.es_tipo_donacion(tipo_original))
+            contadores.incrementar(contadores.DONACIONES, delta)
+    instance._tipo_id_original = instance.tipo_id
+
+
+@receiver(post_delete, sender=Transaccion)
+def descontar_transaccion_eliminada(sender, instance, **kwargs):
+    contadores.incrementar(contadores.TRANSACCIONES, -1)
+    if contadores.es_tipo_donacion(getattr(instance, '_tipo_id_original', instance.tipo_id)):
+        contadores.incrementar(contadores.DONACIONES, -1)
+
+
+@receiver(post_save, sender=ImpactoAmbiental)
+def sumar_impacto(sender, instance, created, **kwargs):
+    """Suma el impacto nuevo (o solo la diferencia, si se actualizó un registro existente)."""
+    carbono_original = None if created else getattr(instance, '_carbono_original', None)
+    energia_original = None if created else getattr(instance, '_energia_original', None)
+    contadores.incrementar(
+        contadores.CARBONO_EVITADO_KG, _decimal(instance.carbono_evitar_kg) - _decimal(carbono_original)
+    )
+    contadores.incrementar(
+        contadores.ENERGIA_AHORRADA_KWH, _decimal(instance.energia_ahorrada_kwh) - _decimal(energia_original)
+    )
+    instance._carbono_original = instance.carbono_evitar_kg
+    instance._energia_original = instance.energia_ahorrada_kwh
+
+
+@receiver(post_delete, sender=ImpactoAmbiental)
+def restar_impacto_eliminado(sender, instance, **kwargs):
+    contadores.incrementar(contadores.CARBONO_EVITADO_KG, -_decimal(instance.carbono_evitar_kg))
+    contadores.incrementar(contadores.ENERGIA_AHORRADA_KWH, -_decimal(instance.energia_ahorrada_kwh))
+
+
+# ==============================================================================
+# SELLOS DE VERSIÓN (ETag)
+# ==============================================================================
+
+# Tablas cuyas vistas de lectura responden 304 (ver cache_utils.pagina_condicional
+# y api_views.ListaCondicionalMixin). Mensaje queda fuera: se escribe demasiado.
+TABLAS_VERSIONADAS = (
+    Usuario, Fundacion, Prenda, TipoTransaccion, Transaccion,
+    ImpactoAmbiental, Logro, CampanaFundacion,
+)
+
+
+def marcar_tabla_modificada(sender, **kwargs):
+    marcar_version_tabla(sender)
+
+
+for modelo in TABLAS_VERSIONADAS:
+    post_save.connect(marcar_tabla_modificada, sender=modelo, dispatch_uid=f'version_{modelo.__name__}_save')
+    post_delete.connect(marcar_tabla_modificada, sender=modelo, dispatch_uid=f'version_{modelo.__name__}_delete')
+
+
+@receiver(post_save, sender=ImpactoAmbiental)
+@receiver(post_delete, sender=ImpactoAmbiental)
+@receiver(post_delete, sender=Transaccion)
+def versionar_prenda_relacionada(sender, instance, **kwargs):
+    """
+    El detalle de la prenda muestra su impacto y su transacción actual: cambia su versión.
+    Al guardar una transacción lo hace Transaccion.save, que sabe si la prenda ya cambió.
+    """
+    Prenda.objects.filter(pk=instance.prenda_id).update(**Prenda.nueva_version())
+
+
+# ==============================================================================
+# ÍNDICE DE BÚSQUEDA EN MEMORIA
+# ==============================================================================
+
+# Se conectan después de los sellos: cada cambio local llega al índice justo después del
+# incremento de version:prenda que lo acompaña (ver indice_busqueda._avanzar_sello).
+
+@receiver(post_save, sender=Prenda)
+def indexar_prenda_guardada(sender, instance, **kwargs):
+    """Reindexa la prenda guardada (texto y disponibilidad) al confirmar."""
+    indice_busqueda.indexar_al_confirmar(instance)
+
+
+@receiver(post_delete, sender=Prenda)
+def quitar_prenda_eliminada(sender, instance, **kwargs):
+    """Quita la prenda eliminada del índice al confirmar."""
+    indice_busqueda.eliminar_al_confirmar(instance.pk)
+
+
+# ==============================================================================
+# CAMBIOS DE ESTADO CON UPDATE CONDICIONAL (transiciones.py)
+# ==============================================================================
+
+@receiver(prenda_cambio_estado)
+def propagar_estado_prenda(sender, id_prenda, estado_nuevo, estaba_disponible, **kwargs):
+    """QuerySet.update() no emite post_save: se replica lo que harían los receptores de Prenda."""
+    disponible = estado_nuevo == 'DISPONIBLE'
+    contadores.incrementar(contadores.PRENDAS_DISPONIBLES, int(disponible) - int(estaba_disponible))
+    marcar_version_tabla(Prenda)
+
+    indice_busqueda.disponibilidad_al_confirmar([id_prenda], disponible)
+
+    if not disponible:
+        autocompletado.quitar_prenda(id_prenda)
+    elif autocompletado._autocompletado is not None:
+        prenda = Prenda.objects.only('nombre', 'categoria', 'fecha_publicacion', 'estado', 'version').filter(pk=id_prenda).first()
+        if prenda:
+            autocompletado.registrar_prenda(prenda)
+
+
+@receiver(transaccion_cambio_estado)
+def propagar_estado_transaccion(sender, transaccion, estado_anterior, estado_nuevo, prenda_actualizada, **kwargs):
+    marcar_version_tabla(Transaccion)
+    eventos.publicar(transaccion, estado_anterior, estado_nuevo)
+    # Si la prenda no cambió de estado igual cambia su versión: el detalle muestra la transacción.
+    if not prenda_actualizada:
+        Prenda.objects.filter(pk=transaccion.prenda_id).update(**Prenda.nueva_version())
+
+
+@receiver(prendas_cambio_estado_lote)
+def propagar_estado_prendas_lote(sender, ids_prenda, estado_nuevo, cambio_disponibles, **kwargs):
+    """Como propagar_estado_prenda, con un solo incremento por contador para todo el lote."""
+    disponible = estado_nuevo == 'DISPONIBLE'
+    contadores.incrementar(contadores.PRENDAS_DISPONIBLES, cambio_disponibles)
+    marcar_version_tabla(Prenda)
+
+    indice_busqueda.disponibilidad_al_confirmar(ids_prenda, disponible)
+
+    if not disponible:
+        for id_prenda in ids_prenda:
+            autocompletado.quitar_prenda(id_prenda)
+    elif autocompletado._autocompletado is not None:
+        for prenda in Prenda.objects.only('nombre', 'categoria', 'fecha_publicacion', 'estado', 'version').filter(pk__in=ids_prenda):
+            autocompletado.registrar_prenda(prenda)
+
+
+@receiver(transacciones_cambio_estado_lote)
+def propagar_estado_transacciones_lote(sender, transacciones, estado_nuevo, ids_prenda_actualizadas, **kwargs):
+    marcar_version_tabla(Transaccion)
+    eventos.publicar_lote(transacciones, estado_nuevo)
+    sin_cambio = {t.prenda_id for t in transacciones} - set(ids_prenda_actualizadas)
+    if sin_cambio:
+        Prenda.objects.filter(pk__in=sin_cambio).update(**Prenda.nueva_version())
+
+
+# ==============================================================================
+# OUTBOX DE EVENTOS (eventos.py)
+# ==============================================================================
+
+@receiver(post_save, sender=Transaccion)
+def publicar_transaccion_creada(sender, instance, created, **kwargs):
+    """Evento de creación (los cambios de estado se publican en los receptores de arriba)."""
+    if created:
+        eventos.publicar(instance, None, instance.estado)
+
+
+# ==============================================================================
+# RESUMEN DE CONVERSACIONES (conversaciones.py)
+# ==============================================================================
+
+@receiver(post_save, sender=Mensaje)
+def actualizar_conversacion(sender, instance, created, **kwargs):
+    """Último mensaje y no leídos del par (los bulk_create llaman a registrar_mensajes)."""
+    if created:
+        conversaciones.registrar_mensaje(instance)
+        # Aviso en vivo a las partes, solo si la transacción se confirma
+        if tiempo_real.habilitado():
+            transaction.on_commit(lambda: tiempo_real.publicar_mensaje(instance))
+
+
+# ==============================================================================
+# PANEL DE NEGOCIACIÓN (panel_negociacion.py)
+# ==============================================================================
+
+@receiver(post_save, sender=Mensaje)
+def invalidar_panel_mensaje(sender, instance, created, **kwargs):
+    """Los paneles de las dos partes muestran los últimos mensajes del hilo."""
+    if created:
+        panel_negociacion.invalidar_usuarios([instance.emisor_id, instance.receptor_id])
+
+
+@receiver(post_save, sender=Prenda)
+@receiver(post_delete, sender=Prenda)
+@receiver(post_save, sender=Transaccion)
+@receiver(post_delete, sender=Transaccion)
+def invalidar_panel_prenda(sender, instance, **kwargs):
+    panel_negociacion.invalidar_prendas([instance.pk if sender is Prenda else instance.prenda_id])
+
+
+@receiver(prenda_cambio_estado)
+def invalidar_panel_estado_prenda(sender, id_prenda, **kwargs):
+    panel_negociacion.invalidar_prendas([id_prenda])
+
+
+@receiver(transaccion_cambio_estado)
+def invalidar_panel_estado_transaccion(sender, transaccion, **kwargs):
+    panel_negociacion.invalidar_prendas([transaccion.prenda_id])
+
+
+@receiver(prendas_cambio_estado_lote)
+def invalidar_paneles_estado_prendas(sender, ids_prenda, **kwargs):
+    panel_negociacion.invalidar_prendas(ids_prenda)
+
+
+@receiver(transacciones_cambio_estado_lote)
+def invalidar_paneles_estado_transacciones(sender, transacciones, **kwargs):
+    panel_negociacion.invalidar_prendas(t.prenda_id for t in transacciones)
@@ -1,3 +1,1380 @@
-from django.test import TestCase
+import importlib
+import os
+import smtplib
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.messages import get_messages
+from django.core import mail, signing
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.template.loader import render_to_string
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    agradecimientos, archivo, autocompletado, contadores, conversaciones, eventos, expiracion, indice_busqueda,
+    limite_mensajes, resumen_mensajes, retencion_mensajes, tiempo_real, tipos_transaccion,
+)
+from .couriers import CourierFalso, quitar_courier, registrar_courier
+from .cache_utils import marcar_version_tabla, nombre_version_tabla
+from .limite_mensajes import LimiteExcedido, verificar_envio
+from .linea_tiempo import linea_tiempo_usuario
+from .models import (
+    ContadorPlataforma, Conversacion, EnvioAgradecimiento, EventoTransaccion, Fundacion, Mensaje, MensajeArchivado,
+    MensajeHistorico, Prenda, ResumenMensajes, Transaccion, TransaccionArchivada, TransaccionHistorica, Usuario,
+)
+from .seguimiento import seguir_envios
+from .tipos_transaccion import DONACION, VENTA, codigo_tipo, obtener_tipo
+from .transiciones import (
+    ConflictoConcurrencia, PrendaNoDisponible, accion_hacia, aplicar_transicion, aplicar_transicion_lote, crear_transaccion,
+)
+
+
+def crear_usuario(nombre):
+    return Usuario.objects.create(nombre=nombre, correo=f'{nombre.lower()}@ecoprenda.test', contrasena='-')
+
+
+def en_paralelo(funciones):
+    """Ejecuta cada función en su propio hilo, liberándolas a la vez; devuelve el resultado o la excepción de cada una."""
+    barrera = threading.Barrier(len(funciones))
+    resultados = [None] * len(funciones)
+
+    def correr(i, funcion):
+        try:
+            barrera.wait()
+            resultados[i] = funcion()
+        except Exception as e:
+            resultados[i] = e
+        finally:
+            connection.close()
+
+    hilos = [threading.Thread(target=correr, args=(i, funcion)) for i, funcion in enumerate(funciones)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return resultados
+
+
+class EcoPrendaTestCase(TestCase):
+    """Base: cada prueba parte con la caché y el registro de tipos vacíos."""
+
+    def setUp(self):
+        cache.clear()
+        tipos_transaccion.invalidar()
+
+
+# ==============================================================================
+# GET CONDICIONAL (ETag / 304)
+# ==============================================================================
+
+class PaginasCondicionalesTests(EcoPrendaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fundacion = Fundacion.objects.create(nombre='Fundación Prueba', activa=False)
+
+    def etag(self, url):
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.has_header('ETag'))
+        return respuesta['ETag']
+
+    def test_pagina_responde_304_con_una_consulta(self):
+        url = reverse('lista_fundaciones')
+        etag = self.etag(url)
+        with self.assertNumQueries(1):
+            respuesta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+
+    def test_api_responde_304_con_una_consulta(self):
+        url = reverse('api-fundacion-list')
+        etag = self.etag(url)
+        with self.assertNumQueries(1):
+            respuesta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+
+    def test_revalidacion_con_sesion_no_reescribe_la_sesion(self):
+        usuario = crear_usuario('Cliente')
+        sesion = self.client.session
+        sesion['usuario_id'] = usuario.pk
+        sesion.save()
+        url = reverse('lista_fundaciones')
+        etag = self.etag(url)
+        with CaptureQueriesContext(connection) as capturadas:
+            respuesta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+        escrituras = [q['sql'] for q in capturadas.captured_queries if q['sql'].lstrip().upper().startswith(('UPDATE', 'INSERT'))]
+        self.assertEqual(escrituras, [])
+
+    def test_listado_de_usuarios_es_privado(self):
+        # El nombre api-usuario-list lo toma usuarios-list/; el listado del router es este
+        respuesta = self.client.get('/api/usuarios/')
+        self.assertIn('private', respuesta['Cache-Control'])
+        self.assertNotIn('public', respuesta['Cache-Control'])
+
+    def test_cambio_confirmado_renueva_el_etag(self):
+        url = reverse('lista_fundaciones')
+        etag = self.etag(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fundacion.nombre = 'Fundación Renombrada'
+            self.fundacion.save()
+        respuesta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+
+    def test_cambio_sin_confirmar_no_renueva_el_etag(self):
+        # Un lector no debe guardar como vigente una versión que todavía puede revertirse
+        url = reverse('lista_fundaciones')
+        etag = self.etag(url)
+        with self.captureOnCommitCallbacks(execute=False):
+            self.fundacion.nombre = 'Fundación Renombrada'
+            self.fundacion.save()
+            respuesta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+
+
+# ==============================================================================
+# OUTBOX DE EVENTOS
+# ==============================================================================
+
+@override_settings(TIEMPO_REAL_HABILITADO=False)
+class EventosTests(EcoPrendaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.donante = crear_usuario('Donante')
+        self.representante = crear_usuario('Representante')
+        self.fundacion = Fundacion.objects.create(
+            nombre='Fundación Prueba', direccion='Calle 1', activa=False, representante=self.representante,
+        )
+        self.prenda = Prenda.objects.create(user=self.donante, nombre='Chaqueta')
+        self.tipo_donacion = obtener_tipo(DONACION)
+
+    def donar(self):
+        return crear_transaccion(self.prenda, tipo=self.tipo_donacion, user_origen=self.donante, fundacion=self.fundacion)
+
+    def consumidores(self, **registrados):
+        """Reemplaza los consumidores registrados mientras dura la prueba (una función recibe todos los eventos)."""
+        registrados = {n: c if isinstance(c, eventos.Consumidor) else eventos.Consumidor(c, None) for n, c in registrados.items()}
+        parche = mock.patch.dict(eventos.CONSUMIDORES, registrados, clear=True)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def vencer_esperas(self):
+        EventoTransaccion.objects.update(disponible_desde=timezone.now() - timedelta(seconds=1))
+
+    def test_evento_se_escribe_en_la_misma_transaccion(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.donar()
+                raise RuntimeError('revertir')
+        self.assertFalse(EventoTransaccion.objects.exists())
+
+        transaccion = self.donar()
+        evento = EventoTransaccion.objects.get()
+        self.assertEqual((evento.transaccion_id, evento.estado_nuevo, evento.estado), (transaccion.pk, 'PENDIENTE', 'PENDIENTE'))
+
+    def test_consumidor_que_falla_reintenta_y_termina_fallido(self):
+        def fallar(eventos_):
+            raise ValueError('sin servicio')
+
+        self.consumidores(falla=fallar)
+        self.donar()
+        with self.assertLogs('A_EcoPrenda.eventos', 'ERROR'):
+            resultado = eventos.procesar_lote()
+        self.assertEqual((resultado['reintentos'], resultado['fallidos']), (1, 0))
+        evento = EventoTransaccion.objects.get()
+        self.assertEqual((evento.estado, evento.intentos), ('PENDIENTE', 1))
+        espera = evento.disponible_desde - timezone.now()
+        self.assertGreater(espera, timedelta(seconds=eventos.ESPERA_BASE_SEGUNDOS - 5))
+        # Antes de la espera no se vuelve a intentar
+        self.assertEqual(eventos.procesar_lote()['reclamados'], 0)
+
+        for _ in range(eventos.MAX_INTENTOS - 1):
+            self.vencer_esperas()
+            with self.assertLogs('A_EcoPrenda.eventos', 'ERROR'):
+                resultado = eventos.procesar_lote()
+        self.assertEqual(resultado['fallidos'], 1)
+        evento.refresh_from_db()
+        self.assertEqual((evento.estado, evento.intentos), ('FALLIDO', eventos.MAX_INTENTOS))
+        self.assertIn('sin servicio', evento.ultimo_error)
+        self.vencer_esperas()
+        self.assertEqual(eventos.procesar_lote()['reclamados'], 0)
+
+    def test_reclamo_vencido_no_se_consume_dos_veces(self):
+        consumidos = []
+        self.consumidores(contar=consumidos.extend)
+        self.donar()
+        marca, reclamados = eventos.reclamar(10)
+        # El primer trabajador se atrasa: su reclamo vence y otro trabajador toma el evento
+        self.vencer_esperas()
+        self.assertEqual(eventos.procesar_lote()['procesados'], 1)
+
+        with self.assertRaises(eventos.ReclamoVencido):
+            eventos._consumir('contar', consumidos.extend, reclamados, marca)
+        self.assertEqual(len(consumidos), 1)
+        self.assertEqual(EventoTransaccion.objects.get().estado, 'PROCESADO')
+
+    def test_donacion_completada_agradece_una_sola_vez(self):
+        intentos_logros = []
+
+        def logros_con_un_fallo(eventos_):
+            intentos_logros.append(len(eventos_))
+            if len(intentos_logros) <= 2:  # Lote y reintento del evento aislado
+                raise ValueError('logros no disponibles')
+
+        self.consumidores(
+            agradecimiento_donacion=eventos.CONSUMIDORES['agradecimiento_donacion'],
+            logros=eventos.Consumidor(logros_con_un_fallo, ('COMPLETADA',)),
+        )
+        transaccion = self.donar()
+        aplicar_transicion(transaccion, 'enviar')
+        aplicar_transicion(transaccion, 'completar')
+        self.vencer_esperas()
+
+        with self.captureOnCommitCallbacks(execute=True), self.assertLogs('A_EcoPrenda.eventos', 'ERROR'):
+            self.assertEqual(eventos.procesar_lote()['reintentos'], 1)
+        # El reintento solo vuelve a correr el consumidor que falló
+        self.vencer_esperas()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(eventos.procesar_lote()['procesados'], 1)
+        self.assertEqual(len(intentos_logros), 3)
+
+        agradecimientos = Mensaje.objects.filter(emisor=self.representante, receptor=self.donante)
+        self.assertEqual(agradecimientos.count(), 1)
+        self.assertIn('Chaqueta', agradecimientos.get().contenido)
+        self.assertFalse(EventoTransaccion.objects.exclude(estado='PROCESADO').exists())
+
+
+# ==============================================================================
+# CONCURRENCIA DE TRANSACCIONES
+# ==============================================================================
+
+class ConsultasTransicionesTests(EcoPrendaTestCase):
+    """Presupuesto de consultas de cada transición, sin contar BEGIN/COMMIT/SAVEPOINT."""
+
+    # Cada cambio de estado incluye el INSERT de su evento en el outbox (eventos.py).
+    # Los contadores y sellos de versión se escriben al confirmar y no entran en la cuenta.
+    PRESUPUESTO = {
+        'crear': 3,
+        'aceptar': 3,
+        'enviar': 3,
+        'guardar seguimiento': 2,
+        'completar': 3,
+        'cancelar': 3,
+    }
+
+    CONTROL = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+    def setUp(self):
+        super().setUp()
+        self.vendedor = crear_usuario('Vendedor')
+        self.comprador = crear_usuario('Comprador')
+        self.campos = {'tipo': obtener_tipo(VENTA), 'user_origen': self.vendedor, 'user_destino': self.comprador}
+        self.prendas = [Prenda.objects.create(user=self.vendedor, nombre=f'Prenda {i}') for i in range(2)]
+        # Registro de tipos y filas de contadores listos, como en un proceso ya en marcha
+        codigo_tipo(self.campos['tipo'].pk)
+        for nombre in contadores.CONTADORES + [nombre_version_tabla(Prenda), nombre_version_tabla(Transaccion)]:
+            ContadorPlataforma.objects.get_or_create(nombre=nombre)
+
+    def assertPresupuesto(self, operacion, funcion):
+        with CaptureQueriesContext(connection) as capturadas:
+            funcion()
+        consultas = [q['sql'] for q in capturadas.captured_queries if not q['sql'].lstrip().upper().startswith(self.CONTROL)]
+        self.assertLessEqual(len(consultas), self.PRESUPUESTO[operacion], f'{operacion}:\n' + '\n'.join(consultas))
+
+    def test_ciclo_de_una_venta(self):
+        self.assertPresupuesto('crear', lambda: crear_transaccion(self.prendas[0], **self.campos))
+
+        transaccion = Transaccion.objects.select_related('prenda').get(prenda=self.prendas[0])
+        self.assertPresupuesto('aceptar', lambda: aplicar_transicion(transaccion, 'aceptar'))
+        self.assertPresupuesto('enviar', lambda: aplicar_transicion(transaccion, 'enviar', direccion_entrega='Calle 123'))
+        transaccion.codigo_seguimiento_envio = 'SEG-1'
+        self.assertPresupuesto('guardar seguimiento', lambda: transaccion.save(update_fields=['codigo_seguimiento_envio']))
+        self.assertPresupuesto('completar', lambda: aplicar_transicion(transaccion, 'completar'))
+        self.assertEqual(Prenda.objects.get(pk=self.prendas[0].pk).estado, 'VENDIDA')
+
+    def test_cancelar(self):
+        otra = crear_transaccion(self.prendas[1], **self.campos)
+        otra = Transaccion.objects.select_related('prenda').get(pk=otra.pk)
+        self.assertPresupuesto('cancelar', lambda: aplicar_transicion(otra, 'cancelar'))
+        self.assertEqual(Prenda.objects.get(pk=self.prendas[1].pk).estado, 'DISPONIBLE')
+
+
+@override_settings(TIEMPO_REAL_HABILITADO=False)
+class DonacionesLoteTests(EcoPrendaTestCase):
+    """Confirmación y rechazo de donaciones en lote: cada fallida se informa sin impedir el resto."""
+
+    def setUp(self):
+        super().setUp()
+        self.donante = crear_usuario('Donante')
+        self.fundacion = Fundacion.objects.create(nombre='Fundación Prueba', direccion='Calle 1', activa=False)
+        self.otra_fundacion = Fundacion.objects.create(nombre='Otra Fundación', direccion='Calle 2', activa=False)
+        self.representante = crear_usuario('Representante')
+        self.representante.rol = 'REPRESENTANTE_FUNDACION'
+        self.representante.fundacion_asignada = self.fundacion
+        self.representante.save()
+        self.tipo_donacion = obtener_tipo(DONACION)
+
+    def donar(self, fundacion=None, enviada=True):
+        prenda = Prenda.objects.create(user=self.donante, nombre='Chaqueta')
+        donacion = crear_transaccion(
+            prenda, tipo=self.tipo_donacion, user_origen=self.donante, fundacion=fundacion or self.fundacion,
+        )
+        if enviada:
+            aplicar_transicion(donacion, 'enviar')
+        return donacion
+
+    def procesar(self, accion, ids):
+        sesion = self.client.session
+        sesion['usuario_id'] = self.representante.pk
+        sesion.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post(reverse('procesar_donaciones_lote'), {'accion': accion, 'donaciones': ids})
+        self.assertRedirects(respuesta, reverse('gestionar_donaciones'), fetch_redirect_response=False)
+        return [str(m) for m in get_messages(respuesta.wsgi_request)]
+
+    def test_confirmar_informa_cada_donacion_fallida(self):
+        valida = self.donar()
+        ajena = self.donar(self.otra_fundacion)
+        pendiente = self.donar(enviada=False)
+        inexistente = pendiente.pk + 1000
+
+        avisos = self.procesar('confirmar', [valida.pk, ajena.pk, pendiente.pk, inexistente])
+        self.assertIn('1 donaciones confirmadas.', avisos)
+        aviso = next(a for a in avisos if a.startswith('3 donaciones no se procesaron'))
+        self.assertIn(f'#{ajena.pk}: No es una donación a tu fundación.', aviso)
+        self.assertIn(f'#{inexistente}: No es una donación a tu fundación.', aviso)
+        self.assertIn(f'#{pendiente.pk}: No se puede completar', aviso)
+
+        estados = dict(Transaccion.objects.values_list('pk', 'estado'))
+        self.assertEqual(
+            (estados[valida.pk], estados[ajena.pk], estados[pendiente.pk]), ('COMPLETADA', 'EN_PROCESO', 'PENDIENTE'),
+        )
+        self.assertEqual(Prenda.objects.get(pk=valida.prenda_id).estado, valida.estado_prenda_derivado('COMPLETADA'))
+
+    def test_rechazar_lote(self):
+        donaciones = [self.donar(enviada=False) for _ in range(3)]
+        avisos = self.procesar('rechazar', [d.pk for d in donaciones])
+        self.assertEqual(avisos, ['3 donaciones rechazadas.'])
+        self.assertEqual(set(Transaccion.objects.values_list('estado', flat=True)), {'RECHAZADA'})
+        self.assertEqual(set(Prenda.objects.values_list('estado', flat=True)), {'DISPONIBLE'})
+
+    def test_version_cambiada_entretanto_no_se_aplica(self):
+        leidas = [self.donar(), self.donar()]
+        leidas = list(Transaccion.objects.filter(pk__in=[d.pk for d in leidas]).order_by('pk'))
+        # Otra operación modifica la segunda después de leerla: el UPDATE del lote se revierte
+        # y se escribe fila por fila
+        Transaccion.objects.filter(pk=leidas[1].pk).update(version=F('version') + 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            aplicadas, fallidas = aplicar_transicion_lote(leidas, 'completar')
+        self.assertEqual([t.pk for t in aplicadas], [leidas[0].pk])
+        self.assertEqual(fallidas, {leidas[1].pk: 'La transacción fue modificada por otra operación.'})
+        estados = dict(Transaccion.objects.values_list('pk', 'estado'))
+        self.assertEqual((estados[leidas[0].pk], estados[leidas[1].pk]), ('COMPLETADA', 'EN_PROCESO'))
+        self.assertEqual(
+            set(EventoTransaccion.objects.filter(estado_nuevo='COMPLETADA').values_list('transaccion_id', flat=True)),
+            {leidas[0].pk},
+        )
+
+
+class ExpiracionTests(EcoPrendaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.vendedor = crear_usuario('Vendedor')
+        self.comprador = crear_usuario('Comprador')
+        self.tipo_venta = obtener_tipo(VENTA)
+        self.ahora = timezone.now()
+
+    def vender(self, horas, estado='PENDIENTE'):
+        """Venta en `estado` creada `horas` horas antes de self.ahora."""
+        prenda = Prenda.objects.create(user=self.vendedor, nombre='Polera')
+        venta = crear_transaccion(prenda, tipo=self.tipo_venta, user_origen=self.vendedor, user_destino=self.comprador)
+        if estado != 'PENDIENTE':
+            aplicar_transicion(venta, accion_hacia('PENDIENTE', estado))
+        Transaccion.objects.filter(pk=venta.pk).update(fecha_transaccion=self.ahora - timedelta(hours=horas))
+        return venta
+
+    def expirar(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return expiracion.expirar_lote(ahora=self.ahora, **kwargs)
+
+    def metrica(self, nombre):
+        return ContadorPlataforma.objects.get(nombre=nombre).valor
+
+    def test_cancela_las_vencidas_y_libera_sus_prendas(self):
+        plazo = expiracion.PLAZOS_HORAS['PENDIENTE']
+        vencida = self.vender(plazo + 1)
+        vigente = self.vender(plazo - 1)
+        aceptada = self.vender(plazo + 1, 'ACEPTADA')  # Su plazo es más largo
+
+        resultado = self.expirar()
+        self.assertEqual((resultado['encontradas'], resultado['expiradas'], resultado['retraso_segundos']), (1, 1, 0))
+        estados = dict(Transaccion.objects.values_list('pk', 'estado'))
+        self.assertEqual(
+            (estados[vencida.pk], estados[vigente.pk], estados[aceptada.pk]), ('CANCELADA', 'PENDIENTE', 'ACEPTADA'),
+        )
+        self.assertEqual(Prenda.objects.get(pk=vencida.prenda_id).estado, 'DISPONIBLE')
+        self.assertEqual(Prenda.objects.get(pk=vigente.prenda_id).estado, 'RESERVADA')
+        self.assertEqual((self.metrica(expiracion.EXPIRADAS), self.metrica(expiracion.ULTIMO_LOTE)), (1, 1))
+
+    def test_lote_acotado_informa_el_retraso_de_las_restantes(self):
+        plazo = expiracion.PLAZOS_HORAS['PENDIENTE']
+        mas_antigua = self.vender(plazo + 3)
+        for horas in (plazo + 2, plazo + 1):
+            self.vender(horas)
+
+        resultado = self.expirar(tamano_lote=1)
+        self.assertEqual(resultado['expiradas'], 1)
+        self.assertEqual(Transaccion.objects.get(pk=mas_antigua.pk).estado, 'CANCELADA')
+        # La vencida más antigua que queda lleva dos horas de retraso
+        self.assertEqual(resultado['retraso_segundos'], 2 * 3600)
+        self.assertEqual(self.metrica(expiracion.RETRASO_SEGUNDOS), 2 * 3600)
+
+        self.expirar(tamano_lote=5)
+        self.assertEqual(self.metrica(expiracion.EXPIRADAS), 3)
+        self.assertEqual((self.metrica(expiracion.ULTIMO_LOTE), self.metrica(expiracion.RETRASO_SEGUNDOS)), (2, 0))
+
+    def test_transaccion_que_avanzo_entretanto_no_se_cancela(self):
+        plazo = expiracion.PLAZOS_HORAS['PENDIENTE']
+        quieta, aceptada = self.vender(plazo + 2), self.vender(plazo + 1)
+        leidas = expiracion.buscar_vencidas(self.ahora, 10)
+        # El vendedor acepta la segunda entre la lectura del lote y su escritura
+        aplicar_transicion(Transaccion.objects.get(pk=aceptada.pk), 'aceptar')
+
+        with mock.patch.object(expiracion, 'buscar_vencidas', return_value=leidas):
+            resultado = self.expirar()
+        self.assertEqual((resultado['expiradas'], resultado['fallidas']), (1, 1))
+        self.assertEqual(Transaccion.objects.get(pk=quieta.pk).estado, 'CANCELADA')
+        self.assertEqual(Transaccion.objects.get(pk=aceptada.pk).estado, 'ACEPTADA')
+        self.assertEqual(Prenda.objects.get(pk=aceptada.prenda_id).estado, 'RESERVADA')
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class CompraConcurrenteTests(TransactionTestCase):
+    """
+    Compradores simultáneos en hilos reales: cada uno con su conexión y sus commits.
+    Necesita una base de datos que admita varias conexiones (no SQLite en memoria).
+    """
+
+    COMPRADORES = 8
+
+    def setUp(self):
+        cache.clear()
+        tipos_transaccion.invalidar()
+        self.vendedor = crear_usuario('Vendedor')
+        self.compradores = [crear_usuario(f'Comprador{i}') for i in range(self.COMPRADORES)]
+        self.tipo_venta = obtener_tipo(VENTA)
+        self.prenda = Prenda.objects.create(user=self.vendedor, nombre='Chaqueta')
+
+    def comprar(self, comprador):
+        return crear_transaccion(
+            Prenda.objects.get(pk=self.prenda.pk), tipo=self.tipo_venta,
+            user_origen=self.vendedor, user_destino=comprador,
+        )
+
+    def test_un_solo_comprador_obtiene_la_prenda(self):
+        resultados = en_paralelo([lambda c=c: self.comprar(c) for c in self.compradores])
+
+        ganadoras = [r for r in resultados if isinstance(r, Transaccion)]
+        perdedoras = [r for r in resultados if not isinstance(r, Transaccion)]
+        self.assertEqual(len(ganadoras), 1)
+        self.assertTrue(all(isinstance(r, PrendaNoDisponible) for r in perdedoras), perdedoras)
+        self.assertEqual(Transaccion.objects.filter(prenda=self.prenda).count(), 1)
+        self.prenda.refresh_from_db()
+        self.assertEqual(self.prenda.estado, 'RESERVADA')
+
+    def test_un_solo_cambio_de_estado_con_la_misma_version(self):
+        transaccion = self.comprar(self.compradores[0])
+        leidas = [Transaccion.objects.get(pk=transaccion.pk) for _ in range(self.COMPRADORES)]
+        version_leida = transaccion.version
+        acciones = ['aceptar' if i % 2 else 'rechazar' for i in range(self.COMPRADORES)]
+
+        resultados = en_paralelo([
+            lambda t=t, a=a: aplicar_transicion(t, a) for t, a in zip(leidas, acciones)
+        ])
+
+        ganadoras = [r for r in resultados if isinstance(r, Transaccion)]
+        perdedoras = [r for r in resultados if not isinstance(r, Transaccion)]
+        self.assertEqual(len(ganadoras), 1)
+        self.assertTrue(all(isinstance(r, ConflictoConcurrencia) for r in perdedoras), perdedoras)
+        transaccion.refresh_from_db()
+        self.assertEqual(transaccion.estado, ganadoras[0].estado)
+        self.assertEqual(transaccion.version, version_leida + 1)
+
+
+# ==============================================================================
+# SEGUIMIENTO DE ENVÍOS
+# ==============================================================================
+
+class SeguimientoEnviosTests(EcoPrendaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        vendedor = crear_usuario('Vendedor')
+        comprador = crear_usuario('Comprador')
+        self.transacciones = {}
+        for codigo in ('ENT-1', 'DEV-1', 'TRN-1'):
+            prenda = Prenda.objects.create(user=vendedor, nombre=f'Prenda {codigo}', estado='EN_PROCESO_ENTREGA')
+            self.transacciones[codigo] = Transaccion.objects.create(
+                prenda=prenda, tipo=obtener_tipo(VENTA), estado='EN_PROCESO', direccion_entrega='Calle 123',
+                user_origen=vendedor, user_destino=comprador, courier='Falso', codigo_seguimiento_envio=codigo,
+            )
+
+    def estados(self):
+        return {
+            codigo: Transaccion.objects.values_list('estado', flat=True).get(pk=transaccion.pk)
+            for codigo, transaccion in self.transacciones.items()
+        }
+
+    def test_avanza_segun_el_courier(self):
+        registrar_courier(CourierFalso)
+        self.addCleanup(quitar_courier, CourierFalso)
+        latencia = CourierFalso.latencia_segundos
+        CourierFalso.latencia_segundos = 0
+        self.addCleanup(setattr, CourierFalso, 'latencia_segundos', latencia)
+
+        resumen = seguir_envios()
+
+        self.assertEqual(resumen['consultados'], 3)
+        self.assertEqual(self.estados(), {'ENT-1': 'COMPLETADA', 'DEV-1': 'CANCELADA', 'TRN-1': 'EN_PROCESO'})
+
+    def test_courier_falso_no_queda_registrado(self):
+        seguir_envios()
+        self.assertEqual(set(self.estados().values()), {'EN_PROCESO'})
+
+
+# ==============================================================================
+# ÍNDICE DE BÚSQUEDA EN MEMORIA
+# ==============================================================================
+
+@override_settings(BUSQUEDA_BACKEND='memoria')
+class IndiceBusquedaTests(EcoPrendaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        indice_busqueda._indice = None
+        self.addCleanup(setattr, indice_busqueda, '_indice', None)
+        self.usuario = crear_usuario('Vendedor')
+
+    def crear_prenda(self, nombre, **campos):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Prenda.objects.create(user=self.usuario, nombre=nombre, **campos)
+
+    def buscar(self, consulta):
+        return indice_busqueda.buscar_ids(Prenda.objects.filter(estado='DISPONIBLE'), consulta, 100)
+
+    def cambiar_en_otro_proceso(self, prenda, **campos):
+        """Escritura que no pasa por las señales de este proceso, salvo el sello de la tabla."""
+        Prenda.objects.filter(pk=prenda.pk).update(**Prenda.nueva_version(**campos))
+        with self.captureOnCommitCallbacks(execute=True):
+            marcar_version_tabla(Prenda)
+
+    def test_cambio_confirmado_se_indexa(self):
+        prenda = self.crear_prenda('Chaqueta azul')
+        self.assertEqual(self.buscar('chaqueta'), [prenda.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            prenda.nombre = 'Abrigo azul'
+            prenda.save()
+        self.assertEqual(self.buscar('chaqueta'), [])
+        self.assertEqual(self.buscar('abrigo'), [prenda.pk])
+
+    def test_cambio_revertido_no_llega_al_indice(self):
+        prenda = self.crear_prenda('Chaqueta azul')
+        self.buscar('chaqueta')
+        with self.captureOnCommitCallbacks(execute=False):
+            prenda.nombre = 'Abrigo azul'
+            prenda.save()
+        self.assertEqual(indice_busqueda._indice.buscar('abrigo'), [])
+
+    def test_sello_distinto_sincroniza_filas_cambiadas(self):
+        prenda = self.crear_prenda('Chaqueta azul')
+        otra = self.crear_prenda('Camisa blanca')
+        self.buscar('chaqueta')
+        self.cambiar_en_otro_proceso(prenda, nombre='Abrigo azul')
+        self.cambiar_en_otro_proceso(otra, estado='RESERVADA')
+
+        self.assertEqual(self.buscar('abrigo'), [prenda.pk])
+        self.assertEqual(self.buscar('chaqueta'), [])
+        self.assertFalse(indice_busqueda._indice.esta_disponible(otra.pk))
+
+    def test_cambio_local_adelanta_el_sello(self):
+        prenda = self.crear_prenda('Chaqueta azul')
+        self.buscar('chaqueta')
+        with self.captureOnCommitCallbacks(execute=True):
+            prenda.nombre = 'Abrigo azul'
+            prenda.save()
+        self.assertEqual(indice_busqueda._indice.sello, indice_busqueda.sello_prendas())
+        # Sello y filtro de la búsqueda: sin sincronizar
+        with self.assertNumQueries(2):
+            self.assertEqual(self.buscar('abrigo'), [prenda.pk])
+
+    def test_cambio_ajeno_no_adelanta_el_sello(self):
+        prenda = self.crear_prenda('Chaqueta azul')
+        otra = self.crear_prenda('Camisa blanca')
+        self.buscar('chaqueta')
+        self.cambiar_en_otro_proceso(otra, nombre='Camisa negra')
+        with self.captureOnCommitCallbacks(execute=True):
+            prenda.nombre = 'Abrigo azul'
+            prenda.save()
+        self.assertNotEqual(indice_busqueda._indice.sello, indice_busqueda.sello_prendas())
+        self.assertEqual(self.buscar('negra'), [otra.pk])
+
+    def test_sincronizacion_lee_solo_lo_modificado(self):
+        antigua = self.crear_prenda('Chaqueta azul')
+        reciente = self.crear_prenda('Camisa blanca')
+        self.buscar('chaqueta')
+        # Cambio fuera de la ventana de la sincronización parcial (solo lo ve la completa)
+        Prenda.objects.filter(pk=antigua.pk).update(
+            nombre='Abrigo azul', version=F('version') + 1,
+            modificada=indice_busqueda._indice.marca - indice_busqueda.MARGEN_DELTA * 2,
+        )
+        self.cambiar_en_otro_proceso(reciente, nombre='Camisa negra')
+
+        self.assertEqual(self.buscar('negra'), [reciente.pk])
+        self.assertEqual(self.buscar('chaqueta'), [antigua.pk])
+        self.assertEqual(indice_busqueda.sincronizar(indice_busqueda._indice, completa=True), 1)
+        self.assertEqual(self.buscar('abrigo'), [antigua.pk])
+
+    def test_snapshot_se_sincroniza_al_cargar(self):
+        prenda = self.crear_prenda('Chaqueta azul')
+        borrada = self.crear_prenda('Camisa blanca')
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = os.path.join(carpeta, 'indice.pkl')
+            indice_busqueda.construir_desde_db().guardar(ruta)
+            # Cambios posteriores al snapshot, hechos mientras el proceso no estaba
+            indice_busqueda._indice = None
+            self.cambiar_en_otro_proceso(prenda, nombre='Abrigo azul')
+            with self.captureOnCommitCallbacks(execute=True):
+                borrada.delete()
+            nueva = self.crear_prenda('Abrigo negro')
+            with self.settings(BUSQUEDA_INDICE_SNAPSHOT=ruta):
+                indice_busqueda.cargar_snapshot()
+
+        self.assertEqual(self.buscar('abrigo'), [nueva.pk, prenda.pk])
+        self.assertEqual(self.buscar('chaqueta'), [])
+        self.assertEqual(self.buscar('camisa'), [])
+
+    def test_limite_despues_de_los_filtros(self):
+        antigua = self.crear_prenda('Camisa', talla='M')
+        for _ in range(3):
+            self.crear_prenda('Camisa', talla='S')
+        ids = indice_busqueda.buscar_ids(Prenda.objects.filter(estado='DISPONIBLE', talla='M'), 'camisa', 2)
+        self.assertEqual(ids, [antigua.pk])
+
+
+# ==============================================================================
+# AUTOCOMPLETADO
+# ==============================================================================
+
+class AutocompletadoTests(EcoPrendaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        autocompletado._autocompletado = None
+        self.addCleanup(setattr, autocompletado, '_autocompletado', None)
+        self.usuario = crear_usuario('Vendedor')
+
+    def crear_prenda(self, nombre):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Prenda.objects.create(user=self.usuario, nombre=nombre)
+
+    def sugerencias(self, prefijo):
+        return [s['texto'] for s in autocompletado.obtener_autocompletado().sugerir(prefijo)]
+
+    def test_cambio_de_otro_worker_se_aplica_por_sello(self):
+        prenda = self.crear_prenda('Chaqueta azul')
+        self.assertEqual(self.sugerencias('chaq'), ['Chaqueta azul'])
+        # Escritura que no pasa por las señales de este proceso, salvo el sello de la tabla
+        Prenda.objects.filter(pk=prenda.pk).update(**Prenda.nueva_version(nombre='Abrigo azul'))
+        with self.captureOnCommitCallbacks(execute=True):
+            marcar_version_tabla(Prenda)
+
+        self.assertEqual(self.sugerencias('chaq'), [])
+        self.assertEqual(self.sugerencias('abri'), ['Abrigo azul'])
+
+    def test_cambio_revertido_no_llega(self):
+        prenda = self.crear_prenda('Chaqueta azul')
+        self.sugerencias('chaq')
+        with self.captureOnCommitCallbacks(execute=False):
+            prenda.nombre = 'Abrigo azul'
+            prenda.save()
+        self.assertEqual(autocompletado._autocompletado.sugerir('abri'), [])
+
+    def test_se_reconstruye_al_vencer(self):
+        prenda = self.crear_prenda('Chaqueta azul')
+        self.sugerencias('chaq')
+        # Borrado por otro worker (aquí no corren los on_commit): solo lo quita la reconstrucción
+        Prenda.objects.filter(pk=prenda.pk).delete()
+        autocompletado._autocompletado.construido -= autocompletado.INTERVALO_RECONSTRUCCION + 1
+        self.assertEqual(self.sugerencias('chaq'), [])
+
+
+# ==============================================================================
+# RESUMEN DE CONVERSACIONES E INSIGNIA DE NO LEÍDOS
+# ==============================================================================
+
+@override_settings(TIEMPO_REAL_HABILITADO=False)
+class ConversacionesTests(EcoPrendaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.ana, self.beto, self.carla = crear_usuario('Ana'), crear_usuario('Beto'), crear_usuario('Carla')
+
+    def conversacion(self, a, b):
+        menor, mayor = conversaciones.par(a.pk, b.pk)
+        return Conversacion.objects.get(usuario_menor_id=menor, usuario_mayor_id=mayor)
+
+    def no_leidos(self, usuario, otro):
+        fila = self.conversacion(usuario, otro)
+        return getattr(fila, conversaciones.campo_no_leidos(usuario.pk, fila.usuario_menor_id))
+
+    def enviar(self, emisor, receptor, contenido='Hola', **campos):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Mensaje.objects.create(emisor=emisor, receptor=receptor, contenido=contenido, **campos)
+
+    def test_mensaje_crea_la_conversacion_y_suma_al_receptor(self):
+        mensaje = self.enviar(self.ana, self.beto)
+        self.assertEqual(self.conversacion(self.ana, self.beto).ultimo_mensaje_id, mensaje.pk)
+        self.assertEqual(self.no_leidos(self.beto, self.ana), 1)
+        self.assertEqual(self.no_leidos(self.ana, self.beto), 0)
+        self.assertEqual(conversaciones.contar_no_leidos(self.beto.pk), 1)
+
+    def test_mensaje_tardio_no_pisa_el_ultimo(self):
+        ultimo = self.enviar(self.ana, self.beto, 'Nuevo')
+        self.enviar(self.beto, self.ana, 'Viejo', fecha_envio=ultimo.fecha_envio - timedelta(minutes=5))
+        fila = self.conversacion(self.ana, self.beto)
+        self.assertEqual((fila.ultimo_mensaje_id, fila.vista_previa), (ultimo.pk, 'Nuevo'))
+        self.assertEqual(self.no_leidos(self.ana, self.beto), 1)
+
+    def test_registrar_mensajes_en_lote(self):
+        self.enviar(self.ana, self.beto, 'Primero')
+        self.assertEqual(conversaciones.contar_no_leidos(self.beto.pk), 1)
+        ahora = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            mensajes = Mensaje.objects.bulk_create([
+                Mensaje(emisor=self.ana, receptor=self.beto, contenido='Segundo', fecha_envio=ahora),
+                Mensaje(emisor=self.ana, receptor=self.beto, contenido='Tercero', fecha_envio=ahora + timedelta(seconds=1)),
+                Mensaje(emisor=self.carla, receptor=self.beto, contenido='Hola', fecha_envio=ahora),
+            ])
+            conversaciones.registrar_mensajes(mensajes)
+
+        self.assertEqual(self.conversacion(self.ana, self.beto).ultimo_mensaje_id, mensajes[1].pk)
+        self.assertEqual(self.no_leidos(self.beto, self.ana), 3)
+        self.assertEqual(self.conversacion(self.carla, self.beto).ultimo_mensaje_id, mensajes[2].pk)
+        self.assertEqual(conversaciones.contar_no_leidos(self.beto.pk), 4)
+
+    def test_difusion_actualiza_cada_conversacion(self):
+        self.enviar(self.beto, self.ana, 'Antes')
+        self.assertEqual(conversaciones.contar_no_leidos(self.beto.pk), 0)
+        ahora = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            mensajes = Mensaje.objects.bulk_create([
+                Mensaje(emisor=self.ana, receptor=receptor, contenido='Gracias', fecha_envio=ahora)
+                for receptor in (self.beto, self.carla)
+            ])
+            conversaciones.registrar_difusion(self.ana.pk, mensajes)
+
+        for mensaje, receptor in zip(mensajes, (self.beto, self.carla)):
+            self.assertEqual(self.conversacion(self.ana, receptor).ultimo_mensaje_id, mensaje.pk)
+            self.assertEqual(self.no_leidos(receptor, self.ana), 1)
+        self.assertEqual(conversaciones.contar_no_leidos(self.beto.pk), 1)
+
+    def test_marcar_leidos_descuenta_solo_lo_marcado(self):
+        self.enviar(self.ana, self.beto)
+        self.enviar(self.ana, self.beto)
+        self.enviar(self.carla, self.beto)
+        self.assertEqual(conversaciones.contar_no_leidos(self.beto.pk), 3)
+        # Un desvío previo del contador se conserva: se restan los marcados, no se pone en cero
+        fila = self.conversacion(self.ana, self.beto)
+        campo = conversaciones.campo_no_leidos(self.beto.pk, fila.usuario_menor_id)
+        Conversacion.objects.filter(pk=fila.pk).update(**{campo: 5})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(conversaciones.marcar_leidos(self.beto, self.ana.pk), 2)
+        self.assertEqual(self.no_leidos(self.beto, self.ana), 3)
+        self.assertEqual(self.no_leidos(self.beto, self.carla), 1)
+        self.assertEqual(conversaciones.contar_no_leidos(self.beto.pk), 1)
+
+    def test_insignia_se_ajusta_al_confirmar(self):
+        self.assertEqual(conversaciones.contar_no_leidos(self.beto.pk), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Mensaje.objects.create(emisor=self.ana, receptor=self.beto, contenido='Hola')
+            self.assertEqual(cache.get(conversaciones.clave_no_leidos(self.beto.pk)), 0)
+        self.assertEqual(cache.get(conversaciones.clave_no_leidos(self.beto.pk)), 1)
+
+        with self.captureOnCommitCallbacks(execute=False):
+            Mensaje.objects.create(emisor=self.ana, receptor=self.beto, contenido='Revertido')
+        self.assertEqual(cache.get(conversaciones.clave_no_leidos(self.beto.pk)), 1)
+
+    def test_reconciliar_corrige_los_desvios(self):
+        self.enviar(self.ana, self.beto)
+        self.enviar(self.carla, self.beto)
+        self.assertEqual(conversaciones.contar_no_leidos(self.beto.pk), 2)
+        fila = self.conversacion(self.ana, self.beto)
+        Conversacion.objects.filter(pk=fila.pk).update(no_leidos_menor=7, no_leidos_mayor=7)
+
+        with self.assertLogs('A_EcoPrenda.conversaciones', 'WARNING'):
+            desvios = conversaciones.reconciliar_no_leidos()
+        self.assertEqual(list(desvios), [(fila.usuario_menor_id, fila.usuario_mayor_id)])
+        self.assertEqual(self.no_leidos(self.beto, self.ana), 1)
+        self.assertEqual(self.no_leidos(self.ana, self.beto), 0)
+        self.assertEqual(conversaciones.contar_no_leidos(self.beto.pk), 2)
+        self.assertEqual(conversaciones.reconciliar_no_leidos(), {})
+
+
+# ==============================================================================
+# MENSAJES EN TIEMPO REAL (SSE)
+# ==============================================================================
+
+@override_settings(TIEMPO_REAL_HABILITADO=True)
+class TiempoRealTests(EcoPrendaTestCase):
+    """El cliente de pruebas es WSGI: el flujo no debe abrirse aunque esté activado."""
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = crear_usuario('Oyente')
+        self.otro = crear_usuario('Remitente')
+        sesion = self.client.session
+        sesion['usuario_id'] = self.usuario.pk
+        sesion.save()
+
+    def test_flujo_bajo_wsgi_responde_204(self):
+        respuesta = self.client.get(reverse('eventos_mensajes'))
+        self.assertEqual(respuesta.status_code, 204)
+        self.assertFalse(respuesta.streaming)
+
+    def test_conversacion_solo_abre_el_flujo_si_esta_disponible(self):
+        request = RequestFactory().get(reverse('conversacion', args=[self.otro.pk]))
+        request.session = self.client.session
+        self.assertFalse(tiempo_real.disponible(request))
+        contexto = {'usuario': self.usuario, 'otro_usuario': self.otro, 'mensajes': []}
+        self.assertNotIn('EventSource', render_to_string('conversacion.html', {**contexto, 'tiempo_real': False}, request))
+        self.assertIn('EventSource', render_to_string('conversacion.html', {**contexto, 'tiempo_real': True}, request))
+
+
+# ==============================================================================
+# LÍMITE DE ENVÍO DE MENSAJES
+# ==============================================================================
+
+INICIO_VENTANA = 6000.0  # Marca de tiempo al comienzo de una ventana de 60 s
+
+
+class LimiteMensajesTests(EcoPrendaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.emisor = crear_usuario('Emisor')
+        self.receptor = crear_usuario('Receptor')
+
+    def iniciar_sesion(self, usuario):
+        sesion = self.client.session
+        sesion['usuario_id'] = usuario.pk
+        sesion.save()
+
+    def enviar_por_api(self, emisor, receptor, contenido='Hola'):
+        return self.client.post(
+            reverse('api-mensaje-enviar'),
+            {'emisor': emisor.pk, 'receptor': receptor.pk, 'contenido': contenido},
+            content_type='application/json',
+        )
+
+    def enviar(self, veces, receptor=None, ahora=INICIO_VENTANA):
+        for _ in range(veces):
+            verificar_envio(self.emisor.pk, (receptor or self.receptor).pk, ahora=ahora)
+
+    @mock.patch.dict(limite_mensajes.LIMITES, {'usuario': (3, 60), 'par': (10, 60)})
+    def test_rafaga_hasta_la_capacidad(self):
+        self.enviar(3)
+        with self.assertRaises(LimiteExcedido) as rechazo:
+            self.enviar(1)
+        self.assertEqual(rechazo.exception.ambito, 'usuario')
+        # Ventana siguiente: las 3 fichas de la anterior pesan 3 * (1 - t/60); queda una libre en t = 20
+        self.assertEqual(rechazo.exception.reintentar_en, 80)
+
+    @mock.patch.dict(limite_mensajes.LIMITES, {'usuario': (3, 60), 'par': (10, 60)})
+    def test_se_recarga_con_el_tiempo(self):
+        self.enviar(3)
+        with self.assertRaises(LimiteExcedido):
+            self.enviar(1, ahora=INICIO_VENTANA + 79)
+        self.enviar(1, ahora=INICIO_VENTANA + 80)
+        # Pasado un periodo entero sin envíos la cubeta vuelve a estar llena
+        self.enviar(3, ahora=INICIO_VENTANA + 200)
+
+    @mock.patch.dict(limite_mensajes.LIMITES, {'usuario': (3, 60), 'par': (2, 60)})
+    def test_cubeta_por_par_aparte_de_la_del_usuario(self):
+        self.enviar(2)
+        with self.assertRaises(LimiteExcedido) as rechazo:
+            self.enviar(1)
+        self.assertEqual(rechazo.exception.ambito, 'par')
+        # El rechazo no gastó fichas: el usuario puede escribir a otra persona
+        self.enviar(1, receptor=crear_usuario('Otro'))
+        with self.assertRaises(LimiteExcedido) as rechazo:
+            self.enviar(1, receptor=crear_usuario('Tercero'))
+        self.assertEqual(rechazo.exception.ambito, 'usuario')
+
+    @mock.patch.dict(limite_mensajes.LIMITES, {'usuario': (1, 60)})
+    def test_api_responde_429_con_retry_after(self):
+        self.iniciar_sesion(self.emisor)
+        self.assertEqual(self.enviar_por_api(self.emisor, self.receptor).status_code, 201)
+        respuesta = self.enviar_por_api(self.emisor, self.receptor)
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertGreaterEqual(int(respuesta['Retry-After']), 1)
+        self.assertEqual(Mensaje.objects.count(), 1)
+
+    def test_api_sin_sesion_no_envia_ni_consume_fichas(self):
+        with mock.patch.dict(limite_mensajes.LIMITES, {'global': (1, 60)}):
+            self.assertEqual(self.enviar_por_api(self.emisor, self.receptor).status_code, 403)
+            # La única ficha global sigue disponible
+            verificar_envio(self.emisor.pk, self.receptor.pk)
+        self.assertFalse(Mensaje.objects.exists())
+
+    def test_api_rechaza_un_emisor_distinto_del_de_la_sesion(self):
+        self.iniciar_sesion(self.emisor)
+        with mock.patch.dict(limite_mensajes.LIMITES, {'usuario': (1, 60)}):
+            for _ in range(3):
+                self.assertEqual(self.enviar_por_api(self.receptor, self.emisor).status_code, 403)
+            # Suplantar a la víctima no gasta su ficha
+            verificar_envio(self.receptor.pk, self.emisor.pk)
+        self.assertFalse(Mensaje.objects.exists())
+
+
+# ==============================================================================
+# ARCHIVO Y RETENCIÓN
+# ==============================================================================
+
+migracion_archivo = importlib.import_module('A_EcoPrenda.migrations.0011_archivo_transacciones_mensajes')
+
+
+class HistoricoTestCase(EcoPrendaTestCase):
+    """Base: las vistas históricas las crea la migración 0011; sin migraciones se crean aquí."""
+
+    @classmethod
+    def setUpTestData(cls):
+        existentes = connection.introspection.table_names(include_views=True)
+        with connection.cursor() as cursor:
+            for vista, sql in zip(('transaccion_historica', 'mensaje_historico'), migracion_archivo.CREAR_VISTAS):
+                if vista not in existentes:
+                    cursor.execute(sql)
+
+    def setUp(self):
+        super().setUp()
+        self.vendedor = crear_usuario('Vendedor')
+        self.comprador = crear_usuario('Comprador')
+        self.tipo_venta = obtener_tipo(VENTA)
+
+    def vender(self, estado='COMPLETADA', dias=400, comprador=None):
+        """Venta en `estado` hace `dias` días, con sus eventos ya despachados."""
+        prenda = Prenda.objects.create(user=self.vendedor, nombre='Polera')
+        transaccion = crear_transaccion(
+            prenda, tipo=self.tipo_venta, user_origen=self.vendedor, user_destino=comprador or self.comprador,
+        )
+        Transaccion.objects.filter(pk=transaccion.pk).update(estado=estado, fecha_transaccion=timezone.now() - timedelta(days=dias))
+        EventoTransaccion.objects.filter(transaccion=transaccion).update(estado='PROCESADO')
+        return transaccion
+
+    def escribir(self, emisor, receptor, dias, leido=True):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Mensaje.objects.create(
+                emisor=emisor, receptor=receptor, contenido='Hola', leido=leido,
+                fecha_envio=timezone.now() - timedelta(days=dias),
+            )
+
+
+class ArchivoTests(HistoricoTestCase):
+
+    def test_archiva_solo_terminadas_antiguas_sin_eventos_pendientes(self):
+        archivable = self.vender('COMPLETADA')
+        rechazada = self.vender('RECHAZADA')
+        reciente = self.vender('COMPLETADA', dias=30)
+        activa = self.vender('EN_PROCESO')
+        con_evento = self.vender('CANCELADA')
+        EventoTransaccion.objects.filter(transaccion=con_evento).update(estado='PENDIENTE')
+
+        self.assertEqual(archivo.archivar_lote(antiguedad_dias=365)['transacciones'], 2)
+        self.assertEqual(set(TransaccionArchivada.objects.values_list('id', flat=True)), {archivable.pk, rechazada.pk})
+        self.assertEqual(set(Transaccion.objects.values_list('id', flat=True)), {reciente.pk, activa.pk, con_evento.pk})
+        # Los reportes siguen viendo todas, cada una en su tabla
+        self.assertEqual(TransaccionHistorica.objects.count(), 5)
+        self.assertEqual(set(TransaccionHistorica.objects.archivadas().values_list('id', flat=True)), {archivable.pk, rechazada.pk})
+        # Repetir no encuentra nada más que archivar
+        self.assertEqual(archivo.archivar_lote(antiguedad_dias=365)['transacciones'], 0)
+
+    def test_archiva_la_conversacion_salvo_no_leidos_y_el_ultimo(self):
+        self.vender('COMPLETADA')
+        leido = self.escribir(self.comprador, self.vendedor, dias=500)
+        no_leido = self.escribir(self.vendedor, self.comprador, dias=450, leido=False)
+        ultimo = self.escribir(self.comprador, self.vendedor, dias=420)
+
+        self.assertEqual(archivo.archivar_lote(antiguedad_dias=365)['mensajes'], 1)
+        self.assertEqual(list(MensajeArchivado.objects.values_list('id', flat=True)), [leido.pk])
+        self.assertEqual(set(Mensaje.objects.values_list('id', flat=True)), {no_leido.pk, ultimo.pk})
+        self.assertEqual(list(MensajeHistorico.objects.values_list('id', 'en_archivo')), [
+            (leido.pk, True), (no_leido.pk, False), (ultimo.pk, False),
+        ])
+        self.assertEqual(Conversacion.objects.get().ultimo_mensaje_id, ultimo.pk)
+
+    def test_par_con_transaccion_activa_conserva_la_conversacion(self):
+        terminada = self.vender('COMPLETADA')
+        self.vender('PENDIENTE', dias=1)
+        self.escribir(self.comprador, self.vendedor, dias=500)
+        self.escribir(self.vendedor, self.comprador, dias=420)
+
+        self.assertEqual(archivo.archivar_lote(antiguedad_dias=365), {'transacciones': 1, 'mensajes': 0})
+        self.assertTrue(TransaccionArchivada.objects.filter(pk=terminada.pk).exists())
+        self.assertEqual(Mensaje.objects.count(), 2)
+
+
+class RetencionMensajesTests(HistoricoTestCase):
+
+    def test_conserva_no_leidos_recientes_y_el_ultimo(self):
+        viejos = [self.escribir(self.comprador, self.vendedor, dias=dias) for dias in (900, 850)]
+        no_leido = self.escribir(self.vendedor, self.comprador, dias=800, leido=False)
+        reciente = self.escribir(self.comprador, self.vendedor, dias=100)
+        ultimo = self.escribir(self.vendedor, self.comprador, dias=10)
+
+        resultado = retencion_mensajes.depurar_lote(dias=730, por_hilo=1)
+        self.assertEqual((resultado['hilos'], resultado['mensajes']), (1, 2))
+        self.assertFalse(Mensaje.objects.filter(pk__in=[m.pk for m in viejos]).exists())
+        self.assertEqual(set(Mensaje.objects.values_list('id', flat=True)), {no_leido.pk, reciente.pk, ultimo.pk})
+        fila = Conversacion.objects.get()
+        self.assertEqual(fila.ultimo_mensaje_id, ultimo.pk)
+        self.assertEqual(conversaciones.contar_no_leidos(self.comprador.pk), 1)
+
+    def test_pares_con_disputa_o_transaccion_activa_quedan_protegidos(self):
+        con_disputa, con_activa = crear_usuario('Disputa'), crear_usuario('Activa')
+        disputada = self.vender('COMPLETADA', comprador=con_disputa)
+        Transaccion.objects.filter(pk=disputada.pk).update(fecha_disputa=timezone.now() - timedelta(days=420))
+        # La disputa resuelta queda solo en el archivo y sigue protegiendo al par
+        archivo.archivar_lote(antiguedad_dias=365)
+        self.assertTrue(TransaccionArchivada.objects.filter(pk=disputada.pk).exists())
+        self.vender('EN_PROCESO', dias=1, comprador=con_activa)
+        for otro in (self.comprador, con_disputa, con_activa):
+            for dias in (900, 800):
+                self.escribir(otro, self.vendedor, dias=dias)
+
+        resultado = retencion_mensajes.depurar_lote(dias=730, por_hilo=1)
+        self.assertEqual((resultado['hilos'], resultado['protegidos'], resultado['mensajes']), (3, 2, 1))
+        self.assertEqual(Mensaje.objects.filter(emisor=self.comprador).count(), 1)
+        self.assertEqual(Mensaje.objects.filter(emisor__in=[con_disputa, con_activa]).count(), 4)
+
+    def test_simular_no_borra(self):
+        for dias in (900, 850, 800):
+            self.escribir(self.comprador, self.vendedor, dias=dias)
+        salida = StringIO()
+        call_command('depurar_mensajes', '--simular', '--por-hilo', '1', '--dias', '730', stdout=salida)
+        self.assertIn('2 mensajes se borrarían', salida.getvalue())
+        self.assertEqual(Mensaje.objects.count(), 3)
+        self.assertEqual(retencion_mensajes.depurar_lote(dias=730, por_hilo=1, simular=True)['mensajes'], 2)
+        self.assertEqual(Mensaje.objects.count(), 3)
+
+
+# ==============================================================================
+# AGRADECIMIENTOS MASIVOS
+# ==============================================================================
+
+class AgradecimientosTests(EcoPrendaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.representante = crear_usuario('Representante')
+        self.fundacion = Fundacion.objects.create(
+            nombre='Fundación Prueba', direccion='Calle 1', activa=False, representante=self.representante,
+        )
+        tipo_donacion = obtener_tipo(DONACION)
+        self.donantes = [crear_usuario(f'Donante{i}') for i in range(5)]
+        # El primero donó dos veces: igual recibe un solo agradecimiento
+        for donante in [self.donantes[0], *self.donantes]:
+            prenda = Prenda.objects.create(user=donante, nombre='Chaqueta')
+            donacion = crear_transaccion(prenda, tipo=tipo_donacion, user_origen=donante, fundacion=self.fundacion)
+            Transaccion.objects.filter(pk=donacion.pk).update(estado='COMPLETADA')
+        self.envio = agradecimientos.crear_envio(self.representante, self.fundacion, 'Gracias', en_hilo=False)
+
+    def recibidos(self):
+        return dict(
+            Mensaje.objects.filter(emisor=self.representante).values_list('receptor').annotate(total=Count('id'))
+        )
+
+    def vencer_espera(self):
+        EnvioAgradecimiento.objects.filter(pk=self.envio.pk).update(disponible_desde=timezone.now() - timedelta(seconds=1))
+
+    def test_reclamo_vencido_retoma_desde_el_ultimo_donante(self):
+        self.assertEqual(self.envio.total, 5)
+        envio, marca = agradecimientos.reclamar()
+        self.assertEqual(agradecimientos.procesar_lote(envio, marca, tamano_lote=2), 2)
+        envio.refresh_from_db()
+        self.assertEqual((envio.enviados, envio.ultimo_donante), (2, self.donantes[1].pk))
+
+        # El proceso se cae: al vencer su reclamo, otro retoma el envío y el primero ya no escribe
+        self.vencer_espera()
+        retomado, otra_marca = agradecimientos.reclamar()
+        with self.assertRaises(agradecimientos.ReclamoVencido):
+            agradecimientos.procesar_lote(envio, marca, tamano_lote=2)
+        self.assertEqual(agradecimientos.procesar_envio(retomado, otra_marca, tamano_lote=2), 3)
+
+        retomado.refresh_from_db()
+        self.assertEqual((retomado.estado, retomado.enviados, retomado.porcentaje), ('COMPLETADO', 5, 100))
+        self.assertEqual(self.recibidos(), {d.pk: 1 for d in self.donantes})
+        self.assertIsNone(agradecimientos.reclamar())
+
+    def test_lote_que_falla_se_revierte_y_se_reintenta(self):
+        envio, marca = agradecimientos.reclamar()
+        agradecimientos.procesar_lote(envio, marca, tamano_lote=2)
+        with mock.patch.object(agradecimientos, 'registrar_difusion', side_effect=RuntimeError('sin base')):
+            with self.assertLogs('A_EcoPrenda.agradecimientos', 'ERROR'):
+                self.assertEqual(agradecimientos.procesar_envio(envio, marca, tamano_lote=2), 0)
+
+        envio.refresh_from_db()
+        self.assertEqual((envio.estado, envio.intentos, envio.reclamado_por), ('EN_PROCESO', 1, None))
+        self.assertEqual((envio.enviados, envio.ultimo_donante), (2, self.donantes[1].pk))
+        self.assertIn('sin base', envio.ultimo_error)
+        self.assertEqual(sum(self.recibidos().values()), 2)
+        # Antes de la espera no se reintenta
+        self.assertIsNone(agradecimientos.reclamar())
+
+        self.vencer_espera()
+        self.assertEqual(agradecimientos.procesar_pendientes(tamano_lote=2), {'envios': 1, 'mensajes': 3})
+        self.assertEqual(EnvioAgradecimiento.objects.get(pk=self.envio.pk).estado, 'COMPLETADO')
+        self.assertEqual(self.recibidos(), {d.pk: 1 for d in self.donantes})
+
+
+# ==============================================================================
+# RESUMEN DE MENSAJES POR CORREO
+# ==============================================================================
+
+class CorreoQueFalla(locmem.EmailBackend):
+    """Backend en memoria que rechaza los correos a `rechazados`, como un servidor SMTP con error."""
+
+    def __init__(self, rechazados=(), **kwargs):
+        super().__init__(**kwargs)
+        self.rechazados = set(rechazados)
+
+    def send_messages(self, mensajes):
+        if any(destino in self.rechazados for m in mensajes for destino in m.to):
+            raise smtplib.SMTPRecipientsRefused({destino: (550, b'rechazado') for destino in self.rechazados})
+        return super().send_messages(mensajes)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class ResumenMensajesTests(EcoPrendaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.ahora = timezone.now()
+        self.emisor, self.otro_emisor = crear_usuario('Emisor'), crear_usuario('Otro')
+        self.receptores = [crear_usuario(f'Receptor{i}') for i in range(3)]
+        for receptor in self.receptores:
+            self.escribir(self.emisor, receptor)
+        self.escribir(self.otro_emisor, self.receptores[0])
+        # Recién llegado: quien está en línea lo lee antes, todavía no se avisa
+        self.escribir(self.otro_emisor, self.receptores[1], minutos=5)
+
+    def escribir(self, emisor, receptor, minutos=60):
+        return Mensaje.objects.create(
+            emisor=emisor, receptor=receptor, contenido='Hola', fecha_envio=self.ahora - timedelta(minutes=minutos),
+        )
+
+    def enviar(self, conexion=None, ahora=None, **kwargs):
+        conexion = resumen_mensajes.ConexionCorreo(conexion, por_segundo=0)
+        return resumen_mensajes.enviar_resumenes(ahora=ahora or self.ahora, conexion=conexion, **kwargs)
+
+    def destinatarios(self):
+        return [correo.to[0] for correo in mail.outbox]
+
+    def test_cada_usuario_recibe_un_resumen_por_lotes_keyset(self):
+        lotes = []
+        totales = self.enviar(limite=2, al_terminar_lote=lotes.append)
+        self.assertEqual((totales['usuarios'], totales['enviados'], totales['fallidos']), (3, 3, 0))
+        self.assertEqual([(l['usuarios'], l['ultimo']) for l in lotes], [(2, self.receptores[1].pk), (1, None)])
+        self.assertEqual(sorted(self.destinatarios()), sorted(r.correo for r in self.receptores))
+        asuntos = {correo.to[0]: correo.subject for correo in mail.outbox}
+        self.assertEqual(asuntos[self.receptores[0].correo], 'Tienes 2 mensajes sin leer en EcoPrenda')
+        self.assertEqual(asuntos[self.receptores[1].correo], 'Tienes 1 mensaje sin leer en EcoPrenda')
+
+        # Otra ejecución no repite nada
+        self.assertEqual(self.enviar()['enviados'], 0)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_como_mucho_un_resumen_por_intervalo(self):
+        self.enviar()
+        mail.outbox.clear()
+        nuevo = Mensaje.objects.create(
+            emisor=self.otro_emisor, receptor=self.receptores[2], contenido='Otra vez', fecha_envio=self.ahora,
+        )
+        self.assertEqual(self.enviar(ahora=self.ahora + timedelta(hours=2))['enviados'], 0)
+
+        # Cumplido el intervalo solo se avisan los mensajes posteriores al resumen anterior
+        # (y el que era muy reciente para el primero)
+        totales = self.enviar(ahora=self.ahora + resumen_mensajes.INTERVALO + timedelta(minutes=1))
+        self.assertEqual(totales['enviados'], 2)
+        self.assertEqual(sorted(self.destinatarios()), sorted(r.correo for r in self.receptores[1:]))
+        self.assertEqual({correo.subject for correo in mail.outbox}, {'Tienes 1 mensaje sin leer en EcoPrenda'})
+        self.assertEqual(ResumenMensajes.objects.get(usuario=self.receptores[2]).ultimo_mensaje, nuevo.pk)
+
+    def test_envio_fallido_restaura_el_avance(self):
+        rechazado = self.receptores[0]
+        with self.assertLogs('A_EcoPrenda.resumen_mensajes', 'WARNING'):
+            totales = self.enviar(CorreoQueFalla([rechazado.correo]))
+        self.assertEqual((totales['enviados'], totales['fallidos']), (2, 1))
+        estado = ResumenMensajes.objects.get(usuario=rechazado)
+        self.assertEqual((estado.ultimo_mensaje, estado.fecha_ultimo_envio), (0, None))
+
+        # El próximo ciclo le envía a él, y solo a él
+        mail.outbox.clear()
+        self.assertEqual(self.enviar()['enviados'], 1)
+        self.assertEqual(self.destinatarios(), [rechazado.correo])
+
+    def test_baja_con_el_enlace_firmado(self):
+        usuario = self.receptores[0]
+        ruta = resumen_mensajes.enlace_baja(usuario.pk)[len(resumen_mensajes.SITIO_URL):]
+        self.assertRedirects(self.client.post(ruta), ruta)
+        self.assertFalse(ResumenMensajes.objects.get(usuario=usuario).activo)
+        # Una firma alterada no da de baja a nadie
+        alterada = reverse('baja_resumen_mensajes', args=[signing.dumps(self.receptores[1].pk, salt='otra')])
+        self.assertRedirects(self.client.post(alterada), reverse('home'), fetch_redirect_response=False)
+        self.assertFalse(ResumenMensajes.objects.filter(usuario=self.receptores[1]).exists())
+
+        self.enviar()
+        self.assertEqual(sorted(self.destinatarios()), sorted(r.correo for r in self.receptores[1:]))
+        # Cada correo lleva el enlace de baja de su destinatario
+        por_correo = {r.correo: r.pk for r in self.receptores}
+        for correo in mail.outbox:
+            token = correo.extra_headers['List-Unsubscribe'].strip('<>').rstrip('/').rsplit('/', 1)[1]
+            self.assertEqual(resumen_mensajes.leer_enlace_baja(token), por_correo[correo.to[0]])
+
+
+# ==============================================================================
+# PAGINACIÓN POR CURSOR
+# ==============================================================================
+
+def recorrer(pagina):
+    """Todas las filas de un listado por cursor, pidiendo páginas hasta que no quede cursor."""
+    filas, cursor = [], None
+    while True:
+        resultados, cursor = pagina(cursor)
+        filas.append(resultados)
+        if cursor is None:
+            return filas
+
+
+class LineaTiempoTests(EcoPrendaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.ana, self.beto, self.carla = crear_usuario('Ana'), crear_usuario('Beto'), crear_usuario('Carla')
+        tipo_venta = obtener_tipo(VENTA)
+        ahora = timezone.now().replace(microsecond=0)
+        # Tres con la misma fecha: el orden entre ellas lo decide el id
+        partes_y_fechas = [
+            (self.ana, self.beto, ahora), (self.beto, self.ana, ahora), (self.ana, self.carla, ahora),
+            (self.carla, self.ana, ahora - timedelta(hours=1)), (self.ana, self.beto, ahora - timedelta(hours=2)),
+            (self.beto, self.carla, ahora),  # No es de Ana
+        ]
+        for origen, destino, fecha in partes_y_fechas:
+            prenda = Prenda.objects.create(user=origen, nombre='Polera')
+            venta = crear_transaccion(prenda, tipo=tipo_venta, user_origen=origen, user_destino=destino)
+            Transaccion.objects.filter(pk=venta.pk).update(fecha_transaccion=fecha)
+        self.esperadas = list(
+            Transaccion.objects.filter(Q(user_origen=self.ana) | Q(user_destino=self.ana))
+            .order_by('-fecha_transaccion', '-id').values_list('id', flat=True)
+        )
+
+    def paginas(self, limite):
+        paginas = recorrer(lambda cursor: linea_tiempo_usuario(self.ana, cursor=cursor, limite=limite))
+        return [[t.pk for t in pagina] for pagina in paginas]
+
+    def test_paginas_con_empates_en_la_fecha(self):
+        for limite in (1, 2, 3, 5):
+            paginas = self.paginas(limite)
+            self.assertEqual(sum(paginas, []), self.esperadas, f'limite={limite}')
+            self.assertTrue(all(len(pagina) == limite for pagina in paginas[:-1]))
+        pagina, siguiente = linea_tiempo_usuario(self.ana, limite=5)
+        self.assertIsNone(siguiente)
+        for t in pagina:
+            enviada = t.user_origen_id == self.ana.pk
+            self.assertEqual((t.es_enviada, t.contraparte), (enviada, t.user_destino if enviada else t.user_origen))
+
+    def test_mezcla_en_python_sin_union(self):
+        # En PostgreSQL compara ambos caminos; en SQLite (sin LIMIT en la UNION) los dos mezclan en Python
+        con_union = self.paginas(2)
+        with mock.patch.object(connection.features, 'supports_slicing_ordering_in_compound', False):
+            self.assertEqual(self.paginas(2), con_union)
+
+    def test_api_pagina_y_rechaza_cursor_invalido(self):
+        url = reverse('api-usuario-transacciones', args=[self.ana.pk])
+        primera = self.client.get(url, {'limite': 3}).json()
+        self.assertEqual([t['id'] for t in primera['resultados']], self.esperadas[:3])
+        segunda = self.client.get(url, {'limite': 3, 'cursor': primera['siguiente']}).json()
+        self.assertEqual([t['id'] for t in segunda['resultados']], self.esperadas[3:])
+        self.assertIsNone(segunda['siguiente'])
+
+        for parametros in ({'cursor': 'no-es-un-cursor'}, {'cursor': 'eHh4fDE='}, {'limite': 'muchos'}):
+            self.assertEqual(self.client.get(url, parametros).status_code, 400, parametros)
+
+
+class HiloMensajesTests(EcoPrendaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.ana, self.beto, self.carla = crear_usuario('Ana'), crear_usuario('Beto'), crear_usuario('Carla')
+        ahora = timezone.now().replace(microsecond=0)
+        # Ambos sentidos en el mismo hilo; tres con la misma fecha
+        emisores_y_fechas = [
+            (self.ana, ahora - timedelta(minutes=2)), (self.beto, ahora - timedelta(minutes=1)),
+            (self.ana, ahora), (self.beto, ahora), (self.ana, ahora),
+        ]
+        for emisor, fecha in emisores_y_fechas:
+            receptor = self.beto if emisor == self.ana else self.ana
+            Mensaje.objects.create(emisor=emisor, receptor=receptor, contenido='Hola', fecha_envio=fecha)
+        Mensaje.objects.create(emisor=self.ana, receptor=self.beto, contenido='Sin fecha', fecha_envio=None)
+        Mensaje.objects.create(emisor=self.ana, receptor=self.carla, contenido='Otro hilo', fecha_envio=ahora)
+        self.esperados = list(
+            Mensaje.objects.hilo(self.ana.pk, self.beto.pk).filter(fecha_envio__isnull=False)
+            .order_by('fecha_envio', 'id').values_list('id', flat=True)
+        )
+
+    def paginas(self, limite):
+        paginas = recorrer(
+            lambda cursor: conversaciones.mensajes_hilo(self.beto.pk, self.ana.pk, cursor=cursor, limite=limite)
+        )
+        return [[m.pk for m in pagina] for pagina in paginas]
+
+    def test_paginas_hacia_atras_con_empates_en_la_fecha(self):
+        self.assertEqual(len(self.esperados), 5)
+        for limite in (1, 2, 3, 5):
+            paginas = self.paginas(limite)
+            # Cada página en orden cronológico; la primera trae los más recientes
+            self.assertEqual(sum(reversed(paginas), []), self.esperados, f'limite={limite}')
+            self.assertTrue(all(len(pagina) == limite for pagina in paginas[:-1]))
+
+    def test_cursor_hasta_un_mensaje_lo_incluye_al_final(self):
+        for pk in self.esperados:
+            mensaje = Mensaje.objects.get(pk=pk)
+            pagina, _ = conversaciones.mensajes_hilo(self.ana.pk, self.beto.pk, conversaciones.cursor_hasta(mensaje), limite=2)
+            self.assertEqual(pagina[-1].pk, pk)
+        self.assertIsNone(conversaciones.cursor_hasta(Mensaje.objects.get(contenido='Sin fecha')))
+
+    def test_api_pagina_y_rechaza_cursor_invalido(self):
+        url = reverse('api-mensaje-conversacion')
+        pares = {'usuario1': self.ana.pk, 'usuario2': self.beto.pk, 'limite': 3}
+        recientes = self.client.get(url, pares).json()
+        self.assertEqual([m['id'] for m in recientes['resultados']], self.esperados[-3:])
+        anteriores = self.client.get(url, {**pares, 'cursor': recientes['anteriores']}).json()
+        self.assertEqual([m['id'] for m in anteriores['resultados']], self.esperados[:2])
+        self.assertIsNone(anteriores['anteriores'])
+
+        for parametros in ({'cursor': 'no-es-un-cursor'}, {'cursor': 'eHh4fDE='}, {'limite': 'muchos'}):
+            self.assertEqual(self.client.get(url, {**pares, **parametros}).status_code, 400, parametros)
@@ -0,0 +1,262 @@
+"""
+Entrega de mensajes en tiempo real (Server-Sent Events)
+Cada usuario conectado mantiene un flujo SSE abierto (`mensajes/eventos/`) y recibe sus
+mensajes nuevos sin recargar la conversación.
+
+- La vista es asíncrona: bajo ASGI una conexión inactiva es una corrutina esperando su
+  cola, sin hilo ni conexión a la base de datos (se cierra al empezar el flujo), así que
+  un worker sostiene miles.
+- Publicación desacoplada en una capa de pub/sub intercambiable (TIEMPO_REAL_BACKEND):
+  'memoria' reparte dentro del proceso (un solo worker); 'redis' publica en Redis y cada
+  worker tiene un único oyente que reparte a sus conexiones locales.
+- Los mensajes se publican con transaction.on_commit: nunca llega por el flujo un
+  mensaje que después se revierte.
+- Contrapresión: cada conexión tiene una cola acotada (TIEMPO_REAL_TAMANO_COLA). Si un
+  cliente lento la llena, se descarta lo pendiente y se le envía `reconectar`; el
+  navegador vuelve a conectarse y recarga la conversación. Un cliente lento no hace
+  crecer la memoria del worker ni frena a los demás.
+- Solo se activa con TIEMPO_REAL_HABILITADO y bajo ASGI: con WSGI un flujo que no termina
+  no envía nada (el manejador consume el iterador asíncrono entero) y retiene el worker.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+TAMANO_COLA = getattr(settings, 'TIEMPO_REAL_TAMANO_COLA', 100)
+INTERVALO_LATIDO = 25  # Segundos; mantiene viva la conexión a través de proxies
+REINTENTO_MS = 3000  # Espera del navegador antes de reconectar
+
+# Marca en la cola de una conexión desbordada
+RECONECTAR = object()
+
+
+def canal_usuario(id_usuario):
+    return f'usuario.{id_usuario}'
+
+
+# ==============================================================================
+# SUSCRIPCIONES
+# ==============================================================================
+
+class Suscripcion:
+    """Una conexión abierta: su cola acotada vive en el event loop que la creó."""
+
+    def __init__(self, canal, tamano_cola):
+        self.canal = canal
+        self.loop = asyncio.get_running_loop()
+        self.cola = asyncio.Queue(maxsize=tamano_cola)
+        self.desbordada = False
+
+    def entregar(self, evento):
+        # Siempre en self.loop (la capa usa call_soon_threadsafe desde otros hilos)
+        if self.desbordada:
+            return
+        try:
+            self.cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            # Consumidor lento: se libera lo pendiente y se le pide reconectar
+            self.desbordada = True
+            while not self.cola.empty():
+                self.cola.get_nowait()
+            self.cola.put_nowait(RECONECTAR)
+
+
+class CapaMemoria:
+    """Pub/sub dentro del proceso; `publicar` se puede llamar desde cualquier hilo."""
+
+    def __init__(self, tamano_cola=TAMANO_COLA):
+        self.tamano_cola = tamano_cola
+        self.suscripciones = defaultdict(set)
+        self.desbordadas = 0
+        self._lock = threading.Lock()
+
+    def suscribir(self, canal):
+        """Nueva suscripción al canal (dentro del event loop que la va a consumir)."""
+        suscripcion = Suscripcion(canal, self.tamano_cola)
+        with self._lock:
+            self.suscripciones[canal].add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            restantes = self.suscripciones.get(suscripcion.canal)
+            if restantes is None or suscripcion not in restantes:
+                return
+            restantes.discard(suscripcion)
+            if not restantes:
+                del self.suscripciones[suscripcion.canal]
+            if suscripcion.desbordada:
+                self.desbordadas += 1
+
+    def conexiones(self):
+        with self._lock:
+            return sum(len(suscripciones) for suscripciones in self.suscripciones.values())
+
+    def publicar(self, canal, evento):
+        self.repartir(canal, evento)
+
+    def repartir(self, canal, evento):
+        """Entrega el evento a las suscripciones de este proceso."""
+        with self._lock:
+            destinatarios = list(self.suscripciones.get(canal, ()))
+        for suscripcion in destinatarios:
+            try:
+                suscripcion.loop.call_soon_threadsafe(suscripcion.entregar, evento)
+            except RuntimeError:
+                # El loop ya se cerró (worker apagándose)
+                self.cancelar(suscripcion)
+
+
+class CapaRedis(CapaMemoria):
+    """
+    Pub/sub entre workers a través de Redis.
+
+    `publicar` envía a Redis; cada event loop con conexiones abre un solo oyente
+    (PSUBSCRIBE) que reparte a sus suscripciones con CapaMemoria.repartir.
+    """
+
+    PREFIJO = 'ecoprenda.tiempo_real.'
+
+    def __init__(self, url, tamano_cola=TAMANO_COLA):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImproperlyConfigured("TIEMPO_REAL_BACKEND='redis' requiere el paquete redis (pip install redis).") from e
+        super().__init__(tamano_cola)
+        self.url = url
+        self._cliente = redis.Redis.from_url(url)
+        self._oyentes = {}
+
+    def suscribir(self, canal):
+        suscripcion = super().suscribir(canal)
+        oyente = self._oyentes.get(suscripcion.loop)
+        if oyente is None or oyente.done():
+            self._oyentes[suscripcion.loop] = suscripcion.loop.create_task(self._escuchar())
+        return suscripcion
+
+    def publicar(self, canal, evento):
+        self._cliente.publish(self.PREFIJO + canal, json.dumps(evento))
+
+    async def _escuchar(self):
+        import redis.asyncio
+
+        espera = 1
+        while True:
+            try:
+                cliente = redis.asyncio.Redis.from_url(self.url)
+                async with cliente.pubsub() as pubsub:
+                    await pubsub.psubscribe(self.PREFIJO + '*')
+                    espera = 1
+                    async for aviso in pubsub.listen():
+                        if aviso['type'] != 'pmessage':
+                            continue
+                        canal = aviso['channel'].decode()[len(self.PREFIJO):]
+                        self.repartir(canal, json.loads(aviso['data']))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Tiempo real: oyente de Redis caído, reintento en {espera}s: {e}")
+                await asyncio.sleep(espera)
+                espera = min(espera * 2, 30)
+
+
+_capa = None
+
+
+def habilitado():
+    """El tiempo real está activado en este despliegue (TIEMPO_REAL_HABILITADO)."""
+    return getattr(settings, 'TIEMPO_REAL_HABILITADO', False)
+
+
+def disponible(request):
+    """Se puede abrir un flujo SSE para esta petición: tiempo real activado y servida con ASGI."""
+    return habilitado() and isinstance(request, ASGIRequest)
+
+
+def obtener_capa():
+    """Capa de pub/sub del proceso según TIEMPO_REAL_BACKEND ('memoria' o 'redis')."""
+    global _capa
+    if _capa is None:
+        backend = getattr(settings, 'TIEMPO_REAL_BACKEND', 'memoria')
+        if backend == 'redis':
+            _capa = CapaRedis(settings.TIEMPO_REAL_REDIS_URL)
+        elif backend == 'memoria':
+            _capa = CapaMemoria()
+        else:
+            raise ImproperlyConfigured(f"TIEMPO_REAL_BACKEND desconocido: {backend!r}")
+    return _capa
+
+
+# ==============================================================================
+# PUBLICACIÓN
+# ==============================================================================
+
+def evento_mensaje(mensaje):
+    return {
+        'tipo': 'mensaje',
+        'id': mensaje.pk,
+        'emisor': mensaje.emisor_id,
+        'receptor': mensaje.receptor_id,
+        'contenido': mensaje.contenido,
+        'fecha_envio': mensaje.fecha_envio.isoformat() if mensaje.fecha_envio else None,
+    }
+
+
+def publicar_mensaje(mensaje):
+    """Avisa del mensaje a sus dos partes (el emisor puede tener otras pestañas abiertas)."""
+    evento = evento_mensaje(mensaje)
+    capa = obtener_capa()
+    for id_usuario in {mensaje.emisor_id, mensaje.receptor_id}:
+        try:
+            capa.publicar(canal_usuario(id_usuario), evento)
+        except Exception as e:
+            # El mensaje ya está guardado: quien no lo recibe en vivo lo ve al recargar
+            logger.error(f"Tiempo real: no se pudo publicar el mensaje {mensaje.pk}: {e}")
+
+
+# ==============================================================================
+# FLUJO SSE
+# ==============================================================================
+
+def formatear_evento(evento):
+    return f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {json.dumps(evento)}\n\n"
+
+
+async def flujo_eventos(id_usuario, capa=None, latido=INTERVALO_LATIDO):
+    """
+    Generador asíncrono con el flujo SSE del usuario.
+
+    Termina cuando la conexión se desborda (tras enviar `reconectar`); si el cliente se
+    desconecta, el servidor ASGI lo cancela. En ambos casos se cancela la suscripción.
+    """
+    capa = capa or obtener_capa()
+    # El middleware (sesión) abrió una conexión a la base de datos para esta petición y
+    # Django la cerraría recién al terminar la respuesta: se cierra antes de quedar a la
+    # espera para que las conexiones abiertas no retengan una conexión cada una.
+    await sync_to_async(connections.close_all)()
+    suscripcion = capa.suscribir(canal_usuario(id_usuario))
+    try:
+        yield f'retry: {REINTENTO_MS}\n\n'
+        while True:
+            try:
+                evento = await asyncio.wait_for(suscripcion.cola.get(), latido)
+            except asyncio.TimeoutError:
+                yield ': latido\n\n'
+                continue
+            if evento is RECONECTAR:
+                yield 'event: reconectar\ndata: {}\n\n'
+                return
+            yield formatear_evento(evento)
+    finally:
+        capa.cancelar(suscripcion)
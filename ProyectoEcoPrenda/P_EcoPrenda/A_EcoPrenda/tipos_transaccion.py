@@ -0,0 +1,130 @@
+"""
+Registro de tipos de transacción
+Los tipos (unas pocas filas) se cargan una vez por proceso y se identifican por un código estable.
+
+- Las vistas obtienen el tipo con `obtener_tipo(VENTA)` en vez de `get_or_create` por petición.
+- `Transaccion.tipo_codigo` guarda el código desnormalizado (indexado): los filtros por tipo
+  no necesitan join con tipo_transaccion.
+- El registro se descarta con las señales de TipoTransaccion en el proceso que lo modifica,
+  se recarga al ver un id desconocido y, en los demás procesos, caduca tras TIPOS_TRANSACCION_TTL segundos.
+"""
+
+import threading
+import time
+import unicodedata
+
+from django.conf import settings
+
+
+# ==============================================================================
+# CÓDIGOS
+# ==============================================================================
+
+DONACION = 'DONACION'
+VENTA = 'VENTA'
+INTERCAMBIO = 'INTERCAMBIO'
+
+# código -> (nombre_tipo, descripción) de los tipos que la aplicación crea si faltan
+TIPOS_BASE = {
+    DONACION: ('Donación', 'Donación de prenda a fundación'),
+    VENTA: ('Venta', 'Venta de prenda entre usuarios'),
+    INTERCAMBIO: ('Intercambio', 'Intercambio de prendas entre usuarios'),
+}
+
+TTL_SEGUNDOS = getattr(settings, 'TIPOS_TRANSACCION_TTL', 300)
+
+
+def codigo_de_nombre(nombre_tipo):
+    """'Donación' -> 'DONACION' (mayúsculas, sin tildes, espacios como '_')."""
+    descompuesto = unicodedata.normalize('NFKD', nombre_tipo or '')
+    sin_tildes = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return '_'.join(sin_tildes.upper().split())
+
+
+# ==============================================================================
+# REGISTRO DEL PROCESO
+# ==============================================================================
+
+class _Registro:
+    def __init__(self, tipos):
+        self.por_id = {tipo.pk: tipo for tipo in tipos}
+        self.por_codigo = {codigo_de_nombre(tipo.nombre_tipo): tipo for tipo in tipos}
+        self.cargado = time.monotonic()
+
+
+_registro = None
+_lock = threading.Lock()
+
+
+def _obtener_registro(recargar=False):
+    global _registro
+    registro = _registro
+    if recargar or registro is None or time.monotonic() - registro.cargado > TTL_SEGUNDOS:
+        from .models import TipoTransaccion
+
+        with _lock:
+            _registro = registro = _Registro(list(TipoTransaccion.objects.all()))
+    return registro
+
+
+def _buscar(atributo, clave):
+    tipo = getattr(_obtener_registro(), atributo).get(clave)
+    if tipo is None:
+        # Desconocido: puede haberse creado en otro proceso
+        tipo = getattr(_obtener_registro(recargar=True), atributo).get(clave)
+    return tipo
+
+
+def obtener_tipo(codigo):
+    """
+    TipoTransaccion de un código, creándolo si es uno de los tipos base y no existe.
+
+    Raises:
+        KeyError: Si el código no existe ni es un tipo base
+    """
+    tipo = _buscar('por_codigo', codigo)
+    if tipo is None:
+        from .models import TipoTransaccion
+
+        nombre, descripcion = TIPOS_BASE[codigo]
+        tipo, _ = TipoTransaccion.objects.get_or_create(nombre_tipo=nombre, defaults={'descripcion': descripcion})
+    return tipo
+
+
+def codigo_tipo(tipo_id):
+    """Código del tipo `tipo_id` (None si no existe)."""
+    if tipo_id is None:
+        return None
+    tipo = _buscar('por_id', tipo_id)
+    return codigo_de_nombre(tipo.nombre_tipo) if tipo else None
+
+
+def nombre_tipo(tipo_id):
+    """Nombre del tipo `tipo_id` (None si no existe)."""
+    if tipo_id is None:
+        return None
+    tipo = _buscar('por_id', tipo_id)
+    return tipo.nombre_tipo if tipo else None
+
+
+def invalidar():
+    global _registro
+    _registro = None
+
+
+# ==============================================================================
+# CONSULTAS
+# ==============================================================================
+
+def contar_por_tipo(transacciones):
+    """
+    Cantidad de transacciones por código de tipo, con una sola consulta agrupada.
+
+    Returns:
+        dict: código -> cantidad (0 para los tipos base sin transacciones)
+    """
+    from django.db.models import Count
+
+    conteo = dict.fromkeys(TIPOS_BASE, 0)
+    conteo.update(transacciones.order_by().values_list('tipo_codigo').annotate(total=Count('pk')))
+    return conteo
@@ -0,0 +1,429 @@
+"""
+Máquina de estados de las transacciones
+Tabla declarativa de transiciones aplicada con UPDATE condicionales (concurrencia optimista).
+
+- Cada acción indica desde qué estados se puede ejecutar y a qué estado lleva la transacción.
+- La escritura es un UPDATE filtrado por (id, estado esperado, versión): si otra petición
+  cambió la fila antes, no se actualiza nada y se lanza ConflictoConcurrencia.
+  No se toman bloqueos de fila (sin SELECT ... FOR UPDATE), así que la contención es barata.
+- La prenda se reserva también con un UPDATE condicional (solo si sigue DISPONIBLE):
+  de dos compradores simultáneos, solo uno la obtiene.
+- QuerySet.update() no emite post_save, así que se emiten señales propias que signals.py
+  usa para mantener contadores, índice de búsqueda, autocompletado y sellos de versión.
+- `aplicar_transicion_lote` aplica una acción a muchas transacciones con un solo UPDATE
+  (y uno por grupo de prendas); las señales de lote permiten actualizar los derivados
+  una sola vez por lote.
+"""
+
+from collections import defaultdict, namedtuple
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import Prenda, Transaccion
+
+
+# ==============================================================================
+# EXCEPCIONES Y SEÑALES
+# ==============================================================================
+
+class TransicionInvalida(Exception):
+    """La acción no está permitida desde el estado actual de la transacción."""
+
+
+class ConflictoConcurrencia(TransicionInvalida):
+    """Otra operación modificó la transacción entre la lectura y la escritura."""
+
+
+class PrendaNoDisponible(TransicionInvalida):
+    """La prenda ya no está disponible (otra transacción la reservó)."""
+
+
+# Argumentos: transaccion, estado_anterior, estado_nuevo, prenda_actualizada
+transaccion_cambio_estado = Signal()
+
+# Argumentos: id_prenda, estado_nuevo, estaba_disponible
+prenda_cambio_estado = Signal()
+
+# Versiones de lote (aplicar_transicion_lote).
+# Argumentos: transacciones, estado_nuevo, ids_prenda_actualizadas
+transacciones_cambio_estado_lote = Signal()
+
+# Argumentos: ids_prenda, estado_nuevo, cambio_disponibles (variación del total de prendas DISPONIBLE)
+prendas_cambio_estado_lote = Signal()
+
+
+# ==============================================================================
+# TABLA DE TRANSICIONES
+# ==============================================================================
+
+# preparar(transaccion, cambios): valida y completa los campos que se escriben junto con el estado
+Transicion = namedtuple('Transicion', ['origenes', 'destino', 'preparar'], defaults=[None])
+
+ESTADOS_SIN_ENTREGAR = ('PENDIENTE', 'ACEPTADA', 'RESERVADA')
+ESTADOS_ACTIVOS = ESTADOS_SIN_ENTREGAR + ('EN_PROCESO', 'EN_DISPUTA')
+
+# Estados de la prenda mientras una transacción activa la retiene
+ESTADOS_PRENDA_RETENIDA = ('RESERVADA', 'EN_PROCESO_ENTREGA')
+
+
+def _preparar_envio(transaccion, cambios):
+    """El envío necesita dirección de entrega; en donaciones se usa la de la fundación."""
+    direccion = cambios.pop('direccion_entrega', None) or transaccion.direccion_entrega
+    if not direccion and transaccion.fundacion_id:
+        direccion = transaccion.fundacion.direccion
+    if not direccion:
+        raise TransicionInvalida('Debes indicar la dirección de entrega antes de marcar el envío.')
+    if direccion != transaccion.direccion_entrega:
+        cambios['direccion_entrega'] = direccion
+
+
+def _preparar_entrega(transaccion, cambios):
+    cambios.setdefault('fecha_entrega', timezone.now())
+
+
+def _preparar_disputa(transaccion, cambios):
+    if not (cambios.get('razon_disputa') or '').strip():
+        raise TransicionInvalida('Debes describir el problema para abrir una disputa.')
+    cambios['en_disputa'] = True
+    cambios.setdefault('fecha_disputa', timezone.now())
+
+
+def _preparar_resolucion(transaccion, cambios):
+    """en_disputa marca las disputas abiertas (cola de moderación); fecha y razón se conservan."""
+    cambios['en_disputa'] = False
+
+
+def _preparar_resolucion_completada(transaccion, cambios):
+    _preparar_resolucion(transaccion, cambios)
+    _preparar_entrega(transaccion, cambios)
+
+
+TRANSICIONES = {
+    'aceptar': Transicion(('PENDIENTE',), 'ACEPTADA'),
+    'reservar': Transicion(('PENDIENTE', 'ACEPTADA'), 'RESERVADA'),
+    'rechazar': Transicion(ESTADOS_SIN_ENTREGAR, 'RECHAZADA'),
+    'enviar': Transicion(ESTADOS_SIN_ENTREGAR, 'EN_PROCESO', _preparar_envio),
+    'completar': Transicion(('EN_PROCESO',), 'COMPLETADA', _preparar_entrega),
+    'cancelar': Transicion(ESTADOS_SIN_ENTREGAR + ('EN_PROCESO',), 'CANCELADA'),
+    'disputar': Transicion(('EN_PROCESO',), 'EN_DISPUTA', _preparar_disputa),
+    'resolver_completada': Transicion(('EN_DISPUTA',), 'COMPLETADA', _preparar_resolucion_completada),
+    'resolver_cancelada': Transicion(('EN_DISPUTA',), 'CANCELADA', _preparar_resolucion),
+}
+
+
+# Acciones que se pueden aplicar en lote: sus campos adicionales son iguales para todas las filas
+ACCIONES_LOTE = ('aceptar', 'reservar', 'rechazar', 'completar', 'cancelar')
+
+
+def accion_hacia(estado_actual, estado_nuevo):
+    """
+    Acción que lleva una transacción de `estado_actual` a `estado_nuevo`.
+
+    Raises:
+        TransicionInvalida: Si ninguna transición de la tabla lo permite
+    """
+    for accion, transicion in TRANSICIONES.items():
+        if transicion.destino == estado_nuevo and estado_actual in transicion.origenes:
+            return accion
+    raise TransicionInvalida(f'No se puede pasar de {estado_actual} a {estado_nuevo}.')
+
+
+# ==============================================================================
+# PRENDA
+# ==============================================================================
+
+def _reflejar_en_prenda(prenda, estado):
+    """Actualiza una instancia ya cargada para que un save() posterior no descuente dos veces."""
+    prenda.estado = estado
+    prenda._estado_original = estado
+    prenda.version = (prenda.version or 0) + 1
+
+
+def reservar_prenda(prenda):
+    """
+    Reserva una prenda con un UPDATE condicional (solo si sigue DISPONIBLE).
+
+    Raises:
+        PrendaNoDisponible: Si otra transacción la reservó antes
+    """
+    reservada = Prenda.objects.filter(pk=prenda.pk, estado='DISPONIBLE').update(
+        **Prenda.nueva_version(estado='RESERVADA')
+    )
+    if not reservada:
+        raise PrendaNoDisponible('Esta prenda ya no está disponible.')
+    prenda_cambio_estado.send(sender=Prenda, id_prenda=prenda.pk, estado_nuevo='RESERVADA', estaba_disponible=True)
+    _reflejar_en_prenda(prenda, 'RESERVADA')
+
+
+def liberar_prenda(id_prenda, excepto_transaccion=None):
+    """
+    Devuelve la prenda a DISPONIBLE si ninguna otra transacción activa la retiene.
+
+    Returns:
+        bool: True si la prenda cambió de estado
+    """
+    otras_activas = Transaccion.objects.filter(
+        prenda=OuterRef('pk'), estado__in=ESTADOS_ACTIVOS
+    ).exclude(pk=excepto_transaccion)
+    liberada = Prenda.objects.filter(
+        pk=id_prenda, estado__in=ESTADOS_PRENDA_RETENIDA
+    ).exclude(Exists(otras_activas)).update(**Prenda.nueva_version(estado='DISPONIBLE'))
+    if liberada:
+        prenda_cambio_estado.send(sender=Prenda, id_prenda=id_prenda, estado_nuevo='DISPONIBLE', estaba_disponible=False)
+    return bool(liberada)
+
+
+def sincronizar_prenda(transaccion, estado_transaccion):
+    """
+    Lleva la prenda al estado que corresponde a `estado_transaccion`.
+
+    Solo escribe si el estado derivado cambia: si la prenda ya está cargada en la
+    transacción y tiene ese estado no se ejecuta ninguna consulta.
+
+    Returns:
+        bool: True si la prenda cambió de estado (y de versión)
+    """
+    nuevo = transaccion.estado_prenda_derivado(estado_transaccion)
+    if nuevo is None:
+        return False
+    prenda_cargada = transaccion.prenda if Transaccion.prenda.is_cached(transaccion) else None
+    if prenda_cargada is not None and prenda_cargada.estado == nuevo:
+        return False
+
+    if nuevo == 'DISPONIBLE':
+        actualizada = liberar_prenda(transaccion.prenda_id, excepto_transaccion=transaccion.pk)
+    else:
+        prendas = Prenda.objects.filter(pk=transaccion.prenda_id)
+        valores = Prenda.nueva_version(estado=nuevo)
+        retenida = prendas.exclude(estado__in=[nuevo, 'DISPONIBLE'])
+        disponible = prendas.filter(estado='DISPONIBLE')
+        # Caso habitual: la prenda ya estaba retenida por esta transacción. Si seguía
+        # DISPONIBLE (transacciones anteriores a la reserva al crear) se toma ahora.
+        # Con la prenda cargada se prueba primero el caso que indica su estado.
+        if prenda_cargada is not None and prenda_cargada.estado == 'DISPONIBLE':
+            intentos = ((disponible, True), (retenida, False))
+        else:
+            intentos = ((retenida, False), (disponible, True))
+        for consulta, estaba_disponible in intentos:
+            if consulta.update(**valores):
+                break
+        else:
+            return False
+        prenda_cambio_estado.send(
+            sender=Prenda, id_prenda=transaccion.prenda_id, estado_nuevo=nuevo, estaba_disponible=estaba_disponible
+        )
+        actualizada = True
+    if actualizada and prenda_cargada is not None:
+        _reflejar_en_prenda(prenda_cargada, nuevo)
+    return actualizada
+
+
+# ==============================================================================
+# OPERACIONES
+# ==============================================================================
+
+def crear_transaccion(prenda, **campos):
+    """
+    Reserva la prenda y crea su transacción PENDIENTE de forma atómica.
+
+    Args:
+        prenda: Prenda a reservar (debe estar DISPONIBLE)
+        **campos: Resto de campos de la transacción (tipo, user_origen, ...)
+
+    Raises:
+        PrendaNoDisponible: Si otro usuario la reservó primero
+    """
+    with transaction.atomic():
+        reservar_prenda(prenda)
+        transaccion = Transaccion(prenda=prenda, estado='PENDIENTE', **campos)
+        transaccion._prenda_reservada = True  # La prenda ya cambió de estado y de versión
+        transaccion.save(force_insert=True)
+        return transaccion
+
+
+def aplicar_transicion(transaccion, accion, **cambios):
+    """
+    Ejecuta una acción de la tabla sobre una transacción.
+
+    El UPDATE solo afecta la fila si sigue en el estado y la versión con que se
+    leyó; la instancia recibida se actualiza con lo escrito.
+
+    Args:
+        transaccion: Transacción leída de la base de datos
+        accion: Clave de TRANSICIONES ('aceptar', 'enviar', 'completar', ...)
+        **cambios: Campos adicionales a escribir junto con el estado
+
+    Returns:
+        Transaccion: La misma instancia, actualizada
+
+    Raises:
+        TransicionInvalida: Si la acción no existe o no aplica al estado actual
+        ConflictoConcurrencia: Si la fila cambió desde que se leyó
+    """
+    transicion = TRANSICIONES.get(accion)
+    if transicion is None:
+        raise TransicionInvalida(f'Acción desconocida: {accion}.')
+    estado_anterior = transaccion.estado
+    if estado_anterior not in transicion.origenes:
+        raise TransicionInvalida(
+            f'No se puede {accion} una transacción en estado {transaccion.get_estado_display()}.'
+        )
+    if transicion.preparar:
+        transicion.preparar(transaccion, cambios)
+
+    with transaction.atomic():
+        actualizadas = Transaccion.objects.filter(
+            pk=transaccion.pk, estado=estado_anterior, version=transaccion.version
+        ).update(estado=transicion.destino, version=F('version') + 1, **cambios)
+        if not actualizadas:
+            raise ConflictoConcurrencia('La transacción fue modificada por otra operación. Recarga e intenta de nuevo.')
+
+        prenda_actualizada = sincronizar_prenda(transaccion, transicion.destino)
+        transaccion_cambio_estado.send(
+            sender=Transaccion, transaccion=transaccion, estado_anterior=estado_anterior,
+            estado_nuevo=transicion.destino, prenda_actualizada=prenda_actualizada,
+        )
+
+    transaccion.estado = transicion.destino
+    transaccion.version += 1
+    for campo, valor in cambios.items():
+        setattr(transaccion, campo, valor)
+    return transaccion
+
+
+# ==============================================================================
+# OPERACIONES EN LOTE
+# ==============================================================================
+
+class _LoteIncompleto(Exception):
+    """Alguna fila cambió desde que se leyó: se revierte el UPDATE del lote."""
+
+
+def _escribir_lote(candidatas, transicion, cambios):
+    """
+    Escribe el nuevo estado de las transacciones leídas y devuelve las que se actualizaron.
+
+    Primero un solo UPDATE condicionado a la versión leída de cada fila (agrupadas por
+    versión). Si alguna fila cambió entretanto, ese UPDATE se revierte y se escribe fila
+    por fila para saber exactamente cuáles se aplicaron.
+    """
+    valores = {'estado': transicion.destino, 'version': F('version') + 1, **cambios}
+    por_version = defaultdict(list)
+    for t in candidatas:
+        por_version[t.version].append(t.pk)
+    condicion = reduce(or_, (Q(version=version, pk__in=ids) for version, ids in por_version.items()))
+    try:
+        with transaction.atomic():
+            actualizadas = Transaccion.objects.filter(condicion, estado__in=transicion.origenes).update(**valores)
+            if actualizadas != len(candidatas):
+                raise _LoteIncompleto
+        return list(candidatas)
+    except _LoteIncompleto:
+        return [
+            t for t in candidatas
+            if Transaccion.objects.filter(pk=t.pk, estado=t.estado, version=t.version).update(**valores)
+        ]
+
+
+def sincronizar_prendas_lote(transacciones, estado_transaccion):
+    """
+    Versión de lote de sincronizar_prenda: un UPDATE por estado de prenda resultante.
+
+    Returns:
+        set: Ids de las prendas que quedaron en su nuevo estado
+    """
+    grupos = defaultdict(list)
+    for t in transacciones:
+        nuevo = t.estado_prenda_derivado(estado_transaccion)
+        if nuevo is not None:
+            grupos[nuevo].append(t)
+
+    actualizadas = set()
+    for nuevo, grupo in grupos.items():
+        ids_prenda = {t.prenda_id for t in grupo}
+        valores = Prenda.nueva_version(estado=nuevo)
+        if nuevo == 'DISPONIBLE':
+            otras_activas = Transaccion.objects.filter(
+                prenda=OuterRef('pk'), estado__in=ESTADOS_ACTIVOS
+            ).exclude(pk__in=[t.pk for t in grupo])
+            cambiadas = Prenda.objects.filter(
+                pk__in=ids_prenda, estado__in=ESTADOS_PRENDA_RETENIDA
+            ).exclude(Exists(otras_activas)).update(**valores)
+            cambio_disponibles = cambiadas
+            if cambiadas:
+                ids_prenda = set(
+                    Prenda.objects.filter(pk__in=ids_prenda, estado='DISPONIBLE').values_list('pk', flat=True)
+                )
+        else:
+            prendas = Prenda.objects.filter(pk__in=ids_prenda)
+            retenidas = prendas.exclude(estado__in=[nuevo, 'DISPONIBLE']).update(**valores)
+            tomadas = prendas.filter(estado='DISPONIBLE').update(**valores)
+            cambio_disponibles = -tomadas
+            cambiadas = retenidas + tomadas
+        if not cambiadas:
+            continue
+        prendas_cambio_estado_lote.send(
+            sender=Prenda, ids_prenda=ids_prenda, estado_nuevo=nuevo, cambio_disponibles=cambio_disponibles
+        )
+        actualizadas |= ids_prenda
+    return actualizadas
+
+
+def aplicar_transicion_lote(transacciones, accion, **cambios):
+    """
+    Ejecuta una acción sobre muchas transacciones en una sola operación atómica.
+
+    Las transacciones que no están en un estado de origen válido, o que otra operación
+    modificó después de leerlas, se informan como fallidas sin impedir el resto.
+
+    Args:
+        transacciones: Transacciones leídas de la base de datos
+        accion: Una de ACCIONES_LOTE
+        **cambios: Campos adicionales a escribir en todas las filas
+
+    Returns:
+        tuple: (lista de Transaccion aplicadas, dict id -> motivo de las fallidas)
+
+    Raises:
+        TransicionInvalida: Si la acción no existe o no se puede aplicar en lote
+    """
+    if accion not in ACCIONES_LOTE:
+        raise TransicionInvalida(f'La acción {accion} no se puede aplicar en lote.')
+    transicion = TRANSICIONES[accion]
+
+    fallidas = {}
+    candidatas = []
+    for t in transacciones:
+        if t.estado in transicion.origenes:
+            candidatas.append(t)
+        else:
+            fallidas[t.pk] = f'No se puede {accion} una transacción en estado {t.get_estado_display()}.'
+    if not candidatas:
+        return [], fallidas
+    if transicion.preparar:
+        transicion.preparar(candidatas[0], cambios)
+
+    with transaction.atomic():
+        aplicadas = _escribir_lote(candidatas, transicion, cambios)
+        ids_aplicadas = {t.pk for t in aplicadas}
+        for t in candidatas:
+            if t.pk not in ids_aplicadas:
+                fallidas[t.pk] = 'La transacción fue modificada por otra operación.'
+        if aplicadas:
+            ids_prenda_actualizadas = sincronizar_prendas_lote(aplicadas, transicion.destino)
+            transacciones_cambio_estado_lote.send(
+                sender=Transaccion, transacciones=aplicadas, estado_nuevo=transicion.destino,
+                ids_prenda_actualizadas=ids_prenda_actualizadas,
+            )
+
+    for t in aplicadas:
+        t.estado = transicion.destino
+        t.version += 1
+        for campo, valor in cambios.items():
+            setattr(t, campo, valor)
+    return aplicadas, fallidas
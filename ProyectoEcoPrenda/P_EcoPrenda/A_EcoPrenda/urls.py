@@ -29,6 +29,7 @@ urlpatterns = [
     path('prenda/<int:id_prenda>/eliminar/', views.eliminar_prenda, name='eliminar_prenda'),
     path('mis-prendas/', views.mis_prendas, name='mis_prendas'),
     path('prenda/<int:id_prenda>/actualizar-imagen/', views.actualizar_imagen_prenda, name='actualizar_imagen_prenda'),
+    path('prenda/<int:id_prenda>/negociacion/', views.panel_negociacion_prenda, name='panel_negociacion'),
     
     # Transacciones
     path('intercambio/<int:id_prenda>/', views.proponer_intercambio, name='proponer_intercambio'),
@@ -43,12 +44,21 @@ urlpatterns = [
     path('transaccion/<int:id_transaccion>/cancelar/', views.cancelar_compra, name='cancelar_transaccion'),
     path('transaccion/<int:id_transaccion>/donacion-enviada/', views.marcar_donacion_enviada, name='marcar_donacion_enviada'),
     path('transaccion/<int:id_transaccion>/reportar-disputa/', views.reportar_disputa, name='reportar_disputa'),
-    path('admin/disputa/<int:id_transaccion>/resolver/', views.resolver_disputa, name='resolver_disputa'),
+
+    # Moderación de disputas (fuera de admin/: esas rutas las captura el sitio de administración)
+    path('moderacion/disputas/', views.cola_disputas, name='cola_disputas'),
+    path('moderacion/disputas/<int:id_transaccion>/resolver/', views.resolver_disputa, name='resolver_disputa'),
+    path('moderacion/disputas/<int:id_transaccion>/evidencia/', views.evidencia_disputa, name='evidencia_disputa'),
     
     # Mensajería
     path('mensajes/', views.lista_mensajes, name='lista_mensajes'),
     path('mensajes/<int:id_usuario>/', views.conversacion, name='conversacion'),
     path('mensajes/enviar/', views.enviar_mensaje, name='enviar_mensaje'),
+    path('mensajes/eventos/', views.eventos_mensajes, name='eventos_mensajes'),
+    path('mensajes/buscar/', views.buscar_mensajes, name='buscar_mensajes'),
+    path('mensajes/no-leidos/', views.mensajes_no_leidos, name='mensajes_no_leidos'),
+    path('mensajes/marcar-leidos/', views.marcar_mensajes_leidos, name='marcar_mensajes_leidos'),
+    path('mensajes/resumen/<str:token>/', views.baja_resumen_mensajes, name='baja_resumen_mensajes'),
     
     # Fundaciones
     path('fundaciones/', views.lista_fundaciones, name='lista_fundaciones'),
@@ -61,6 +71,11 @@ urlpatterns = [
     # Gestión de donaciones
     path('panel-fundacion/', views.panel_fundacion, name='panel_fundacion'),
     path('gestionar-donaciones/', views.gestionar_donaciones, name='gestionar_donaciones'),
+    path('gestionar-donaciones/lote/', views.procesar_donaciones_lote, name='procesar_donaciones_lote'),
+    path('gestionar-donaciones/<int:id_transaccion>/confirmar/', views.confirmar_recepcion_donacion, name='confirmar_recepcion_donacion'),
+    path('agradecer-donante/<int:id_usuario_donante>/', views.enviar_mensaje_agradecimiento, name='enviar_mensaje_agradecimiento'),
+    path('agradecer-donantes/', views.agradecer_donantes, name='agradecer_donantes'),
+    path('agradecer-donantes/<int:id_envio>/progreso/', views.progreso_agradecimiento, name='progreso_agradecimiento'),
     path('estadisticas-donaciones', views.estadisticas_donaciones, name='estadisticas_donaciones'),
     
     # Campañas
@@ -80,6 +95,7 @@ urlpatterns = [
 
     # Búsqueda y filtros
     path('buscar/', views.buscar_prendas, name='buscar_prendas'),
+    path('api/autocompletar/', views.api_autocompletar, name='api_autocompletar'),
 
     # Gestión de sesiones
     path('session-info/', views.session_info, name='session_info'),
@@ -2,16 +2,19 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.db.models import Q, Sum, Count
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.paginator import Paginator
+from django.views.decorators.cache import cache_control
 from django import forms  # Agregado para forms
 import hashlib
 import json
 import logging  # Agregado para logging
+import time
 
 from .models import (
-    Usuario, Prenda, Transaccion, TipoTransaccion, 
-    Fundacion, Mensaje, ImpactoAmbiental, 
-    Logro, UsuarioLogro, CampanaFundacion
+    Usuario, Prenda, Transaccion, 
+    Fundacion, ImpactoAmbiental, 
+    Logro, UsuarioLogro, CampanaFundacion, TransaccionHistorica, EnvioAgradecimiento, ResumenMensajes
 )
 from .decorators import (
     login_required_custom, 
@@ -46,6 +49,23 @@ from .carbon_utils import (
     formatear_equivalencia
 )
 
+from .cache_utils import etag_pagina, pagina_condicional, renderizar_tarjetas_prendas, versiones_tablas
+from .indice_busqueda import buscar_ids, busqueda_en_memoria_activa
+from .autocompletado import obtener_autocompletado
+from . import (
+    agradecimientos, busqueda_mensajes, contadores, conversaciones, disputas, panel_negociacion,
+    resumen_mensajes, tiempo_real,
+)
+from .contadores import leer_contadores
+from .tipos_transaccion import DONACION, INTERCAMBIO, VENTA, contar_por_tipo, obtener_tipo
+from .logros import otorgar_logros
+from .limite_mensajes import LimiteExcedido, verificar_envio
+from .linea_tiempo import CursorInvalido, contar_por_tipo_usuario, linea_tiempo_usuario, transacciones_por_lado
+from .transiciones import (
+    ConflictoConcurrencia, PrendaNoDisponible, TransicionInvalida,
+    ESTADOS_SIN_ENTREGAR, accion_hacia, aplicar_transicion, aplicar_transicion_lote, crear_transaccion,
+)
+
 from .forms import RegistroForm, PerfilForm, PrendaForm
 
 # Configuración de logging
@@ -103,14 +123,14 @@ def puede_actualizar_transaccion(usuario, transaccion, permiso_requerido):
     Retorna tupla: (True/False, mensaje_error o None)
     """
     if permiso_requerido == 'origen':
-        if transaccion.user_origen.id != usuario.id_usuario:  # Cambiado: 'user_origen' en lugar de 'id_usuario_origen'
+        if transaccion.user_origen_id != usuario.id_usuario:  # Cambiado: 'user_origen' en lugar de 'id_usuario_origen'
             return False, 'Solo el propietario/vendedor puede realizar esta acción.'
     elif permiso_requerido == 'destino':
-        if not transaccion.user_destino or transaccion.user_destino.id != usuario.id_usuario:  # Cambiado: 'user_destino'
+        if transaccion.user_destino_id != usuario.id_usuario:  # Cambiado: 'user_destino'
             return False, 'Solo el receptor/comprador puede realizar esta acción.'
     elif permiso_requerido == 'origen_o_destino':
-        es_origen = transaccion.user_origen.id == usuario.id_usuario
-        es_destino = transaccion.user_destino and transaccion.user_destino.id == usuario.id_usuario
+        es_origen = transaccion.user_origen_id == usuario.id_usuario
+        es_destino = transaccion.user_destino_id == usuario.id_usuario
         if not (es_origen or es_destino):
             return False, 'No tienes permiso para actualizar esta transacción.'
     elif permiso_requerido == 'representante':
@@ -123,12 +143,14 @@ def puede_actualizar_transaccion(usuario, transaccion, permiso_requerido):
 
 def home(request):
     usuario = get_usuario_actual(request)
-    total_prendas = Prenda.objects.count()
-    total_usuarios = Usuario.objects.count()
-    impacto_total = ImpactoAmbiental.objects.aggregate(
-        total_carbono=Sum('carbono_evitar_kg'),
-        total_energia=Sum('energia_ahorrada_kwh')
-    )
+    # Totales desnormalizados: una sola consulta en vez de dos count(*) y un Sum
+    totales = leer_contadores()
+    total_prendas = int(totales[contadores.PRENDAS])
+    total_usuarios = int(totales[contadores.USUARIOS])
+    impacto_total = {
+        'total_carbono': totales[contadores.CARBONO_EVITADO_KG],
+        'total_energia': totales[contadores.ENERGIA_AHORRADA_KWH],
+    }
     prendas_recientes = Prenda.objects.select_related('user').order_by('-fecha_publicacion')[:6]  # Cambiado: 'user' en lugar de 'id_usuario'
     context = {
         'usuario': usuario,
@@ -238,11 +260,49 @@ def perfil_usuario(request):
 # ------------------------------------------------------------------------------------------------------------------
 # Gestión de Prendas 
 
+PRENDAS_POR_PAGINA = 24
+
+
+def paginar_tarjetas(request, prendas, nombre_vista):
+    """Pagina un queryset de prendas y obtiene sus tarjetas desde la caché de fragmentos.
+    Registra el tiempo de renderizado de las tarjetas para comparar caché fría/caliente.
+    """
+    page_obj = Paginator(prendas, PRENDAS_POR_PAGINA).get_page(request.GET.get('pagina'))
+    inicio = time.perf_counter()
+    tarjetas, aciertos = renderizar_tarjetas_prendas(page_obj.object_list)
+    logger.debug(
+        f"{nombre_vista}: {len(tarjetas)} tarjetas en {(time.perf_counter() - inicio) * 1000:.1f} ms "
+        f"({aciertos} desde caché)"
+    )
+    return page_obj, tarjetas
+
+
+def filtros_sin_pagina(request):
+    """Query string actual sin el parámetro de página (para los enlaces de paginación)."""
+    params = request.GET.copy()
+    params.pop('pagina', None)
+    return params.urlencode()
+
+# ------------------------------------------------------------------------------
+# ETags de páginas de lectura (una consulta liviana, sin renderizar)
+
+def etag_detalle_prenda(request, id_prenda):
+    version = Prenda.objects.filter(pk=id_prenda).values_list('version', flat=True).first()
+    if version is None:
+        return None  # La vista responde 404
+    return etag_pagina(request, 'prenda', id_prenda, version)
+
+def etag_lista_fundaciones(request):
+    return etag_pagina(request, 'fundaciones', *versiones_tablas(Fundacion))
+
+def etag_mapa_fundaciones(request):
+    return etag_pagina(request, 'mapa', *versiones_tablas(Fundacion, Usuario))
+
 @cliente_only
 def lista_prendas(request):
     """Lista todas las prendas disponibles con opción de filtrado."""
     usuario = get_usuario_actual(request)
-    prendas = Prenda.objects.filter(disponibilidad='DISPONIBLE').order_by('-fecha_publicacion')
+    prendas = Prenda.objects.filter(estado='DISPONIBLE').select_related('user').order_by('-fecha_publicacion')
 
     categoria = request.GET.get('categoria')
     talla = request.GET.get('talla')
@@ -255,9 +315,14 @@ def lista_prendas(request):
     if estado:
         prendas = prendas.filter(estado=estado)
 
+    page_obj, tarjetas = paginar_tarjetas(request, prendas, 'lista_prendas')
+
     context = {
         'usuario': usuario,
-        'prendas': prendas,
+        'prendas': page_obj.object_list,
+        'tarjetas': tarjetas,
+        'page_obj': page_obj,
+        'filtros': filtros_sin_pagina(request),
         'categorias': ['Camiseta', 'Pantalón', 'Vestido', 'Chaqueta', 'Zapatos', 'Accesorios'],
         'tallas': ['XS', 'S', 'M', 'L', 'XL', 'XXL'],
         'estados': ['Nuevo', 'Excelente', 'Bueno', 'Usado'],
@@ -416,22 +481,31 @@ def buscar_prendas(request):
     talla = request.GET.get('talla')
     estado = request.GET.get('estado')
 
-    prendas = Prenda.objects.filter(disponibilidad='DISPONIBLE')
-    if query:
-        prendas = prendas.filter(
-            Q(nombre__icontains=query) |
-            Q(descripcion__icontains=query)
-        )
+    prendas = Prenda.objects.filter(estado='DISPONIBLE').select_related('user')
     if categoria:
         prendas = prendas.filter(categoria=categoria)
     if talla:
         prendas = prendas.filter(talla=talla)
     if estado:
         prendas = prendas.filter(estado=estado)
+    if query and busqueda_en_memoria_activa():
+        # Índice invertido en memoria: el límite se aplica después de los demás filtros
+        ids = buscar_ids(prendas, query, settings.BUSQUEDA_MAX_RESULTADOS)
+        prendas = prendas.filter(pk__in=ids)
+    elif query:
+        prendas = prendas.filter(
+            Q(nombre__icontains=query) |
+            Q(descripcion__icontains=query)
+        )
+
+    page_obj, tarjetas = paginar_tarjetas(request, prendas.order_by('-fecha_publicacion'), 'buscar_prendas')
 
     context = {
         'usuario': usuario,
-        'prendas': prendas.order_by('-fecha_publicacion'),
+        'prendas': page_obj.object_list,
+        'tarjetas': tarjetas,
+        'page_obj': page_obj,
+        'filtros': filtros_sin_pagina(request),
         'query': query,
         'categorias': ['Camiseta', 'Pantalón', 'Vestido', 'Chaqueta', 'Zapatos', 'Accesorios'],
         'tallas': ['XS', 'S', 'M', 'L', 'XL', 'XXL'],
@@ -439,9 +513,42 @@ def buscar_prendas(request):
     }
     return render(request, 'buscar_prendas.html', context)
 
+@cache_control(public=True, max_age=60)
+def api_autocompletar(request):
+    """
+    Sugerencias para el buscador de prendas (nombres y categorías).
+
+    No usa la sesión, así que la respuesta depende solo de ?q= y puede
+    cachearse por prefijo en el navegador o en un proxy. El plazo es corto:
+    se suma al atraso del autocompletado de cada worker.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+
+    prefijo = request.GET.get('q', '')[:50]
+    return JsonResponse({
+        'q': prefijo,
+        'sugerencias': obtener_autocompletado().sugerir(prefijo),
+    })
+
 # ------------------------------------------------------------------------------------------------------------------
 # Transacciones
 
+@ajax_login_required
+def panel_negociacion_prenda(request, id_prenda):
+    """
+    Prenda, transacción activa y últimos mensajes con la otra parte en una sola respuesta
+    (JSON, desde la caché mientras no haya mensajes ni cambios de estado).
+    """
+    try:
+        limite = int(request.GET.get('limite', panel_negociacion.MENSAJES_PANEL))
+    except ValueError:
+        return JsonResponse({'error': 'Límite inválido'}, status=400)
+    datos = panel_negociacion.panel(request.usuario_actual.pk, id_prenda, limite=limite)
+    if datos is None:
+        return JsonResponse({'error': 'Prenda no encontrada'}, status=404)
+    return JsonResponse(datos)
+
 @login_required_custom
 def proponer_intercambio(request, id_prenda):
     """Permite a un usuario proponer un intercambio por otra prenda."""
@@ -461,20 +568,21 @@ def proponer_intercambio(request, id_prenda):
         if prenda_origen.estado != 'DISPONIBLE':  # Cambiado: check directo
             messages.error(request, 'La prenda ofrecida ya no está disponible.')
             return redirect('detalle_prenda', id_prenda=id_prenda)
-        tipo_intercambio, _ = TipoTransaccion.objects.get_or_create(nombre_tipo='Intercambio', defaults={
-            'descripcion': 'Intercambio de prendas entre usuarios'
-        })
+        tipo_intercambio = obtener_tipo(INTERCAMBIO)
         try:
-            transaccion = Transaccion.objects.create(
-                prenda=prenda_destino,  # Cambiado: 'prenda=prenda_destino'
+            # Reserva la prenda con un UPDATE condicional: si otro usuario la tomó primero, falla.
+            transaccion = crear_transaccion(
+                prenda_destino,  # Cambiado: 'prenda=prenda_destino'
                 tipo=tipo_intercambio,  # Cambiado: 'tipo=tipo_intercambio'
                 user_origen=usuario,  # Cambiado: 'user_origen=usuario'
                 user_destino=prenda_destino.user,  # Cambiado: 'user_destino=prenda_destino.user'
                 fecha_transaccion=timezone.now(),
-                estado='PENDIENTE'
             )
             messages.success(request, f'¡Intercambio propuesto! Código de seguimiento: {transaccion.id}. Ahora puedes negociar con el otro usuario.')  # Cambiado: 'transaccion.id'
-            return redirect('conversacion', id_usuario=prenda_destino.user.id)  # Cambiado: 'prenda_destino.user.id'
+            return redirect('conversacion', id_usuario=prenda_destino.user.id_usuario)
+        except PrendaNoDisponible:
+            messages.error(request, 'Esta prenda ya no está disponible para intercambio.')
+            return redirect('detalle_prenda', id_prenda=id_prenda)
         except Exception as e:
             logger.error(f"Error creando intercambio para usuario {usuario.id_usuario}: {e}")
             messages.error(request, 'Error interno. Intenta nuevamente.')
@@ -499,9 +607,13 @@ def marcar_intercambio_entregado(request, id_transaccion):
         return JsonResponse({'error': 'La transacción no está en estado reservado.'}, status=400)
     
     try:
-        transaccion.marcar_en_proceso()
+        transaccion.marcar_en_proceso(direccion_entrega=request.POST.get('direccion_entrega'))
         messages.success(request, 'Has marcado la prenda como entregada.')
         return redirect('mis_transacciones')
+    except ConflictoConcurrencia as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    except TransicionInvalida as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         logger.error(f"Error marcando intercambio entregado {transaccion.id}: {e}")
         return JsonResponse({'error': 'Error interno'}, status=500)
@@ -521,6 +633,10 @@ def confirmar_recepcion_intercambio(request, id_transaccion):
         transaccion.marcar_como_completada()
         messages.success(request, '¡Intercambio completado con éxito!')
         return redirect('mis_transacciones')
+    except ConflictoConcurrencia as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    except TransicionInvalida as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         logger.error(f"Error confirmando recepción intercambio {transaccion.id}: {e}")
         return JsonResponse({'error': 'Error interno'}, status=500)
@@ -540,6 +656,10 @@ def cancelar_intercambio(request, id_transaccion):
         transaccion.cancelar()
         messages.success(request, 'Intercambio cancelado y prenda devuelta a disponible.')
         return redirect('mis_transacciones')
+    except ConflictoConcurrencia as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    except TransicionInvalida as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         logger.error(f"Error cancelando intercambio {transaccion.id}: {e}")
         return JsonResponse({'error': 'Error interno'}, status=500)
@@ -558,20 +678,21 @@ def comprar_prenda(request, id_prenda):
         return redirect('detalle_prenda', id_prenda=id_prenda)
 
     if request.method == 'POST':
-        tipo_venta, _ = TipoTransaccion.objects.get_or_create(
-            nombre_tipo='Venta', defaults={'descripcion': 'Venta de prenda entre usuarios'}
-        )
+        tipo_venta = obtener_tipo(VENTA)
         try:
-            transaccion = Transaccion.objects.create(
-                prenda=prenda,  # Cambiado: 'prenda=prenda'
+            # Reserva la prenda con un UPDATE condicional: de dos compradores simultáneos, solo uno la obtiene.
+            transaccion = crear_transaccion(
+                prenda,  # Cambiado: 'prenda=prenda'
                 tipo=tipo_venta,  # Cambiado: 'tipo=tipo_venta'
                 user_origen=prenda.user,  # Cambiado: 'user_origen=prenda.user'
                 user_destino=usuario,  # Cambiado: 'user_destino=usuario'
                 fecha_transaccion=timezone.now(),
-                estado='PENDIENTE'
             )
             messages.success(request, f'Solicitud de compra enviada. Código: {transaccion.id}. Ahora puedes negociar con el vendedor.')  # Cambiado: 'transaccion.id'
-            return redirect('conversacion', id_usuario=prenda.user.id)  # Cambiado: 'prenda.user.id'
+            return redirect('conversacion', id_usuario=prenda.user.id_usuario)
+        except PrendaNoDisponible:
+            messages.error(request, "Esta prenda ya no está disponible.")
+            return redirect('detalle_prenda', id_prenda=id_prenda)
         except Exception as e:
             logger.error(f"Error creando compra para usuario {usuario.id_usuario}: {e}")
             messages.error(request, 'Error interno. Intenta nuevamente.')
@@ -591,9 +712,13 @@ def marcar_compra_entregado(request, id_transaccion):
         return JsonResponse({'error': 'La transacción no está en estado reservado.'}, status=400)
     
     try:
-        transaccion.marcar_en_proceso()
+        transaccion.marcar_en_proceso(direccion_entrega=request.POST.get('direccion_entrega'))
         messages.success(request, 'Has marcado la prenda como entregada.')
         return redirect('mis_transacciones')
+    except ConflictoConcurrencia as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    except TransicionInvalida as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         logger.error(f"Error marcando compra entregada {transaccion.id}: {e}")
         return JsonResponse({'error': 'Error interno'}, status=500)
@@ -613,9 +738,13 @@ def marcar_donacion_enviada(request, id_transaccion):
         return JsonResponse({'error': 'La transacción no está en un estado válido para marcar como enviada.'}, status=400)
 
     try:
-        transaccion.marcar_en_proceso()
+        transaccion.marcar_en_proceso(direccion_entrega=request.POST.get('direccion_entrega'))
         messages.success(request, 'Has marcado la donación como enviada. La fundación confirmará la recepción.')
         return redirect('mis_transacciones')
+    except ConflictoConcurrencia as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    except TransicionInvalida as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         logger.error(f"Error marcando donación enviada {transaccion.id}: {e}")
         return JsonResponse({'error': 'Error interno'}, status=500)
@@ -635,6 +764,10 @@ def confirmar_recepcion_compra(request, id_transaccion):
         transaccion.marcar_como_completada()
         messages.success(request, '¡Transacción completada con éxito!')
         return redirect('mis_transacciones')
+    except ConflictoConcurrencia as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    except TransicionInvalida as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         logger.error(f"Error confirmando recepción compra {transaccion.id}: {e}")
         return JsonResponse({'error': 'Error interno'}, status=500)
@@ -654,6 +787,10 @@ def cancelar_compra(request, id_transaccion):
         transaccion.cancelar()
         messages.success(request, 'Transacción cancelada y prenda devuelta a disponible.')
         return redirect('mis_transacciones')
+    except ConflictoConcurrencia as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    except TransicionInvalida as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         logger.error(f"Error cancelando compra {transaccion.id}: {e}")
         return JsonResponse({'error': 'Error interno'}, status=500)
@@ -675,26 +812,21 @@ def donar_prenda(request, id_prenda):
             messages.error(request, 'Debes seleccionar una fundación válida.')
             return redirect('donar_prenda', id_prenda=id_prenda)
         fundacion = get_object_or_404(Fundacion.objects.select_related('representante'), pk=fundacion_id, activa=True)  # Cambiado: agregado select_related
-        tipo_donacion, _ = TipoTransaccion.objects.get_or_create(nombre_tipo='Donación', defaults={
-            'descripcion': 'Donación de prenda a fundación'
-        })
+        tipo_donacion = obtener_tipo(DONACION)
         try:
-            transaccion = Transaccion.objects.create(
-                prenda=prenda,  # Cambiado: 'prenda=prenda'
+            transaccion = crear_transaccion(
+                prenda,  # Cambiado: 'prenda=prenda'
                 tipo=tipo_donacion,  # Cambiado: 'tipo=tipo_donacion'
                 user_origen=usuario,  # Cambiado: 'user_origen=usuario'
                 fundacion=fundacion,  # Cambiado: 'fundacion=fundacion'
                 fecha_transaccion=timezone.now(),
-                estado='PENDIENTE'
             )
-            prenda.marcar_como_reservada()
-            # Verificar logros
-            nuevos_logros = verificar_logros(usuario)  # Asumiendo que existe
-            if nuevos_logros:
-                for logro in nuevos_logros:
-                    messages.success(request, f'🏆 ¡Nuevo logro desbloqueado: {logro.nombre}!')
+            # Los logros los otorga el consumidor 'logros' del outbox cuando la donación se completa
             messages.success(request, f'¡Prenda donada exitosamente a {fundacion.nombre}! Código de seguimiento: {transaccion.id}')  # Cambiado: 'transaccion.id'
             return redirect('mis_transacciones')
+        except PrendaNoDisponible:
+            messages.error(request, 'Esta prenda ya no está disponible.')
+            return redirect('detalle_prenda', id_prenda=id_prenda)
         except Exception as e:
             logger.error(f"Error donando prenda {prenda.pk} por usuario {usuario.id_usuario}: {e}")
             messages.error(request, 'Error interno. Intenta nuevamente.')
@@ -708,22 +840,24 @@ def donar_prenda(request, id_prenda):
 
 @login_required_custom
 def mis_transacciones(request):
+    """Transacciones enviadas y recibidas del usuario, paginadas por cursor (de la más reciente a la más antigua)."""
     usuario = get_usuario_actual(request)
-    
-    transacciones_enviadas = Transaccion.objects.filter(
-        user_origen=usuario  # Cambiado: 'user_origen=usuario'
-    ).select_related('prenda', 'tipo', 'user_destino', 'fundacion')  # Agregado select_related
-    
-    transacciones_recibidas = Transaccion.objects.filter(
-        user_destino=usuario  # Cambiado: 'user_destino=usuario'
-    ).exclude(
-        fundacion__isnull=False  # Cambiado: 'fundacion__isnull=False'
-    ).select_related('prenda', 'tipo', 'user_origen')  # Agregado select_related
-    
+    cursor = request.GET.get('cursor')
+
+    try:
+        pagina, siguiente_cursor = linea_tiempo_usuario(usuario, cursor=cursor)
+    except CursorInvalido:
+        messages.warning(request, 'El enlace de paginación no es válido; se muestran las transacciones más recientes.')
+        cursor = None
+        pagina, siguiente_cursor = linea_tiempo_usuario(usuario)
+
     context = {
         "usuario": usuario,
-        "transacciones_enviadas": transacciones_enviadas,
-        "transacciones_recibidas": transacciones_recibidas,
+        "transacciones_enviadas": [t for t in pagina if t.es_enviada],
+        # Las donaciones a fundaciones se gestionan desde el panel de la fundación.
+        "transacciones_recibidas": [t for t in pagina if not t.es_enviada and t.fundacion_id is None],
+        "cursor_actual": cursor,
+        "siguiente_cursor": siguiente_cursor,
     }
     return render(request, 'mis_transacciones.html', context)
 
@@ -732,8 +866,8 @@ def actualizar_estado_transaccion(request, id_transaccion):
     """Permite actualizar el estado de una transacción."""
     usuario = get_usuario_actual(request)
     transaccion = get_object_or_404(Transaccion.objects.select_related('prenda', 'user_destino', 'user_origen'), pk=id_transaccion)  # Cambiado: agregado select_related
-    if transaccion.user_destino and transaccion.user_destino.id != usuario.id_usuario:  # Cambiado: 'user_destino'
-        if transaccion.user_origen.id != usuario.id_usuario:  # Cambiado: 'user_origen'
+    if transaccion.user_destino_id and transaccion.user_destino_id != usuario.id_usuario:  # Cambiado: 'user_destino'
+        if transaccion.user_origen_id != usuario.id_usuario:  # Cambiado: 'user_origen'
             return JsonResponse({'error': 'No autorizado'}, status=403)
     
     if request.method == 'POST':
@@ -741,34 +875,28 @@ def actualizar_estado_transaccion(request, id_transaccion):
         if not nuevo_estado or nuevo_estado not in dict(Transaccion.ESTADO_CHOICES):
             return JsonResponse({'error': 'Estado inválido'}, status=400)
         
-        if transaccion.estado == 'PENDIENTE':
-            if nuevo_estado == 'ACEPTADA':
-                try:
-                    transaccion.prenda.marcar_como_reservada()  # Cambiado: 'prenda'
-                    transaccion.estado = nuevo_estado
-                    transaccion.save()
-                    messages.success(request, 'Has aceptado la propuesta. La prenda ahora está reservada.')
-                except Exception as e:
-                    logger.error(f"Error aceptando transacción {transaccion.id}: {e}")
-                    return JsonResponse({'error': 'Error interno'}, status=500)
-            elif nuevo_estado == 'RECHAZADA':
-                try:
-                    transaccion.estado = nuevo_estado
-                    transaccion.save()
-                    messages.success(request, 'Has rechazado la propuesta. La prenda sigue disponible.')
-                except Exception as e:
-                    logger.error(f"Error rechazando transacción {transaccion.id}: {e}")
-                    return JsonResponse({'error': 'Error interno'}, status=500)
-            else:
+        try:
+            accion = accion_hacia(transaccion.estado, nuevo_estado)
+            if transaccion.estado == 'PENDIENTE' and accion not in ('aceptar', 'rechazar'):
                 return JsonResponse({'error': 'Desde PENDIENTE solo puedes aceptar (ACEPTADA) o rechazar (RECHAZADA).'}, status=400)
+            # Las disputas tienen su propio flujo (reportar_disputa / resolver_disputa).
+            if accion == 'disputar' or accion.startswith('resolver_'):
+                return JsonResponse({'error': 'Las disputas se gestionan desde su propio formulario.'}, status=400)
+            aplicar_transicion(transaccion, accion)
+        except ConflictoConcurrencia as e:
+            return JsonResponse({'error': str(e)}, status=409)
+        except TransicionInvalida as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except Exception as e:
+            logger.error(f"Error actualizando estado transacción {transaccion.id}: {e}")
+            return JsonResponse({'error': 'Error interno'}, status=500)
+
+        if accion == 'aceptar':
+            messages.success(request, 'Has aceptado la propuesta. La prenda ahora está reservada.')
+        elif accion == 'rechazar':
+            messages.success(request, 'Has rechazado la propuesta. La prenda vuelve a estar disponible.')
         else:
-            try:
-                transaccion.estado = nuevo_estado
-                transaccion.save()
-                messages.success(request, f'Estado de la transacción actualizado a: {transaccion.get_estado_display()}')
-            except Exception as e:
-                logger.error(f"Error actualizando estado transacción {transaccion.id}: {e}")
-                return JsonResponse({'error': 'Error interno'}, status=500)
+            messages.success(request, f'Estado de la transacción actualizado a: {transaccion.get_estado_display()}')
         
         return redirect('mis_transacciones')
     return JsonResponse({'error': 'Método no permitido'}, status=405)
@@ -779,7 +907,7 @@ def reportar_disputa(request, id_transaccion):
     usuario = get_usuario_actual(request)
     transaccion = get_object_or_404(Transaccion.objects.select_related('prenda', 'user_destino'), pk=id_transaccion)  # Cambiado: agregado select_related
     
-    if not transaccion.user_destino or transaccion.user_destino.id != usuario.id_usuario:  # Cambiado: 'user_destino'
+    if transaccion.user_destino_id != usuario.id_usuario:  # Cambiado: 'user_destino'
         messages.error(request, 'Solo el receptor puede reportar problemas.')
         return redirect('mis_transacciones')
     
@@ -794,14 +922,12 @@ def reportar_disputa(request, id_transaccion):
             return redirect('mis_transacciones')
         
         try:
-            transaccion.estado = 'EN_DISPUTA'
-            transaccion.en_disputa = True
-            transaccion.razon_disputa = razon.strip()
-            transaccion.reportado_por = usuario
-            transaccion.fecha_disputa = timezone.now()
-            transaccion.save()
+            aplicar_transicion(transaccion, 'disputar', razon_disputa=razon.strip(), reportado_por=usuario)
             messages.success(request, 'Tu reporte ha sido registrado. El equipo de administración revisará la disputa.')
             return redirect('mis_transacciones')
+        except TransicionInvalida as e:
+            messages.error(request, str(e))
+            return redirect('mis_transacciones')
         except Exception as e:
             logger.error(f"Error reportando disputa en transacción {transaccion.id}: {e}")
             messages.error(request, 'Error interno. Intenta nuevamente.')
@@ -812,14 +938,33 @@ def reportar_disputa(request, id_transaccion):
     }
     return render(request, 'reportar_disputa.html', context)
 
+@admin_required
+def cola_disputas(request):
+    """Solo administrador: Disputas abiertas, las más antiguas primero (paginadas por cursor)."""
+    cursor = request.GET.get('cursor')
+    try:
+        pagina, siguiente_cursor = disputas.cola_disputas(cursor=cursor)
+    except CursorInvalido:
+        messages.warning(request, 'El enlace de paginación no es válido; se muestra el inicio de la cola.')
+        cursor = None
+        pagina, siguiente_cursor = disputas.cola_disputas()
+
+    context = {
+        'disputas': pagina,
+        'total_abiertas': disputas.disputas_abiertas().count(),
+        'cursor_actual': cursor,
+        'siguiente_cursor': siguiente_cursor,
+    }
+    return render(request, 'admin_cola_disputas.html', context)
+
 @admin_required
 def resolver_disputa(request, id_transaccion):
     """Solo administrador: Resuelve una disputa."""
-    transaccion = get_object_or_404(Transaccion.objects.select_related('prenda', 'user_origen', 'user_destino', 'reportado_por'), pk=id_transaccion)  # Cambiado: agregado select_related
+    transaccion = get_object_or_404(Transaccion.objects.select_related('prenda', 'tipo', 'user_origen', 'user_destino', 'reportado_por'), pk=id_transaccion)  # Cambiado: agregado select_related
     
     if transaccion.estado != 'EN_DISPUTA':
         messages.error(request, 'Esta transacción no está en disputa.')
-        return redirect('admin:index')
+        return redirect('cola_disputas')
     
     if request.method == 'POST':
         resolucion = request.POST.get('resolucion')
@@ -829,25 +974,50 @@ def resolver_disputa(request, id_transaccion):
             return JsonResponse({'error': 'Resolución inválida'}, status=400)
         
         try:
-            transaccion.estado = resolucion
-            transaccion.save()
+            aplicar_transicion(transaccion, f'resolver_{resolucion.lower()}')
             messages.success(request, f'Disputa resuelta como {transaccion.get_estado_display()}')
-            return redirect('admin:index')
+            return redirect('cola_disputas')
+        except ConflictoConcurrencia as e:
+            return JsonResponse({'error': str(e)}, status=409)
+        except TransicionInvalida as e:
+            return JsonResponse({'error': str(e)}, status=400)
         except Exception as e:
             logger.error(f"Error resolviendo disputa en transacción {transaccion.id}: {e}")
             return JsonResponse({'error': 'Error interno'}, status=500)
     
-    # Obtener mensajes entre los usuarios
-    mensajes = Mensaje.objects.filter(
-        Q(emisor=transaccion.user_origen, receptor=transaccion.user_destino) |  # Cambiado: 'emisor', 'receptor'
-        Q(emisor=transaccion.user_destino, receptor=transaccion.user_origen)
-    ).order_by('fecha_envio')
+    # Solo la primera página de evidencia; el resto se pide a evidencia_disputa
+    mensajes, siguiente_cursor = disputas.evidencia_disputa(transaccion)
     
     context = {
         'transaccion': transaccion,
         'mensajes': mensajes,
+        'siguiente_cursor': siguiente_cursor,
     }
     return render(request, 'admin_resolver_disputa.html', context)
+
+@admin_required
+def evidencia_disputa(request, id_transaccion):
+    """Solo administrador: Página siguiente de los mensajes entre las partes (JSON)."""
+    transaccion = get_object_or_404(Transaccion.objects.only('user_origen', 'user_destino', 'fecha_transaccion', 'fecha_entrega'), pk=id_transaccion)
+    try:
+        mensajes, siguiente_cursor = disputas.evidencia_disputa(
+            transaccion, cursor=request.GET.get('cursor'), limite=request.GET.get('limite', disputas.MENSAJES_POR_PAGINA)
+        )
+    except CursorInvalido as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'mensajes': [
+            {
+                'emisor': m.emisor.nombre,
+                'es_origen': m.emisor_id == transaccion.user_origen_id,
+                'contenido': m.contenido,
+                'fecha_envio': m.fecha_envio.isoformat(),
+            }
+            for m in mensajes
+        ],
+        'siguiente': siguiente_cursor,
+    })
                    
 
 # ------------------------------------------------------------------------------------------------------------------
@@ -855,33 +1025,47 @@ def resolver_disputa(request, id_transaccion):
 
 @login_required_custom
 def lista_mensajes(request):
-    """Vista de la lista de conversaciones del usuario."""
+    """Bandeja de entrada: conversaciones del usuario con su último mensaje, paginadas por cursor."""
     usuario = get_usuario_actual(request)
-    # Usuarios con los que hay intercambio de mensajes
-    enviados = Mensaje.objects.filter(emisor=usuario).values_list('receptor', flat=True)  # Cambiado: 'emisor', 'receptor'
-    recibidos = Mensaje.objects.filter(receptor=usuario).values_list('emisor', flat=True)  # Cambiado: 'receptor', 'emisor'
-    ids_conversaciones = set(list(enviados) + list(recibidos))
-    conversaciones = Usuario.objects.filter(id__in=ids_conversaciones).select_related()  # Cambiado: 'id__in', agregado select_related
+    cursor = request.GET.get('cursor')
+
+    try:
+        bandeja, siguiente_cursor = conversaciones.bandeja(usuario, cursor=cursor)
+    except CursorInvalido:
+        messages.warning(request, 'El enlace de paginación no es válido; se muestran las conversaciones más recientes.')
+        cursor = None
+        bandeja, siguiente_cursor = conversaciones.bandeja(usuario)
+
     context = {
         'usuario': usuario,
-        'conversaciones': conversaciones,
+        'conversaciones': bandeja,
+        'cursor_actual': cursor,
+        'siguiente_cursor': siguiente_cursor,
     }
     return render(request, 'lista_mensajes.html', context)
 
 @login_required_custom
 def conversacion(request, id_usuario):
-    """Muestra la conversación entre el usuario y otro usuario específico."""
+    """Muestra la conversación con otro usuario: los mensajes más recientes y, por cursor, los anteriores."""
     usuario = get_usuario_actual(request)
     otro_usuario = get_object_or_404(Usuario, pk=id_usuario)  # Cambiado: 'pk=id_usuario'
-    # Mensajes entre ambos (enviado/recibido)
-    mensajes_conversacion = Mensaje.objects.filter(
-        Q(emisor=usuario, receptor=otro_usuario) |  # Cambiado: 'emisor', 'receptor'
-        Q(emisor=otro_usuario, receptor=usuario)
-    ).order_by('fecha_envio').select_related('emisor', 'receptor')  # Agregado select_related
+    cursor = request.GET.get('cursor')
+    if not cursor:
+        # Al abrir la conversación se leen los mensajes recibidos (y se descuentan de la bandeja)
+        conversaciones.marcar_leidos(usuario, otro_usuario.pk)
+    try:
+        mensajes_conversacion, cursor_anteriores = conversaciones.mensajes_hilo(usuario.pk, otro_usuario.pk, cursor=cursor)
+    except CursorInvalido:
+        messages.warning(request, 'El enlace de paginación no es válido; se muestran los mensajes más recientes.')
+        cursor = None
+        mensajes_conversacion, cursor_anteriores = conversaciones.mensajes_hilo(usuario.pk, otro_usuario.pk)
     context = {
         'usuario': usuario,
         'otro_usuario': otro_usuario,
         'mensajes': mensajes_conversacion,
+        'cursor_actual': cursor,
+        'cursor_anteriores': cursor_anteriores,
+        'tiempo_real': tiempo_real.disponible(request),
     }
     return render(request, 'conversacion.html', context)
 
@@ -896,12 +1080,9 @@ def enviar_mensaje(request):
             return JsonResponse({'error': 'Datos incompletos.'}, status=400)
         try:
             receptor = Usuario.objects.get(pk=receptor_id)  # Cambiado: 'pk=receptor_id'
-            Mensaje.objects.create(
-                emisor=usuario,  # Cambiado: 'emisor'
-                receptor=receptor,  # Cambiado: 'receptor'
-                contenido=contenido.strip(),
-                fecha_envio=timezone.now()
-            )
+            verificar_envio(usuario.pk, receptor.pk)
+            # Crea el mensaje y actualiza el resumen de la conversación en una sola transacción
+            conversaciones.enviar(usuario, receptor, contenido.strip())
             messages.success(request, f'Mensaje enviado a {receptor.nombre}')
             # Si usas AJAX:
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -909,14 +1090,95 @@ def enviar_mensaje(request):
             return redirect('conversacion', id_usuario=receptor.pk)  # Cambiado: 'receptor.pk'
         except Usuario.DoesNotExist:
             return JsonResponse({'error': 'Receptor no encontrado.'}, status=404)
+        except LimiteExcedido as e:
+            return _respuesta_limite(request, e, receptor, contenido)
         except Exception as e:
             logger.error(f"Error enviando mensaje de {usuario.id_usuario} a {receptor_id}: {e}")
             return JsonResponse({'error': 'Error interno.'}, status=500)
     return JsonResponse({'error': 'Método no permitido'}, status=405)
 
+def _respuesta_limite(request, error, receptor, contenido):
+    """429 con Retry-After: JSON para AJAX; para el formulario, una página que conserva el texto."""
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        respuesta = JsonResponse({'error': str(error), 'reintentar_en': error.reintentar_en}, status=429)
+    else:
+        context = {'receptor': receptor, 'contenido': contenido, 'error': error}
+        respuesta = render(request, 'limite_mensajes.html', context, status=429)
+    respuesta['Retry-After'] = str(error.reintentar_en)
+    return respuesta
+
+@login_required_custom
+def buscar_mensajes(request):
+    """Búsqueda de texto completo en los mensajes del usuario (solo sus conversaciones)."""
+    usuario = request.usuario_actual
+    query = request.GET.get('q', '').strip()
+    try:
+        pagina = max(1, min(int(request.GET.get('pagina', 1)), busqueda_mensajes.MAX_PAGINAS))
+    except ValueError:
+        pagina = 1
+    resultados, hay_mas = busqueda_mensajes.buscar(usuario.pk, query, pagina=pagina)
+    context = {
+        'usuario': usuario,
+        'query': query,
+        'resultados': resultados,
+        'pagina': pagina,
+        'hay_mas': hay_mas,
+    }
+    return render(request, 'buscar_mensajes.html', context)
+
+@login_required_custom
+def marcar_mensajes_leidos(request):
+    """Marca como leídos todos los mensajes recibidos por el usuario (POST)."""
+    if request.method != 'POST':
+        return redirect('lista_mensajes')
+    usuario = request.usuario_actual
+    marcados = conversaciones.marcar_todos_leidos(usuario)
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return JsonResponse({'success': True, 'marcados': marcados, 'no_leidos': 0})
+    if marcados:
+        messages.success(request, f'{marcados} mensaje(s) marcados como leídos.')
+    return redirect('lista_mensajes')
+
+@ajax_login_required
+def mensajes_no_leidos(request):
+    """Insignia de mensajes sin leer (JSON mínimo, leído desde la caché)."""
+    return JsonResponse({'no_leidos': conversaciones.contar_no_leidos(request.usuario_actual.pk)})
+
+def baja_resumen_mensajes(request, token):
+    """Baja (o reactivación) del resumen de mensajes por correo, desde el enlace firmado del correo."""
+    id_usuario = resumen_mensajes.leer_enlace_baja(token)
+    if id_usuario is None:
+        messages.error(request, 'El enlace no es válido.')
+        return redirect('home')
+    usuario = get_object_or_404(Usuario, pk=id_usuario)
+    if request.method == 'POST':
+        activo = request.POST.get('activar') == '1'
+        ResumenMensajes.objects.update_or_create(usuario=usuario, defaults={'activo': activo})
+        messages.success(request, 'Volverás a recibir el resumen.' if activo else 'Ya no recibirás el resumen de mensajes.')
+        return redirect('baja_resumen_mensajes', token=token)
+    context = {
+        'usuario': usuario,
+        'activo': not ResumenMensajes.objects.filter(usuario=usuario, activo=False).exists(),
+    }
+    return render(request, 'baja_resumen_mensajes.html', context)
+
+async def eventos_mensajes(request):
+    """Flujo SSE con los mensajes nuevos del usuario (vista asíncrona: servir con ASGI)."""
+    if not tiempo_real.disponible(request):
+        # Bajo WSGI el flujo no enviaría nada y retendría el worker; 204 hace que el navegador no reconecte
+        return HttpResponse(status=204)
+    usuario_id = await request.session.aget('usuario_id')
+    if not usuario_id:
+        return JsonResponse({'error': 'No autenticado', 'redirect': '/login/'}, status=401)
+    respuesta = StreamingHttpResponse(tiempo_real.flujo_eventos(usuario_id), content_type='text/event-stream')
+    respuesta['Cache-Control'] = 'no-cache'
+    respuesta['X-Accel-Buffering'] = 'no'  # Sin buffer en nginx: cada evento sale al enviarse
+    return respuesta
+
 # ------------------------------------------------------------------------------------------------------------------
 # Fundaciones
 
+@pagina_condicional(etag_lista_fundaciones)
 def lista_fundaciones(request):
     """Lista todas las fundaciones registradas."""
     usuario = get_usuario_actual(request)
@@ -934,7 +1196,7 @@ def detalle_fundacion(request, id_fundacion):
     # Donaciones recibidas por la fundación, ordenadas por más recientes
     donaciones = Transaccion.objects.filter(
         fundacion=fundacion,  # Cambiado: 'fundacion'
-        tipo__nombre_tipo='Donación'  # Cambiado: 'tipo__nombre_tipo'
+        tipo_codigo=DONACION
     ).select_related('prenda', 'user_origen').order_by('-fecha_transaccion')  # Cambiado: 'prenda', 'user_origen', agregado select_related
 
     # Impacto ambiental total de todas las prendas donadas a esta fundación
@@ -965,10 +1227,11 @@ def panel_impacto(request):
         total_carbono=Sum('carbono_evitar_kg'),
         total_energia=Sum('energia_ahorrada_kwh')
     )
-    total_transacciones = Transaccion.objects.count()
-    total_donaciones = Transaccion.objects.filter(tipo__nombre_tipo='Donación').count()  # Cambiado: 'tipo__nombre_tipo'
-    total_intercambios = Transaccion.objects.filter(tipo__nombre_tipo='Intercambio').count()  # Cambiado: 'tipo__nombre_tipo'
-    total_ventas = Transaccion.objects.filter(tipo__nombre_tipo='Venta').count()  # Cambiado: 'tipo__nombre_tipo'
+    por_tipo = contar_por_tipo(TransaccionHistorica.objects.all())
+    total_transacciones = sum(por_tipo.values())
+    total_donaciones = por_tipo[DONACION]
+    total_intercambios = por_tipo[INTERCAMBIO]
+    total_ventas = por_tipo[VENTA]
 
     usuarios_activos = Usuario.objects.annotate(
         num_transacciones=Count('transacciones_origen')  # Cambiado: 'transacciones_origen' (related_name)
@@ -997,30 +1260,27 @@ def mi_impacto(request):
     if not usuario:
         messages.error(request, 'Debes iniciar sesión.')
         return redirect('login')
-    mis_transacciones = Transaccion.objects.filter(
-        Q(user_origen=usuario) | Q(user_destino=usuario)  # Cambiado: 'user_origen', 'user_destino'
-    ).select_related('prenda', 'tipo', 'user_origen', 'user_destino', 'fundacion')  # Cambiado: nombres, agregado select_related
-
-    prendas_ids = [t.prenda.pk for t in mis_transacciones if t.prenda]  # Cambiado: 't.prenda.pk'
+    # Un filtro por lado (user_origen / user_destino) para que cada uno use su índice;
+    # el impacto personal incluye las transacciones archivadas.
+    enviadas, recibidas = transacciones_por_lado(usuario, modelo=TransaccionHistorica)
     mi_impacto_total = ImpactoAmbiental.objects.filter(
-        prenda__pk__in=prendas_ids  # Cambiado: 'prenda__pk__in'
+        Q(prenda__in=enviadas.values('prenda')) | Q(prenda__in=recibidas.values('prenda'))
     ).aggregate(
         total_carbono=Sum('carbono_evitar_kg'),
         total_energia=Sum('energia_ahorrada_kwh')
     )
 
-    donaciones = mis_transacciones.filter(tipo__nombre_tipo='Donación').count()  # Cambiado: 'tipo__nombre_tipo'
-    intercambios = mis_transacciones.filter(tipo__nombre_tipo='Intercambio').count()  # Cambiado: 'tipo__nombre_tipo'
-    ventas = mis_transacciones.filter(tipo__nombre_tipo='Venta').count()  # Cambiado: 'tipo__nombre_tipo'
+    por_tipo = contar_por_tipo_usuario(usuario)
+    transacciones_recientes, _ = linea_tiempo_usuario(usuario, limite=10)
 
     context = {
         'usuario': usuario,
         'mi_impacto': mi_impacto_total,
-        'total_transacciones': mis_transacciones.count(),
-        'donaciones': donaciones,
-        'intercambios': intercambios,
-        'ventas': ventas,
-        'transacciones_recientes': mis_transacciones.order_by('-fecha_transaccion')[:10],
+        'total_transacciones': por_tipo['total'],
+        'donaciones': por_tipo[DONACION],
+        'intercambios': por_tipo[INTERCAMBIO],
+        'ventas': por_tipo[VENTA],
+        'transacciones_recientes': transacciones_recientes,
     }
     return render(request, 'mi_impacto.html', context)
 
@@ -1118,7 +1378,7 @@ def session_status(request):
     usuario_nombre = request.session.get('usuario_nombre')
     if (not usuario_nombre) and id_usuario:
         try:
-            u = Usuario.objects.only('nombre').get(id=id_usuario)  
+            u = Usuario.objects.only('nombre').get(pk=id_usuario)
             usuario_nombre = u.nombre
             request.session['usuario_nombre'] = usuario_nombre
         except Usuario.DoesNotExist:
@@ -1130,6 +1390,7 @@ def session_status(request):
         'id_usuario': id_usuario,
         'usuario_nombre': usuario_nombre,
         'tiempo_restante': tiempo_restante,
+        'mensajes_no_leidos': conversaciones.contar_no_leidos(request.usuario_actual.pk),
         'session_key': (request.session.session_key or '')[:10] + '...' if request.session.session_key else 'N/A'  # Limitado para seguridad
     })
 
@@ -1272,21 +1533,21 @@ def panel_fundacion(request):
     
     # Obtener donaciones recibidas
     donaciones_recibidas = Transaccion.objects.filter(
-        id_fundacion=fundacion,
-        id_tipo__nombre_tipo='Donación'
-    ).select_related('id_prenda', 'id_usuario_origen')
+        fundacion=fundacion,
+        tipo_codigo=DONACION
+    ).select_related('prenda', 'user_origen')
     
     # Calcular impacto ambiental desde las prendas donadas
     impacto = ImpactoAmbiental.objects.filter(
-        id_prenda__transaccion__id_fundacion=fundacion,
-        id_prenda__transaccion__id_tipo__nombre_tipo='Donación'
+        prenda__transaccion__fundacion=fundacion,
+        prenda__transaccion__tipo_codigo=DONACION
     ).aggregate(
         total_carbono=Sum('carbono_evitar_kg'),
         total_energia=Sum('energia_ahorrada_kwh'),
     )
     
     # Obtener campañas de la fundación
-    campanas = CampanaFundacion.objects.filter(id_fundacion=fundacion).order_by('-fecha_inicio')
+    campanas = CampanaFundacion.objects.filter(fundacion=fundacion).order_by('-fecha_inicio')
     
     # Estadísticas generales
     total_donaciones = donaciones_recibidas.count()
@@ -1310,7 +1571,10 @@ def gestionar_donaciones(request):
     """Lista todas las donaciones a la fundación, permite confirmar o rechazar."""
     usuario = get_usuario_actual(request)
     fundacion = usuario.fundacion_asignada
-    donaciones = Transaccion.objects.filter(id_fundacion=fundacion, id_tipo__nombre_tipo='Donación', estado='PENDIENTE')
+    # Pendientes de recibir: aún sin entregar o ya enviadas por el donante
+    donaciones = Transaccion.objects.filter(
+        fundacion=fundacion, tipo_codigo=DONACION, estado__in=ESTADOS_SIN_ENTREGAR + ('EN_PROCESO',)
+    ).select_related('prenda', 'user_origen').order_by('fecha_transaccion')
     context = {
         'usuario': usuario,
         'fundacion': fundacion,
@@ -1323,9 +1587,9 @@ def confirmar_recepcion_donacion(request, id_transaccion):
     """Confirma la recepción de una donación y actualiza estados."""
     usuario = get_usuario_actual(request)
     transaccion = get_object_or_404(
-        Transaccion,
-        id_transaccion=id_transaccion,
-        id_fundacion=usuario.fundacion_asignada
+        Transaccion.objects.select_related('prenda', 'tipo', 'user_origen', 'fundacion'),
+        pk=id_transaccion,
+        fundacion=usuario.fundacion_asignada
     )
 
     if request.method != 'POST':
@@ -1334,20 +1598,69 @@ def confirmar_recepcion_donacion(request, id_transaccion):
     if transaccion.estado != 'EN_PROCESO':
         return JsonResponse({'error': 'La donación aún no ha sido marcada como entregada por el donante.'}, status=400)
 
-    transaccion.estado = 'COMPLETADA'
-    transaccion.fecha_entrega = timezone.now()
-    transaccion.save()
-    transaccion.actualizar_disponibilidad_prenda()
+    try:
+        transaccion.marcar_como_completada()
+    except ConflictoConcurrencia as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    except TransicionInvalida as e:
+        return JsonResponse({'error': str(e)}, status=400)
 
-    Mensaje.objects.create(
-        id_emisor=usuario,
-        id_receptor=transaccion.id_usuario_origen,
-        contenido=f"Gracias por tu donación de {transaccion.id_prenda.nombre}! Tu prenda ha sido recibida y será destinada a {transaccion.id_fundacion.nombre}.",
-        fecha_envio=timezone.now()
-    )
+    # El agradecimiento al donante y sus logros los despacha el outbox (eventos.py)
+    messages.success(request, 'Donación confirmada. El donante recibirá tu agradecimiento en breve.')
+    return redirect('gestionar_donaciones')
+
+# Acción del formulario de gestionar_donaciones -> acción de la máquina de estados
+ACCIONES_DONACIONES_LOTE = {
+    'confirmar': 'completar',
+    'rechazar': 'rechazar',
+}
+MAX_DONACIONES_LOTE = 1000
+MAX_FALLIDAS_INFORMADAS = 10
 
-    verificar_logros(transaccion.id_usuario_origen)
-    messages.success(request, 'Donación confirmada y donante notificado.')
+
+@representante_fundacion_required
+def procesar_donaciones_lote(request):
+    """Confirma la recepción o rechaza varias donaciones seleccionadas en una sola operación."""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido. Debes enviar el formulario mediante POST.'}, status=405)
+    fundacion = request.usuario_actual.fundacion_asignada
+
+    accion = ACCIONES_DONACIONES_LOTE.get(request.POST.get('accion'))
+    try:
+        ids = {int(pk) for pk in request.POST.getlist('donaciones')}
+    except ValueError:
+        ids = None
+    if accion is None or ids is None:
+        messages.error(request, 'Solicitud inválida.')
+        return redirect('gestionar_donaciones')
+    if not ids:
+        messages.warning(request, 'Selecciona al menos una donación.')
+        return redirect('gestionar_donaciones')
+    if len(ids) > MAX_DONACIONES_LOTE:
+        messages.error(request, f'Puedes procesar hasta {MAX_DONACIONES_LOTE} donaciones a la vez.')
+        return redirect('gestionar_donaciones')
+
+    donaciones = list(
+        Transaccion.objects.filter(pk__in=ids, fundacion=fundacion, tipo_codigo=DONACION)
+    )
+    fallidas = dict.fromkeys(ids - {d.pk for d in donaciones}, 'No es una donación a tu fundación.')
+    try:
+        aplicadas, no_aplicadas = aplicar_transicion_lote(donaciones, accion)
+    except Exception as e:
+        logger.error(f"Error al procesar lote de donaciones de la fundación {fundacion.pk}: {e}")
+        messages.error(request, 'Error interno. Intenta nuevamente.')
+        return redirect('gestionar_donaciones')
+    fallidas.update(no_aplicadas)
+
+    # Agradecimientos y logros de los donantes: los despacha el outbox (eventos.py)
+    if aplicadas:
+        verbo = 'confirmadas' if accion == 'completar' else 'rechazadas'
+        messages.success(request, f'{len(aplicadas)} donaciones {verbo}.')
+    if fallidas:
+        detalle = '; '.join(f'#{pk}: {motivo}' for pk, motivo in sorted(fallidas.items())[:MAX_FALLIDAS_INFORMADAS])
+        if len(fallidas) > MAX_FALLIDAS_INFORMADAS:
+            detalle += f' (y {len(fallidas) - MAX_FALLIDAS_INFORMADAS} más)'
+        messages.warning(request, f'{len(fallidas)} donaciones no se procesaron: {detalle}')
     return redirect('gestionar_donaciones')
 
 @representante_fundacion_required
@@ -1360,12 +1673,7 @@ def enviar_mensaje_agradecimiento(request, id_usuario_donante):
         if not contenido:
             messages.error(request, 'Escribe un mensaje de agradecimiento.')
         else:
-            Mensaje.objects.create(
-                id_emisor=usuario,
-                id_receptor=donante,
-                contenido=contenido,
-                fecha_envio=timezone.now()
-            )
+            conversaciones.enviar(usuario, donante, contenido)
             messages.success(request, f'Mensaje enviado a {donante.nombre}.')
             return redirect('panel_fundacion')
     context = {
@@ -1374,6 +1682,65 @@ def enviar_mensaje_agradecimiento(request, id_usuario_donante):
     }
     return render(request, 'enviar_mensaje_agradecimiento.html', context)
 
+def _limite_dia(texto, fin=False):
+    """'AAAA-MM-DD' del formulario -> inicio (o fin) de ese día con zona horaria; None si no es válida."""
+    from datetime import datetime
+    from django.utils.dateparse import parse_date
+
+    try:
+        fecha = parse_date(texto or '')
+    except ValueError:
+        return None
+    if fecha is None:
+        return None
+    return timezone.make_aware(datetime.combine(fecha, datetime.max.time() if fin else datetime.min.time()))
+
+@representante_fundacion_required
+def agradecer_donantes(request):
+    """Agradecimiento masivo a los donantes de una campaña o de un rango de fechas (en segundo plano)."""
+    usuario = request.usuario_actual
+    fundacion = usuario.fundacion_asignada
+    campanas = CampanaFundacion.objects.filter(fundacion=fundacion).order_by('-fecha_inicio')
+    if request.method == 'POST':
+        contenido = (request.POST.get('contenido') or '').strip()
+        id_campana = request.POST.get('campana')
+        campana = campanas.filter(pk=id_campana).first() if id_campana else None
+        fecha_desde = _limite_dia(request.POST.get('fecha_desde'))
+        fecha_hasta = _limite_dia(request.POST.get('fecha_hasta'), fin=True)
+        if len(contenido) < 2 or len(contenido) > 500:
+            messages.error(request, 'Escribe un mensaje de agradecimiento (hasta 500 caracteres).')
+        elif id_campana and campana is None:
+            messages.error(request, 'La campaña seleccionada no pertenece a tu fundación.')
+        elif (request.POST.get('fecha_desde') and not fecha_desde) or (request.POST.get('fecha_hasta') and not fecha_hasta):
+            messages.error(request, 'Las fechas deben tener el formato AAAA-MM-DD.')
+        elif fecha_desde and fecha_hasta and fecha_desde > fecha_hasta:
+            messages.error(request, 'La fecha de inicio debe ser anterior a la de término.')
+        else:
+            envio = agradecimientos.crear_envio(usuario, fundacion, contenido, campana, fecha_desde, fecha_hasta)
+            if envio.total:
+                messages.success(request, f'Enviando tu agradecimiento a {envio.total} donante(s).')
+            else:
+                messages.info(request, 'No hay donantes que coincidan con el filtro.')
+            return redirect('agradecer_donantes')
+    context = {
+        'usuario': usuario,
+        'fundacion': fundacion,
+        'campanas': campanas,
+        'envios': EnvioAgradecimiento.objects.filter(fundacion=fundacion).select_related('campana').order_by('-fecha_creacion')[:10],
+    }
+    return render(request, 'agradecer_donantes.html', context)
+
+@representante_fundacion_required
+def progreso_agradecimiento(request, id_envio):
+    """Avance de un agradecimiento masivo (JSON, para la barra de progreso)."""
+    envio = get_object_or_404(EnvioAgradecimiento, pk=id_envio, fundacion=request.usuario_actual.fundacion_asignada)
+    return JsonResponse({
+        'estado': envio.estado,
+        'total': envio.total,
+        'enviados': envio.enviados,
+        'porcentaje': envio.porcentaje,
+    })
+
 # ------------------------------------------------------------------------------------------------------------------
 # Campañas solidarias
 
@@ -1420,9 +1787,9 @@ def campanas_solidarias(request):
 def detalle_campana(request, id_campana):
     """Detalle de una campaña solidaria de una fundación."""
     usuario = get_usuario_actual(request)
-    campana = get_object_or_404(CampanaFundacion, id_campana=id_campana)
-    donaciones = Transaccion.objects.filter(id_campana=campana, id_tipo__nombre_tipo='Donación')
-    prendas_donadas = [don.id_prenda for don in donaciones if don.id_prenda]
+    campana = get_object_or_404(CampanaFundacion, pk=id_campana)
+    donaciones = Transaccion.objects.filter(campana=campana, tipo_codigo=DONACION).select_related('prenda')
+    prendas_donadas = [don.prenda for don in donaciones]
     avance = len(prendas_donadas)
     porcentaje_avance = int(100 * avance / campana.objetivo_prendas) if campana.objetivo_prendas else 0
     context = {
@@ -1438,28 +1805,26 @@ def detalle_campana(request, id_campana):
 def donar_a_campana(request, id_campana):
     """Permite donar una prenda a una campaña solidaria."""
     usuario = get_usuario_actual(request)
-    campana = get_object_or_404(CampanaFundacion, id_campana=id_campana, activa=True)
+    campana = get_object_or_404(CampanaFundacion.objects.select_related('fundacion'), pk=id_campana, activa=True)
     if request.method == 'POST':
         prenda_id = request.POST.get('prenda_id')
-        prenda = get_object_or_404(Prenda, id_prenda=prenda_id, id_usuario=usuario, disponibilidad='DISPONIBLE')
-        if not prenda.esta_disponible():
+        prenda = get_object_or_404(Prenda, pk=prenda_id, user=usuario)
+        tipo_donacion = obtener_tipo(DONACION)
+        try:
+            crear_transaccion(
+                prenda,
+                tipo=tipo_donacion,
+                user_origen=usuario,
+                fundacion=campana.fundacion,
+                campana=campana,
+                fecha_transaccion=timezone.now(),
+            )
+        except PrendaNoDisponible:
             messages.error(request, 'La prenda ya no está disponible.')
             return redirect('donar_a_campana', id_campana=id_campana)
-        tipo_donacion, _ = TipoTransaccion.objects.get_or_create(nombre_tipo='Donación')
-        Transaccion.objects.create(
-            id_prenda=prenda,
-            id_tipo=tipo_donacion,
-            id_usuario_origen=usuario,
-            id_fundacion=campana.id_fundacion,
-            id_campana=campana,
-            fecha_transaccion=timezone.now(),
-            estado='PENDIENTE'
-        )
-        prenda.disponibilidad = 'RESERVADA'
-        prenda.save()
         messages.success(request, f'¡Donación asociada a la campaña "{campana.nombre}"!')
         return redirect('mis_prendas')
-    prendas_usuario = Prenda.objects.filter(id_usuario=usuario, disponibilidad='DISPONIBLE')
+    prendas_usuario = Prenda.objects.filter(user=usuario, estado='DISPONIBLE')
     context = {
         'usuario': usuario,
         'campana': campana,
@@ -1484,73 +1849,10 @@ def mis_campanas(request):
 # Logros y Recomendaciones
 
 def verificar_logros(usuario):
-    """Chequea y asigna logros automáticamente según reglas."""
-    nuevos = []
-
+    """Chequea y asigna logros automáticamente según reglas (ver logros.py)."""
     if not usuario:
         return []
-    
-    for logro in Logro.objects.all():
-        # Verificar si el usuario ya tiene el logro
-        if UsuarioLogro.objects.filter(id_usuario=usuario, id_logro=logro).exists():
-            continue
-        
-        # Logro: Donador (1 donación completada)
-        if logro.codigo == 'DONADOR':
-            donaciones = Transaccion.objects.filter(
-                id_usuario_origen=usuario,
-                id_tipo__nombre_tipo='Donación',
-                estado='COMPLETADA'
-            ).count()
-            if donaciones >= 1:
-                UsuarioLogro.objects.create(
-                    id_usuario=usuario,
-                    id_logro=logro,
-                    fecha_desbloqueo=timezone.now()
-                )
-                nuevos.append(logro)
-        
-        # Logro: SuperUser (10 prendas publicadas)
-        elif logro.codigo == 'SUPERUSER':
-            prendas_count = Prenda.objects.filter(id_usuario=usuario).count()
-            if prendas_count >= 10:
-                UsuarioLogro.objects.create(
-                    id_usuario=usuario,
-                    id_logro=logro,
-                    fecha_desbloqueo=timezone.now()
-                )
-                nuevos.append(logro)
-        
-        # Logro: Intercambiador (5 intercambios completados)
-        elif logro.codigo == 'INTERCAMBIADOR':
-            intercambios = Transaccion.objects.filter(
-                Q(id_usuario_origen=usuario) | Q(id_usuario_destino=usuario),
-                id_tipo__nombre_tipo='Intercambio',
-                estado='COMPLETADA'
-            ).count()
-            if intercambios >= 5:
-                UsuarioLogro.objects.create(
-                    id_usuario=usuario,
-                    id_logro=logro,
-                    fecha_desbloqueo=timezone.now()
-                )
-                nuevos.append(logro)
-        
-        # Logro: Eco Guerrero (1000 kg de carbono evitado)
-        elif logro.codigo == 'ECO_GUERRERO':
-            impacto = ImpactoAmbiental.objects.filter(
-                id_prenda__id_usuario=usuario
-            ).aggregate(total_carbono=Sum('carbono_evitar_kg'))
-            carbono_total = impacto['total_carbono'] or 0
-            if carbono_total >= 1000:
-                UsuarioLogro.objects.create(
-                    id_usuario=usuario,
-                    id_logro=logro,
-                    fecha_desbloqueo=timezone.now()
-                )
-                nuevos.append(logro)
-    
-    return nuevos
+    return otorgar_logros([usuario.pk]).get(usuario.pk, [])
 
 @login_required_custom
 def desbloquear_logro(request, codigo_logro):
@@ -1695,8 +1997,8 @@ def estadisticas_donaciones(request):
     """Panel con estadísticas avanzadas de donaciones de la fundación."""
     usuario = get_usuario_actual(request)
     fundacion = usuario.fundacion_asignada
-    donaciones = Transaccion.objects.filter(id_fundacion=fundacion, id_tipo__nombre_tipo='Donación')
-    resumen = donaciones.values('estado').annotate(total=Count('id_transaccion'))
+    donaciones = Transaccion.objects.filter(fundacion=fundacion, tipo_codigo=DONACION)
+    resumen = donaciones.values('estado').annotate(total=Count('pk'))
     prendas = Prenda.objects.filter(id_fundacion=fundacion)
     context = {
         'fundacion': fundacion,
@@ -1710,6 +2012,7 @@ def estadisticas_donaciones(request):
 # VISTA DEL MAPA INTERACTIVO
 # ==============================================================================
 
+@pagina_condicional(etag_mapa_fundaciones)
 def mapa_fundaciones(request):
     """
     Mapa interactivo que muestra:
@@ -2236,11 +2539,12 @@ def crear_prenda(request):
 # ACTUALIZAR: detalle_prenda - Mostrar impacto con equivalencias
 # ------------------------------------------------------------------------------
 @cliente_only
+@pagina_condicional(etag_detalle_prenda)
 def detalle_prenda(request, id_prenda):
     """Detalle de prenda con impacto ambiental y equivalencias."""
     usuario = get_usuario_actual(request)
-    prenda = get_object_or_404(Prenda, id_prenda=id_prenda)
-    impacto_obj = ImpactoAmbiental.objects.filter(id_prenda=prenda).first()
+    prenda = get_object_or_404(Prenda.objects.select_related('user'), pk=id_prenda)
+    impacto_obj = ImpactoAmbiental.objects.filter(prenda=prenda).first()
     
     # Calcular equivalencias si hay impacto
     equivalencias = None
@@ -2254,7 +2558,7 @@ def detalle_prenda(request, id_prenda):
     
     # Buscar transacción actual
     transaccion_actual = Transaccion.objects.filter(
-        id_prenda=prenda,
+        prenda=prenda,
         estado__in=['PENDIENTE', 'RESERVADA', 'EN_PROCESO']
     ).order_by('-fecha_transaccion').first()
 
@@ -2280,19 +2584,11 @@ def panel_impacto(request):
     impacto_plataforma = obtener_impacto_total_plataforma()
     
     # Estadísticas de transacciones
-    total_transacciones = Transaccion.objects.filter(estado='COMPLETADA').count()
-    total_donaciones = Transaccion.objects.filter(
-        id_tipo__nombre_tipo='Donación',
-        estado='COMPLETADA'
-    ).count()
-    total_intercambios = Transaccion.objects.filter(
-        id_tipo__nombre_tipo='Intercambio',
-        estado='COMPLETADA'
-    ).count()
-    total_ventas = Transaccion.objects.filter(
-        id_tipo__nombre_tipo='Venta',
-        estado='COMPLETADA'
-    ).count()
+    completadas_por_tipo = contar_por_tipo(TransaccionHistorica.objects.filter(estado='COMPLETADA'))
+    total_transacciones = sum(completadas_por_tipo.values())
+    total_donaciones = completadas_por_tipo[DONACION]
+    total_intercambios = completadas_por_tipo[INTERCAMBIO]
+    total_ventas = completadas_por_tipo[VENTA]
 
     # Top usuarios con más impacto
     from django.db.models import Sum, Count
@@ -2340,16 +2636,9 @@ def mi_impacto(request):
     # Obtener impacto total del usuario
     impacto_usuario = obtener_impacto_total_usuario(usuario)
     
-    # Mis transacciones completadas
-    mis_transacciones = Transaccion.objects.filter(
-        Q(id_usuario_origen=usuario) | Q(id_usuario_destino=usuario),
-        estado='COMPLETADA'
-    ).select_related('id_prenda', 'id_tipo', 'id_usuario_origen', 'id_usuario_destino', 'id_fundacion')
-
-    # Desglose por tipo
-    donaciones = mis_transacciones.filter(id_tipo__nombre_tipo='Donación').count()
-    intercambios = mis_transacciones.filter(id_tipo__nombre_tipo='Intercambio').count()
-    ventas = mis_transacciones.filter(id_tipo__nombre_tipo='Venta').count()
+    # Desglose por tipo de mis transacciones completadas (una consulta agrupada por lado)
+    por_tipo = contar_por_tipo_usuario(usuario, estado='COMPLETADA')
+    transacciones_recientes, _ = linea_tiempo_usuario(usuario, limite=10, estado='COMPLETADA')
     
     # Ranking del usuario
     from django.db.models import Sum
@@ -2362,11 +2651,11 @@ def mi_impacto(request):
     context = {
         'usuario': usuario,
         'mi_impacto': impacto_usuario,
-        'total_transacciones': mis_transacciones.count(),
-        'donaciones': donaciones,
-        'intercambios': intercambios,
-        'ventas': ventas,
-        'transacciones_recientes': mis_transacciones.order_by('-fecha_transaccion')[:10],
+        'total_transacciones': por_tipo['total'],
+        'donaciones': por_tipo[DONACION],
+        'intercambios': por_tipo[INTERCAMBIO],
+        'ventas': por_tipo[VENTA],
+        'transacciones_recientes': transacciones_recientes,
         'equivalencias': impacto_usuario.get('equivalencias', {}),
         'ranking': ranking,
     }
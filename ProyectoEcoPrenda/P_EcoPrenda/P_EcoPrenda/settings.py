@@ -89,6 +89,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'A_EcoPrenda.context_processors.mensajes_no_leidos',
             ],
         },
     },
@@ -195,6 +196,114 @@ LOGIN_REDIRECT_URL = 'home'
 # Redirección después del logout
 LOGOUT_REDIRECT_URL = 'home'
 
+# Configuración de Caché
+
+# Memoria local por defecto; en producción con varios workers conviene un backend compartido
+# (por ejemplo django.core.cache.backends.redis.RedisCache con CACHE_URL en .env).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ecoprenda',
+    }
+}
+if os.environ.get('CACHE_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_URL'),
+    }
+
+# Tiempo de vida de las tarjetas de prendas cacheadas (segundos)
+CACHE_TARJETAS_TIMEOUT = 60 * 60
+
+# Tiempo de vida del panel de negociación de una prenda (segundos). Los mensajes nuevos y
+# los cambios de la prenda o de sus transacciones lo invalidan antes
+CACHE_PANEL_NEGOCIACION_TIMEOUT = 30
+
+# Configuración de Búsqueda
+
+# 'db' usa consultas icontains; 'memoria' usa el índice invertido en memoria (A_EcoPrenda/indice_busqueda.py)
+BUSQUEDA_BACKEND = os.environ.get('BUSQUEDA_BACKEND', 'db')
+BUSQUEDA_INDICE_SNAPSHOT = os.environ.get('BUSQUEDA_INDICE_SNAPSHOT', str(BASE_DIR / 'indice_busqueda.pkl'))
+BUSQUEDA_MAX_RESULTADOS = 2000
+
+# Expiración de transacciones (python manage.py expirar_transacciones)
+
+# Horas sin avance tras las cuales una transacción se cancela y su prenda vuelve al catálogo
+TRANSACCIONES_EXPIRACION_HORAS = {
+    'PENDIENTE': 72,
+    'ACEPTADA': 168,
+    'RESERVADA': 168,
+}
+
+# Archivo de transacciones terminadas (python manage.py archivar_transacciones)
+
+# Días desde fecha_transaccion tras los cuales una transacción terminada (y la conversación
+# entre sus partes) pasa a las tablas de archivo
+ARCHIVO_ANTIGUEDAD_DIAS = int(os.environ.get('ARCHIVO_ANTIGUEDAD_DIAS', 365))
+
+# Retención de mensajes (python manage.py depurar_mensajes)
+
+# Se conserva todo mensaje con menos de RETENCION_MENSAJES_DIAS días o entre los
+# RETENCION_MENSAJES_POR_HILO más recientes de su conversación. Nunca se borran los no
+# leídos ni las conversaciones con transacciones activas o disputas.
+RETENCION_MENSAJES_DIAS = int(os.environ.get('RETENCION_MENSAJES_DIAS', 730))
+RETENCION_MENSAJES_POR_HILO = int(os.environ.get('RETENCION_MENSAJES_POR_HILO', 500))
+
+# Mensajes en tiempo real (A_EcoPrenda/tiempo_real.py, requiere servir con ASGI)
+
+# Activar solo al servir P_EcoPrenda.asgi:application (ver Notas.txt), p. ej.:
+#   gunicorn P_EcoPrenda.asgi:application -k uvicorn.workers.UvicornWorker
+# Con WSGI o runserver la página no abre el flujo y la vista responde 204
+TIEMPO_REAL_HABILITADO = os.environ.get('TIEMPO_REAL_HABILITADO', 'False') == 'True'
+
+# 'memoria' reparte dentro del proceso (un solo worker); 'redis' comparte los avisos entre
+# workers a través de TIEMPO_REAL_REDIS_URL (por defecto, la misma instancia que CACHE_URL)
+TIEMPO_REAL_BACKEND = os.environ.get('TIEMPO_REAL_BACKEND', 'memoria')
+TIEMPO_REAL_REDIS_URL = os.environ.get('TIEMPO_REAL_REDIS_URL', os.environ.get('CACHE_URL'))
+# Avisos pendientes por conexión; un cliente que se atrasa más se desconecta y recarga
+TIEMPO_REAL_TAMANO_COLA = 100
+
+# Agradecimientos masivos de fundaciones (A_EcoPrenda/agradecimientos.py)
+
+# Procesar cada envío en un hilo del proceso web al crearlo. Con False (o si el proceso se
+# reinicia a mitad de un envío) los procesa: python manage.py procesar_agradecimientos --continuo
+AGRADECIMIENTOS_EN_HILO = True
+
+# Límite de envío de mensajes (A_EcoPrenda/limite_mensajes.py)
+
+# Ámbito -> (ráfaga máxima, segundos en que se recarga entera). Las cubetas viven en la
+# caché: con varios workers, CACHE_URL (Redis) hace que el límite sea compartido
+LIMITES_MENSAJES = {
+    'usuario': (30, 60),
+    'par': (10, 60),
+    'global': (3000, 60),
+}
+
+# Correo
+
+# SMTP en EMAIL_HOST:EMAIL_PORT. En desarrollo, un servidor de depuración local muestra
+# los correos en la consola sin enviarlos: python -m aiosmtpd -n -l localhost:1025
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 1025))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'False') == 'True'
+EMAIL_TIMEOUT = 30
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'EcoPrenda <no-responder@ecoprenda.cl>')
+
+# URL pública del sitio, para los enlaces de los correos
+SITIO_URL = os.environ.get('SITIO_URL', 'https://proyectoecoprenda-ykp.onrender.com')
+
+# Resumen de mensajes sin leer por correo (python manage.py enviar_resumenes_mensajes)
+
+# Como mucho un resumen cada RESUMEN_MENSAJES_INTERVALO_HORAS por usuario, solo con los
+# mensajes que siguen sin leer RESUMEN_MENSAJES_ESPERA_MINUTOS después de llegar
+RESUMEN_MENSAJES_INTERVALO_HORAS = 24
+RESUMEN_MENSAJES_ESPERA_MINUTOS = 30
+# Ritmo máximo de envío (según el proveedor de correo); 0 = sin límite
+RESUMEN_CORREOS_POR_SEGUNDO = int(os.environ.get('RESUMEN_CORREOS_POR_SEGUNDO', 20))
+
 # Configuración de Sesiones
 
 # Motor de sesiones (base de datos es más seguro que archivos)